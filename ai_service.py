@@ -1,12 +1,65 @@
-import os
 import json
 import urllib.request
 import re
 import logging
-import datetime
-import traceback
-from com.sun.star.awt.MessageBoxType import MESSAGEBOX, INFOBOX
-from com.sun.star.awt.MessageBoxButtons import BUTTONS_OK
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from bpe_tokenizer import get_tokenizer_registry
+from cancellation import CancelToken, RequestCancelled
+from chunking import PROMPT_OVERHEAD_TOKENS, OrderedStreamMerger, chunk_token_budget, split_text
+from conversation import GEMINI_CACHE_TTL
+from http_pool import get_http_pool
+from metrics import RequestTimer, get_metrics
+from model_limits import output_token_limit
+from log_setup import Truncated, dropped_records, get_logger, set_level, setup_logging
+from provider_router import StreamClaim, get_provider_router
+from rate_limiter import RateLimitExceeded, get_rate_limiter
+from retry_policy import HEDGE_PERCENTILE, get_latency_tracker, get_retry_policy, hedged_call
+from response_cache import ResponseCache, get_response_cache
+from semantic_cache import SemanticCache, get_semantic_cache
+from settings_service import get_settings_service
+from token_count_cache import get_token_count_cache
+from token_estimator import heuristic_token_count
+from sse_stream import iter_sse_events
+
+
+class AIServiceError(Exception):
+    """AI服務請求失敗，帶有顯示用的標題與訊息"""
+
+    def __init__(self, title, message):
+        super().__init__(message)
+        self.title = title
+        self.message = message
+
+
+# 收到 429 時依 Retry-After 等待後重送的次數上限
+RATE_LIMIT_RETRIES = 3
+
+# 重點合計仍超過預算時，最多再分塊整理的層數
+MAX_REDUCE_LEVELS = 3
+
+# 各提供商表示回應因達到輸出上限 (max_tokens) 而被截斷的結束原因：
+# Gemini 的 finishReason、OpenAI / Mistral 的 finish_reason、Claude 的 stop_reason
+TRUNCATED_FINISH_REASONS = ("MAX_TOKENS", "length", "max_tokens")
+
+CHUNK_MAP_PROMPT = """使用者對一份長文本提出以下請求：
+{instruction}
+
+以下是這份長文本的第{index}/{count}部分。請針對上述請求整理這一部分中相關的重點、關鍵數據與結論，使用與原文相同的語言，不要加入原文沒有的內容。
+
+{text}"""
+
+CHUNK_REDUCE_PROMPT = """使用者對一份長文本提出以下請求：
+{instruction}
+
+原文超過單一請求的長度，以下是原文各部分依序整理出的重點。請根據這些重點完成上述請求；若請求沒有明確的要求，請整合為一份完整的摘要。
+
+{notes}"""
+
+# 無法從問題中分離出文件時，以問題的開頭與結尾代表使用者的請求
+CHUNK_EXCERPT_INSTRUCTION = "（請求的開頭為「{head}」，結尾為「{tail}」）"
+# 問題只有文件內容、沒有其他文字時使用的請求
+CHUNK_DEFAULT_INSTRUCTION = "（沒有明確的要求）"
 
 
 class AIService:    
@@ -16,50 +69,52 @@ class AIService:
         self.previous_token = None
         # 長度調整因數，默認為1.0
         self.length_adjustment_factor = 1.0
+        # 共用的 keep-alive 連線池，避免每次請求重新建立 TCP/TLS 連線
+        self.http_pool = get_http_pool()
+        # .env 設定快照，只在檔案變更時重新解析
+        self.settings_service = get_settings_service()
+        # 相同提示詞的回應快取（可在 .env 以 RESPONSE_CACHE=false 略過）
+        self.response_cache = get_response_cache()
+        # 近似重複提示詞的索引（MinHash + LSH），命中時沿用回應快取中的回應
+        self.semantic_cache = get_semantic_cache()
+        # 本機 BPE 詞表，可在不發送網路請求的情況下計算 token 數
+        self.tokenizers = get_tokenizer_registry()
+        # 以 (提供商, 模型, 文本雜湊) 為鍵的 token 數快取，長度調整時同一段文本不必重複計算
+        self.token_counts = get_token_count_cache()
+        # 依提供商與金鑰限制每分鐘請求數與 token 數，額度不足時排隊而不是讓請求失敗
+        self.rate_limiter = get_rate_limiter()
+        # 暫時性錯誤的退避重試（共用重試預算）與各模型的近期延遲，用於決定何時送出對沖請求
+        self.retry_policy = get_retry_policy()
+        self.latency_tracker = get_latency_tracker()
+        # 多提供商備援與競速（.env 的 ROUTING_MODE 與 PROVIDER_ORDER）
+        self.router = get_provider_router()
+        # 各提供商與模型的分段延遲與吞吐量統計，定期寫入 ~/.libreoffice/logs
+        self.metrics = get_metrics()
         # 初始化日誌系統
         self.setup_logging()
         
     def setup_logging(self):
-        """設定日誌系統"""
+        """設定日誌系統（整個行程共用一個非同步寫入的日誌管線，等級由 .env 的 LOG_LEVEL 決定）"""
+        self.logger = get_logger("ai_service")
         try:
-            # 創建 .libreoffice 目錄（如果不存在）
-            libreoffice_dir = os.path.join(os.path.expanduser("~"), ".libreoffice")
-            if not os.path.exists(libreoffice_dir):
-                os.makedirs(libreoffice_dir)
-                
-            # 創建日誌目錄
-            logs_dir = os.path.join(libreoffice_dir, "logs")
-            if not os.path.exists(logs_dir):
-                os.makedirs(logs_dir)
-                
-            # 設定日誌文件名（按日期）
-            today = datetime.datetime.now().strftime("%Y-%m-%d")
-            log_file = os.path.join(logs_dir, f"ai_query_{today}.log")
-            
-            # 配置日誌處理器
-            file_handler = logging.FileHandler(log_file, encoding='utf-8')
-            formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-            file_handler.setFormatter(formatter)
-            
-            # 獲取日誌記錄器並設置級別
-            self.logger = logging.getLogger('ai_service')
-            self.logger.setLevel(logging.INFO)
-            
-            # 清除可能存在的處理器
-            if self.logger.handlers:
-                for handler in self.logger.handlers:
-                    self.logger.removeHandler(handler)
-            
-            # 添加處理器
-            self.logger.addHandler(file_handler)
-            
-            self.logger.info("====== AI 服務日誌系統已初始化 ======")
-        except Exception as e:
-            print(f"無法設置日誌系統: {str(e)}")
-            self.logger = None
+            self._log_level = self.settings_service.get().log_level
+        except Exception:
+            self._log_level = "INFO"
+        setup_logging(self._log_level)
 
-    def show_message(self, message, title="Information", message_type=INFOBOX):
+    def reset_session(self):
+        """開啟新的對話框時清除上次對話留下的長度調整狀態（服務物件在整個行程內共用）"""
+        self.previous_token = None
+        self.length_adjustment_factor = 1.0
+
+    def show_message(self, message, title="Information", message_type=None):
         """顯示訊息對話框"""
+        # 在這裡才匯入 UNO 常數，讓請求相關的邏輯可以在 LibreOffice 之外使用（例如 benchmarks）
+        from com.sun.star.awt.MessageBoxType import INFOBOX
+        from com.sun.star.awt.MessageBoxButtons import BUTTONS_OK
+
+        if message_type is None:
+            message_type = INFOBOX
         toolkit = self.ctx.ServiceManager.createInstance("com.sun.star.awt.Toolkit")
         parent = toolkit.getActiveTopWindow()
         mb = toolkit.createMessageBox(
@@ -95,65 +150,89 @@ class AIService:
         
     def estimate_token_count(self, text, provider="gemini"):
         """更准确地估算文本的token数量"""
-        # 先尝试调用API获取精确的token数量
+        settings = self._load_api_settings()
+
+        # 同一段文本已计算过（或已由API回应的usage得知）时直接使用
+        cached = self.token_counts.get(settings.provider, settings.model, text)
+        if cached is not None:
+            self.logger.info("token数量快取命中: %s (来源: %s)", cached[0], cached[1])
+            return cached[0]
+
+        # 优先使用本机BPE词表计算，不需要任何网络请求
+        try:
+            token_count = self.tokenizers.count_tokens(text, settings.provider, settings.model)
+            if token_count is not None:
+                self.logger.info("本机词表计算token数量: %s", token_count)
+                self.token_counts.put(settings.provider, settings.model, text, token_count, "local")
+                return token_count
+        except Exception as e:
+            self.logger.warning("本机词表计算失败: %s", e)
+
+        # 没有可用的本机词表时，尝试调用API获取精确的token数量
         try:
             token_count = self.get_token_count_from_api(text, provider)
             if token_count:
-                if hasattr(self, 'logger') and self.logger:
-                    self.logger.info(f"从API获取到精确的token数量: {token_count}")
+                self.logger.info("从API获取到精确的token数量: %s", token_count)
+                self.token_counts.put(settings.provider, settings.model, text, token_count, "api")
                 return token_count
         except Exception as e:
-            if hasattr(self, 'logger') and self.logger:
-                self.logger.warning(f"无法从API获取token数量: {str(e)}, 使用本地估算方法")
-        
-        # 如果API方法失败，使用改进的本地估算方法
-        
-        # 分析文本组成
-        chinese_chars = len(re.findall(r'[\u4e00-\u9fff]', text))
-        # 数字
-        numbers = len(re.findall(r'\d', text))
-        # 英文单词
-        english_words = len(re.findall(r'\b[a-zA-Z]+\b', text))
-        # 标点符号
-        punct_chars = len(re.findall(r'[^\w\s\u4e00-\u9fff]', text))
-        # 空白字符
-        whitespace = len(re.findall(r'\s', text))
-        # 其他字符
-        other_chars = len(text) - chinese_chars - numbers - punct_chars - whitespace
-        
-        # 使用更准确的权重计算
-        # 中文字符权重 - 根据Gemini/GPT等模型，中文每个字符约为0.5-0.7个token
-        chinese_weight = 0.7
-        # 英文单词权重 - 平均每个英文单词约1.3个token
-        english_word_weight = 1.3
-        # 数字权重 - 数字通常比字母更高效编码
-        number_weight = 0.5
-        # 标点符号权重
-        punct_weight = 0.5
-        # 空白字符权重
-        whitespace_weight = 0.3
-        # 其他字符权重
-        other_weight = 1.0
-        
-        # 计算总token数
-        estimated_tokens = (
-            chinese_chars * chinese_weight +
-            english_words * english_word_weight +
-            numbers * number_weight +
-            punct_chars * punct_weight +
-            whitespace * whitespace_weight +
-            other_chars * other_weight
-        )
+            self.logger.warning("无法从API获取token数量: %s, 使用本地估算方法", e)
         
-        # 向上取整
-        token_count = int(estimated_tokens + 0.5)
+        # 如果API方法失败，使用改进的本地估算方法（单次走访完成字元分类）
+        token_count, counts = heuristic_token_count(text)
         
-        if hasattr(self, 'logger') and self.logger:
-            self.logger.info(f"文本组成分析: 中文字符 {chinese_chars}, 英文单词 {english_words}, 数字 {numbers}, 标点 {punct_chars}, 空白字符 {whitespace}, 其他字符 {other_chars}")
-            self.logger.info(f"Token 估算: 文本长度 {len(text)} 字符, 估算 {token_count} tokens")
+        self.logger.debug("文本组成分析: 中文字符 %(chinese)s, 英文单词 %(english_words)s, 数字 %(numbers)s, "
+                          "标点 %(punct)s, 空白字符 %(whitespace)s, 其他字符 %(other)s", counts)
+        self.logger.info("Token 估算: 文本长度 %d 字符, 估算 %d tokens", len(text), token_count)
         
+        self.token_counts.put(settings.provider, settings.model, text, token_count, "heuristic")
         return token_count
 
+    def count_tokens_offline(self, text):
+        """
+        不發送網路請求估算 token 數，用於分塊等需要對同一段文本多次計算的場合
+
+        依序使用 token 數快取（含 API 回應 usage 得知的精確值）、本機 BPE 詞表，
+        最後以近期回應的 usage 校正字元類別估算；還沒有 usage 時直接使用字元類別估算。
+        """
+        settings = self._load_api_settings()
+        cached = self.token_counts.get(settings.provider, settings.model, text)
+        # 快取中未校正的字元類別估算不使用
+        if cached is not None and cached[1] != "heuristic":
+            return cached[0]
+        try:
+            token_count = self.tokenizers.count_tokens(text, settings.provider, settings.model)
+            if token_count is not None:
+                self.token_counts.put(settings.provider, settings.model, text, token_count, "local")
+                return token_count
+        except Exception as e:
+            self.logger.warning("本機詞表計算失敗: %s", e)
+        token_count = heuristic_token_count(text)[0]
+        scale = self.token_counts.heuristic_scale(settings.provider, settings.model)
+        if scale:
+            token_count = max(1, int(round(token_count * scale))) if token_count else 0
+        return token_count
+
+    def _token_counter(self, text):
+        """
+        回傳分塊時計算各片段 token 數的函式
+
+        有本機詞表時逐段以詞表計算；否則以整段文本的 count_tokens_offline 結果
+        校正各片段的字元類別估算，避免英文文本被高估而切出不必要的區塊。
+        """
+        settings = self._load_api_settings()
+        try:
+            local_count = self.tokenizers.count_tokens(text, settings.provider, settings.model)
+        except Exception:
+            local_count = None
+        if local_count is not None:
+            return lambda piece: self.tokenizers.count_tokens(piece, settings.provider, settings.model)
+        estimate = heuristic_token_count(text)[0]
+        if not estimate:
+            return lambda piece: heuristic_token_count(piece)[0]
+        scale = self.count_tokens_offline(text) / estimate
+        return lambda piece: int(round(heuristic_token_count(piece)[0] * scale))
+
     def get_token_count_from_api(self, text, provider="gemini"):
         """尝试从API获取精确的token数量"""
         if not text:
@@ -161,19 +240,9 @@ class AIService:
             
         try:
             # 加载API设置
-            libreoffice_dir = os.path.join(os.path.expanduser("~"), ".libreoffice")
-            env_path = os.path.join(libreoffice_dir, ".env")
-            
-            api_key = ""
-            
-            if os.path.exists(env_path):
-                with open(env_path, 'r') as f:
-                    content = f.read()
-                    for line in content.splitlines():
-                        if line.startswith("DEFAULT_PROVIDER="):
-                            provider = line.split("=")[1].strip('"\'')
-                        elif "API_KEY=" in line:
-                            api_key = line.split("=")[1].strip('"\'')
+            settings = self._load_api_settings()
+            provider = settings.provider
+            api_key = settings.api_key
             
             if not api_key:
                 return None
@@ -188,9 +257,8 @@ class AIService:
                 headers = {'Content-Type': 'application/json'}
                 
                 data_bytes = json.dumps(data).encode('utf-8')
-                req = urllib.request.Request(url, data=data_bytes, headers=headers)
                 
-                with urllib.request.urlopen(req) as response:
+                with self.http_pool.urlopen(url, data=data_bytes, headers=headers, timeout=settings.request_timeout) as response:
                     result = json.loads(response.read().decode('utf-8'))
                     return result.get('totalTokens', None)
                     
@@ -204,11 +272,11 @@ class AIService:
                 return None
                 
         except Exception as e:
-            if hasattr(self, 'logger') and self.logger:
-                self.logger.error(f"获取API token数量失败: {str(e)}")
+            self.logger.error("获取API token数量失败: %s", e)
             return None
 
-    def get_target_token_count(self, length_adjustment, current_token_count=None):
+    def get_length_factor(self, length_adjustment):
+        """長度調整選項對應的目標長度倍率；無法解析時回傳 None"""
         length_adjustments = {
             "-75%": 0.4, "-50%": 0.6, "-25%": 0.8,
             "+25%": 2.0, "+50%": 3.0, "+75%": 4.0
@@ -220,20 +288,21 @@ class AIService:
             if match:
                 sign, percentage = match.group(1), int(match.group(2)) / 100
                 adjustment_factor = 1 + percentage if sign == '+' else 1 - percentage
+        return adjustment_factor
+
+    def get_target_token_count(self, length_adjustment, current_token_count=None):
+        adjustment_factor = self.get_length_factor(length_adjustment)
                 
         if current_token_count is None:
             current_token_count = self.previous_token
-            if hasattr(self, 'logger') and self.logger:
-                self.logger.info(f"使用 previous_token: {current_token_count}")
+            self.logger.info("使用 previous_token: %s", current_token_count)
                 
         if current_token_count and adjustment_factor:
             target_count = int(current_token_count * adjustment_factor)
-            if hasattr(self, 'logger') and self.logger:
-                self.logger.info(f"計算目標 token 數: {current_token_count} * {adjustment_factor} = {target_count}")
+            self.logger.info("計算目標 token 數: %s * %s = %s", current_token_count, adjustment_factor, target_count)
             return target_count
 
-        if hasattr(self, 'logger') and self.logger:
-            self.logger.warning("無法計算目標 token 數（缺少 token 或調整因數）")
+        self.logger.warning("無法計算目標 token 數（缺少 token 或調整因數）")
         return None
 
     def create_adjustment_prompt(self, original_text, current_token_count, target_token_count):
@@ -285,16 +354,28 @@ class AIService:
         # 如果已經在範圍內，不需要調整
         return None    
     
-    def ask_ai_with_length_adjustment(self, question, length_adjustment=None, max_attempts=3):
-        """使用長度調整功能發送請求到AI服務"""
+    def create_length_instruction(self, question, requested_token_count):
+        """在第一回合的提示詞前加上明確的目標長度，讓初始回應就接近目標"""
+        lower_bound = int(requested_token_count * 0.9)
+        upper_bound = int(requested_token_count * 1.1)
+        return f"【長度要求】修改後的文本約{requested_token_count}個tokens (容許範圍:{lower_bound}-{upper_bound})，只輸出修改後的文本。\n{question}"
+
+    def ask_ai_with_length_adjustment(self, question, length_adjustment=None, max_attempts=3, cancel_token=None):
+        """
+        使用長度調整功能發送請求到AI服務
+
+        以 LengthController 做閉迴路控制：每回合依模型過去實際達到的長度修正要求的
+        token 數，同時設定提供商的輸出上限，通常一到兩回合即可落在目標 ±10% 範圍內。
+        .env 設定 LENGTH_CANDIDATES=N (N > 1) 時，每回合平行送出 N 個要求長度不同的候選，
+        任一候選落在範圍內即取消其餘請求，以較多的 token 用量換取較短的等待時間。
+        """
         try:
             # 在方法開始時就保存當前的previous_token，整個方法中都使用這個值
             previous_token_value = self.previous_token
             
             # 記錄長度調整參數
-            if hasattr(self, 'logger') and self.logger:
-                self.logger.info(f"====== 開始長度調整流程 ======")
-                self.logger.info(f"長度調整參數: {length_adjustment}, 調用前token數: {previous_token_value}")
+            self.logger.info("====== 開始長度調整流程 ======")
+            self.logger.info("長度調整參數: %s, 調用前token數: %s", length_adjustment, previous_token_value)
             
             # 從提示中提取長度調整指示
             if not length_adjustment:
@@ -302,116 +383,185 @@ class AIService:
                 
             # 如果沒有長度調整指示，不進行調整
             if not length_adjustment:
-                if hasattr(self, 'logger') and self.logger:
-                    self.logger.info(f"未找到長度調整參數，不進行調整")
-                initial_response = self.ask_ai(question)
+                self.logger.info("未找到長度調整參數，不進行調整")
+                initial_response = self.ask_ai(question, cancel_token=cancel_token, raise_errors=True)
                 current_token_count = self.estimate_token_count(initial_response)
                 self.previous_token = current_token_count
                 return initial_response
             
-            # 獲取初始回應
-            initial_response = self.ask_ai(question)
-                
-            # 估算當前回應的token數
-            current_token_count = self.estimate_token_count(initial_response)
-
-            # 計算目標token數（一律使用previous_token_value而不是current_token_count）
+            # 計算目標token數（一律使用previous_token_value），第一回合就需要目標才能控制長度
             target_token_count = self.get_target_token_count(length_adjustment, previous_token_value)
             
             # 如果無法計算目標token數，直接返回初始結果
             if not target_token_count:
-                if hasattr(self, 'logger') and self.logger:
-                    self.logger.warning("無法計算目標 token 數量，返回初始回應")
-                return initial_response
-                
-            # 檢查初始回應的token數是否已經接近目標
-            token_diff = abs(current_token_count - target_token_count)
-            token_diff_percent = (token_diff / target_token_count) * 100
-            
-            # 如果已經足夠接近目標（差距小於10%），直接返回初始回應
-            if token_diff_percent < 10:
-                if hasattr(self, 'logger') and self.logger:
-                    self.logger.info(f"初始回應的 token 數已接近目標 (差距 {token_diff_percent:.2f}% < 10%)，不需調整")
+                self.logger.warning("無法計算目標 token 數量，返回初始回應")
+                initial_response = self.ask_ai(question, cancel_token=cancel_token, raise_errors=True)
+                self.estimate_token_count(initial_response)
                 return initial_response
-                
-            # 準備進行長度調整
-            best_response = initial_response
-            best_token_count = current_token_count
-            best_token_diff = token_diff
-            
-            # 多次嘗試調整長度
-            for attempt in range(1, max_attempts):
-                # 計算與目標的差距
-                token_diff_percent = (abs(best_token_count - target_token_count) / target_token_count) * 100
-                
-                if hasattr(self, 'logger') and self.logger:
-                    self.logger.info(f"調整嘗試 #{attempt}, 當前 token 數: {best_token_count}, 與目標 {target_token_count} 的差距: {token_diff_percent:.2f}%")
-                
-                # 如果差距在可接受範圍內（10%以內），停止調整
-                if token_diff_percent <= 10:
-                    if hasattr(self, 'logger') and self.logger:
-                        self.logger.info(f"差距在可接受範圍內 ({token_diff_percent:.2f}% ≤ 10%), 停止調整")
+
+            # 長度控制器只在調整長度時使用，延遲到第一次需要時才匯入
+            from length_controller import LengthController, get_length_response_model
+
+            settings = self._load_api_settings()
+            response_model = get_length_response_model()
+            controller = LengthController(
+                target_token_count, previous_token_value, max_rounds=max_attempts,
+                exponent=response_model.exponent(settings.provider, settings.model),
+                output_limit=settings.max_tokens, model=settings.model
+            )
+            candidates = settings.length_candidates
+            self.logger.info("長度控制器: 目標 %d tokens (容許範圍:%d-%d), 模型反應係數 k=%.2f, 每回合候選數 %d",
+                             target_token_count, controller.lower_bound, controller.upper_bound, controller.exponent, candidates)
+
+            initial_token_count = None
+            while True:
+                # 使用者取消時不再發送後續調整請求
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+
+                requests = controller.next_requests(candidates)
+                if not requests:
                     break
-                    
-                # 創建調整提示
-                adjustment_prompt = self.create_adjustment_prompt(
-                    best_response, best_token_count, target_token_count
-                )
-                
+
+                best_response, best_token_count = controller.best
+                prompts = []
+                for request in requests:
+                    if request.round_number == 1:
+                        prompt = self.create_length_instruction(question, request.requested_tokens)
+                    else:
+                        prompt = self.create_adjustment_prompt(best_response, best_token_count, request.requested_tokens)
+                    if prompt:
+                        prompts.append((request, prompt))
+                        self.logger.info("第 %d 回合: 基準 %d tokens, 要求 %d tokens, 輸出上限 %d", request.round_number,
+                                         request.current_tokens, request.requested_tokens, request.max_tokens)
+
                 # 如果沒有需要調整的提示，停止調整
-                if not adjustment_prompt:
-                    if hasattr(self, 'logger') and self.logger:
-                        self.logger.info("無需調整提示，停止調整")
+                if not prompts:
+                    self.logger.info("無需調整提示，停止調整")
                     break
-                    
-                # 發送調整請求
-                try:
-                    if hasattr(self, 'logger') and self.logger:
-                        self.logger.info(f"發送第 {attempt} 次調整請求")
-                        
-                    adjusted_response = self.ask_ai(adjustment_prompt)
-                    adjusted_token_count = self.estimate_token_count(adjusted_response)
-                    adjusted_token_diff = abs(adjusted_token_count - target_token_count)
-                    
-                    if hasattr(self, 'logger') and self.logger:
-                        self.logger.info(f"調整後 token 數: {adjusted_token_count}, 與目標差距: {adjusted_token_diff} tokens ({(adjusted_token_diff / target_token_count * 100):.2f}%)")
-                    
-                    # 如果調整後的結果更接近目標，採用這個結果
-                    if adjusted_token_diff < best_token_diff:
-                        if hasattr(self, 'logger') and self.logger:
-                            self.logger.info(f"採用新調整結果: 從 {best_token_count} tokens → {adjusted_token_count} tokens")
-                            self.logger.info(f"改善程度: {best_token_diff - adjusted_token_diff} tokens ({(best_token_diff - adjusted_token_diff) / target_token_count * 100:.2f}%)")
-                            
-                        best_token_diff = adjusted_token_diff
-                        best_response = adjusted_response
-                        best_token_count = adjusted_token_count
-                    else:
-                        if hasattr(self, 'logger') and self.logger:
-                            self.logger.info(f"保留先前結果，新調整沒有改善（{best_token_count} tokens 優於 {adjusted_token_count} tokens）")
-                except Exception as e:
-                    # 調整失敗，繼續使用最佳結果
-                    if hasattr(self, 'logger') and self.logger:
-                        self.logger.error(f"調整請求失敗: {str(e)}")
-                    pass
-            
-            if hasattr(self, 'logger') and self.logger:
-                self.logger.info(f"長度調整完成，最終 token 數: {best_token_count}")
-                self.logger.info(f"目標 token 數: {target_token_count}, 最終差異: {best_token_diff} tokens ({(best_token_diff / target_token_count * 100):.2f}%)")
-                if current_token_count != best_token_count:
-                    change_percentage = ((best_token_count - current_token_count) / current_token_count * 100)
-                    direction = "增加" if change_percentage > 0 else "減少"
-                    self.logger.info(f"與初始回應相比: {direction} {abs(change_percentage):.2f}% ({abs(best_token_count - current_token_count)} tokens)")
-                self.logger.info("====== 長度調整流程完成 ======")
+
+                if len(prompts) > 1:
+                    results = self._ask_length_candidates(controller, prompts, cancel_token)
+                else:
+                    request, prompt = prompts[0]
+                    response_info = {}
+                    try:
+                        response = self.ask_ai(prompt, cancel_token=cancel_token, max_tokens=request.max_tokens,
+                                               raise_errors=True, response_info=response_info)
+                        token_count = self.estimate_token_count(response)
+                    except AIServiceError as e:
+                        # 第一回合失敗時沒有可用結果，交由外層處理；之後的調整失敗則保留最佳結果
+                        if request.round_number == 1:
+                            raise
+                        self.logger.error("調整請求失敗: %s", e)
+                        break
+                    truncated = self.is_truncated(response_info)
+                    results = [(request, token_count, controller.observe(response, token_count, request=request,
+                                                                         truncated=truncated))]
+
+                # 平行候選全部失敗時沒有新的觀察，不再繼續
+                if not results:
+                    if controller.best[1] is None:
+                        raise Exception("所有長度候選請求皆失敗")
+                    break
+
+                for request, token_count, improved in results:
+                    if initial_token_count is None:
+                        initial_token_count = token_count
+                    token_diff = abs(token_count - target_token_count)
+                    self.logger.info("第 %d 回合結果 (要求 %d): %d tokens, 與目標差距 %d tokens (%.2f%%), %s, 修正後 k=%.2f",
+                                     request.round_number, request.requested_tokens, token_count, token_diff,
+                                     token_diff / target_token_count * 100, '採用' if improved else '保留先前結果',
+                                     controller.exponent)
+
+            # 本次觀察更新模型的反應係數，下一次請求的第一回合即可使用
+            response_model.update(settings.provider, settings.model, controller.observations)
+
+            best_response, best_token_count = controller.best
+            if controller.best_truncated:
+                self.logger.warning("所有回合的回應都因達到輸出上限而被截斷，回傳最接近目標的截斷回應")
+            best_token_diff = abs(best_token_count - target_token_count)
+            self.logger.info("長度調整完成，共 %d 回合，最終 token 數: %d", controller.rounds, best_token_count)
+            self.logger.info("目標 token 數: %d, 最終差異: %d tokens (%.2f%%)", target_token_count, best_token_diff,
+                             best_token_diff / target_token_count * 100)
+            if initial_token_count and initial_token_count != best_token_count:
+                change_percentage = ((best_token_count - initial_token_count) / initial_token_count * 100)
+                direction = "增加" if change_percentage > 0 else "減少"
+                self.logger.info("與初始回應相比: %s %.2f%% (%d tokens)", direction, abs(change_percentage),
+                                 abs(best_token_count - initial_token_count))
+            self.logger.info("====== 長度調整流程完成 ======")
             
             # 只在方法最後更新previous_token
             self.previous_token = best_token_count  # 確保這一行只在方法末尾出現一次
 
             return best_response
+        except RequestCancelled:
+            self.logger.info("長度調整流程已被使用者取消")
+            raise
+        except AIServiceError:
+            # 請求失敗的訊息已由 ask_ai 記錄，直接交給呼叫端顯示
+            raise
         except Exception as e:
-            if hasattr(self, 'logger') and self.logger:
-                self.logger.error(f"長度調整過程出錯: {str(e)}")
+            self.logger.error("長度調整過程出錯: %s", e)
             raise Exception(f"長度調整過程出錯: {str(e)}")
             
+    def _ask_length_candidates(self, controller, prompts, cancel_token=None):
+        """
+        平行送出同一回合的長度候選
+
+        每個候選使用獨立的子 CancelToken；任一候選落在容許範圍內時，
+        立即取消其餘仍在等待的請求並返回，不等待被取消的執行緒結束。
+        失敗的候選直接捨棄；候選不記錄回應狀態，previous_token 由呼叫端依最佳結果設定。
+
+        Args:
+            controller: LengthController，每個抵達的回應都會交給 observe
+            prompts: (LengthRequest, 提示詞) 的列表
+
+        Returns:
+            list: 依抵達順序的 (LengthRequest, token 數, 是否成為最佳結果)
+        """
+        parent_token = cancel_token if cancel_token is not None else CancelToken()
+        candidate_tokens = [parent_token.child() for _ in prompts]
+
+        def run(prompt, request, token):
+            # 候選平行執行，不更新 previous_token 等共用狀態；被取消後仍在執行的候選也不會覆寫
+            response_info = {}
+            response = self.ask_ai(prompt, cancel_token=token, max_tokens=request.max_tokens,
+                                   raise_errors=True, record=False, response_info=response_info)
+            token.raise_if_cancelled()
+            return response, self.estimate_token_count(response), self.is_truncated(response_info)
+
+        pool = ThreadPoolExecutor(max_workers=len(prompts), thread_name_prefix="length-candidate")
+        futures = {
+            pool.submit(run, prompt, request, token): request
+            for (request, prompt), token in zip(prompts, candidate_tokens)
+        }
+        results = []
+        try:
+            for future in as_completed(futures):
+                request = futures[future]
+                try:
+                    response, token_count, truncated = future.result()
+                except RequestCancelled:
+                    continue
+                except AIServiceError as e:
+                    self.logger.error("長度候選請求失敗 (要求 %d): %s", request.requested_tokens, e.message)
+                    continue
+                results.append((request, token_count,
+                                controller.observe(response, token_count, request=request, truncated=truncated)))
+                if controller.converged:
+                    break
+        finally:
+            # 取消仍在進行中的候選（已完成的候選取消不會有任何作用）
+            for token in candidate_tokens:
+                token.cancel()
+                parent_token.release_child(token)
+            pool.shutdown(wait=False)
+
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        return results
+
     def validate_api_key(self, api_key, provider):
         """驗證API金鑰是否有效"""
         try:
@@ -419,28 +569,25 @@ class AIService:
             if provider == "gemini":
                 url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash?key={api_key}"
                 headers = {'Content-Type': 'application/json'}
-                req = urllib.request.Request(url, headers=headers, method='GET')
             elif provider == "openai":
                 url = "https://api.openai.com/v1/models"
                 headers = {'Authorization': f'Bearer {api_key}'}
-                req = urllib.request.Request(url, headers=headers, method='GET')
             elif provider == "claude":
                 url = "https://api.anthropic.com/v1/models"
                 headers = {
                     'x-api-key': api_key,
                     'anthropic-version': '2023-06-01'
                 }
-                req = urllib.request.Request(url, headers=headers, method='GET')
             elif provider == "mistral":
                 url = "https://api.mistral.ai/v1/models"
                 headers = {'Authorization': f'Bearer {api_key}'}
-                req = urllib.request.Request(url, headers=headers, method='GET')
             else:
                 return False, f"不支援的AI提供商: {provider}"
                 
             # 發送請求檢查API金鑰有效性
             try:
-                with urllib.request.urlopen(req, timeout=5) as response:
+                with self.http_pool.urlopen(url, headers=headers, method='GET', timeout=5) as response:
+                    response.read()  # 讀完回應內容，讓連線可以歸還連線池
                     if response.getcode() == 200:
                         return True, "API金鑰有效"
                     else:
@@ -449,11 +596,469 @@ class AIService:
                 return False, f"API金鑰驗證失敗: {str(e)}"
                 
         except Exception as e:
-            if hasattr(self, 'logger') and self.logger:
-                self.logger.error(f"API金鑰驗證過程出錯: {str(e)}")
+            self.logger.error("API金鑰驗證過程出錯: %s", e)
             return False, f"API金鑰驗證過程出錯: {str(e)}"
             
-    def ask_ai(self, question, dialog=None, generate_prompt=False, selected_options=None, config_manager=None):
+    def _load_api_settings(self):
+        """
+        取得目前的API設定快照（只有 .env 變更時才會重新解析）
+
+        Returns:
+            EnvSettings: 設定快照
+        """
+        settings = self.settings_service.get()
+        if settings.log_level != self._log_level:
+            self._log_level = settings.log_level
+            set_level(settings.log_level)
+        if settings.http_pool_size is not None and settings.http_pool_size != self.http_pool.max_per_host:
+            self.http_pool.configure(max_per_host=settings.http_pool_size)
+        return settings
+
+    def _generation_params(self, settings):
+        """由設定快照取得生成參數"""
+        return {
+            "temperature": settings.temperature,
+            "max_tokens": settings.max_tokens
+        }
+
+    def _build_request(self, provider, model, api_key, question, params, stream=False, conversation=None):
+        """
+        根據不同的AI提供商建立API請求
+
+        Args:
+            params: 生成參數字典，包含 temperature 與 max_tokens
+            conversation: 多輪對話；指定時請求包含文件與歷史問答，question 為本輪的新問題
+
+        Returns:
+            tuple: (url, headers, data)
+        """
+        headers = {'Content-Type': 'application/json'}
+        if conversation is not None:
+            messages = conversation.chat_messages(question)
+        else:
+            messages = [{"role": "user", "content": question}]
+        
+        if provider == "gemini":
+            if stream:
+                url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent?alt=sse&key={api_key}"
+            else:
+                url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}"
+            data = {
+                "contents": [{"parts": [{"text": question}]}],
+                "generationConfig": {
+                    "temperature": params["temperature"],
+                    "maxOutputTokens": params["max_tokens"]
+                }
+            }
+            if conversation is not None:
+                data.update(conversation.gemini_fields(model, question))
+        elif provider == "openai":
+            url = "https://api.openai.com/v1/chat/completions"
+            data = {
+                "model": model,
+                "messages": messages,
+                "temperature": params["temperature"],
+                "max_tokens": params["max_tokens"]
+            }
+            if conversation is not None and conversation.document:
+                # 相同文件的請求導向同一組快取，提高前綴快取的命中率
+                data["prompt_cache_key"] = conversation.cache_key
+            if stream:
+                data["stream"] = True
+                # 要求在最後一個串流區塊中附上token使用量
+                data["stream_options"] = {"include_usage": True}
+            headers['Authorization'] = f'Bearer {api_key}'
+        elif provider == "claude":
+            url = "https://api.anthropic.com/v1/messages"
+            data = {
+                "model": model,
+                "max_tokens": params["max_tokens"],
+                "messages": messages,
+                "temperature": params["temperature"]
+            }
+            if conversation is not None:
+                data.update(conversation.claude_fields(question))
+            if stream:
+                data["stream"] = True
+            headers.update({
+                'anthropic-version': '2023-06-01', 
+                'x-api-key': api_key
+            })
+        elif provider == "mistral":
+            url = "https://api.mistral.ai/v1/chat/completions"
+            data = {
+                "model": model,
+                "messages": messages,
+                "temperature": params["temperature"],
+                "max_tokens": params["max_tokens"]
+            }
+            if stream:
+                data["stream"] = True
+            headers['Authorization'] = f'Bearer {api_key}'
+        else:
+            raise AIServiceError("不支援的提供商", f"不支援的AI提供商: {provider}")
+
+        if stream:
+            headers['Accept'] = 'text/event-stream'
+        return url, headers, data
+
+    def _reserved_tokens(self, question, params, conversation=None):
+        """發送請求前向速率限制器預扣的 token 數：估計的輸入 token 數加上輸出上限"""
+        if conversation is not None:
+            question = conversation.prompt_text(question)
+        return heuristic_token_count(question)[0] + (params.get("max_tokens") or 0)
+
+    def _prepare_conversation(self, settings, conversation, cancel_token=None):
+        """
+        Gemini 對話的文件夠長時建立 cachedContents，之後各輪以名稱引用文件
+
+        建立失敗（例如模型不支援或低於最低 token 數）時記錄下來，這段對話改為每輪附上文件。
+        """
+        if settings.provider != "gemini":
+            return
+        if not conversation.needs_gemini_cache(settings.model, self.count_tokens_offline):
+            return
+        url = f"https://generativelanguage.googleapis.com/v1beta/cachedContents?key={settings.api_key}"
+        data = {
+            "model": f"models/{settings.model}",
+            "systemInstruction": conversation.gemini_system_instruction(),
+            "ttl": f"{GEMINI_CACHE_TTL}s"
+        }
+        try:
+            with self.http_pool.urlopen(url, data=json.dumps(data).encode('utf-8'),
+                                        headers={'Content-Type': 'application/json'},
+                                        timeout=settings.request_timeout, cancel_token=cancel_token) as response:
+                result = json.loads(response.read().decode('utf-8'))
+        except (urllib.error.URLError, ValueError) as e:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            conversation.gemini_cache_failed.add(settings.model)
+            self.logger.warning("無法建立 Gemini 對話快取 (%s)，改為每輪附上文件: %s", settings.model, e)
+            return
+        conversation.set_gemini_cache(settings.model, result["name"])
+        self.logger.info("已建立 Gemini 對話快取 %s (%s)", result["name"], settings.model)
+
+    def _send(self, settings, url, data_bytes, headers, reserved_tokens, cancel_token=None, timer=None):
+        """
+        發送請求並回傳回應物件，記錄取得回應標頭所需的時間
+
+        .env 設定 HEDGE_REQUESTS=true 且已有足夠的延遲樣本時，請求超過該模型近期的 p95 延遲
+        仍未回應，會再送出一個相同的請求，採用先回應者並中斷另一個。
+        """
+        key = (settings.provider, settings.model)
+        hedge_after = self.latency_tracker.percentile(key, HEDGE_PERCENTILE) if settings.hedge_requests else None
+
+        def open_response(token):
+            start = time.monotonic()
+            response = self._open_limited(settings, url, data_bytes, headers, reserved_tokens, token)
+            self.latency_tracker.record(key, time.monotonic() - start)
+            return response
+
+        response = hedged_call(open_response, hedge_after, cancel_token,
+                               discard=lambda response: response.close(), stats=self.retry_policy)
+        if timer is not None:
+            timer.add_response(response.timings)
+        return response
+
+    def _log_retry(self, error, retry_number, delay):
+        self.logger.warning("暫時性錯誤: %s，%.1f 秒後第 %d 次重試", error, delay, retry_number)
+
+    def _log_timings(self, timer):
+        if self.logger.isEnabledFor(logging.INFO):
+            phases = ", ".join(f"{phase}={seconds * 1000:.0f}ms" for phase, seconds in timer.phases.items())
+            self.logger.info("請求計時 (%s/%s): %s", timer.provider, timer.model, phases)
+
+    def get_diagnostics_report(self):
+        """回傳診斷面板顯示的報表：各模型的分段延遲與吞吐量，以及快取、速率限制、重試與路由統計"""
+        lines = [self.metrics.format_report(), "", "■ 其他統計"]
+        for name, stats in (("回應快取", self.get_cache_stats()),
+                            ("相似提示詞快取", self.get_semantic_cache_stats()),
+                            ("token數快取", self.get_token_count_stats()),
+                            ("速率限制", self.get_rate_limit_stats()),
+                            ("重試與對沖", self.get_retry_stats()),
+                            ("提供商路由", self.get_routing_stats())):
+            lines.append(f"  {name}: {stats}")
+        lines.append(f"  日誌: 等級 {logging.getLevelName(self.logger.getEffectiveLevel())}, 佇列已滿丟棄 {dropped_records()} 筆")
+        lines.append("")
+        lines.append(f"統計檔案: {self.metrics.path}")
+        return "\n".join(lines)
+
+    def get_routing_stats(self):
+        """回傳提供商備援次數、競速勝出次數與冷卻中的提供商"""
+        return self.router.stats()
+
+    def get_retry_stats(self):
+        """回傳重試、對沖次數與各模型的 p95 延遲"""
+        stats = self.retry_policy.stats()
+        stats["p95_latency"] = self.latency_tracker.stats()
+        return stats
+
+    def _open_limited(self, settings, url, data_bytes, headers, reserved_tokens, cancel_token=None):
+        """
+        經過速率限制器發送請求並回傳回應物件
+
+        額度不足時在用戶端排隊等待；收到 429 時依 Retry-After 暫停同一金鑰的請求後重送，
+        最多 RATE_LIMIT_RETRIES 次。其他 HTTP 錯誤照常拋出 urllib.error.URLError。
+        """
+        provider, api_key = settings.provider, settings.api_key
+        self.rate_limiter.configure(provider, settings.rate_limit_rpm, settings.rate_limit_tpm)
+        queued = 0.0
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            try:
+                waited = self.rate_limiter.acquire(provider, api_key, reserved_tokens, cancel_token)
+                queued += waited
+            except RateLimitExceeded as e:
+                raise AIServiceError("API速率限制", str(e))
+            if waited:
+                self.logger.info("速率限制: %s 請求排隊 %.1f 秒", provider, waited)
+
+            try:
+                response = self.http_pool.urlopen(url, data=data_bytes, headers=headers,
+                                                  timeout=settings.request_timeout, cancel_token=cancel_token)
+            except urllib.error.HTTPError as e:
+                if e.code != 429:
+                    raise
+                # 被拒絕的請求沒有使用 token，退回預扣的額度
+                self.rate_limiter.settle(provider, api_key, reserved_tokens, 0)
+                try:
+                    body = e.read().decode('utf-8', 'replace')
+                except Exception:
+                    body = ""
+                if attempt == RATE_LIMIT_RETRIES:
+                    raise AIServiceError("API速率限制", f"已達 {provider} 的速率限制，請稍後再試")
+                delay = self.rate_limiter.on_rate_limited(provider, api_key, e.headers, body)
+                self.logger.warning("速率限制: %s 回應 429，%.1f 秒後重送 (第 %d 次)", provider, delay, attempt + 1)
+                continue
+
+            self.rate_limiter.update_from_headers(provider, api_key, response.headers)
+            response.timings["queue"] = queued
+            return response
+
+    def get_rate_limit_stats(self):
+        """回傳速率限制器的排隊與 429 統計"""
+        return self.rate_limiter.stats()
+
+    def _parse_response(self, provider, result):
+        """
+        根據不同的AI提供商解析回應
+
+        Returns:
+            tuple: (response_text, token_info)
+        """
+        response_text = ""
+        token_info = None
+        
+        if provider == "gemini":
+            if 'candidates' in result and result['candidates']:
+                response_text = result.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '')
+                # 提取token使用情況
+                if 'usageMetadata' in result:
+                    token_info = {
+                        'prompt_tokens': result['usageMetadata'].get('promptTokenCount', 0),
+                        'completion_tokens': result['usageMetadata'].get('candidatesTokenCount', 0),
+                        'total_tokens': result['usageMetadata'].get('totalTokenCount', 0),
+                        'cached_tokens': result['usageMetadata'].get('cachedContentTokenCount', 0)
+                    }
+            else:
+                raise AIServiceError("Gemini錯誤", f"Gemini API錯誤: {result.get('error', {}).get('message', '未知錯誤')}")
+        elif provider in ("openai", "mistral"):
+            if 'choices' in result and result['choices']:
+                response_text = result.get('choices', [{}])[0].get('message', {}).get('content', '')
+                # 提取token使用情況
+                if 'usage' in result:
+                    token_info = {
+                        'prompt_tokens': result['usage'].get('prompt_tokens', 0),
+                        'completion_tokens': result['usage'].get('completion_tokens', 0),
+                        'total_tokens': result['usage'].get('total_tokens', 0),
+                        'cached_tokens': (result['usage'].get('prompt_tokens_details') or {}).get('cached_tokens', 0)
+                    }
+            else:
+                name = "OpenAI" if provider == "openai" else "Mistral"
+                raise AIServiceError(f"{name}錯誤", f"{name} API錯誤: {result.get('error', {}).get('message', '未知錯誤')}")
+        elif provider == "claude":
+            if 'content' in result:
+                response_text = result.get('content', [{}])[0].get('text', '')
+                # 提取token使用情況
+                if 'usage' in result:
+                    # input_tokens 不含寫入與讀取快取的部分，prompt_tokens 以三者合計
+                    prompt_tokens = self._claude_prompt_tokens(result['usage'])
+                    token_info = {
+                        'prompt_tokens': prompt_tokens,
+                        'completion_tokens': result['usage'].get('output_tokens', 0),
+                        'total_tokens': prompt_tokens + result['usage'].get('output_tokens', 0),
+                        'cached_tokens': result['usage'].get('cache_read_input_tokens') or 0
+                    }
+            else:
+                raise AIServiceError("Claude錯誤", f"Claude API錯誤: {result.get('error', {}).get('message', '未知錯誤')}")
+
+        finish_reason = self._finish_reason(provider, result)
+        if finish_reason:
+            token_info = dict(token_info or {}, finish_reason=finish_reason)
+        return response_text, token_info
+
+    @staticmethod
+    def _finish_reason(provider, payload):
+        """回應或串流事件中的結束原因，沒有時回傳 None"""
+        if provider == "gemini":
+            return (payload.get('candidates') or [{}])[0].get('finishReason')
+        if provider in ("openai", "mistral"):
+            return (payload.get('choices') or [{}])[0].get('finish_reason')
+        if provider == "claude":
+            return payload.get('stop_reason') or (payload.get('delta') or {}).get('stop_reason')
+        return None
+
+    @staticmethod
+    def is_truncated(token_info):
+        """
+        回應是否因達到輸出上限而被截斷
+
+        Returns:
+            bool: 依提供商回傳的結束原因判斷；token_info 中沒有結束原因時回傳 None
+        """
+        finish_reason = (token_info or {}).get('finish_reason')
+        if not finish_reason:
+            return None
+        return finish_reason in TRUNCATED_FINISH_REASONS
+
+    @staticmethod
+    def _claude_prompt_tokens(usage):
+        return ((usage.get('input_tokens') or 0) + (usage.get('cache_creation_input_tokens') or 0)
+                + (usage.get('cache_read_input_tokens') or 0))
+
+    def _parse_stream_event(self, provider, event, payload, usage):
+        """
+        解析單一串流事件，回傳其中的文字片段並更新 usage 字典
+
+        Returns:
+            str: 本事件新增的文字（可能為空字串）
+        """
+        if 'error' in payload or event == "error":
+            message = payload.get('error', {}).get('message', '未知錯誤')
+            raise AIServiceError("串流錯誤", f"{provider} API串流錯誤: {message}")
+        finish_reason = self._finish_reason(provider, payload)
+        if finish_reason:
+            usage['finish_reason'] = finish_reason
+
+        if provider == "gemini":
+            if 'usageMetadata' in payload:
+                usage['prompt_tokens'] = payload['usageMetadata'].get('promptTokenCount', 0)
+                usage['completion_tokens'] = payload['usageMetadata'].get('candidatesTokenCount', 0)
+                usage['total_tokens'] = payload['usageMetadata'].get('totalTokenCount', 0)
+                usage['cached_tokens'] = payload['usageMetadata'].get('cachedContentTokenCount', 0)
+            candidates = payload.get('candidates') or [{}]
+            parts = candidates[0].get('content', {}).get('parts') or [{}]
+            return "".join(part.get('text', '') for part in parts)
+
+        if provider in ("openai", "mistral"):
+            if payload.get('usage'):
+                usage['prompt_tokens'] = payload['usage'].get('prompt_tokens', 0)
+                usage['completion_tokens'] = payload['usage'].get('completion_tokens', 0)
+                usage['total_tokens'] = payload['usage'].get('total_tokens', 0)
+                usage['cached_tokens'] = (payload['usage'].get('prompt_tokens_details') or {}).get('cached_tokens', 0)
+            choices = payload.get('choices') or [{}]
+            return choices[0].get('delta', {}).get('content') or ''
+
+        if provider == "claude":
+            if event == "message_start":
+                message_usage = payload.get('message', {}).get('usage', {})
+                usage['prompt_tokens'] = self._claude_prompt_tokens(message_usage)
+                usage['cached_tokens'] = message_usage.get('cache_read_input_tokens') or 0
+                usage['completion_tokens'] = message_usage.get('output_tokens', 0)
+            elif event == "message_delta":
+                usage['completion_tokens'] = payload.get('usage', {}).get('output_tokens', usage.get('completion_tokens', 0))
+            elif event == "content_block_delta":
+                return payload.get('delta', {}).get('text', '')
+            if usage:
+                usage['total_tokens'] = usage.get('prompt_tokens', 0) + usage.get('completion_tokens', 0)
+            return ''
+
+        return ''
+
+    def _cache_lookup(self, settings, params, question, use_cache):
+        """
+        查詢回應快取
+
+        Returns:
+            tuple: (cache_key, entry)；停用快取時 cache_key 為 None，未命中時 entry 為 None
+        """
+        if not (use_cache and settings.response_cache):
+            return None, None
+        cache_key = ResponseCache.make_key(settings.provider, settings.model, params, question)
+        entry = self.response_cache.get(cache_key)
+        if entry is not None:
+            self.logger.info("回應快取命中 (%s/%s)，略過API請求", settings.provider, settings.model)
+        elif settings.semantic_cache:
+            # 精確快取未命中時，尋找只差在標點、空白或少數字的已快取提示詞
+            self.semantic_cache.configure(threshold=settings.semantic_cache_threshold)
+            scope = SemanticCache.make_scope(settings.provider, settings.model, params)
+            similar_key, similarity = self.semantic_cache.lookup(scope, question)
+            if similar_key is not None and similar_key != cache_key:
+                entry = self.response_cache.get(similar_key)
+                if entry is None:
+                    # 回應已從回應快取中淘汰或過期
+                    self.semantic_cache.discard(similar_key)
+                else:
+                    self.logger.info("相似提示詞快取命中 (%s/%s, 相似度 %.2f)，略過API請求",
+                                     settings.provider, settings.model, similarity)
+        return cache_key, entry
+
+    def _cache_store(self, settings, params, cache_key, question, response_text, token_info):
+        """將回應存入回應快取，並把提示詞加入相似提示詞索引"""
+        self.response_cache.put(cache_key, response_text, token_info)
+        if settings.semantic_cache and response_text:
+            scope = SemanticCache.make_scope(settings.provider, settings.model, params)
+            self.semantic_cache.add(scope, question, cache_key)
+
+    def get_cache_stats(self):
+        """回傳回應快取的命中統計"""
+        return self.response_cache.stats()
+
+    def get_semantic_cache_stats(self):
+        """回傳相似提示詞快取的命中統計"""
+        return self.semantic_cache.stats()
+
+    def get_token_count_stats(self):
+        """回傳token數快取的命中統計"""
+        return self.token_counts.stats()
+
+    def _fail(self, dialog, error):
+        """記錄並顯示錯誤，回傳錯誤訊息字串"""
+        if dialog:
+            dialog.show_error(error.title, error.message)
+        self.logger.error(error.message)
+        return error.message
+
+    def _record_response(self, response_text, token_info, settings=None, record=True):
+        """
+        記錄API回應並保存token資訊，並以usage中的completion_tokens預先填入token數快取
+
+        record 為 False 時只記錄日誌與填入token數快取，不更新 previous_token 與 last_token_info。
+        """
+        # 回應內容只在 DEBUG 等級記錄，避免批次處理時寫入大量文字
+        self.logger.debug("API 回應: %s", Truncated(response_text))
+        if token_info:
+            self.logger.info("Token使用: %s", token_info)
+        if settings is not None:
+            self.token_counts.seed_from_usage(settings.provider, settings.model, response_text, token_info)
+        if not record:
+            return
+
+        if token_info and 'completion_tokens' in token_info:
+            # 保存當前的completion_tokens到previous_token
+            self.previous_token = token_info['completion_tokens']
+            
+            # 計算目標token數（使用previous_token而不是當前token）
+            if self.length_adjustment_factor:
+                target_tokens = int(self.previous_token * self.length_adjustment_factor)
+                self.logger.debug("目標token數: %d = 上次保存的token數 %d × 長度調整因數 %s",
+                                  target_tokens, self.previous_token, self.length_adjustment_factor)
+
+        # 存儲token信息並轉換為字符串
+        if token_info:
+            self.last_token_info = token_info
+            self.token_info_str = str(token_info)  # 轉為字符串
+
+    def ask_ai(self, question, dialog=None, generate_prompt=False, selected_options=None, config_manager=None, cancel_token=None, use_cache=True, max_tokens=None, raise_errors=False, provider=None, conversation=None, record=True, response_info=None):
         """
         直接發送請求到AI服務API
 
@@ -463,19 +1068,27 @@ class AIService:
             generate_prompt: 是否僅生成提示詞模板
             selected_options: 選擇的選項字典
             config_manager: 配置管理器實例
+            cancel_token: CancelToken，取消時中斷請求並拋出 RequestCancelled
+            use_cache: 是否使用回應快取，False 時一定會發送API請求
+            max_tokens: 本次請求的輸出上限，未指定時使用 .env 的 MAX_TOKENS
+            raise_errors: 為 True 時失敗會拋出 AIServiceError，而不是回傳錯誤訊息字串
+            provider: 指定提供商；未指定時依 .env 的 ROUTING_MODE 在各提供商之間分派
+            conversation: 多輪對話；指定時 question 為本輪的新問題，請求包含文件與歷史問答且不使用回應快取
+            record: 為 False 時不更新 previous_token 與 last_token_info；平行的請求（長度候選、批次處理）
+                使用，避免彼此覆寫
+            response_info: 傳入 dict 時填入本次回應的 token_info（包含結束原因 finish_reason），不受 record 影響
             
         Returns:
             str: AI的回應文本或在錯誤情況下的錯誤訊息
         """
-        # 在類中添加一個屬性來存儲上次的token信息
-        self.last_token_info = None
-        self.token_info_str = None  # 新增一個字符串版本的token信息
+        if record:
+            # 在類中添加一個屬性來存儲上次的token信息
+            self.last_token_info = None
+            self.token_info_str = None  # 新增一個字符串版本的token信息
+        timer = None
         try:
-            # 記錄API請求
-            if hasattr(self, 'logger') and self.logger:
-                # 限制日誌中的提示詞長度
-                log_question = question[:200] + "..." if len(question) > 200 else question
-                self.logger.info(f"API 請求: {log_question}")
+            # 記錄API請求（提示詞只在 DEBUG 等級記錄，並限制長度）
+            self.logger.debug("API 請求: %s", Truncated(question))
                 
             # 如果是生成提示詞模式且傳入了config_manager
             if generate_prompt and selected_options and config_manager:
@@ -485,218 +1098,423 @@ class AIService:
                 )
         
             # 載入API設定
-            libreoffice_dir = os.path.join(os.path.expanduser("~"), ".libreoffice")
-            env_path = os.path.join(libreoffice_dir, ".env")
-        
-            provider = "gemini"  # 預設
-            api_key = ""
-            model = ""  # 添加模型變數
-        
-            if os.path.exists(env_path):
-                with open(env_path, 'r') as f:
-                    content = f.read()
-                    for line in content.splitlines():
-                        if line.startswith("DEFAULT_PROVIDER="):
-                            provider = line.split("=")[1].strip('"\'')
-                        elif "API_KEY=" in line:
-                            api_key = line.split("=")[1].strip('"\'')
-                        elif line.startswith(f"{provider.upper()}_MODEL="):  # 讀取模型配置
-                            model = line.split("=")[1].strip('"\'')
+            started = time.perf_counter()
+            settings = self._load_api_settings()
+            if provider is None and settings.routing_mode != "single":
+                return self.router.route(
+                    settings,
+                    lambda name, token: self.ask_ai(question, cancel_token=token, use_cache=use_cache,
+                                                    max_tokens=max_tokens, raise_errors=True, provider=name,
+                                                    conversation=conversation, record=record,
+                                                    response_info=response_info),
+                    cancel_token, logger=getattr(self, 'logger', None)
+                )
+            if provider:
+                settings = settings._replace(provider=provider)
+            provider, api_key, model = settings.provider, settings.api_key, settings.model
+            timer = RequestTimer(provider, model, started=started)
+            timer.lap("settings")
         
             if not api_key:
-                error_msg = "未設定API金鑰，請前往設定頁面設定"
-                if dialog:
-                    dialog.show_error("API金鑰錯誤", error_msg)
-                if hasattr(self, 'logger') and self.logger:
-                    self.logger.error(error_msg)
-                return error_msg
-
-            # 設置默認模型（如果未在配置中指定）
-            if not model:
-                if provider == "gemini":
-                    model = "gemini-1.5-flash"
-                elif provider == "openai":
-                    model = "gpt-3.5-turbo"
-                elif provider == "claude":
-                    model = "claude-3-opus-20240229"
-                elif provider == "mistral":
-                    model = "mistral-large-latest"
+                raise AIServiceError("API金鑰錯誤", "未設定API金鑰，請前往設定頁面設定")
             
+            # 相同提示詞與參數已有快取時直接回傳
+            params = self._generation_params(settings)
+            if max_tokens:
+                params["max_tokens"] = max_tokens
+            cache_key, cached = self._cache_lookup(settings, params, question, use_cache and conversation is None)
+            if cached is not None:
+                self._record_response(cached["response"], cached.get("token_info"), settings, record)
+                if response_info is not None:
+                    response_info.update(cached.get("token_info") or {})
+                # 快取命中不是提供商的請求，不計入延遲統計
+                timer = None
+                return cached["response"]
+
             # 根據不同的AI提供商建立API請求
-            headers = {'Content-Type': 'application/json'}
-            
-            if provider == "gemini":
-                url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}"
-                data = {
-                    "contents": [{"parts": [{"text": question}]}],
-                    "generationConfig": {
-                        "temperature": 0.7,
-                        "maxOutputTokens": 2048
-                    }
-                }
-            elif provider == "openai":
-                url = "https://api.openai.com/v1/chat/completions"
-                data = {
-                    "model": model,
-                    "messages": [{"role": "user", "content": question}],
-                    "temperature": 0.7,
-                    "max_tokens": 2048
-                }
-                headers['Authorization'] = f'Bearer {api_key}'
-            elif provider == "claude":
-                url = "https://api.anthropic.com/v1/messages"
-                data = {
-                    "model": model,
-                    "max_tokens": 2048,
-                    "messages": [{"role": "user", "content": question}],
-                    "temperature": 0.7
-                }
-                headers.update({
-                    'anthropic-version': '2023-06-01', 
-                    'x-api-key': api_key
-                })
-            elif provider == "mistral":
-                url = "https://api.mistral.ai/v1/chat/completions"
-                data = {
-                    "model": model,
-                    "messages": [{"role": "user", "content": question}],
-                    "temperature": 0.7,
-                    "max_tokens": 2048
-                }
-                headers['Authorization'] = f'Bearer {api_key}'
-            else:
-                error_msg = f"不支援的AI提供商: {provider}"
-                if dialog:
-                    dialog.show_error("不支援的提供商", error_msg)
-                if hasattr(self, 'logger') and self.logger:
-                    self.logger.error(error_msg)
-                return error_msg
+            if conversation is not None:
+                self._prepare_conversation(settings, conversation, cancel_token)
+            url, headers, data = self._build_request(provider, model, api_key, question, params,
+                                                     conversation=conversation)
                 
             # 準備HTTP請求
             data_bytes = json.dumps(data).encode('utf-8')
-            req = urllib.request.Request(url, data=data_bytes, headers=headers)
+            reserved_tokens = self._reserved_tokens(question, params, conversation)
             
-            # 增加超時處理
+            def attempt(token):
+                with self._send(settings, url, data_bytes, headers, reserved_tokens, token, timer) as response:
+                    body = response.read()
+                    timer.lap("body")
+                    result = json.loads(body.decode('utf-8'))
+                    timer.lap("decode")
+                    return result
+
+            # 增加超時處理（透過連線池重複使用既有連線），暫時性錯誤以退避重試
             try:
-                with urllib.request.urlopen(req, timeout=30) as response:
-                    result = json.loads(response.read().decode('utf-8'))
+                result = self.retry_policy.call(attempt, cancel_token, max_retries=settings.max_retries,
+                                                on_retry=self._log_retry)
             except urllib.error.URLError as e:
-                error_msg = f"API請求失敗: {str(e)}"
-                if dialog:
-                    dialog.show_error("API請求錯誤", error_msg)
-                if hasattr(self, 'logger') and self.logger:
-                    self.logger.error(error_msg)
-                return error_msg
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                raise AIServiceError("API請求錯誤", f"API請求失敗: {str(e)}")
             except json.JSONDecodeError:
-                error_msg = "解析API回應失敗"
-                if dialog:
-                    dialog.show_error("解析錯誤", error_msg)
-                if hasattr(self, 'logger') and self.logger:
-                    self.logger.error(error_msg)
-                return error_msg
+                raise AIServiceError("解析錯誤", "解析API回應失敗")
             
             # 根據不同的AI提供商解析回應
-            response_text = ""
-            token_info = None
-            
-            if provider == "gemini":
-                if 'candidates' in result and result['candidates']:
-                    response_text = result.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '')
-                    # 提取token使用情況
-                    if 'usageMetadata' in result:
-                        token_info = {
-                            'prompt_tokens': result['usageMetadata'].get('promptTokenCount', 0),
-                            'completion_tokens': result['usageMetadata'].get('candidatesTokenCount', 0),
-                            'total_tokens': result['usageMetadata'].get('totalTokenCount', 0)
-                        }
-                else:
-                    error_msg = f"Gemini API錯誤: {result.get('error', {}).get('message', '未知錯誤')}"
-                    if dialog:
-                        dialog.show_error("Gemini錯誤", error_msg)
-                    if hasattr(self, 'logger') and self.logger:
-                        self.logger.error(error_msg)
-                    return error_msg
-            elif provider == "openai":
-                if 'choices' in result and result['choices']:
-                    response_text = result.get('choices', [{}])[0].get('message', {}).get('content', '')
-                    # 提取token使用情況
-                    if 'usage' in result:
-                        token_info = {
-                            'prompt_tokens': result['usage'].get('prompt_tokens', 0),
-                            'completion_tokens': result['usage'].get('completion_tokens', 0),
-                            'total_tokens': result['usage'].get('total_tokens', 0)
-                        }
-                else:
-                    error_msg = f"OpenAI API錯誤: {result.get('error', {}).get('message', '未知錯誤')}"
-                    if dialog:
-                        dialog.show_error("OpenAI錯誤", error_msg)
-                    if hasattr(self, 'logger') and self.logger:
-                        self.logger.error(error_msg)
-                    return error_msg
-            elif provider == "claude":
-                if 'content' in result:
-                    response_text = result.get('content', [{}])[0].get('text', '')
-                    # 提取token使用情況
-                    if 'usage' in result:
-                        token_info = {
-                            'prompt_tokens': result['usage'].get('input_tokens', 0),
-                            'completion_tokens': result['usage'].get('output_tokens', 0),
-                            'total_tokens': result['usage'].get('input_tokens', 0) + result['usage'].get('output_tokens', 0)
-                        }
-                else:
-                    error_msg = f"Claude API錯誤: {result.get('error', {}).get('message', '未知錯誤')}"
-                    if dialog:
-                        dialog.show_error("Claude錯誤", error_msg)
-                    if hasattr(self, 'logger') and self.logger:
-                        self.logger.error(error_msg)
-                    return error_msg
-            elif provider == "mistral":
-                if 'choices' in result and result['choices']:
-                    response_text = result.get('choices', [{}])[0].get('message', {}).get('content', '')
-                    # 提取token使用情況
-                    if 'usage' in result:
-                        token_info = {
-                            'prompt_tokens': result['usage'].get('prompt_tokens', 0),
-                            'completion_tokens': result['usage'].get('completion_tokens', 0),
-                            'total_tokens': result['usage'].get('total_tokens', 0)
-                        }
-                else:
-                    error_msg = f"Mistral API錯誤: {result.get('error', {}).get('message', '未知錯誤')}"
-                    if dialog:
-                        dialog.show_error("Mistral錯誤", error_msg)
-                    if hasattr(self, 'logger') and self.logger:
-                        self.logger.error(error_msg)
-                    return error_msg            # 記錄API回應
-            if hasattr(self, 'logger') and self.logger:
-                log_response = response_text[:200] + "..." if len(response_text) > 200 else response_text
-                self.logger.info(f"API 回應: {log_response}")
-                
-                if token_info:
-                    self.logger.info(f"Token使用: {token_info}")  # 新增紀錄-當前token數
-                    if 'completion_tokens' in token_info:
-                        self.logger.info(f"當前token數: {token_info['completion_tokens']}")
-                        # 保存當前的completion_tokens到previous_token
-                        self.previous_token = token_info['completion_tokens']
-                        
-                        # 計算目標token數（使用previous_token而不是當前token）
-                        if hasattr(self, 'previous_token') and hasattr(self, 'length_adjustment_factor') and self.length_adjustment_factor:
-                            target_tokens = int(self.previous_token * self.length_adjustment_factor)
-                            self.logger.info(f"目標token數: {target_tokens} = 上次保存的token數 {self.previous_token} × 長度調整因數 {self.length_adjustment_factor}")
-                            
-            # 存儲token信息並轉換為字符串
-            if token_info:
-                self.last_token_info = token_info
-                self.token_info_str = str(token_info)  # 轉為字符串
+            response_text, token_info = self._parse_response(provider, result)
+            self._record_response(response_text, token_info, settings, record)
+            if response_info is not None:
+                response_info.update(token_info or {})
+            self.rate_limiter.settle(provider, api_key, reserved_tokens, (token_info or {}).get('total_tokens'))
+            self.metrics.record(timer, token_info)
+            self._log_timings(timer)
+
+            # 只有成功的回應才會存入快取，錯誤訊息在前面就已返回
+            if cache_key is not None:
+                self._cache_store(settings, params, cache_key, question, response_text, token_info)
                 
             return response_text  # 只返回回應文本，不返回token信息
             
+        except AIServiceError as e:
+            if timer is not None:
+                self.metrics.record_failure(timer)
+            if raise_errors:
+                self.logger.error(e.message)
+                raise
+            return self._fail(dialog, e)
+        except RequestCancelled:
+            raise
         except Exception as e:
+            # 取消時連線被中斷所造成的讀取錯誤，不視為API錯誤
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
             error_msg = f"API請求過程中發生錯誤: {str(e)}"
+            if timer is not None:
+                self.metrics.record_failure(timer)
+            if raise_errors:
+                self.logger.error(error_msg, exc_info=True)
+                raise AIServiceError("API錯誤", error_msg) from e
             if dialog:
                 dialog.show_error("API錯誤", error_msg)
-            if hasattr(self, 'logger') and self.logger:
-                self.logger.error(error_msg)
-            import traceback
-            if hasattr(self, 'logger') and self.logger:
-                self.logger.error(traceback.format_exc())
+            self.logger.error(error_msg, exc_info=True)
             return error_msg
+
+    def ask_ai_stream(self, question, on_chunk, dialog=None, cancel_token=None, use_cache=True, max_tokens=None, raise_errors=False, provider=None, conversation=None):
+        """
+        以串流模式發送請求，每收到一段文字就呼叫 on_chunk
+
+        若 .env 中設定 STREAM_RESPONSES=false，則退回一般請求並一次回傳全文。
+
+        Args:
+            question: 問題或提示詞
+            on_chunk: 接收文字片段的回呼函式 on_chunk(text)
+            dialog: 對話框引用
+            cancel_token: CancelToken，取消時中斷串流並拋出 RequestCancelled
+            use_cache: 是否使用回應快取
+            max_tokens: 本次請求的輸出上限，未指定時使用 .env 的 MAX_TOKENS
+            raise_errors: 為 True 時失敗會拋出 AIServiceError，而不是回傳錯誤訊息字串
+            provider: 指定提供商；未指定時依 .env 的 ROUTING_MODE 在各提供商之間分派
+            conversation: 多輪對話，見 ask_ai
+
+        Returns:
+            str: 完整的回應文本或在錯誤情況下的錯誤訊息
+        """
+        self.last_token_info = None
+        self.token_info_str = None
+        timer = None
+        try:
+            self.logger.debug("API 串流請求: %s", Truncated(question))
+
+            started = time.perf_counter()
+            settings = self._load_api_settings()
+            if provider is None and settings.routing_mode != "single":
+                # 競速時只有第一個輸出文字的提供商會寫入對話框；已輸出內容後失敗則不再改用其他提供商
+                claim = StreamClaim(on_chunk)
+                return self.router.route(
+                    settings,
+                    lambda name, token: self.ask_ai_stream(question, claim.writer(name, token), cancel_token=token,
+                                                           use_cache=use_cache, max_tokens=max_tokens,
+                                                           raise_errors=True, provider=name,
+                                                           conversation=conversation),
+                    cancel_token, logger=getattr(self, 'logger', None),
+                    should_failover=lambda error: claim.owner is None
+                )
+            if provider:
+                settings = settings._replace(provider=provider)
+            provider, api_key, model = settings.provider, settings.api_key, settings.model
+
+            if not settings.stream_responses:
+                response_text = self.ask_ai(question, dialog=dialog, cancel_token=cancel_token, use_cache=use_cache,
+                                            max_tokens=max_tokens, raise_errors=raise_errors, provider=provider,
+                                            conversation=conversation)
+                on_chunk(response_text)
+                return response_text
+            timer = RequestTimer(provider, model, stream=True, started=started)
+            timer.lap("settings")
+
+            if not api_key:
+                raise AIServiceError("API金鑰錯誤", "未設定API金鑰，請前往設定頁面設定")
+
+            params = self._generation_params(settings)
+            if max_tokens:
+                params["max_tokens"] = max_tokens
+            cache_key, cached = self._cache_lookup(settings, params, question, use_cache and conversation is None)
+            if cached is not None:
+                self._record_response(cached["response"], cached.get("token_info"), settings)
+                timer = None
+                on_chunk(cached["response"])
+                return cached["response"]
+
+            if conversation is not None:
+                self._prepare_conversation(settings, conversation, cancel_token)
+            url, headers, data = self._build_request(provider, model, api_key, question, params, stream=True,
+                                                     conversation=conversation)
+            data_bytes = json.dumps(data).encode('utf-8')
+            reserved_tokens = self._reserved_tokens(question, params, conversation)
+
+            text_parts = []
+            usage = {}
+
+            def attempt(token):
+                with self._send(settings, url, data_bytes, headers, reserved_tokens, token, timer) as response:
+                    decode_seconds = 0.0
+                    for event, event_data in iter_sse_events(response):
+                        if token is not None:
+                            token.raise_if_cancelled()
+                        if event_data == "[DONE]":
+                            break
+                        decode_started = time.perf_counter()
+                        payload = json.loads(event_data)
+                        decode_seconds += time.perf_counter() - decode_started
+                        text = self._parse_stream_event(provider, event, payload, usage)
+                        if text:
+                            timer.first_token()
+                            text_parts.append(text)
+                            on_chunk(text)
+                    # body 為接收串流的時間，不含解析 JSON 的時間
+                    timer.lap("body")
+                    timer.add("body", -decode_seconds)
+                    timer.add("decode", decode_seconds)
+
+            try:
+                # 已經輸出部分內容的串流不能重送，否則欄位中會出現重複的文字
+                self.retry_policy.call(attempt, cancel_token, max_retries=settings.max_retries,
+                                       should_retry=lambda error: not text_parts, on_retry=self._log_retry)
+            except urllib.error.URLError as e:
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                raise AIServiceError("API請求錯誤", f"API請求失敗: {str(e)}")
+            except json.JSONDecodeError:
+                raise AIServiceError("解析錯誤", "解析API回應失敗")
+
+            # 取消時連線被中斷，串流會提早結束，不應把不完整的內容當成回應
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+
+            response_text = "".join(text_parts)
+            self._record_response(response_text, usage or None, settings)
+            self.rate_limiter.settle(provider, api_key, reserved_tokens, usage.get('total_tokens'))
+            self.metrics.record(timer, usage or None)
+            self._log_timings(timer)
+
+            if cache_key is not None:
+                self._cache_store(settings, params, cache_key, question, response_text, usage or None)
+            return response_text
+
+        except AIServiceError as e:
+            if timer is not None:
+                self.metrics.record_failure(timer)
+            if raise_errors:
+                self.logger.error(e.message)
+                raise
+            return self._fail(dialog, e)
+        except RequestCancelled:
+            raise
+        except Exception as e:
+            # 取消時連線被中斷所造成的讀取錯誤，不視為API錯誤
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            error_msg = f"API請求過程中發生錯誤: {str(e)}"
+            if timer is not None:
+                self.metrics.record_failure(timer)
+            if raise_errors:
+                self.logger.error(error_msg, exc_info=True)
+                raise AIServiceError("API錯誤", error_msg) from e
+            if dialog:
+                dialog.show_error("API錯誤", error_msg)
+            self.logger.error(error_msg, exc_info=True)
+            return error_msg
+
+    def split_for_request(self, text, output_ratio=1.0, reserved_tokens=0):
+        """
+        依目前模型的上下文視窗與輸出上限，將過長的文本切成多個區塊
+
+        Args:
+            text: 要處理的文本
+            output_ratio: 預期輸出長度與輸入長度的比例；None 表示輸出長度與輸入無關，只受上下文視窗限制
+            reserved_tokens: 每個區塊的提示詞中另外附加的文字（例如使用者的請求）的 token 數
+
+        Returns:
+            list: 區塊列表；文本在單一請求的預算內時只有一個元素
+        """
+        return split_text(text, self.request_token_budget(output_ratio, reserved_tokens), self._token_counter(text))
+
+    def split_for_adjustment(self, text, length_adjustment=None):
+        """
+        調整回應時切分文本：有長度調整時優先以單一請求調整長度
+
+        只有目標長度超過單次請求的輸出上限時才分塊改寫（分塊改寫無法控制整體長度）；
+        沒有長度調整時，依改寫後約為原文 1.2 倍的長度分塊。
+
+        Returns:
+            list: 區塊列表；不需分塊時只有一個元素
+        """
+        factor = self.get_length_factor(length_adjustment)
+        if factor:
+            settings = self._load_api_settings()
+            output_limit = min(settings.max_tokens, output_token_limit(settings.model))
+            if self.count_tokens_offline(text) * factor <= output_limit:
+                return [text]
+        return self.split_for_request(text, factor or 1.2)
+
+    def request_token_budget(self, output_ratio=None, reserved_tokens=0):
+        """目前模型單一請求可放入的輸入 token 數，參數同 split_for_request"""
+        settings = self._load_api_settings()
+        max_output_tokens = min(settings.max_tokens, output_token_limit(settings.model))
+        return chunk_token_budget(settings.model, max_output_tokens, output_ratio,
+                                  PROMPT_OVERHEAD_TOKENS + reserved_tokens)
+
+    @staticmethod
+    def _split_instruction(question, document=None):
+        """
+        將問題分成使用者的請求與要處理的長文本
+
+        問題中包含 document（開啟對話框時選取的文字）時，其餘文字即為請求；
+        否則整個問題都視為長文本，以問題的開頭與結尾代表請求。
+
+        Returns:
+            tuple: (請求, 長文本)
+        """
+        if document and document in question:
+            instruction = question.replace(document, "", 1).strip()
+            return instruction or CHUNK_DEFAULT_INSTRUCTION, document
+        return CHUNK_EXCERPT_INSTRUCTION.format(head=question[:200].strip(), tail=question[-200:].strip()), question
+
+    def map_chunks(self, chunks, build_prompt, on_chunk=None, cancel_token=None):
+        """
+        平行處理各區塊 (map)，並依區塊順序串流輸出
+
+        同時執行的請求數由 .env 的 BATCH_WORKERS 決定。任一區塊失敗時取消其餘區塊並拋出例外。
+
+        Args:
+            chunks: 區塊列表
+            build_prompt: build_prompt(chunk, index, count) 回傳該區塊的提示詞
+            on_chunk: 依區塊順序接收輸出片段的回呼，可為 None
+            cancel_token: CancelToken
+
+        Returns:
+            list: 各區塊的輸出，順序與 chunks 相同
+        """
+        settings = self._load_api_settings()
+        count = len(chunks)
+        merger = OrderedStreamMerger(count, on_chunk) if on_chunk else None
+        parent_token = cancel_token if cancel_token is not None else CancelToken()
+        map_token = parent_token.child()
+
+        self.logger.info("分塊處理: %d 個區塊, 同時執行 %d 個請求", count, settings.batch_workers)
+
+        def run(index, chunk):
+            prompt = build_prompt(chunk, index, count)
+            on_piece = (lambda text: merger.feed(index, text)) if merger else (lambda text: None)
+            output = self.ask_ai_stream(prompt, on_piece, cancel_token=map_token, raise_errors=True)
+            if merger:
+                merger.finish(index)
+            return output
+
+        pool = ThreadPoolExecutor(max_workers=min(count, settings.batch_workers), thread_name_prefix="ai-chunk")
+        try:
+            futures = [pool.submit(run, index, chunk) for index, chunk in enumerate(chunks)]
+            outputs = []
+            for future in futures:
+                try:
+                    outputs.append(future.result())
+                except Exception:
+                    # 一個區塊失敗，其餘區塊的結果也無法組成完整輸出
+                    map_token.cancel()
+                    raise
+            return outputs
+        finally:
+            parent_token.release_child(map_token)
+            pool.shutdown(wait=not map_token.cancelled)
+
+    def ask_ai_chunked(self, question, on_chunk, dialog=None, cancel_token=None, document=None, raise_errors=False):
+        """
+        處理超過模型上下文視窗的長文本：先平行整理各區塊重點 (map)，再彙整為最終回應 (reduce)
+
+        文本在上下文視窗內時等同 ask_ai_stream。每個區塊的提示詞都附上使用者的請求，
+        讓整理出的重點與請求相關；各區塊重點合計仍過長時，會再對重點分塊整理一次。
+
+        只有 reduce 的結果以串流方式交給 on_chunk：map 階段的輸出是給 reduce 使用的中間重點，
+        不是回應的一部分，若依區塊順序串流到回應欄位，最終回應會接在整理重點之後而重複；
+        map 階段的區塊數只記錄在日誌中。
+
+        Args:
+            document: 開啟對話框時選取的文字；問題包含這段文字時，其餘文字視為使用者的請求
+            raise_errors: 為 True 時失敗拋出 AIServiceError，而不是回傳錯誤訊息
+
+        Returns:
+            str: 最終回應或錯誤訊息
+        """
+        if len(self.split_for_request(question, output_ratio=None)) <= 1:
+            return self.ask_ai_stream(question, on_chunk, dialog=dialog, cancel_token=cancel_token,
+                                      raise_errors=raise_errors)
+
+        instruction, text = self._split_instruction(question, document)
+        reserved = self.count_tokens_offline(instruction)
+        try:
+            notes = self.split_for_request(text, output_ratio=None, reserved_tokens=reserved)
+            for _ in range(MAX_REDUCE_LEVELS):
+                notes = self.map_chunks(
+                    notes,
+                    lambda chunk, index, count: CHUNK_MAP_PROMPT.format(
+                        instruction=instruction, index=index + 1, count=count, text=chunk
+                    ),
+                    cancel_token=cancel_token
+                )
+                notes = self.split_for_request("\n\n".join(notes), output_ratio=None, reserved_tokens=reserved)
+                if len(notes) <= 1:
+                    break
+
+            reduce_prompt = CHUNK_REDUCE_PROMPT.format(instruction=instruction, notes="\n\n".join(notes))
+            return self.ask_ai_stream(reduce_prompt, on_chunk, dialog=dialog, cancel_token=cancel_token,
+                                      raise_errors=raise_errors)
+        except AIServiceError as e:
+            if raise_errors:
+                raise
+            return self._fail(dialog, e)
+
+    def ask_conversation(self, conversation, question, on_chunk, cancel_token=None, provider=None):
+        """
+        在多輪對話中提問，以串流方式輸出回應，成功後把這一輪加入對話
+
+        文件、歷史問答與問題合計超過模型的上下文視窗時，先捨棄最早的歷史問答；
+        只有文件與問題就已超過時，這一輪改以 ask_ai_chunked 分塊整理，不加入對話。
+        失敗時拋出 AIServiceError，失敗的一輪不會加入對話。
+
+        Returns:
+            str: 回應文本
+        """
+        turn_question = conversation.take_question(question)
+        fits, dropped = conversation.trim_to_budget(turn_question, self.request_token_budget())
+        if dropped:
+            self.logger.info("對話超過上下文視窗，捨棄最早的 %d 輪問答", dropped)
+        if not fits:
+            return self.ask_ai_chunked(question, on_chunk, cancel_token=cancel_token,
+                                       document=conversation.document or None, raise_errors=True)
+        response_text = self.ask_ai_stream(turn_question, on_chunk, cancel_token=cancel_token, use_cache=False,
+                                           raise_errors=True, provider=provider, conversation=conversation)
+        conversation.add_turn(turn_question, response_text, self.last_token_info)
+        if self.last_token_info and self.last_token_info.get('cached_tokens'):
+            self.logger.info("對話第 %d 輪: 輸入 %s token，其中 %s 由提供商快取讀取", len(conversation.turns),
+                             self.last_token_info.get('prompt_tokens'), self.last_token_info.get('cached_tokens'))
+        return response_text
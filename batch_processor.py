@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from cancellation import RequestCancelled
+
+
+class ParagraphJob(namedtuple("ParagraphJob", ["index", "text", "target"])):
+    """
+    批次處理的單一段落
+
+    index 為段落在文件（或選取範圍）中的順序，target 為寫回時使用的段落物件。
+    """
+    __slots__ = ()
+
+
+class BatchProcessor:
+    """
+    以有界的工作執行緒池平行處理大量段落，並依文件順序寫回結果
+
+    同時送出的工作數量以 max_pending 限制，數千個段落也不會一次全部排入佇列；
+    先完成的結果暫存在重新排序緩衝區，直到前面的段落都完成後才依序交給 write，
+    因此緩衝區大小也受 max_pending 限制。空白段落與內容沒有改變的結果不會寫回。
+    """
+
+    def __init__(self, transform, max_workers=4, max_pending=None):
+        """
+        Args:
+            transform: 在工作執行緒呼叫 transform(text, cancel_token)，回傳新文本；失敗時拋出例外
+            max_workers: 同時執行的工作數
+            max_pending: 已送出但尚未寫回的段落上限，預設為 max_workers 的 8 倍
+        """
+        self.transform = transform
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max_pending or self.max_workers * 8
+
+    def run(self, jobs, write, cancel_token=None, on_progress=None, progress_interval=0.2):
+        """
+        處理所有段落並依序寫回
+
+        Args:
+            jobs: ParagraphJob 的序列
+            write: write(items) 以文件順序接收 [(job, new_text), ...]，在本執行緒呼叫
+            cancel_token: CancelToken，取消時停止送出新工作並拋出 RequestCancelled
+            on_progress: on_progress(stats)，最多每 progress_interval 秒呼叫一次，結束時再呼叫一次
+
+        Returns:
+            dict: total、processed、written、skipped_empty、unchanged、failed、errors
+        """
+        jobs = list(jobs)
+        stats = {
+            "total": len(jobs), "processed": 0, "written": 0,
+            "skipped_empty": 0, "unchanged": 0, "failed": 0, "errors": []
+        }
+        condition = threading.Condition()
+        # 以段落在 jobs 中的位置為鍵的已完成結果（重新排序緩衝區）
+        finished = {}
+        next_to_write = 0
+        submitted = 0
+        last_progress = 0.0
+
+        def work(position, job):
+            try:
+                # 取消後仍在佇列中的工作直接結束，不再發送請求
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                result = self.transform(job.text, cancel_token)
+            except Exception as e:
+                result = e
+            with condition:
+                finished[position] = result
+                condition.notify()
+
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ai-batch")
+        try:
+            while next_to_write < len(jobs):
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+
+                # 補足進行中的工作，但已送出未寫回的段落不超過 max_pending
+                while submitted < len(jobs) and submitted - next_to_write < self.max_pending:
+                    job = jobs[submitted]
+                    if job.text.strip():
+                        pool.submit(work, submitted, job)
+                    else:
+                        # 空白段落不需要送出請求，直接視為已完成
+                        with condition:
+                            finished[submitted] = None
+                    submitted += 1
+
+                # 等待下一個要寫回的段落完成，再取出所有已按順序完成的結果
+                ready = []
+                with condition:
+                    while next_to_write not in finished:
+                        if cancel_token is not None and cancel_token.cancelled:
+                            break
+                        condition.wait(0.1)
+                    while next_to_write in finished:
+                        ready.append((jobs[next_to_write], finished.pop(next_to_write)))
+                        next_to_write += 1
+
+                items = []
+                for job, result in ready:
+                    stats["processed"] += 1
+                    if result is None:
+                        stats["skipped_empty"] += 1
+                    elif isinstance(result, RequestCancelled):
+                        raise result
+                    elif isinstance(result, Exception):
+                        stats["failed"] += 1
+                        if len(stats["errors"]) < 10:
+                            stats["errors"].append(f"段落 {job.index + 1}: {str(result)}")
+                    elif not result.strip() or result.strip() == job.text.strip():
+                        stats["unchanged"] += 1
+                    else:
+                        items.append((job, result.strip()))
+                if items:
+                    write(items)
+                    stats["written"] += len(items)
+
+                now = time.monotonic()
+                if on_progress and now - last_progress >= progress_interval:
+                    last_progress = now
+                    on_progress(dict(stats))
+        finally:
+            # 取消時不等待執行中的請求結束（它們會因 cancel_token 而盡快中斷）
+            pool.shutdown(wait=not (cancel_token is not None and cancel_token.cancelled))
+
+        if on_progress:
+            on_progress(dict(stats))
+        return stats
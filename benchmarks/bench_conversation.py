@@ -0,0 +1,213 @@
+"""
+多輪對話測試：比較每輪重新送出整份文件的獨立請求與使用提示詞快取的 Conversation
+
+以 --words 個字的文件連續詢問 --turns 個問題，比較兩種方式：
+
+    independent   每輪的提示詞都是「文件 + 問題」，不保留之前的問答（原本的詢問方式）
+    conversation  AIService.ask_conversation：文件在固定的前綴中，第 2 輪以後由提供商快取讀取
+
+預設不連線：以 AIService._build_request 產生各提供商每一輪的請求內容（回應以隨機文字代替），
+依提供商組合提示詞的順序（Claude 為 system 再 messages，Gemini 的 cachedContents 視為文件本身）
+展開後，逐輪列出估計的輸入 token 數、與前一輪相同的前綴 token 數，以及標記為可快取
+（Claude 的 cache_control、Gemini 的 cachedContent）的 token 數。前綴在各輪之間保持不變，
+提供商的提示詞快取才能命中。
+
+加上 --live 時實際呼叫提供商的 API（需要 ~/.libreoffice/.env 中設定的 API 金鑰，會產生費用），
+逐輪列出提供商回報的輸入 token 數、其中由快取讀取的 token 數，以及收到第一個 token 的時間。
+Claude 與 OpenAI 的前綴需達 1024 token 以上才會快取；Gemini 需達 model_limits.GEMINI_MIN_CACHE_TOKENS 中該模型的最低 token 數。
+
+用法:
+    python benchmarks/bench_conversation.py [--words 6000] [--turns 4] [--live] [--provider claude]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_service import AIService  # noqa: E402
+from conversation import DOCUMENT_INSTRUCTION, Conversation  # noqa: E402
+from token_estimator import heuristic_token_count  # noqa: E402
+
+OFFLINE_MODELS = {"claude": "claude-3-5-sonnet-latest", "openai": "gpt-4o", "gemini": "gemini-2.5-flash",
+                  "mistral": "mistral-large-latest"}
+
+QUESTIONS = [
+    "請用三句話摘要這份文件。",
+    "文件中提到哪些數字？請列出。",
+    "文件最常出現的三個詞是什麼？",
+    "請為這份文件擬一個標題。",
+    "文件的語氣是正式還是非正式？",
+]
+
+
+def make_document(words, rng):
+    vocabulary = ["報告", "季度", "營收", "成長", "客戶", "產品", "市場", "策略", "風險", "預算",
+                  "report", "quarter", "revenue", "growth", "customer"]
+    sentences = []
+    remaining = words
+    while remaining > 0:
+        size = min(remaining, rng.randint(8, 20))
+        sentences.append(" ".join(rng.choice(vocabulary) for _ in range(size)) + f" {rng.randint(1, 999)}。")
+        remaining -= size
+    return "".join(sentences)
+
+
+def make_answer(rng):
+    words = ["營收", "成長", "客戶", "重點", "結論", "數字", "revenue", "growth", "summary"]
+    return " ".join(rng.choice(words) for _ in range(rng.randint(60, 160)))
+
+
+def _text(content):
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content)
+
+
+def render_prompt(provider, data, document):
+    """
+    依提供商組合提示詞的順序展開請求內容
+
+    Returns:
+        tuple: (文字片段列表, 標記為可快取的前綴片段數)
+    """
+    segments = []
+    cached = 0
+    if provider == "claude":
+        for block in data.get("system", []):
+            segments.append("system:" + block["text"])
+            if "cache_control" in block:
+                cached = len(segments)
+        for message in data["messages"]:
+            segments.append(message["role"] + ":" + _text(message["content"]))
+            if isinstance(message["content"], list) and any("cache_control" in block for block in message["content"]):
+                cached = len(segments)
+    elif provider == "gemini":
+        if "cachedContent" in data:
+            # cachedContents 中保存的就是文件（見 Conversation.gemini_system_instruction）
+            segments.append("system:" + DOCUMENT_INSTRUCTION + document)
+            cached = 1
+        elif "systemInstruction" in data:
+            segments.append("system:" + "".join(part["text"] for part in data["systemInstruction"]["parts"]))
+        for content in data["contents"]:
+            segments.append(content.get("role", "user") + ":" + "".join(part["text"] for part in content["parts"]))
+    else:
+        for message in data["messages"]:
+            segments.append(message["role"] + ":" + _text(message["content"]))
+    return segments, cached
+
+
+def common_prefix_tokens(segments, previous):
+    """兩次請求展開後相同前綴的估計 token 數"""
+    if previous is None:
+        return 0
+    shared = []
+    for current, before in zip(segments, previous):
+        if current == before:
+            shared.append(current)
+            continue
+        length = 0
+        for a, b in zip(current, before):
+            if a != b:
+                break
+            length += 1
+        shared.append(current[:length])
+        break
+    return heuristic_token_count("".join(shared))[0]
+
+
+def offline(args, service, document, questions):
+    rng = random.Random(5)
+    answers = [make_answer(rng) for _ in questions]
+    params = {"temperature": 0.7, "max_tokens": 1024}
+    providers = [args.provider] if args.provider else list(OFFLINE_MODELS)
+    for provider in providers:
+        model = OFFLINE_MODELS.get(provider, provider)
+        for name in ("independent", "conversation"):
+            conversation = Conversation(document) if name == "conversation" else None
+            previous = None
+            totals = [0, 0, 0]
+            print(f"{provider} / {name}")
+            for turn, (question, answer) in enumerate(zip(questions, answers), 1):
+                if conversation is not None:
+                    asked = conversation.take_question(document + "\n\n" + question)
+                    if conversation.needs_gemini_cache(model):
+                        conversation.set_gemini_cache(model, "cachedContents/offline")
+                else:
+                    asked = document + "\n\n" + question
+                _, _, data = service._build_request(provider, model, "offline", asked, params,
+                                                    conversation=conversation)
+                segments, cached_segments = render_prompt(provider, data, document)
+                input_tokens = heuristic_token_count("".join(segments))[0]
+                prefix = common_prefix_tokens(segments, previous)
+                marked = heuristic_token_count("".join(segments[:cached_segments]))[0]
+                payload = len(json.dumps(data).encode("utf-8"))
+                print(f"  turn {turn}  input {input_tokens:7d} tok  same prefix as previous turn {prefix:7d} tok  "
+                      f"marked cacheable {marked:7d} tok  payload {payload:8d} bytes")
+                totals[0] += input_tokens
+                totals[1] += prefix
+                totals[2] += marked
+                previous = segments
+                if conversation is not None:
+                    conversation.add_turn(asked, answer)
+            share = totals[1] / totals[0] if totals[0] else 0.0
+            print(f"  total input {totals[0]} tok, reusable prefix {totals[1]} tok ({share:.0%})")
+
+
+def run_turn(service, ask):
+    first = []
+    start = time.perf_counter()
+
+    def on_chunk(text):
+        if not first:
+            first.append(time.perf_counter() - start)
+
+    ask(on_chunk)
+    elapsed = time.perf_counter() - start
+    info = service.last_token_info or {}
+    return info.get("prompt_tokens"), info.get("cached_tokens"), (first or [elapsed])[0], elapsed
+
+
+def report(name, rows):
+    print(name)
+    for turn, (prompt_tokens, cached_tokens, first_token, elapsed) in enumerate(rows, 1):
+        print(f"  turn {turn}  input {prompt_tokens!s:>7} tok  cached {cached_tokens!s:>7} tok  "
+              f"first token {first_token * 1000:7.0f} ms  total {elapsed * 1000:7.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, default=6000)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--live", action="store_true", help="實際呼叫提供商的 API（會產生費用）")
+    parser.add_argument("--provider", help="指定提供商；預設離線時比較所有提供商，--live 時使用 .env 的 DEFAULT_PROVIDER")
+    args = parser.parse_args()
+
+    service = AIService(None)
+    document = make_document(args.words, random.Random(17))
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.turns)]
+    print(f"document ~{args.words} words, {args.turns} turns")
+    if not args.live:
+        offline(args, service, document, questions)
+        return
+
+    rows = []
+    for question in questions:
+        rows.append(run_turn(service, lambda on_chunk: service.ask_ai_stream(
+            document + "\n\n" + question, on_chunk, use_cache=False, raise_errors=True, provider=args.provider)))
+    report("independent", rows)
+
+    conversation = Conversation(document)
+    rows = []
+    for question in questions:
+        rows.append(run_turn(service, lambda on_chunk: service.ask_conversation(
+            conversation, document + "\n\n" + question, on_chunk, provider=args.provider)))
+    report("conversation", rows)
+    print(f"conversation totals: {conversation.stats()}")
+
+
+if __name__ == "__main__":
+    main()
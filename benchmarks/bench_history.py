@@ -0,0 +1,95 @@
+"""
+問答紀錄測試：比較原本把每則回應串接到回應欄位全文的方式與 SessionHistory 的視窗顯示
+
+模擬連續詢問 --asks 次、每則回應約 --chars 個字元，量測每次更新欄位需要產生（並經 UNO 傳給
+欄位）的文字長度與耗時；接著量測 HistoryStore 寫入本機 SQLite 與跨工作階段搜尋的時間。
+資料庫寫在暫存目錄，不會動到 ~/.libreoffice 中的歷史紀錄。
+
+用法:
+    python benchmarks/bench_history.py [--asks 200] [--chars 3000] [--window 3]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_store import SEPARATOR, HistoryStore, SessionHistory  # noqa: E402
+
+
+def make_responses(asks, chars, rng):
+    vocabulary = ["回應", "文件", "段落", "模型", "摘要", "response", "history", "window", "paging"]
+    responses = []
+    for i in range(asks):
+        words = []
+        size = 0
+        while size < chars:
+            word = rng.choice(vocabulary)
+            words.append(word)
+            size += len(word) + 1
+        responses.append(f"#{i} " + " ".join(words))
+    return responses
+
+
+def legacy(responses):
+    """原本的 AskButtonListener：prefix = 欄位全文 + 分隔線，再以 setText 寫回全文"""
+    field = ""
+    marshalled = 0
+    start = time.perf_counter()
+    for response in responses:
+        prefix = field + SEPARATOR if field.strip() else ""
+        field = prefix + response
+        # setText(prefix) 與 setText(全文) 都會把整段文字傳給欄位
+        marshalled += len(prefix) + len(field)
+    return time.perf_counter() - start, marshalled, len(field)
+
+
+def windowed(responses, window):
+    history = SessionHistory(window=window)
+    marshalled = 0
+    field = ""
+    start = time.perf_counter()
+    for response in responses:
+        prefix = history.prefix()
+        history.add("ask", "問題", response)
+        field = history.render()
+        marshalled += len(prefix) + len(field)
+    return time.perf_counter() - start, marshalled, len(field)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--asks", type=int, default=200)
+    parser.add_argument("--chars", type=int, default=3000)
+    parser.add_argument("--window", type=int, default=3)
+    args = parser.parse_args()
+
+    responses = make_responses(args.asks, args.chars, random.Random(11))
+    print(f"{args.asks} asks, ~{args.chars} characters per response")
+    for name, (elapsed, marshalled, final) in (("legacy concat", legacy(responses)),
+                                               (f"window={args.window}", windowed(responses, args.window))):
+        print(f"  {name:<14} {elapsed * 1000:9.2f} ms  characters sent to field {marshalled:12d}  "
+              f"final field {final:9d}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = HistoryStore(os.path.join(directory, "history.sqlite3"))
+        history = SessionHistory(store, window=args.window)
+        start = time.perf_counter()
+        for i, response in enumerate(responses):
+            history.add("ask", f"問題 {i}", response, provider="gemini", model="gemini-1.5-flash")
+        enqueue_time = time.perf_counter() - start
+        store.flush()
+        write_time = time.perf_counter() - start
+        start = time.perf_counter()
+        found = store.search(f"#{args.asks // 2} ")
+        search_time = time.perf_counter() - start
+        print(f"  sqlite         add (UI thread) {enqueue_time / args.asks * 1e6:8.1f} us/entry, "
+              f"all written after {write_time * 1000:.1f} ms, search {search_time * 1000:.2f} ms "
+              f"({len(found)} hit, {store.count()} stored)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+連線池效能測試：比較 urllib.request.urlopen 與 HTTPConnectionPool 的單次請求延遲
+
+以本機 HTTP(S) 假伺服器模擬 AI 服務端點，可用 --connect-delay 模擬建立連線
+（TCP + TLS 握手）的網路往返時間。
+
+用法:
+    python benchmarks/bench_http_pool.py [--requests 200] [--connect-delay 20]
+                                         [--certfile cert.pem --keyfile key.pem]
+"""
+import argparse
+import json
+import os
+import ssl
+import statistics
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_pool import HTTPConnectionPool  # noqa: E402
+
+
+RESPONSE_BODY = json.dumps({
+    "candidates": [{"content": {"parts": [{"text": "ok"}]}}],
+    "usageMetadata": {"promptTokenCount": 3, "candidatesTokenCount": 1, "totalTokenCount": 4},
+}).encode("utf-8")
+
+
+def make_handler(connect_delay):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            # 每條新連線只延遲一次，模擬握手成本
+            time.sleep(connect_delay)
+            super().setup()
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(length)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(RESPONSE_BODY)))
+            self.end_headers()
+            self.wfile.write(RESPONSE_BODY)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def summarize(name, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<10} mean {statistics.mean(samples) * 1000:8.2f} ms   "
+          f"p50 {statistics.median(samples) * 1000:8.2f} ms   p95 {p95 * 1000:8.2f} ms")
+
+
+def run(url, requests, opener):
+    payload = json.dumps({"contents": [{"parts": [{"text": "hello"}]}]}).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        with opener(url, payload, headers) as response:
+            json.loads(response.read().decode("utf-8"))
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--connect-delay", type=float, default=20.0, help="模擬握手延遲（毫秒）")
+    parser.add_argument("--certfile")
+    parser.add_argument("--keyfile")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.connect_delay / 1000.0))
+    scheme = "http"
+    client_context = None
+    if args.certfile:
+        server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        server_context.load_cert_chain(args.certfile, args.keyfile)
+        server.socket = server_context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+        client_context = ssl._create_unverified_context()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"{scheme}://127.0.0.1:{server.server_address[1]}/v1beta/models/stub:generateContent"
+
+    def urllib_opener(url, data, headers):
+        req = urllib.request.Request(url, data=data, headers=headers)
+        return urllib.request.urlopen(req, timeout=30, context=client_context)
+
+    pool = HTTPConnectionPool(max_per_host=4)
+    if client_context is not None:
+        pool._ssl_context = client_context
+
+    def pool_opener(url, data, headers):
+        return pool.urlopen(url, data=data, headers=headers, timeout=30)
+
+    print(f"{args.requests} requests to {url} (connect delay {args.connect_delay:.0f} ms)")
+    summarize("urllib", run(url, args.requests, urllib_opener))
+    summarize("pool", run(url, args.requests, pool_opener))
+    print(f"pool stats: {pool.stats()}")
+
+    pool.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
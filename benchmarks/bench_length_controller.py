@@ -0,0 +1,144 @@
+"""
+長度控制器回放測試：比較舊的「要求目標長度、接受或拒絕」流程、閉迴路控制器
+以及平行候選模式收斂所需的回合數
+
+以模擬模型回放長度調整請求。模擬模型對長度要求的反應為
+    achieved = current * (requested / current) ** k * 噪聲
+k < 1 表示調整不足、k > 1 表示調整過度，噪聲為對數常態分布。
+每個模擬模型連續處理 --requests 次請求，控制器在請求之間保留學到的 k。
+回合數包含第一次（原始提示詞）請求，未在 --max-rounds 內進入 ±10% 範圍者記為未收斂。
+
+用法:
+    python benchmarks/bench_length_controller.py [--requests 200] [--noise 0.08]
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from length_controller import LengthController, LengthResponseModel  # noqa: E402
+
+# 與 AIService.get_target_token_count 相同的目標倍率
+TARGET_FACTORS = {
+    "-75%": 0.4, "-50%": 0.6, "-25%": 0.8,
+    "+25%": 2.0, "+50%": 3.0, "+75%": 4.0
+}
+# 原始提示詞文字中的百分比（config.json 的縮減／擴展模板）
+WORDING_RATIOS = {
+    "-75%": 0.25, "-50%": 0.5, "-25%": 0.75,
+    "+25%": 1.25, "+50%": 1.5, "+75%": 1.75
+}
+
+
+class SimulatedModel:
+    def __init__(self, exponent, noise, rng):
+        self.exponent = exponent
+        self.noise = noise
+        self.rng = rng
+
+    def respond(self, current, requested):
+        achieved = current * (requested / current) ** self.exponent
+        return max(1, int(achieved * self.rng.lognormvariate(0, self.noise)))
+
+
+def in_band(count, target):
+    return int(target * 0.9) <= count <= int(target * 1.1)
+
+
+def run_baseline(model, current, adjustment, max_rounds):
+    """舊流程：原始提示詞只帶百分比文字，之後每回合要求精確的目標長度"""
+    target = int(current * TARGET_FACTORS[adjustment])
+    best = model.respond(current, current * WORDING_RATIOS[adjustment])
+    for round_number in range(1, max_rounds + 1):
+        if in_band(best, target):
+            return round_number
+        if round_number == max_rounds:
+            break
+        adjusted = model.respond(best, target)
+        if abs(adjusted - target) < abs(best - target):
+            best = adjusted
+    return None
+
+
+def run_controller(model, current, adjustment, max_rounds, response_model):
+    target = int(current * TARGET_FACTORS[adjustment])
+    controller = LengthController(target, current, max_rounds=max_rounds,
+                                  exponent=response_model.exponent("sim", "sim"))
+    while True:
+        request = controller.next_request()
+        if request is None:
+            break
+        achieved = model.respond(request.current_tokens, request.requested_tokens)
+        # 輸出上限會截斷過長的回應
+        controller.observe(None, min(achieved, request.max_tokens))
+    response_model.update("sim", "sim", controller.observations)
+    return controller.rounds if controller.converged else None
+
+
+def run_parallel(model, current, adjustment, max_rounds, response_model, candidates, rng):
+    """平行候選：每回合同時送出多個要求，任一候選落在範圍內即結束（回合數即延遲倍數）"""
+    target = int(current * TARGET_FACTORS[adjustment])
+    controller = LengthController(target, current, max_rounds=max_rounds,
+                                  exponent=response_model.exponent("sim", "sim"))
+    while True:
+        requests = controller.next_requests(candidates)
+        if not requests:
+            break
+        # 模擬回應抵達順序是隨機的
+        rng.shuffle(requests)
+        for request in requests:
+            achieved = model.respond(request.current_tokens, request.requested_tokens)
+            controller.observe(None, min(achieved, request.max_tokens), request=request)
+            if controller.converged:
+                break
+    response_model.update("sim", "sim", controller.observations)
+    return controller.rounds if controller.converged else None
+
+
+def summarize(name, results, max_rounds):
+    converged = [rounds for rounds in results if rounds is not None]
+    within = [sum(1 for rounds in converged if rounds <= limit) / len(results) * 100
+              for limit in range(1, max_rounds + 1)]
+    # 未收斂的請求以用盡全部回合計算；循序模式的回合數即 API 請求次數，平行模式則為延遲倍數
+    calls = sum(rounds if rounds is not None else max_rounds for rounds in results) / len(results)
+    bands = "  ".join(f"<={limit}: {share:5.1f}%" for limit, share in zip(range(1, max_rounds + 1), within))
+    print(f"  {name:<12} {bands}  failed: {100 - within[-1]:5.1f}%  avg rounds: {calls:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="每個模擬模型的請求次數")
+    parser.add_argument("--noise", type=float, default=0.08, help="對數常態噪聲的標準差")
+    parser.add_argument("--max-rounds", type=int, default=3)
+    parser.add_argument("--candidates", type=int, default=3, help="平行候選模式每回合的請求數")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    for exponent in (0.5, 0.7, 1.0, 1.3):
+        rng = random.Random(args.seed)
+        workload = [(rng.randint(150, 900), rng.choice(list(TARGET_FACTORS))) for _ in range(args.requests)]
+        baseline_model = SimulatedModel(exponent, args.noise, random.Random(args.seed + 1))
+        controller_model = SimulatedModel(exponent, args.noise, random.Random(args.seed + 1))
+        response_model = LengthResponseModel()
+
+        baseline = [run_baseline(baseline_model, current, adjustment, args.max_rounds)
+                    for current, adjustment in workload]
+        controlled = [run_controller(controller_model, current, adjustment, args.max_rounds, response_model)
+                      for current, adjustment in workload]
+        parallel_model = SimulatedModel(exponent, args.noise, random.Random(args.seed + 1))
+        parallel_response_model = LengthResponseModel()
+        order_rng = random.Random(args.seed + 2)
+        parallel = [run_parallel(parallel_model, current, adjustment, args.max_rounds, parallel_response_model,
+                                 args.candidates, order_rng)
+                    for current, adjustment in workload]
+
+        print(f"simulated model k={exponent} (learned k={response_model.exponent('sim', 'sim'):.2f})")
+        summarize("baseline", baseline, args.max_rounds)
+        summarize("controller", controlled, args.max_rounds)
+        summarize(f"parallel x{args.candidates}", parallel, args.max_rounds)
+
+
+if __name__ == "__main__":
+    main()
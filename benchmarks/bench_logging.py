@@ -0,0 +1,93 @@
+"""
+日誌管線測試：比較同步寫檔與佇列式非同步日誌在請求執行緒上的耗時
+
+同步模式模擬舊版做法：每筆紀錄在呼叫端格式化並直接寫入 FileHandler；
+佇列模式使用 log_setup 的管線，呼叫端只把紀錄放入佇列。另外比較 INFO 等級下
+以 DEBUG 記錄提示詞（延遲格式化，不輸出）的成本，以及寫入後日誌目錄的總大小。
+
+用法:
+    python benchmarks/bench_logging.py [--records 20000] [--threads 4] [--prompt-size 2000]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import log_setup  # noqa: E402
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def hammer(logger, args, prompt, lazy):
+    """多個執行緒同時寫入日誌，回傳每次呼叫的耗時（微秒）"""
+    per_thread = args.records // args.threads
+    samples = [[] for _ in range(args.threads)]
+
+    def worker(index):
+        local = samples[index]
+        for i in range(per_thread):
+            start = time.perf_counter()
+            if lazy:
+                logger.info("請求計時 (%s/%s): total=%dms", "gemini", "gemini-2.0-flash", i)
+                logger.debug("API 請求: %s", log_setup.Truncated(prompt))
+            else:
+                logger.info(f"請求計時 (gemini/gemini-2.0-flash): total={i}ms")
+                logger.info(f"API 請求: {prompt[:200] + '...' if len(prompt) > 200 else prompt}")
+            local.append((time.perf_counter() - start) * 1e6)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return [value for local in samples for value in local], elapsed
+
+
+def report(name, samples, elapsed, log_dir):
+    print(f"  {name:<10} p50 {percentile(samples, 0.5):7.1f} us  p99 {percentile(samples, 0.99):8.1f} us  "
+          f"wall {elapsed:6.2f} s  log size {directory_size(log_dir) / 1024:8.0f} KB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--prompt-size", type=int, default=2000)
+    args = parser.parse_args()
+    prompt = "請將以下段落翻譯成英文。" * (args.prompt_size // 12 + 1)
+
+    print(f"{args.records} calls x 2 records, {args.threads} threads")
+    with tempfile.TemporaryDirectory() as sync_dir, tempfile.TemporaryDirectory() as queued_dir:
+        sync_logger = logging.getLogger("bench_sync")
+        sync_logger.propagate = False
+        sync_logger.setLevel(logging.INFO)
+        handler = logging.FileHandler(os.path.join(sync_dir, "ai_query_sync.log"), encoding="utf-8")
+        handler.setFormatter(logging.Formatter(log_setup.LOG_FORMAT))
+        sync_logger.addHandler(handler)
+        samples, elapsed = hammer(sync_logger, args, prompt, lazy=False)
+        handler.close()
+        report("sync", samples, elapsed, sync_dir)
+
+        queued_logger = log_setup.setup_logging("INFO", log_dir=queued_dir)
+        samples, elapsed = hammer(log_setup.get_logger("bench"), args, prompt, lazy=True)
+        log_setup.shutdown_logging()
+        report("queued", samples, elapsed, queued_dir)
+        print(f"  dropped {log_setup.dropped_records()} records, level {logging.getLevelName(queued_logger.level)}")
+
+
+if __name__ == "__main__":
+    main()
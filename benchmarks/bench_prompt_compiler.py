@@ -0,0 +1,115 @@
+"""
+提示詞規則表效能測試：比較原本逐一走訪下拉選單的 generate_adjustment_prompt 與編譯後的規則表
+
+產生含 --dropdowns 個下拉選單、每個 --options 個選項的配置（四種規則類型輪流使用），
+先確認兩種實作對隨機選擇的輸出完全一致，再量測編譯一次的時間與每次產生提示詞的時間。
+
+用法:
+    python benchmarks/bench_prompt_compiler.py [--dropdowns 40] [--options 300] [--renders 5000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompt_compiler import compile_prompt_config  # noqa: E402
+
+
+def reference_generate(config, selected_options, text=""):
+    """ConfigManager.generate_adjustment_prompt 原本的實作（長度調整類改以 prompt_templates 判斷）"""
+    prompt_parts = [config.get("prompt_header", "請按照以下要求修改文本：")]
+    for dropdown in config["dropdowns"]:
+        dropdown_id = dropdown["id"]
+        selected_option = selected_options.get(dropdown_id)
+        if selected_option and selected_option != dropdown["options"][dropdown["default_option"]]:
+            if "prompt_templates" in dropdown:
+                if "-" in selected_option:
+                    percentage = selected_option.replace("-", "")
+                    prompt_parts.append(dropdown["prompt_templates"]["decrease"].format(percentage=percentage))
+                else:
+                    percentage = selected_option.replace("+", "")
+                    prompt_parts.append(dropdown["prompt_templates"]["increase"].format(percentage=percentage))
+            elif "target_option" in dropdown and selected_option == dropdown["target_option"]:
+                template = dropdown.get("prompt_template", "將文本轉換為{option}。")
+                prompt_parts.append(template.format(option=selected_option))
+            elif "prompt_values" in dropdown and selected_option in dropdown["prompt_values"]:
+                template = dropdown.get("prompt_template", "")
+                if template:
+                    prompt_value = dropdown["prompt_values"][selected_option]
+                    prompt_parts.append(template.format(option=selected_option, prompt_value=prompt_value))
+            elif "prompt_template" in dropdown:
+                prompt_parts.append(dropdown["prompt_template"].format(option=selected_option))
+    prompt_parts.append(config.get("original_text_label", "\n原始文本："))
+    prompt_parts.append(text)
+    prompt_parts.append(config.get("modified_text_label", "\n修改後的文本："))
+    return "\n".join(prompt_parts)
+
+
+def make_config(dropdowns, options):
+    config = {"dropdowns": []}
+    for i in range(dropdowns):
+        names = [f"選單{i}"] + [f"選項{i}-{j}" for j in range(options - 1)]
+        dropdown = {"id": f"dropdown_{i}", "position": i + 1, "options": names, "default_option": 0}
+        kind = i % 4
+        if kind == 0:
+            dropdown["options"] = [f"選單{i}"] + [f"{sign}{j}%" for j in range(1, options // 2) for sign in "+-"]
+            dropdown["prompt_templates"] = {"decrease": "將文本縮減{percentage}。", "increase": "將文本擴展{percentage}。"}
+        elif kind == 1:
+            dropdown["prompt_template"] = "以{option}的風格撰寫，{prompt_value}。"
+            dropdown["prompt_values"] = {name: f"{name}的詳細說明" for name in names[1:]}
+        elif kind == 2:
+            dropdown["prompt_template"] = "將文本轉換為{option}。"
+            dropdown["target_option"] = names[-1]
+        else:
+            dropdown["prompt_template"] = "加入{option}的要求。"
+        config["dropdowns"].append(dropdown)
+    return config
+
+
+def random_selection(config, rng):
+    return {dropdown["id"]: rng.choice(dropdown["options"]) for dropdown in config["dropdowns"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dropdowns", type=int, default=40)
+    parser.add_argument("--options", type=int, default=300)
+    parser.add_argument("--renders", type=int, default=5000)
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    config = make_config(args.dropdowns, args.options)
+    selections = [random_selection(config, rng) for _ in range(args.renders)]
+
+    start = time.perf_counter()
+    compiled = compile_prompt_config(config)
+    compile_time = time.perf_counter() - start
+
+    for selection in selections[:500]:
+        if compiled.render(selection, "文本") != reference_generate(config, selection, "文本"):
+            print("MISMATCH between compiled rules and reference implementation")
+            sys.exit(1)
+
+    start = time.perf_counter()
+    for selection in selections:
+        reference_generate(config, selection, "文本")
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for selection in selections:
+        compiled.render(selection, "文本")
+    compiled_time = time.perf_counter() - start
+
+    total_options = sum(len(dropdown["options"]) for dropdown in config["dropdowns"])
+    print(f"{args.dropdowns} dropdowns, {total_options} options, {args.renders} renders")
+    print(f"  compile once     {compile_time * 1000:8.2f} ms")
+    print(f"  reference        {reference_time / args.renders * 1e6:8.1f} us/render")
+    print(f"  compiled         {compiled_time / args.renders * 1e6:8.1f} us/render  "
+          f"({reference_time / compiled_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+提供商路由測試：以模擬的提供商比較 single、failover 與 race 模式
+
+主要提供商有 --outage 比例的請求失敗（失敗前會先等待 --timeout 秒，模擬逾時），
+且延遲變異較大；備援提供商較穩定。比較各模式的成功率、平均與 p95 延遲。
+
+用法:
+    python benchmarks/bench_provider_router.py [--requests 200] [--outage 0.2]
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cancellation import RequestCancelled  # noqa: E402
+from provider_router import ProviderRouter  # noqa: E402
+from settings_service import build_settings  # noqa: E402
+
+
+class SimulatedProviders:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(8)
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def __call__(self, name, token):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if name == "gemini":
+                failed = self.rng.random() < self.args.outage
+                latency = self.args.timeout if failed else self.rng.lognormvariate(-3.0, 0.8)
+            else:
+                failed = False
+                latency = self.rng.lognormvariate(-2.7, 0.3)
+        if token is not None and token.wait(latency):
+            raise RequestCancelled("請求已取消")
+        if token is None:
+            time.sleep(latency)
+        if failed:
+            raise RuntimeError(f"{name} timed out")
+        return name
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(mode, args):
+    settings = build_settings({
+        "GOOGLE_API_KEY": "g", "OPENAI_API_KEY": "o",
+        "PROVIDER_ORDER": "gemini,openai", "ROUTING_MODE": mode
+    })
+    providers = SimulatedProviders(args)
+    # 冷卻時間設為 0，讓每個請求都從主要提供商開始，量測最差情況
+    router = ProviderRouter(cooldown=0)
+
+    def one(_):
+        start = time.perf_counter()
+        try:
+            if mode == "single":
+                providers("gemini", None)
+            else:
+                router.route(settings, providers)
+            ok = True
+        except Exception:
+            ok = False
+        return ok, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(one, range(args.requests)))
+    latencies = [elapsed for ok, elapsed in results if ok]
+    success = len(latencies) / len(results) * 100
+    mean = sum(latencies) / len(latencies)
+    print(f"  {mode:<9} success {success:5.1f}%  mean {mean * 1000:5.0f} ms  p95 {percentile(latencies, 0.95) * 1000:5.0f} ms  "
+          f"calls {providers.calls}  failovers {router.failovers}  race wins {router.race_wins}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--outage", type=float, default=0.2, help="主要提供商失敗的比例")
+    parser.add_argument("--timeout", type=float, default=0.3, help="失敗的請求在拋出錯誤前等待的秒數")
+    args = parser.parse_args()
+    for mode in ("single", "failover", "race"):
+        run(mode, args)
+
+
+if __name__ == "__main__":
+    main()
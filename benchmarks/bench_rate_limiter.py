@@ -0,0 +1,116 @@
+"""
+速率限制器測試：多個執行緒對模擬的限流伺服器發送請求
+
+模擬伺服器以每分鐘請求數與 token 數的權杖桶判斷是否回應 429，並在回應標頭中
+回報剩餘額度與 Retry-After。比較不經限制器直接發送（以固定間隔重試 429）與經過
+RateLimiter 排隊（預先設定限制，或只由回應標頭與 429 學到限制）時，完成所有請求所需的時間與收到 429 的次數。
+
+用法:
+    python benchmarks/bench_rate_limiter.py [--requests 60] [--threads 8] [--rpm 600] [--tpm 600000]
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import RateLimiter, TokenBucket  # noqa: E402
+
+
+class SimulatedServer:
+    def __init__(self, rpm, tpm, latency):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.rejected = 0
+        self.served = 0
+
+    def call(self, tokens):
+        """回傳 (status, headers)"""
+        with self.lock:
+            now = time.monotonic()
+            wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+            if wait > 0:
+                self.rejected += 1
+                return 429, {"retry-after": f"{wait:.3f}",
+                             "x-ratelimit-remaining-tokens": str(int(max(0, self.tokens.level)))}
+            self.requests.take(1, now)
+            self.tokens.take(tokens, now)
+            self.served += 1
+            headers = {
+                "x-ratelimit-limit-requests": str(int(self.requests.capacity)),
+                "x-ratelimit-remaining-requests": str(int(self.requests.level)),
+                "x-ratelimit-limit-tokens": str(int(self.tokens.capacity)),
+                "x-ratelimit-remaining-tokens": str(int(self.tokens.level)),
+            }
+        time.sleep(self.latency)
+        return 200, headers
+
+
+def run(server, workload, threads, limiter):
+    queue = list(workload)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not queue:
+                    return
+                tokens = queue.pop()
+            while True:
+                if limiter is not None:
+                    limiter.acquire("openai", "key", tokens)
+                status, headers = server.call(tokens)
+                if status == 200:
+                    if limiter is not None:
+                        limiter.update_from_headers("openai", "key", headers)
+                    break
+                if limiter is not None:
+                    limiter.settle("openai", "key", tokens, 0)
+                    limiter.on_rate_limited("openai", "key", headers)
+                else:
+                    time.sleep(0.05)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--rpm", type=int, default=600)
+    parser.add_argument("--tpm", type=int, default=600000)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    rng = random.Random(4)
+    workload = [rng.randint(200, 1500) for _ in range(args.requests)]
+    # 伺服器從空桶開始，模擬額度已被先前的請求用完
+    # learned limits：用戶端沒有設定限制，只依回應標頭與 429 學到的限制排隊
+    for name, limiter, preset in (("naive retry", None, False),
+                                  ("rate limiter", RateLimiter({"openai": (args.rpm, args.tpm)}), True),
+                                  ("learned", RateLimiter(), False)):
+        server = SimulatedServer(args.rpm, args.tpm, args.latency)
+        server.requests.level = server.tokens.level = 0
+        if preset:
+            limiter.acquire("openai", "key", 0)
+            limiter.update_from_headers("openai", "key", {"x-ratelimit-remaining-requests": "0",
+                                                          "x-ratelimit-remaining-tokens": "0"})
+        elapsed = run(server, workload, args.threads, limiter)
+        ideal = max(args.requests / args.rpm, sum(workload) / args.tpm) * 60
+        print(f"{name:<13} {elapsed:6.2f} s (ideal {ideal:.2f} s), served {server.served}, "
+              f"429 responses {server.rejected}")
+
+
+if __name__ == "__main__":
+    main()
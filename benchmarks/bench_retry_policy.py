@@ -0,0 +1,107 @@
+"""
+重試與對沖請求測試：以帶有長尾延遲與暫時性錯誤的模擬請求比較各策略
+
+模擬請求的延遲大多接近 --latency，但有 --tail 比例的請求慢 --tail-factor 倍；
+另有 --failure 比例的請求回應 503。比較單次請求、退避重試、重試加對沖
+三種策略的成功率與延遲百分位數。對沖以 LatencyTracker 量測到的 p95 為等待時間。
+
+用法:
+    python benchmarks/bench_retry_policy.py [--requests 400] [--failure 0.05] [--tail 0.05]
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cancellation import RequestCancelled  # noqa: E402
+from retry_policy import (HEDGE_PERCENTILE, LatencyTracker, RetryBudget, RetryPolicy,  # noqa: E402
+                          hedged_call)
+
+
+class SimulatedEndpoint:
+    def __init__(self, args, seed):
+        self.args = args
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def __call__(self, token):
+        with self.lock:
+            self.calls += 1
+            slow = self.rng.random() < self.args.tail
+            failed = self.rng.random() < self.args.failure
+            latency = self.args.latency * self.rng.uniform(0.8, 1.2) * (self.args.tail_factor if slow else 1)
+        if token.wait(latency):
+            raise RequestCancelled("請求已取消")
+        if failed:
+            raise urllib.error.HTTPError("http://sim", 503, "Service Unavailable", {}, io.BytesIO(b""))
+        return latency
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(name, args, retries, hedge):
+    from cancellation import CancelToken
+    endpoint = SimulatedEndpoint(args, seed=11)
+    policy = RetryPolicy(max_retries=retries, base_delay=args.latency / 4, budget=RetryBudget(), rng=random.Random(2))
+    tracker = LatencyTracker()
+
+    def one_request(_):
+        token = CancelToken()
+        start = time.perf_counter()
+
+        def attempt(attempt_token):
+            hedge_after = tracker.percentile("sim", HEDGE_PERCENTILE) if hedge else None
+
+            def timed(hedge_token):
+                began = time.perf_counter()
+                result = endpoint(hedge_token)
+                tracker.record("sim", time.perf_counter() - began)
+                return result
+
+            return hedged_call(timed, hedge_after, attempt_token, stats=policy)
+
+        try:
+            policy.call(attempt, token)
+            ok = True
+        except Exception:
+            ok = False
+        return ok, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(one_request, range(args.requests)))
+    latencies = [elapsed for ok, elapsed in results if ok]
+    success = len(latencies) / len(results) * 100
+    print(f"  {name:<16} success {success:5.1f}%  p50 {percentile(latencies, 0.5) * 1000:6.0f} ms  "
+          f"p95 {percentile(latencies, 0.95) * 1000:6.0f} ms  p99 {percentile(latencies, 0.99) * 1000:6.0f} ms  "
+          f"calls {endpoint.calls}  hedged {policy.hedged} (won {policy.hedge_wins})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--tail", type=float, default=0.05, help="慢速請求的比例")
+    parser.add_argument("--tail-factor", type=float, default=10.0)
+    parser.add_argument("--failure", type=float, default=0.05, help="回應 503 的比例")
+    args = parser.parse_args()
+
+    print(f"{args.requests} requests, {args.failure:.0%} transient failures, {args.tail:.0%} tail x{args.tail_factor:g}")
+    run("single attempt", args, retries=0, hedge=False)
+    run("retry", args, retries=2, hedge=False)
+    run("retry + hedge", args, retries=2, hedge=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+相似提示詞快取測試：以改寫過的提示詞語料量測 SemanticCache 的精確率與召回率
+
+先以 --base 個基準提示詞（中英文的翻譯、摘要、改寫、擴展等指令加上隨機長度的文本）建立索引，
+再以每個基準提示詞產生的變體查詢：
+
+    應命中  只改標點、空白、全半形、大小寫，或加減「請」「幫我」「謝謝」等客套字
+    不應命中  換成另一段文本、換指令、換目標語言、換百分比，或在指令中加入「用英文」「並簡短」等要求
+
+對每個門檻列出精確率（命中中正確的比例）、召回率（應命中中實際命中的比例）、
+誤命中的變體類型，以及平均查詢時間；最後比較 LSH 查詢與逐一比對全部簽章的時間。
+
+用法:
+    python benchmarks/bench_semantic_cache.py [--base 500] [--thresholds 0.7,0.8,0.9,0.95,1.0]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from semantic_cache import SemanticCache, estimate_similarity  # noqa: E402
+
+INSTRUCTIONS = [
+    ("請將以下文字翻譯成{lang}：", True),
+    ("請摘要以下內容，列出三個重點：", False),
+    ("請用正式的語氣改寫下面這段文字：", False),
+    ("請將文本擴展{percent}%，保持原意。", False),
+    ("Rewrite the following paragraph in a friendly tone:", False),
+    ("Summarize the text below in one sentence:", False),
+    ("Translate the following text into {lang}:", True),
+]
+LANGUAGES = ["英文", "日文", "法文", "德文", "韓文"]
+ZH_WORDS = ["季度", "營收", "成長", "客戶", "產品", "市場", "策略", "風險", "預算", "團隊", "會議", "計畫",
+            "報告", "系統", "使用者", "資料", "分析", "結果", "目標", "進度"]
+EN_WORDS = ["quarter", "revenue", "growth", "customer", "product", "market", "strategy", "risk", "budget",
+            "team", "meeting", "plan", "report", "system", "user", "data", "analysis", "result", "goal"]
+POLITE_PREFIXES = ["請", "幫我", "麻煩", "please "]
+POLITE_SUFFIXES = ["謝謝", "，謝謝！", " thanks", "。感謝"]
+ADDED_INSTRUCTIONS = ["用英文", "並簡短", " 更正式", "，列出五點", " in French", "不要"]
+PUNCTUATION = {"，": ",", "。": ".", "：": ":", "！": "!", ",": "，", ".": "。", ":": "："}
+
+
+def make_text(rng):
+    words = ZH_WORDS if rng.random() < 0.6 else EN_WORDS
+    joiner = "" if words is ZH_WORDS else " "
+    sentences = []
+    for _ in range(rng.randint(1, 8)):
+        sentence = joiner.join(rng.choice(words) for _ in range(rng.randint(4, 12)))
+        sentences.append(sentence + ("。" if words is ZH_WORDS else ". "))
+    return "".join(sentences)
+
+
+def make_base(rng):
+    template, _ = rng.choice(INSTRUCTIONS)
+    fields = {"lang": rng.choice(LANGUAGES), "percent": rng.choice([10, 20, 30, 50])}
+    return {"template": template, "fields": fields, "text": make_text(rng)}
+
+
+def render(base, template=None, fields=None, text=None):
+    template = template or base["template"]
+    values = dict(base["fields"], **(fields or {}))
+    return template.format(**values) + "\n" + (text if text is not None else base["text"])
+
+
+def positive_variants(base, rng):
+    prompt = render(base)
+    variants = {
+        "punctuation": "".join(PUNCTUATION.get(ch, ch) for ch in prompt),
+        "whitespace": prompt.replace("\n", "\n\n  ").replace("：", "： ") + "  ",
+        "case": prompt.upper() if rng.random() < 0.5 else prompt.lower(),
+        "polite": rng.choice(POLITE_PREFIXES) + prompt + rng.choice(POLITE_SUFFIXES),
+    }
+    return variants
+
+
+def negative_variants(base, rng):
+    variants = {"other_text": render(base, text=make_text(rng))}
+    others = [template for template, _ in INSTRUCTIONS if template != base["template"]]
+    variants["other_instruction"] = render(base, template=rng.choice(others))
+    # 在指令結尾（冒號或句號之前）插入額外的要求
+    template = base["template"]
+    variants["added_instruction"] = render(base, template=template[:-1] + rng.choice(ADDED_INSTRUCTIONS) + template[-1])
+    if "{lang}" in base["template"]:
+        lang = rng.choice([lang for lang in LANGUAGES if lang != base["fields"]["lang"]])
+        variants["other_language"] = render(base, fields={"lang": lang})
+    if "{percent}" in base["template"]:
+        percent = rng.choice([p for p in (10, 20, 30, 50) if p != base["fields"]["percent"]])
+        variants["other_percent"] = render(base, fields={"percent": percent})
+    return variants
+
+
+def evaluate(cache, queries):
+    true_hits = false_hits = misses = 0
+    false_kinds = Counter()
+    missed_kinds = Counter()
+    start = time.perf_counter()
+    for prompt, expected, kind in queries:
+        target, _ = cache.lookup("scope", prompt)
+        if target is None:
+            if expected is not None:
+                misses += 1
+                missed_kinds[kind] += 1
+        elif target == expected:
+            true_hits += 1
+        else:
+            false_hits += 1
+            false_kinds[kind] += 1
+    elapsed = time.perf_counter() - start
+    return true_hits, false_hits, misses, false_kinds, missed_kinds, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base", type=int, default=500)
+    parser.add_argument("--thresholds", default="0.7,0.8,0.9,0.95,1.0")
+    args = parser.parse_args()
+
+    rng = random.Random(23)
+    bases = [make_base(rng) for _ in range(args.base)]
+    queries = []
+    for index, base in enumerate(bases):
+        for kind, prompt in positive_variants(base, rng).items():
+            queries.append((prompt, index, kind))
+        for kind, prompt in negative_variants(base, rng).items():
+            queries.append((prompt, None, kind))
+    positives = sum(1 for _, expected, _ in queries if expected is not None)
+    print(f"{args.base} cached prompts, {len(queries)} queries ({positives} should hit)")
+
+    for threshold in (float(value) for value in args.thresholds.split(",")):
+        cache = SemanticCache(threshold=threshold)
+        for index, base in enumerate(bases):
+            cache.add("scope", render(base), index)
+        true_hits, false_hits, misses, false_kinds, missed_kinds, elapsed = evaluate(cache, queries)
+        hits = true_hits + false_hits
+        precision = true_hits / hits if hits else 1.0
+        recall = true_hits / positives
+        print(f"  threshold {threshold:4.2f}  precision {precision:6.3f}  recall {recall:6.3f}  "
+              f"{elapsed / len(queries) * 1e6:7.1f} us/lookup  "
+              f"false hits {dict(false_kinds)}  missed {dict(missed_kinds)}")
+
+    # LSH 只比對同一區段落在同一個桶的候選；與逐一比對全部簽章比較
+    cache = SemanticCache(threshold=0.9)
+    for index, base in enumerate(bases):
+        cache.add("scope", render(base), index)
+    signatures = [entry.signature for entry in cache._entries.values()]
+    probes = [prompt for prompt, _, _ in queries[:500]]
+    start = time.perf_counter()
+    features = [cache._features("scope", prompt) for prompt in probes]
+    feature_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for prompt in probes:
+        cache.lookup("scope", prompt)
+    lsh_time = time.perf_counter() - start - feature_time
+    start = time.perf_counter()
+    for _, _, signature, _ in features:
+        max(estimate_similarity(signature, other) for other in signatures)
+    scan_time = time.perf_counter() - start
+    print(f"  normalize + MinHash signature  {feature_time / len(probes) * 1e6:8.1f} us")
+    print(f"  LSH candidates + edit check    {lsh_time / len(probes) * 1e6:8.1f} us   "
+          f"candidates/lookup {cache.stats()['candidates_per_lookup']:.1f}")
+    print(f"  linear scan of all signatures  {scan_time / len(probes) * 1e6:8.1f} us   "
+          f"compared {len(signatures)} signatures")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+對話框開啟延遲測試：量測從點擊工具列到主對話框顯示的時間
+
+cold 模式模擬舊版每次點擊的做法：清除已匯入的擴充模組與共用服務後重新建立；
+warm 模式重複使用行程內共用的服務物件。
+
+預設不需要 LibreOffice，只量測 Python 端的部分：cold 為重新匯入模組並建立 AIService
+（連線池、快取、設定、日誌等共用物件），warm 為重複使用時每次開啟仍會執行的
+reset_session 與讀取設定快照。加上 --office 時以 officehelper.bootstrap 啟動 LibreOffice
+（請使用 office 內附的 Python 執行），量測完整的開啟流程，每次都以 setVisible 顯示對話框後立即關閉；
+請先確認 ~/.libreoffice/libreoffice_ai_config.json 已存在，否則第一次會跳出建立配置的訊息框。
+
+用法:
+    python benchmarks/bench_startup.py [--iterations 20] [--office]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+# 日誌管線在行程內只建立一次，清除模組時保留，避免每次重新匯入都多一個寫入執行緒
+KEEP_MODULES = {"log_setup"}
+
+
+def extension_modules():
+    names = []
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None) or ""
+        if os.path.dirname(os.path.abspath(path)) == BASE_DIR and name not in KEEP_MODULES:
+            names.append(name)
+    return names
+
+
+def clear_extension_modules():
+    for name in extension_modules():
+        if name != "main":
+            del sys.modules[name]
+
+
+def open_offline(cold, shared):
+    started = time.perf_counter()
+    if cold:
+        clear_extension_modules()
+        from ai_service import AIService
+        service = AIService(None)
+    else:
+        service = shared
+    service.reset_session()
+    service.settings_service.get()
+    return (time.perf_counter() - started) * 1000
+
+
+def open_once(job, cold):
+    started = time.perf_counter()
+    if cold:
+        clear_extension_modules()
+    from services import get_services, reset_services
+    if cold:
+        reset_services()
+    services = get_services(job.ctx)
+    dialog, event_handler = job.open_dialog(services)
+    dialog.setVisible(True)
+    elapsed = time.perf_counter() - started
+    dialog.setVisible(False)
+    event_handler.dispose()
+    dialog.dispose()
+    return elapsed * 1000
+
+
+def report(name, samples):
+    ordered = sorted(samples)
+    print(f"  {name:<6} first {samples[0]:7.1f} ms  median {statistics.median(samples):7.1f} ms  "
+          f"p95 {ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--office", action="store_true", help="以 LibreOffice 量測完整的對話框開啟流程")
+    args = parser.parse_args()
+
+    if not args.office:
+        print(f"{args.iterations} service setups (Python side only)")
+        report("cold", [open_offline(True, None) for _ in range(args.iterations)])
+        from ai_service import AIService
+        shared = AIService(None)
+        report("warm", [open_offline(False, shared) for _ in range(args.iterations)])
+        return
+
+    import officehelper
+    ctx = officehelper.bootstrap()
+    if ctx is None:
+        print("ERROR: Could not bootstrap default Office.")
+        sys.exit(1)
+
+    from main import AIQueryJob
+    job = AIQueryJob(ctx)
+    print(f"{args.iterations} dialog opens")
+    report("cold", [open_once(job, cold=True) for _ in range(args.iterations)])
+    report("warm", [open_once(job, cold=False) for _ in range(args.iterations)])
+
+
+if __name__ == "__main__":
+    main()
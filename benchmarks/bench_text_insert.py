@@ -0,0 +1,263 @@
+"""
+文件插入測試：比較原本的 insertString 插入方式與 WriterTextInserter
+
+每種方式都在新的 Writer 文件中插入約 --words 個字的回應，量測耗時與產生的復原步驟數：
+
+    legacy          原本的 Utils.insert_text_at_cursor（畫面游標 + 一次 insertString）
+    legacy-stream   以原本的方式逐段插入串流片段（每段一次 insertString）
+    inserter        insert_text：鎖定畫面並包在一個復原內容中
+    inserter-stream 以 WriterTextInserter 逐段寫入串流片段（鎖定畫面，累積後才寫入文件）
+
+預設以記憶體中的模擬文件執行，不需要 LibreOffice：每次 UNO 呼叫計入 --call-cost 微秒，
+未鎖定畫面時每次修改文件計入一次 --reflow-cost 微秒的版面重排（鎖定期間的修改在解除鎖定時
+只重排一次），復原步驟依 undo context 計算。加上 --office 時改用實際的 LibreOffice
+（以 officehelper.bootstrap 啟動，請使用 office 內附的 Python 執行）。
+
+用法:
+    python benchmarks/bench_text_insert.py [--words 5000] [--chunk 24] [--office [--visible]]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_inserter import WriterTextInserter, insert_text  # noqa: E402
+
+
+def make_response(words, rng):
+    vocabulary = ["the", "model", "response", "document", "paragraph", "insert", "writer", "text", "layout",
+                  "undo", "stream", "chunk", "文件", "段落", "回應"]
+    paragraphs = []
+    remaining = words
+    while remaining > 0:
+        size = min(remaining, rng.randint(40, 120))
+        paragraphs.append(" ".join(rng.choice(vocabulary) for _ in range(size)) + ".")
+        remaining -= size
+    return "\n".join(paragraphs)
+
+
+def _spin(seconds):
+    """忙碌等待模擬的成本；time.sleep 的精度不足以表示數十微秒"""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class SimulatedDocument:
+    """
+    記憶體中的 Writer 文件，只實作插入測試用到的 UNO 介面
+
+    文字一律附加在文件結尾（測試只在空白文件的結尾插入）；calls 為 UNO 呼叫數，
+    reflows 為版面重排次數。
+    """
+
+    def __init__(self, call_cost, reflow_cost):
+        self.call_cost = call_cost
+        self.reflow_cost = reflow_cost
+        self.parts = []
+        self.calls = 0
+        self.reflows = 0
+        self.undo_titles = []
+        self._undo_depth = 0
+        self._lock_depth = 0
+        self._dirty = False
+        self._text = SimulatedText(self)
+        self._view_cursor = SimulatedCursor(self)
+
+    def call(self):
+        self.calls += 1
+        _spin(self.call_cost)
+
+    def modified(self, title):
+        if self._undo_depth == 0:
+            self.undo_titles.append(title)
+        if self._lock_depth:
+            self._dirty = True
+        else:
+            self._reflow()
+
+    def _reflow(self):
+        self.reflows += 1
+        _spin(self.reflow_cost)
+
+    # XModel
+    def getCurrentController(self):
+        self.call()
+        return self
+
+    def getViewCursor(self):
+        self.call()
+        return self._view_cursor
+
+    def getText(self):
+        self.call()
+        return self._text
+
+    def lockControllers(self):
+        self.call()
+        self._lock_depth += 1
+
+    def unlockControllers(self):
+        self.call()
+        self._lock_depth -= 1
+        if self._lock_depth == 0 and self._dirty:
+            self._dirty = False
+            self._reflow()
+
+    # XUndoManager
+    def getUndoManager(self):
+        self.call()
+        return self
+
+    def enterUndoContext(self, title):
+        self.call()
+        if self._undo_depth == 0:
+            self.undo_titles.append(title)
+        self._undo_depth += 1
+
+    def leaveUndoContext(self):
+        self.call()
+        self._undo_depth -= 1
+
+    def getAllUndoActionTitles(self):
+        return list(self.undo_titles)
+
+    def close(self, deliver_ownership):
+        pass
+
+
+class SimulatedText:
+    def __init__(self, doc):
+        self.doc = doc
+
+    def createTextCursorByRange(self, text_range):
+        self.doc.call()
+        return SimulatedCursor(self.doc)
+
+    def insertControlCharacter(self, cursor, character, absorb):
+        self.doc.call()
+        self.doc.parts.append("\n")
+        self.doc.modified("新段落")
+
+    def insertString(self, cursor, text, absorb):
+        self.doc.call()
+        self.doc.parts.append(text)
+        self.doc.modified("輸入")
+
+    def getString(self):
+        return "".join(self.doc.parts)
+
+
+class SimulatedCursor:
+    def __init__(self, doc):
+        self.doc = doc
+
+    @property
+    def Text(self):
+        self.doc.call()
+        return self.doc._text
+
+    def getText(self):
+        self.doc.call()
+        return self.doc._text
+
+    def getEnd(self):
+        self.doc.call()
+        return self
+
+    def isCollapsed(self):
+        self.doc.call()
+        return True
+
+    def gotoRange(self, text_range, expand):
+        self.doc.call()
+
+
+def legacy_insert(doc, text):
+    cursor = doc.getCurrentController().getViewCursor()
+    if not cursor.isCollapsed():
+        cursor.gotoRange(cursor.getEnd(), False)
+    cursor.Text.insertControlCharacter(cursor, 0, False)
+    cursor.Text.insertString(cursor, text, False)
+
+
+def legacy_stream(doc, chunks):
+    cursor = doc.getCurrentController().getViewCursor()
+    cursor.Text.insertControlCharacter(cursor, 0, False)
+    for chunk in chunks:
+        cursor.Text.insertString(cursor, chunk, False)
+
+
+def inserter_stream(doc, chunks):
+    inserter = WriterTextInserter(doc).begin()
+    try:
+        for chunk in chunks:
+            inserter.write(chunk)
+    finally:
+        inserter.finish()
+
+
+def run(name, new_document, action):
+    doc = new_document()
+    try:
+        start = time.perf_counter()
+        action(doc)
+        elapsed = time.perf_counter() - start
+        undo_steps = len(doc.getUndoManager().getAllUndoActionTitles())
+        characters = len(doc.getText().getString())
+        detail = f"  UNO calls {doc.calls:6d}  reflows {doc.reflows:6d}" if isinstance(doc, SimulatedDocument) else ""
+    finally:
+        doc.close(True)
+    print(f"  {name:<16} {elapsed * 1000:9.1f} ms  undo steps {undo_steps:5d}  characters {characters}{detail}")
+
+
+def office_document_factory(visible):
+    import officehelper
+    from com.sun.star.beans import PropertyValue
+
+    ctx = officehelper.bootstrap()
+    if ctx is None:
+        print("ERROR: Could not bootstrap default Office.")
+        sys.exit(1)
+    desktop = ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+
+    def new_document():
+        hidden = PropertyValue()
+        hidden.Name = "Hidden"
+        hidden.Value = not visible
+        return desktop.loadComponentFromURL("private:factory/swriter", "_blank", 0, (hidden,))
+    return new_document
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, default=5000)
+    parser.add_argument("--chunk", type=int, default=24, help="串流片段的平均字元數")
+    parser.add_argument("--office", action="store_true", help="使用實際的 LibreOffice 文件")
+    parser.add_argument("--visible", action="store_true", help="在可見的視窗中插入（包含重繪成本，需搭配 --office）")
+    parser.add_argument("--call-cost", type=float, default=20.0, help="模擬文件每次 UNO 呼叫的微秒數")
+    parser.add_argument("--reflow-cost", type=float, default=300.0, help="模擬文件每次版面重排的微秒數")
+    args = parser.parse_args()
+
+    if args.office:
+        new_document = office_document_factory(args.visible)
+    else:
+        new_document = lambda: SimulatedDocument(args.call_cost / 1e6, args.reflow_cost / 1e6)
+
+    rng = random.Random(3)
+    text = make_response(args.words, rng)
+    chunks = [text[i:i + args.chunk] for i in range(0, len(text), args.chunk)]
+    print(f"{args.words} words, {len(text)} characters, {len(chunks)} stream chunks"
+          f"{'' if args.office else ' (simulated document)'}")
+
+    run("legacy", new_document, lambda doc: legacy_insert(doc, text))
+    run("legacy-stream", new_document, lambda doc: legacy_stream(doc, chunks))
+    run("inserter", new_document, lambda doc: insert_text(doc, text))
+    run("inserter-stream", new_document, lambda doc: inserter_stream(doc, chunks))
+
+
+if __name__ == "__main__":
+    main()
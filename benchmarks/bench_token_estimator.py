@@ -0,0 +1,115 @@
+"""
+字元分類估算效能測試：比較原本的五次 re.findall 與單次走訪的 count_char_classes
+
+會先確認兩種實作在多種文本上的估算結果完全一致，再量測速度；
+若單次走訪沒有比原實作快 --min-speedup 倍，以非零狀態碼結束。
+
+用法:
+    python benchmarks/bench_token_estimator.py [--size 500000] [--min-speedup 1.5]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from token_estimator import heuristic_token_count  # noqa: E402
+
+
+def reference_estimate(text):
+    """AIService.estimate_token_count 原本的本地估算實作"""
+    chinese_chars = len(re.findall(r'[一-鿿]', text))
+    numbers = len(re.findall(r'\d', text))
+    english_words = len(re.findall(r'\b[a-zA-Z]+\b', text))
+    punct_chars = len(re.findall(r'[^\w\s一-鿿]', text))
+    whitespace = len(re.findall(r'\s', text))
+    other_chars = len(text) - chinese_chars - numbers - punct_chars - whitespace
+    estimated_tokens = (
+        chinese_chars * 0.7 +
+        english_words * 1.3 +
+        numbers * 0.5 +
+        punct_chars * 0.5 +
+        whitespace * 0.3 +
+        other_chars * 1.0
+    )
+    return int(estimated_tokens + 0.5)
+
+
+SAMPLES = [
+    "",
+    "Hello, world!",
+    "abc中文def 123abc abc123 _abc abc_ café naïve",
+    "人工智慧（AI）正在改變 LibreOffice 的寫作流程，version 7.6 起支援 Python 3。",
+    "tabs\tand\nnewlines\r\n　全形空白　and emoji 🤖🚀",
+    "Ⅻ ½ ٣ ١٢٣ ① x²",
+]
+
+
+def make_text(size):
+    random.seed(7)
+    alphabet = (
+        "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+        "    \n\t.,;:!?()[]{}\"'-_"
+        "的一是不了人我在有他這中大來上國個到說們為子和你地出道也時年"
+        "，。、；：？！「」（）éüñß½①🤖"
+    )
+    return "".join(random.choice(alphabet) for _ in range(size))
+
+
+def random_samples(count):
+    """涵蓋 BMP、中文區段與補充平面的隨機字碼，檢查邊界情況"""
+    random.seed(11)
+    samples = []
+    for _ in range(count):
+        samples.append("".join(
+            chr(random.choice([
+                random.randint(0x20, 0x7e), random.randint(0, 0x2fff),
+                random.randint(0x4e00, 0x9fff), random.randint(0x10000, 0x1ffff)
+            ]))
+            for _ in range(random.randint(0, 40))
+        ))
+    return samples
+
+
+def timed(function, text, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=500000, help="測試文本字元數")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-speedup", type=float, default=1.5)
+    args = parser.parse_args()
+
+    text = make_text(args.size)
+    samples = SAMPLES + random_samples(2000) + [text[:5000], text]
+    for sample in samples:
+        expected = reference_estimate(sample)
+        actual = heuristic_token_count(sample)[0]
+        if expected != actual:
+            print(f"MISMATCH on {sample[:40]!r}: reference {expected}, single-pass {actual}")
+            sys.exit(1)
+    print(f"outputs identical on {len(samples)} samples")
+
+    reference_time = timed(reference_estimate, text, args.repeat)
+    single_pass_time = timed(heuristic_token_count, text, args.repeat)
+    speedup = reference_time / single_pass_time
+    print(f"{args.size} chars: five findall scans {reference_time * 1000:.1f} ms, "
+          f"single pass {single_pass_time * 1000:.1f} ms, speedup {speedup:.2f}x")
+    if speedup < args.min_speedup:
+        print(f"FAIL: speedup below {args.min_speedup}x")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+本機 BPE 分詞器效能測試：在 1 MB 中英混合文本上計算 token 數
+
+可用 --vocab 指定真實的 tiktoken 詞表（例如 cl100k_base.tiktoken）；
+未指定時會以測試文本訓練一個小型詞表，只用於量測速度。
+同時驗證堆積合併演算法與 tiktoken 原始的逐一掃描演算法結果一致，
+並比較文字詞表與二進位快取的載入時間。
+
+用法:
+    python benchmarks/bench_tokenizer.py [--vocab cl100k_base.tiktoken] [--size 1000000]
+"""
+import argparse
+import base64
+import collections
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bpe_tokenizer import (  # noqa: E402
+    CL100K_PATTERN, BPETokenizer, load_binary_ranks, load_tiktoken_ranks, save_binary_ranks
+)
+
+ENGLISH = (
+    "The quick brown fox jumps over the lazy dog. Large language models split text into tokens "
+    "before processing it, and the number of tokens determines both cost and latency. "
+)
+CHINESE = (
+    "人工智慧正在改變我們撰寫文件的方式，透過大型語言模型可以快速摘要、翻譯與改寫內容。"
+    "在長度調整的過程中，準確估算字詞數量能減少不必要的請求次數。"
+)
+
+
+def random_segment():
+    """隨機組合的中英文片段，避免整份文本都命中片段快取"""
+    words = ENGLISH.split()
+    english = " ".join(random.choice(words) for _ in range(random.randint(3, 12)))
+    chinese = "".join(random.choice(CHINESE) for _ in range(random.randint(5, 30)))
+    return f"{english} {chinese}。"
+
+
+def make_text(size):
+    random.seed(42)
+    parts = []
+    total = 0
+    while total < size:
+        part = random.choice([
+            ENGLISH, CHINESE, random_segment(), random_segment(),
+            f"第{random.randint(1, 999)}章 Chapter {random.randint(1, 99)}\n"
+        ])
+        parts.append(part)
+        total += len(part.encode("utf-8"))
+    return "".join(parts)
+
+
+def train_ranks(text, merges):
+    """以片段頻率訓練簡易的 byte-level BPE 詞表"""
+    ranks = {bytes([byte]): byte for byte in range(256)}
+    words = collections.Counter(match.group().encode("utf-8") for match in CL100K_PATTERN.finditer(text))
+    splits = {word: [word[i:i + 1] for i in range(len(word))] for word in words}
+    for _ in range(merges):
+        pairs = collections.Counter()
+        for word, freq in words.items():
+            parts = splits[word]
+            for i in range(len(parts) - 1):
+                pairs[parts[i], parts[i + 1]] += freq
+        if not pairs:
+            break
+        (left, right), _ = pairs.most_common(1)[0]
+        merged = left + right
+        ranks[merged] = len(ranks)
+        for word in words:
+            parts = splits[word]
+            i = 0
+            while i < len(parts) - 1:
+                if parts[i] == left and parts[i + 1] == right:
+                    parts[i:i + 2] = [merged]
+                else:
+                    i += 1
+    return ranks
+
+
+def reference_merge_count(ranks, piece):
+    """tiktoken 原始的 O(n^2) 合併演算法，用於驗證結果"""
+    parts = [piece[i:i + 1] for i in range(len(piece))]
+    while len(parts) > 1:
+        best = None
+        for i in range(len(parts) - 1):
+            rank = ranks.get(parts[i] + parts[i + 1])
+            if rank is not None and (best is None or rank < best[0]):
+                best = (rank, i)
+        if best is None:
+            break
+        i = best[1]
+        parts[i:i + 2] = [parts[i] + parts[i + 1]]
+    return len(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vocab", help="tiktoken 格式詞表路徑")
+    parser.add_argument("--size", type=int, default=1000000, help="測試文本大小（位元組）")
+    parser.add_argument("--merges", type=int, default=300, help="未指定詞表時訓練的合併規則數")
+    args = parser.parse_args()
+
+    text = make_text(args.size)
+    print(f"text: {len(text.encode('utf-8'))} bytes, {len(text)} chars")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if args.vocab:
+            start = time.perf_counter()
+            ranks = load_tiktoken_ranks(args.vocab)
+            text_load = time.perf_counter() - start
+        else:
+            start = time.perf_counter()
+            ranks = train_ranks(text[:20000], args.merges)
+            print(f"trained {len(ranks) - 256} merges in {time.perf_counter() - start:.2f} s")
+            vocab_path = os.path.join(temp_dir, "trained.tiktoken")
+            with open(vocab_path, "wb") as f:
+                for token, rank in ranks.items():
+                    f.write(base64.b64encode(token) + b" " + str(rank).encode() + b"\n")
+            start = time.perf_counter()
+            load_tiktoken_ranks(vocab_path)
+            text_load = time.perf_counter() - start
+
+        binary_path = os.path.join(temp_dir, "ranks.bin")
+        save_binary_ranks(ranks, binary_path)
+        start = time.perf_counter()
+        assert load_binary_ranks(binary_path) == ranks
+        binary_load = time.perf_counter() - start
+        print(f"vocab load: text {text_load * 1000:.1f} ms, binary cache {binary_load * 1000:.1f} ms "
+              f"({os.path.getsize(binary_path)} bytes)")
+
+    tokenizer = BPETokenizer(ranks)
+
+    # 驗證堆積合併與參考實作一致
+    pieces = {match.group().encode("utf-8") for match in CL100K_PATTERN.finditer(text[:200000])}
+    mismatches = sum(1 for piece in pieces if len(tokenizer._merge(piece)) != reference_merge_count(ranks, piece))
+    print(f"merge check: {len(pieces)} distinct pieces, {mismatches} mismatches")
+
+    start = time.perf_counter()
+    cold = tokenizer.count(text)
+    cold_time = time.perf_counter() - start
+    start = time.perf_counter()
+    warm = tokenizer.count(text)
+    warm_time = time.perf_counter() - start
+    assert cold == warm
+    mb = len(text.encode("utf-8")) / 1e6
+    print(f"count: {cold} tokens; cold {cold_time:.2f} s ({mb / cold_time:.2f} MB/s), "
+          f"warm piece cache {warm_time:.2f} s ({mb / warm_time:.2f} MB/s)")
+
+
+if __name__ == "__main__":
+    main()
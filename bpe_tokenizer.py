@@ -0,0 +1,401 @@
+import base64
+import heapq
+import os
+import re
+import struct
+import threading
+import time
+from array import array
+
+from log_setup import get_logger
+
+
+logger = get_logger("bpe_tokenizer")
+
+
+# cl100k_base 的預先分詞規則。標準函式庫的 re 不支援 \p{L}、\p{N}，
+# 這裡以 [^\W\d_]（字母）與 \d（數字）近似，對一般中英文文本的切分結果相同。
+_LETTER = r"[^\W\d_]"
+_NOT_LETTER_NUMBER_NEWLINE = r"(?:[^\r\n\w]|_)"
+_NOT_SPACE_LETTER_NUMBER = r"(?:[^\s\w]|_)"
+CL100K_PATTERN = re.compile(
+    r"(?i:'s|'t|'re|'ve|'m|'ll|'d)"
+    rf"|{_NOT_LETTER_NUMBER_NEWLINE}?{_LETTER}+"
+    r"|\d{1,3}"
+    rf"| ?{_NOT_SPACE_LETTER_NUMBER}+[\r\n]*"
+    r"|\s*[\r\n]+"
+    r"|\s+(?!\S)"
+    r"|\s+"
+)
+
+# o200k_base 的預先分詞規則：依大小寫切開駝峰式單字、縮寫 ('s 等) 接在單字後面、
+# 標點後面可接 / 與換行。\p{Lu} 與 \p{Ll} 以常見的拉丁、希臘、西里爾大小寫字母近似，
+# 沒有大小寫的文字（例如中文）同時屬於兩類，與原始規則相同。
+_UPPER_LETTER = r"(?:(?![a-zß-öø-ÿα-ωа-яё])[^\W\d_])"
+_LOWER_LETTER = r"(?:(?![A-ZÀ-ÖØ-ÞΑ-ΩА-ЯЁ])[^\W\d_])"
+_CONTRACTION = r"(?i:'s|'t|'re|'ve|'m|'ll|'d)"
+O200K_PATTERN = re.compile(
+    rf"{_NOT_LETTER_NUMBER_NEWLINE}?{_UPPER_LETTER}*{_LOWER_LETTER}+{_CONTRACTION}?"
+    rf"|{_NOT_LETTER_NUMBER_NEWLINE}?{_UPPER_LETTER}+{_LOWER_LETTER}*{_CONTRACTION}?"
+    r"|\d{1,3}"
+    rf"| ?{_NOT_SPACE_LETTER_NUMBER}+[\r\n/]*"
+    r"|\s*[\r\n]+"
+    r"|\s+(?!\S)"
+    r"|\s+"
+)
+
+# GPT-2 (r50k_base、p50k_base) 的預先分詞規則，用於 merges.txt 格式的詞表
+GPT2_PATTERN = re.compile(
+    r"'s|'t|'re|'ve|'m|'ll|'d"
+    rf"| ?{_LETTER}+"
+    r"| ?\d+"
+    rf"| ?{_NOT_SPACE_LETTER_NUMBER}+"
+    r"|\s+(?!\S)"
+    r"|\s+"
+)
+
+# 各編碼的預先分詞規則；不在表中的編碼使用 cl100k_base 的規則
+ENCODING_PATTERNS = {
+    "cl100k_base": CL100K_PATTERN,
+    "o200k_base": O200K_PATTERN,
+    "gpt2": GPT2_PATTERN,
+    "r50k_base": GPT2_PATTERN,
+    "p50k_base": GPT2_PATTERN,
+    "p50k_edit": GPT2_PATTERN,
+}
+
+# 詞表目錄的檔案清單重新讀取的間隔（秒）
+LISTING_TTL = 30.0
+# 詞表載入失敗或找不到時，經過這段時間（秒）才再嘗試載入
+RETRY_INTERVAL = 60.0
+
+# 二進位快取檔格式標記
+_BINARY_MAGIC = b"BPERANK1"
+
+# 以 OpenAI 編碼的計數推估其他提供商 token 數的校正係數：(拉丁文字係數, 中日韓文字係數)。
+# 依文本中中日韓字元所佔比例線性內插，僅為近似值。
+CALIBRATION = {
+    "openai": (1.0, 1.0),
+    "claude": (1.15, 1.1),
+    "gemini": (0.95, 0.65),
+    "mistral": (1.1, 1.3)
+}
+
+_CJK_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+
+
+def load_tiktoken_ranks(path):
+    """讀取 tiktoken 格式的詞表（每行為 base64 token 與其 rank）"""
+    ranks = {}
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            token, rank = line.split()
+            ranks[base64.b64decode(token)] = int(rank)
+    return ranks
+
+
+def _bytes_to_unicode():
+    """GPT-2 byte-level BPE 所使用的位元組與可見字元對照表"""
+    printable = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    codes = printable[:]
+    extra = 0
+    for byte in range(256):
+        if byte not in printable:
+            printable.append(byte)
+            codes.append(256 + extra)
+            extra += 1
+    return {chr(code): byte for byte, code in zip(printable, codes)}
+
+
+def load_merges_ranks(merges_path):
+    """
+    讀取 GPT-2 格式的 merges.txt，轉換為以位元組為鍵的 rank 表
+
+    基本的 256 個位元組佔用 rank 0-255，第 i 條合併規則產生的 token 為 256 + i。
+    """
+    decoder = _bytes_to_unicode()
+    ranks = {bytes([byte]): byte for byte in range(256)}
+    with open(merges_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line or line.startswith("#version"):
+                continue
+            left, right = line.split(" ")
+            merged = bytes(decoder[ch] for ch in left + right)
+            if merged not in ranks:
+                ranks[merged] = len(ranks)
+    return ranks
+
+
+def save_binary_ranks(ranks, path):
+    """
+    將 rank 表存成精簡的二進位檔
+
+    格式：標記、token 數、rank 陣列 (uint32)、長度陣列 (uint16)、所有 token 位元組串接。
+    載入時只需三次 frombytes，比逐行 base64 解碼快一個數量級。
+    """
+    items = sorted(ranks.items(), key=lambda item: item[1])
+    rank_array = array("I", (rank for _, rank in items))
+    length_array = array("H", (len(token) for token, _ in items))
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(_BINARY_MAGIC)
+        f.write(struct.pack("<I", len(items)))
+        f.write(rank_array.tobytes())
+        f.write(length_array.tobytes())
+        f.write(b"".join(token for token, _ in items))
+    os.replace(temp_path, path)
+
+
+def load_binary_ranks(path):
+    """讀取 save_binary_ranks 產生的二進位 rank 表"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(_BINARY_MAGIC):
+        raise ValueError(f"不是有效的 BPE 二進位快取: {path}")
+    offset = len(_BINARY_MAGIC)
+    (count,) = struct.unpack_from("<I", data, offset)
+    offset += 4
+    rank_array = array("I")
+    rank_array.frombytes(data[offset:offset + count * rank_array.itemsize])
+    offset += count * rank_array.itemsize
+    length_array = array("H")
+    length_array.frombytes(data[offset:offset + count * length_array.itemsize])
+    offset += count * length_array.itemsize
+
+    ranks = {}
+    for rank, length in zip(rank_array, length_array):
+        ranks[data[offset:offset + length]] = rank
+        offset += length
+    return ranks
+
+
+class BPETokenizer:
+    """
+    純 Python 的 byte-level BPE 編碼器
+
+    先以正規表示式預先分詞，再對每個片段依 rank 由小到大合併位元組對。
+    合併使用堆積 (heap)，長度為 n 的片段只需 O(n log n)，
+    中文這類沒有空白、整句成為單一片段的文本也能快速處理。
+    """
+
+    def __init__(self, ranks, pattern=CL100K_PATTERN, cache_size=50000):
+        self.ranks = ranks
+        self.pattern = pattern
+        self.cache_size = cache_size
+        self._piece_cache = {}
+
+    def _merge(self, piece):
+        """回傳片段合併後各 token 的起始位置列表"""
+        ranks = self.ranks
+        length = len(piece)
+        next_start = list(range(1, length + 1))
+        prev_start = list(range(-1, length - 1))
+        alive = [True] * length
+
+        heap = []
+        for start in range(length - 1):
+            rank = ranks.get(piece[start:start + 2])
+            if rank is not None:
+                heap.append((rank, start))
+        heapq.heapify(heap)
+
+        while heap:
+            rank, start = heapq.heappop(heap)
+            if not alive[start]:
+                continue
+            middle = next_start[start]
+            if middle >= length:
+                continue
+            end = next_start[middle]
+            # 跳過已失效的候選（相鄰片段在加入堆積後已被合併）
+            if ranks.get(piece[start:end]) != rank:
+                continue
+
+            alive[middle] = False
+            next_start[start] = end
+            if end < length:
+                prev_start[end] = start
+
+            before = prev_start[start]
+            if before >= 0:
+                merged_rank = ranks.get(piece[before:end])
+                if merged_rank is not None:
+                    heapq.heappush(heap, (merged_rank, before))
+            if end < length:
+                merged_rank = ranks.get(piece[start:next_start[end]])
+                if merged_rank is not None:
+                    heapq.heappush(heap, (merged_rank, start))
+
+        return [start for start in range(length) if alive[start]]
+
+    def _piece_token_count(self, piece):
+        count = self._piece_cache.get(piece)
+        if count is None:
+            encoded = piece.encode("utf-8")
+            count = 1 if encoded in self.ranks else len(self._merge(encoded))
+            if len(self._piece_cache) >= self.cache_size:
+                self._piece_cache.clear()
+            self._piece_cache[piece] = count
+        return count
+
+    def count(self, text):
+        """計算文本的 token 數"""
+        piece_count = self._piece_token_count
+        return sum(piece_count(match.group()) for match in self.pattern.finditer(text))
+
+    def encode(self, text):
+        """將文本編碼為 token rank 列表"""
+        tokens = []
+        for match in self.pattern.finditer(text):
+            encoded = match.group().encode("utf-8")
+            rank = self.ranks.get(encoded)
+            if rank is not None:
+                tokens.append(rank)
+                continue
+            starts = self._merge(encoded)
+            for index, start in enumerate(starts):
+                end = starts[index + 1] if index + 1 < len(starts) else len(encoded)
+                tokens.append(self.ranks[encoded[start:end]])
+        return tokens
+
+
+def pattern_for_encoding(encoding):
+    """依編碼名稱選擇預先分詞規則"""
+    return ENCODING_PATTERNS.get(encoding, CL100K_PATTERN)
+
+
+def encoding_for_model(model):
+    """依 OpenAI 模型名稱選擇編碼"""
+    model = (model or "").lower()
+    if model.startswith(("gpt-4o", "gpt-4.1", "o1", "o3", "o4")):
+        return "o200k_base"
+    return "cl100k_base"
+
+
+class TokenizerRegistry:
+    """
+    管理 ~/.libreoffice/tokenizers 下的詞表
+
+    支援 <encoding>.tiktoken，或 <encoding>.merges.txt（GPT-2 格式）。
+    首次載入文字詞表後會另存 <encoding>.bin 二進位快取，之後直接讀取快取。
+    目錄的檔案清單快取 LISTING_TTL 秒；載入失敗的編碼在 RETRY_INTERVAL 秒後重新嘗試。
+    """
+
+    def __init__(self, tokenizer_dir=None):
+        if tokenizer_dir is None:
+            tokenizer_dir = os.path.join(os.path.expanduser("~"), ".libreoffice", "tokenizers")
+        self.tokenizer_dir = tokenizer_dir
+        self._tokenizers = {}
+        # 編碼 -> 上次載入失敗（或找不到詞表）的 time.monotonic()
+        self._failed = {}
+        # (檔案清單, 讀取時的 time.monotonic())
+        self._listing = None
+        self._lock = threading.Lock()
+
+    def _load_ranks(self, encoding):
+        binary_path = os.path.join(self.tokenizer_dir, f"{encoding}.bin")
+        sources = [
+            (os.path.join(self.tokenizer_dir, f"{encoding}.tiktoken"), load_tiktoken_ranks),
+            (os.path.join(self.tokenizer_dir, f"{encoding}.merges.txt"), load_merges_ranks),
+        ]
+        for source_path, loader in sources:
+            if not os.path.exists(source_path):
+                continue
+            if os.path.exists(binary_path) and os.path.getmtime(binary_path) >= os.path.getmtime(source_path):
+                return load_binary_ranks(binary_path)
+            ranks = loader(source_path)
+            try:
+                save_binary_ranks(ranks, binary_path)
+            except OSError as e:
+                logger.warning("無法寫入詞表快取: %s", e)
+            return ranks
+        if os.path.exists(binary_path):
+            return load_binary_ranks(binary_path)
+        return None
+
+    def get(self, encoding):
+        """取得指定編碼的 BPETokenizer；找不到詞表時回傳 None"""
+        with self._lock:
+            tokenizer = self._tokenizers.get(encoding)
+            if tokenizer is not None:
+                return tokenizer
+            failed_at = self._failed.get(encoding)
+            if failed_at is not None and time.monotonic() - failed_at < RETRY_INTERVAL:
+                return None
+            ranks = None
+            try:
+                ranks = self._load_ranks(encoding)
+            except (OSError, ValueError) as e:
+                logger.warning("載入詞表 %s 失敗: %s", encoding, e)
+            if not ranks:
+                self._failed[encoding] = time.monotonic()
+                return None
+            self._failed.pop(encoding, None)
+            tokenizer = self._tokenizers[encoding] = BPETokenizer(ranks, pattern_for_encoding(encoding))
+            return tokenizer
+
+    def available_encodings(self):
+        """目錄中有詞表檔的編碼；檔案清單快取 LISTING_TTL 秒"""
+        with self._lock:
+            listing = self._listing
+            if listing is not None and time.monotonic() - listing[1] < LISTING_TTL:
+                return listing[0]
+        try:
+            names = os.listdir(self.tokenizer_dir)
+        except OSError:
+            names = []
+        encodings = set()
+        for name in names:
+            for suffix in (".tiktoken", ".merges.txt", ".bin"):
+                if name.endswith(suffix):
+                    encodings.add(name[:-len(suffix)])
+        encodings = sorted(encodings)
+        with self._lock:
+            self._listing = (encodings, time.monotonic())
+        return encodings
+
+    def count_tokens(self, text, provider, model=None):
+        """
+        在本機計算 token 數，完全不需要網路請求
+
+        OpenAI 使用對應編碼直接計數；其他提供商以可用的編碼計數後套用 CALIBRATION 校正。
+
+        Returns:
+            int: token 數；沒有可用詞表時回傳 None
+        """
+        if not text:
+            return 0
+        if provider == "openai":
+            candidates = [encoding_for_model(model), "cl100k_base"]
+        else:
+            candidates = ["cl100k_base", "o200k_base"]
+        candidates += [encoding for encoding in self.available_encodings() if encoding not in candidates]
+
+        for encoding in candidates:
+            tokenizer = self.get(encoding)
+            if tokenizer is None:
+                continue
+            count = tokenizer.count(text)
+            latin_factor, cjk_factor = CALIBRATION.get(provider, (1.0, 1.0))
+            if latin_factor == cjk_factor == 1.0:
+                return count
+            cjk_share = len(_CJK_PATTERN.findall(text)) / len(text)
+            factor = latin_factor * (1 - cjk_share) + cjk_factor * cjk_share
+            return max(1, int(count * factor + 0.5))
+        return None
+
+
+_shared_registry = None
+_shared_registry_lock = threading.Lock()
+
+
+def get_tokenizer_registry():
+    """取得行程內共用的詞表管理器"""
+    global _shared_registry
+    with _shared_registry_lock:
+        if _shared_registry is None:
+            _shared_registry = TokenizerRegistry()
+        return _shared_registry
@@ -0,0 +1,71 @@
+import threading
+
+
+class RequestCancelled(Exception):
+    """請求已被使用者取消"""
+
+
+class CancelToken:
+    """
+    可跨執行緒共用的取消旗標
+
+    其他元件可以透過 add_callback 註冊取消時要執行的動作
+    （例如中斷正在等待回應的連線），讓阻塞中的請求能立即結束。
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """設定取消旗標並執行所有已註冊的回呼"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks)
+            self._callbacks = []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def add_callback(self, callback):
+        """註冊取消回呼；若已取消則立即執行"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def child(self):
+        """
+        建立子 token：父 token 取消時子 token 一併取消，子 token 可單獨取消
+
+        使用完畢後應呼叫 release_child，避免父 token 保留已結束的回呼。
+        """
+        token = CancelToken()
+        self.add_callback(token.cancel)
+        return token
+
+    def release_child(self, token):
+        self.remove_callback(token.cancel)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise RequestCancelled("請求已取消")
+
+    def wait(self, timeout):
+        """等待指定秒數，期間若被取消則提早返回 True"""
+        return self._event.wait(timeout)
@@ -0,0 +1,164 @@
+import re
+import threading
+
+from model_limits import context_window
+from token_estimator import heuristic_token_count
+
+
+MIN_CHUNK_TOKENS = 200
+# 提示詞中指示文字、標籤等額外內容的保留量
+PROMPT_OVERHEAD_TOKENS = 300
+
+# 句子結尾：中日文全形標點（可接右引號或括號），或英文標點後接空白
+_SENTENCE_END = re.compile(
+    r"[。！？；…]+[」』”’）)]*\s*"
+    r"|[.!?;]+[\"')\]]*\s+"
+)
+# 句子仍過長時的次要切分點：逗號、頓號與冒號
+_CLAUSE_END = re.compile(r"[，、,：:]\s*")
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n|\n")
+
+
+def chunk_token_budget(model, max_output_tokens, output_ratio=1.0, prompt_overhead=PROMPT_OVERHEAD_TOKENS):
+    """
+    計算每個區塊的輸入 token 上限
+
+    輸入、提示詞額外內容與輸出合計不能超過模型的上下文視窗；輸出長度與輸入成比例時
+    （例如改寫，輸出約為輸入的 output_ratio 倍），輸出也不能超過單次請求的輸出上限 max_output_tokens。
+
+    Args:
+        model: 模型名稱
+        max_output_tokens: 每次請求的輸出上限
+        output_ratio: 預期輸出長度與輸入長度的比例（改寫約 1）；None 表示輸出長度與輸入無關
+            （例如回答問題），只受上下文視窗限制
+        prompt_overhead: 提示詞中指示文字的 token 數
+    """
+    budget = context_window(model) - prompt_overhead - max_output_tokens
+    if output_ratio is not None:
+        budget = min(budget, max_output_tokens / max(output_ratio, 0.05))
+    return max(MIN_CHUNK_TOKENS, int(budget))
+
+
+def _split_with(pattern, text):
+    """以 pattern 的結尾位置切分文本，切分點保留在前一段，各段串接後等於原文"""
+    pieces = []
+    start = 0
+    for match in pattern.finditer(text):
+        if match.end() > start:
+            pieces.append(text[start:match.end()])
+            start = match.end()
+    if start < len(text):
+        pieces.append(text[start:])
+    return pieces
+
+
+def _hard_split(text, max_tokens, count_tokens):
+    """沒有任何標點可用時，依字元數二分切開"""
+    if count_tokens(text) <= max_tokens or len(text) <= 1:
+        return [text]
+    middle = len(text) // 2
+    return _hard_split(text[:middle], max_tokens, count_tokens) + _hard_split(text[middle:], max_tokens, count_tokens)
+
+
+def _units(text, max_tokens, count_tokens):
+    """將文本切成不超過 max_tokens 的最小單位：段落 → 句子 → 子句 → 字元"""
+    units = []
+    for paragraph in _split_with(_PARAGRAPH_BREAK, text):
+        if count_tokens(paragraph) <= max_tokens:
+            units.append(paragraph)
+            continue
+        for sentence in _split_with(_SENTENCE_END, paragraph):
+            if count_tokens(sentence) <= max_tokens:
+                units.append(sentence)
+                continue
+            for clause in _split_with(_CLAUSE_END, sentence):
+                units.extend(_hard_split(clause, max_tokens, count_tokens))
+    return units
+
+
+def default_token_counter(text):
+    return heuristic_token_count(text)[0]
+
+
+def split_text(text, max_tokens, count_tokens=default_token_counter):
+    """
+    將文本切成每塊不超過 max_tokens 的區塊
+
+    優先在段落邊界切分，段落過長時才依句子（中文以 。！？ 等全形標點判斷，
+    不依賴空白）、子句切分，最後才依字元數硬切。所有區塊串接後與原文完全相同。
+
+    Returns:
+        list: 區塊字串列表
+    """
+    if not text:
+        return []
+    if count_tokens(text) <= max_tokens:
+        return [text]
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for unit in _units(text, max_tokens, count_tokens):
+        unit_tokens = count_tokens(unit)
+        if current and current_tokens + unit_tokens > max_tokens:
+            current = _flush(chunks, current, max_tokens, count_tokens)
+            current_tokens = sum(count_tokens(item) for item in current)
+        current.append(unit)
+        current_tokens += unit_tokens
+    while current:
+        current = _flush(chunks, current, max_tokens, count_tokens)
+    return chunks
+
+
+def _flush(chunks, units, max_tokens, count_tokens):
+    """
+    將 units 串接為一個區塊加入 chunks，回傳需要移到下一個區塊的單位
+
+    各單位的 token 數分別取整，加總可能略小於整塊的實際 token 數，
+    因此以整塊重新計算，超過預算時把最後的單位移到下一個區塊。
+    """
+    carry = []
+    while len(units) > 1 and count_tokens("".join(units)) > max_tokens:
+        carry.insert(0, units.pop())
+    chunks.append("".join(units))
+    return carry
+
+
+class OrderedStreamMerger:
+    """
+    將多個平行串流依區塊順序合併輸出
+
+    目前最前面的區塊的片段會立即輸出；後面區塊的片段先暫存，
+    前一個區塊結束後才依序輸出，因此對話框中的內容永遠依原文順序排列。
+    可從多個執行緒呼叫，emit 在鎖內呼叫以保證順序，應只做排入 UI 佇列等快速動作。
+    """
+
+    def __init__(self, count, emit, separator="\n"):
+        self.count = count
+        self.emit = emit
+        self.separator = separator
+        self._buffers = [[] for _ in range(count)]
+        self._finished = [False] * count
+        self._head = 0
+        self._lock = threading.Lock()
+
+    def feed(self, index, text):
+        if not text:
+            return
+        with self._lock:
+            if index == self._head:
+                self.emit(text)
+            else:
+                self._buffers[index].append(text)
+
+    def finish(self, index):
+        """標記區塊已完成，並輸出之後已暫存的區塊"""
+        with self._lock:
+            self._finished[index] = True
+            while self._head < self.count and self._finished[self._head]:
+                self._head += 1
+                if self._head < self.count:
+                    self.emit(self.separator)
+                    if self._buffers[self._head]:
+                        self.emit("".join(self._buffers[self._head]))
+                        self._buffers[self._head] = []
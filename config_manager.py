@@ -1,5 +1,8 @@
 import os
 import json
+from config_watcher import stat_signature
+from prompt_compiler import compile_prompt_config
+from settings_service import get_settings_service
 from com.sun.star.awt.MessageBoxType import MESSAGEBOX, INFOBOX
 from com.sun.star.awt.MessageBoxButtons import BUTTONS_OK
 
@@ -8,6 +11,12 @@ class ConfigManager:
     def __init__(self, ctx):
         self.ctx = ctx
         self.config = None
+        self.config_path = os.path.join(os.path.expanduser("~"), ".libreoffice", "libreoffice_ai_config.json")
+        # 已載入配置檔的 (修改時間, 大小)，檔案未變更時不重新讀取
+        self._signature = None
+        # 由 self.config 編譯的提示詞規則表
+        self._compiled = None
+        self._compiled_from = None
     
     def show_message(self, message, title="Information", message_type=INFOBOX):
         """顯示訊息對話框"""
@@ -17,22 +26,41 @@ class ConfigManager:
             parent, message_type, BUTTONS_OK, title, str(message))
         mb.execute()
     
+    @property
+    def signature(self):
+        """已載入配置檔的 (修改時間, 大小)"""
+        return self._signature
+
+    def apply_config(self, config, compiled, signature):
+        """套用在背景讀取並編譯好的配置（由 ConfigWatcher 提供）"""
+        self.config = config
+        self._compiled = compiled
+        self._compiled_from = config
+        self._signature = signature
+
     def load_config(self):
         """
         從外部配置文件加載下拉選單配置
+
+        配置已載入且檔案未變更時直接回傳記憶體中的配置
         """
         try:
             # 創建 .libreoffice 目錄（如果不存在）
-            libreoffice_dir = os.path.join(os.path.expanduser("~"), ".libreoffice")
+            libreoffice_dir = os.path.dirname(self.config_path)
             if not os.path.exists(libreoffice_dir):
                 os.makedirs(libreoffice_dir)
             
             # 嘗試從 .libreoffice 目錄加載配置文件
-            config_file_path = os.path.join(libreoffice_dir, "libreoffice_ai_config.json")
+            config_file_path = self.config_path
             
-            if os.path.exists(config_file_path):
+            signature = stat_signature(config_file_path)
+            if self.config is not None and signature is not None and signature == self._signature:
+                return self.config
+
+            if signature is not None:
                 with open(config_file_path, 'r', encoding='utf-8') as f:
                     self.config = json.load(f)
+                self._signature = signature
             else:
                 # 如果找不到文件，使用默認配置
                 self.config = {
@@ -95,6 +123,7 @@ class ConfigManager:
                 # 將默認配置寫入文件作為範例
                 with open(config_file_path, 'w', encoding='utf-8') as f:
                     json.dump(self.config, f, ensure_ascii=False, indent=2)
+                self._signature = stat_signature(config_file_path)
                     
                 self.show_message(f"已在 {config_file_path} 建立默認配置檔案", "信息")
             return self.config
@@ -108,11 +137,14 @@ class ConfigManager:
         """
         try:
             old_config = self.config
+            old_signature = self._signature
             self.config = None  # 清除舊配置
+            self._signature = None
             self.load_config()  # 重新載入
             return True
         except Exception as e:
             self.config = old_config  # 恢復舊配置
+            self._signature = old_signature
             self.show_message(f"重新載入配置失敗: {str(e)}", "錯誤", MESSAGEBOX)
             return False
     
@@ -126,9 +158,6 @@ class ConfigManager:
             if not os.path.exists(libreoffice_dir):
                 os.makedirs(libreoffice_dir)
         
-            # 定義檔案路徑
-            env_path = os.path.join(libreoffice_dir, ".env")
-        
             provider_map = {
                 "Gemini": "gemini",
                 "GPT (OpenAI)": "openai",
@@ -137,20 +166,8 @@ class ConfigManager:
     
             provider_key = provider_map.get(provider, "gemini")
     
-            # 組織 .env 檔案內容
-            env_content = f"DEFAULT_PROVIDER={provider_key}\n"
-        
-            # 針對不同供應商設置對應的 API 金鑰
-            if provider_key == "gemini":
-                env_content += f"GOOGLE_API_KEY={api_key}\n"
-            elif provider_key == "openai":
-                env_content += f"OPENAI_API_KEY={api_key}\n"
-            elif provider_key == "claude":
-                env_content += f"ANTHROPIC_API_KEY={api_key}\n"
-    
-            # 寫入 .env 檔案
-            with open(env_path, "w") as f:
-                f.write(env_content)
+            # 透過設定服務原子性地寫入 .env，並同步更新設定快照
+            get_settings_service().save(provider_key, api_key)
         
             # 依據作業系統創建啟動腳本
             if os.name == 'nt':  # Windows
@@ -179,6 +196,21 @@ read -p "Press Enter to continue..."
             self.show_message(f"儲存設定失敗: {str(e)}", "錯誤", MESSAGEBOX)
             return False
             
+    @property
+    def prompt_rules(self):
+        """
+        目前配置編譯後的提示詞規則表（CompiledPromptConfig）
+
+        每次載入配置後只在第一次使用時編譯一次。
+        """
+        if self.config is None:
+            self.load_config()
+        config = self.config
+        if self._compiled_from is not config:
+            self._compiled = compile_prompt_config(config)
+            self._compiled_from = config
+        return self._compiled
+
     def generate_adjustment_prompt(self, selected_options, text=""):
         """
         根據獲取的選項映射，使用配置文件中的模板生成提示詞
@@ -190,54 +222,4 @@ read -p "Press Enter to continue..."
         Returns:
             生成的完整提示詞
         """
-        # 檢查配置是否已加載
-        if self.config is None:
-            self.load_config()
-            
-        # 從配置獲取提示詞頭部和標籤
-        prompt_parts = [self.config.get("prompt_header", "請按照以下要求修改文本：")]
-        
-        # 對於每個下拉選單配置
-        for dropdown in self.config["dropdowns"]:
-            dropdown_id = dropdown["id"]
-            
-            # 獲取選擇的選項
-            selected_option = selected_options.get(dropdown_id)
-            
-            # 如果選擇了非默認選項
-            if selected_option and selected_option != dropdown["options"][dropdown["default_option"]]:
-                # 特殊處理長度調整
-                if dropdown_id == "length_adjustment":
-                    if "-" in selected_option:
-                        percentage = selected_option.replace("-", "")
-                        template = dropdown["prompt_templates"]["decrease"]
-                        prompt_parts.append(template.format(percentage=percentage))
-                    else:
-                        percentage = selected_option.replace("+", "")
-                        template = dropdown["prompt_templates"]["increase"]
-                        prompt_parts.append(template.format(percentage=percentage))
-                
-                # 特殊處理只針對特定選項生成提示詞
-                elif "target_option" in dropdown and selected_option == dropdown["target_option"]:
-                    template = dropdown.get("prompt_template", "將文本轉換為{option}。")
-                    prompt_parts.append(template.format(option=selected_option))
-                
-                # 標準處理具有提示值的下拉選單
-                elif "prompt_values" in dropdown and selected_option in dropdown["prompt_values"]:
-                    template = dropdown.get("prompt_template", "")
-                    if template:
-                        prompt_value = dropdown["prompt_values"][selected_option]
-                        prompt_parts.append(template.format(option=selected_option, prompt_value=prompt_value))
-                
-                # 一般處理不需要額外提示值的下拉選單
-                elif "prompt_template" in dropdown:
-                    template = dropdown["prompt_template"]
-                    prompt_parts.append(template.format(option=selected_option))
-        
-        # 添加原始文本和修改後的文本提示
-        prompt_parts.append(self.config.get("original_text_label", "\n原始文本："))
-        prompt_parts.append(text)
-        prompt_parts.append(self.config.get("modified_text_label", "\n修改後的文本："))
-        
-        # 組合最終的提示詞，使用換行符連接非空部分
-        return "\n".join(prompt_parts)
+        return self.prompt_rules.render(selected_options, text)
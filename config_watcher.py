@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+
+from prompt_compiler import compile_prompt_config, validate_prompt_config
+
+
+# 輪詢間隔（秒）；每次只做一次 os.stat
+POLL_INTERVAL = 1.0
+
+
+def stat_signature(path):
+    """回傳檔案的 (修改時間, 大小)，檔案不存在時回傳 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def load_compiled_config(path):
+    """
+    讀取、驗證並編譯配置檔
+
+    Returns:
+        tuple: (配置 dict, CompiledPromptConfig)；檔案或格式錯誤時拋出 OSError 或 ValueError
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    validate_prompt_config(config)
+    return config, compile_prompt_config(config)
+
+
+class ConfigWatcher:
+    """
+    監看配置檔的變更
+
+    背景執行緒每 interval 秒以 os.stat 比對修改時間與大小，變更時在背景讀取、驗證並
+    編譯配置，再呼叫 on_change(config, compiled, signature)；讀取或驗證失敗時呼叫
+    on_error(error)。兩個回呼都在監看執行緒上執行，需要更新 UI 時由呼叫端轉交 UI 執行緒。
+    """
+
+    def __init__(self, path, on_change, on_error=None, interval=POLL_INTERVAL, signature=None):
+        self.path = path
+        self.on_change = on_change
+        self.on_error = on_error
+        self.interval = interval
+        # 目前已套用的檔案狀態；與檔案相同時不重新讀取
+        self.signature = signature
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._force = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ai-config-watcher", daemon=True)
+            self._thread.start()
+
+    def check_now(self, force=False):
+        """立即檢查一次；force 為 True 時即使檔案未變更也重新讀取"""
+        if force:
+            self._force = True
+        self._wake.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break
+            force, self._force = self._force, False
+            self.poll(force)
+
+    def poll(self, force=False):
+        """檢查檔案狀態，變更時讀取並通知；回傳是否呼叫了 on_change"""
+        signature = stat_signature(self.path)
+        if signature is None or (signature == self.signature and not force):
+            return False
+        try:
+            config, compiled = load_compiled_config(self.path)
+        except (OSError, ValueError) as e:
+            # 記下這個版本，同一個錯誤的檔案不會每次輪詢都回報
+            self.signature = signature
+            if self.on_error:
+                self.on_error(e)
+            return False
+        self.signature = signature
+        self.on_change(config, compiled, signature)
+        return True
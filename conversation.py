@@ -0,0 +1,202 @@
+import hashlib
+import threading
+import time
+import uuid
+
+from model_limits import gemini_min_cache_tokens
+from token_estimator import heuristic_token_count
+
+
+# 保留的歷史問答輪數；超過時捨棄最早的問答（文件仍保留在前綴中）
+MAX_TURNS = 10
+# Gemini cachedContents 的存活時間（秒）；過期後下一輪重新建立
+GEMINI_CACHE_TTL = 600
+# 提前視為過期的秒數，避免請求送出時快取剛好失效
+GEMINI_CACHE_MARGIN = 30
+
+DOCUMENT_INSTRUCTION = "以下是這次對話討論的文件，之後的問題都與這份文件有關：\n\n"
+# 問題只有文件內容、沒有其他文字時使用的問題
+DEFAULT_DOCUMENT_QUESTION = "請處理上述文件。"
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+class Conversation:
+    """
+    多輪對話
+
+    document 是整段對話共用的文件內容（開啟對話框時選取的文字），turns 依序保存之前的問答。
+    每次請求都依「文件 → 歷史問答 → 新問題」的固定順序排列，前綴在各輪之間完全相同，
+    讓提供商的提示詞快取可以重複使用，第 2 輪以後文件不必再以全價處理：
+
+        claude   文件放在 system 區塊並加上 cache_control，最後一則歷史回應也加上 cache_control
+        openai   依相同前綴自動快取，並以文件雜湊作為 prompt_cache_key 提高命中率
+        gemini   文件建立為 cachedContents 後以名稱引用（由 AIService 建立，見 gemini_cache）
+        mistral  沒有提示詞快取，仍以相同順序送出歷史問答
+
+    同一個對話可能同時被多個提供商使用（競速模式），各提供商的請求內容都由這裡產生。
+    """
+
+    def __init__(self, document="", max_turns=MAX_TURNS):
+        self.document = document or ""
+        self.max_turns = max_turns
+        self.turns = []
+        self.id = uuid.uuid4().hex
+        # (模型, cachedContents 名稱, 到期的 time.monotonic())
+        self.gemini_cache = None
+        # 建立 Gemini 快取失敗的模型，這段對話不再嘗試
+        self.gemini_cache_failed = set()
+        # 累計的輸入 token 數與其中由提供商快取讀取的 token 數
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache_key(self):
+        """以文件內容的雜湊作為提供商快取的路由鍵，同一份文件的對話共用"""
+        return hashlib.sha256(self.document.encode("utf-8")).hexdigest()[:32]
+
+    def take_question(self, text):
+        """
+        取出本輪要送出的問題
+
+        問題中包含文件內容時移除該段文字（文件已在前綴中）；第一輪的問題不包含文件時，
+        表示使用者已換成其他內容，這段對話不再附帶文件。
+        """
+        with self._lock:
+            if self.document and self.document in text:
+                return text.replace(self.document, "", 1).strip() or DEFAULT_DOCUMENT_QUESTION
+            if not self.turns and self.document:
+                self.document = ""
+                self.gemini_cache = None
+            return text
+
+    def add_turn(self, question, answer, token_info=None):
+        with self._lock:
+            self.turns.append((question, answer))
+            if len(self.turns) > self.max_turns:
+                del self.turns[:len(self.turns) - self.max_turns]
+            if token_info:
+                self.prompt_tokens += token_info.get("prompt_tokens") or 0
+                self.cached_tokens += token_info.get("cached_tokens") or 0
+
+    def clear(self):
+        """捨棄歷史問答，保留文件與提供商快取"""
+        with self._lock:
+            self.turns = []
+
+    def prompt_text(self, question):
+        """本輪請求的完整文字，用於估計速率限制預扣的 token 數"""
+        with self._lock:
+            parts = [self.document] if self.document else []
+            for asked, answer in self.turns:
+                parts.append(asked)
+                parts.append(answer)
+        parts.append(question)
+        return "\n\n".join(parts)
+
+    def trim_to_budget(self, question, max_tokens):
+        """
+        捨棄最早的歷史問答，直到本輪請求（文件、歷史問答與問題）的估計 token 數不超過 max_tokens
+
+        捨棄問答會改變前綴，下一輪的提示詞快取只有文件部分仍可重複使用。
+
+        Returns:
+            tuple: (是否能放入單一請求, 捨棄的問答輪數)；只剩文件與問題仍超過時為 (False, 0)，不捨棄任何問答
+        """
+        with self._lock:
+            turn_tokens = [heuristic_token_count(asked)[0] + heuristic_token_count(answer)[0]
+                           for asked, answer in self.turns]
+            fixed = heuristic_token_count(question)[0] + (heuristic_token_count(self.document)[0] if self.document else 0)
+            if fixed > max_tokens:
+                return False, 0
+            total = fixed + sum(turn_tokens)
+            dropped = 0
+            while total > max_tokens and dropped < len(turn_tokens):
+                total -= turn_tokens[dropped]
+                dropped += 1
+            if dropped:
+                del self.turns[:dropped]
+            return True, dropped
+
+    def document_tokens(self, count_tokens=None):
+        if not self.document:
+            return 0
+        return count_tokens(self.document) if count_tokens else heuristic_token_count(self.document)[0]
+
+    def chat_messages(self, question):
+        """OpenAI 與 Mistral 的 messages：文件為 system 訊息，其後為歷史問答與新問題"""
+        with self._lock:
+            messages = [{"role": "system", "content": DOCUMENT_INSTRUCTION + self.document}] if self.document else []
+            for asked, answer in self.turns:
+                messages.append({"role": "user", "content": asked})
+                messages.append({"role": "assistant", "content": answer})
+        messages.append({"role": "user", "content": question})
+        return messages
+
+    def claude_fields(self, question):
+        """Claude 的 system 與 messages；文件與最後一則歷史回應是兩個快取斷點"""
+        fields = {}
+        with self._lock:
+            if self.document:
+                fields["system"] = [{"type": "text", "text": DOCUMENT_INSTRUCTION + self.document,
+                                     "cache_control": CACHE_CONTROL}]
+            messages = []
+            for asked, answer in self.turns:
+                messages.append({"role": "user", "content": asked})
+                messages.append({"role": "assistant", "content": answer})
+        if messages:
+            messages[-1] = {"role": "assistant",
+                            "content": [{"type": "text", "text": messages[-1]["content"], "cache_control": CACHE_CONTROL}]}
+        messages.append({"role": "user", "content": question})
+        fields["messages"] = messages
+        return fields
+
+    def gemini_fields(self, model, question):
+        """
+        Gemini 的 contents 與文件的位置
+
+        有效的 cachedContents 時以名稱引用文件，否則把文件放在 systemInstruction。
+        """
+        fields = {}
+        with self._lock:
+            cached_name = self.cached_content_name(model)
+            if cached_name:
+                fields["cachedContent"] = cached_name
+            elif self.document:
+                fields["systemInstruction"] = self.gemini_system_instruction()
+            contents = []
+            for asked, answer in self.turns:
+                contents.append({"role": "user", "parts": [{"text": asked}]})
+                contents.append({"role": "model", "parts": [{"text": answer}]})
+        contents.append({"role": "user", "parts": [{"text": question}]})
+        fields["contents"] = contents
+        return fields
+
+    def gemini_system_instruction(self):
+        return {"parts": [{"text": DOCUMENT_INSTRUCTION + self.document}]}
+
+    def cached_content_name(self, model):
+        """目前模型仍有效的 Gemini cachedContents 名稱，沒有時回傳 None"""
+        cache = self.gemini_cache
+        if cache and cache[0] == model and time.monotonic() < cache[2]:
+            return cache[1]
+        return None
+
+    def needs_gemini_cache(self, model, count_tokens=None):
+        """
+        是否應為這個模型建立 Gemini 快取：文件達到該模型的最低 token 數、尚未建立或已過期，且之前沒有失敗
+
+        Args:
+            count_tokens: 計算文件 token 數的函式，預設為字元類別估算
+        """
+        return (bool(self.document) and model not in self.gemini_cache_failed
+                and self.cached_content_name(model) is None
+                and self.document_tokens(count_tokens) >= gemini_min_cache_tokens(model))
+
+    def set_gemini_cache(self, model, name, ttl=GEMINI_CACHE_TTL):
+        with self._lock:
+            self.gemini_cache = (model, name, time.monotonic() + ttl - GEMINI_CACHE_MARGIN)
+
+    def stats(self):
+        return {"turns": len(self.turns), "document_tokens": self.document_tokens(),
+                "prompt_tokens": self.prompt_tokens, "cached_tokens": self.cached_tokens}
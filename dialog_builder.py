@@ -1,276 +1,312 @@
+import threading
+
 import uno
 import unohelper
 
 
+FIXED_TEXT = "com.sun.star.awt.UnoControlFixedTextModel"
+EDIT = "com.sun.star.awt.UnoControlEditModel"
+LIST_BOX = "com.sun.star.awt.UnoControlListBoxModel"
+BUTTON = "com.sun.star.awt.UnoControlButtonModel"
+GEOMETRY = ("Width", "Height", "PositionX", "PositionY")
+
+# 控制項定義: (名稱, 模型服務, (寬, 高, X, Y), 其他屬性)；插入順序即為 Tab 順序
+SETTINGS_DIALOG = ((300, 160, " AI Settings"), (
+    ("ModelLabel", FIXED_TEXT, (80, 15, 20, 23), {"Label": "AI Model:"}),
+    ("ModelDropdown", LIST_BOX, (180, 15, 100, 20),
+     {"Dropdown": True, "StringItemList": ("Gemini", "GPT (OpenAI)", "Claude"), "SelectedItems": (0,)}),
+    ("ApiKeyLabel", FIXED_TEXT, (80, 15, 20, 63), {"Label": "API Key:"}),
+    # EchoChar 42 = "*" for password masking
+    ("ApiKeyField", EDIT, (180, 15, 100, 60), {"EchoChar": 42}),
+    ("HelpText", FIXED_TEXT, (280, 35, 10, 90),
+     {"Label": "設定會儲存至 ~/.libreoffice 目錄。\n按下儲存後將創建啟動 AI 服務的批次檔。", "MultiLine": True}),
+    ("SaveButton", BUTTON, (80, 20, 110, 125), {"Label": "Save"}),
+    ("CancelButton", BUTTON, (80, 20, 200, 125), {"Label": "Cancel"}),
+))
+
+DIAGNOSTICS_DIALOG = ((400, 300, " AI Diagnostics"), (
+    # 統計報表顯示區域
+    ("ReportField", EDIT, (380, 250, 10, 10),
+     {"MultiLine": True, "ReadOnly": True, "VScroll": True, "HScroll": True}),
+    ("RefreshButton", BUTTON, (80, 20, 220, 270), {"Label": "Refresh"}),
+    ("CloseButton", BUTTON, (80, 20, 310, 270), {"Label": "Close"}),
+))
+
+HISTORY_DIALOG = ((400, 300, " AI History"), (
+    ("SearchField", EDIT, (290, 15, 10, 10), {"HelpText": "搜尋問題或回應中的文字；留白顯示最近的紀錄"}),
+    ("SearchButton", BUTTON, (80, 15, 310, 10), {"Label": "Search"}),
+    ("ResultsField", EDIT, (380, 235, 10, 30), {"MultiLine": True, "ReadOnly": True, "VScroll": True}),
+    ("CloseButton", BUTTON, (80, 20, 310, 270), {"Label": "Close"}),
+))
+
+MAIN_DIALOG = (350, 360, " AI Query")
+
+# 主對話框在下拉選單列之前的控制項
+MAIN_CONTROLS_BEFORE_DROPDOWNS = (
+    ("QuestionLabel", FIXED_TEXT, (170, 15, 10, 10), {"Label": "Your question:"}),
+    # History button - 搜尋跨工作階段的問答紀錄
+    ("HistoryButton", BUTTON, (50, 15, 290, 10), {"Label": "History", "HelpText": "搜尋歷史問答紀錄"}),
+    ("TextField1", EDIT, (330, 50, 10, 30), {"MultiLine": True, "VScroll": True}),
+    ("ResponseLabel", FIXED_TEXT, (170, 15, 10, 100), {"Label": "AI Response:"}),
+    # Request status label - 顯示請求執行狀態
+    ("StatusLabel", FIXED_TEXT, (105, 15, 180, 100), {"Label": ""}),
+    # Cancel Request button - 取消執行中的請求
+    ("CancelRequestButton", BUTTON, (50, 15, 290, 98),
+     {"Label": "Cancel", "HelpText": "取消執行中的請求", "Enabled": False}),
+    ("ResponseField", EDIT, (330, 90, 10, 120), {"MultiLine": True, "ReadOnly": True, "VScroll": True}),
+    ("AdjustResponseLabel", FIXED_TEXT, (55, 10, 10, 228), {"Label": "Adjust Response:"}),
+)
+
+# 每列下拉選單的 X 位置；超過四個時換到下一列
+DROPDOWN_POSITIONS = (70, 120, 170, 220)
+DROPDOWN_ROW_Y = 225
+DROPDOWN_ROW_HEIGHT = 20
+# 下拉選單超過一列時，位於此 Y 座標以下的控制項與對話框高度隨列數往下延伸
+DROPDOWN_AREA_BOTTOM = 245
+
+# 主對話框在下拉選單列之後的控制項
+MAIN_CONTROLS_AFTER_DROPDOWNS = (
+    ("SettingsButton", BUTTON, (10, 10, 330, 335), {"Label": "⚙️", "HelpText": "AI 模型設定"}),
+    ("DiagnosticsButton", BUTTON, (10, 10, 330, 315), {"Label": "📊", "HelpText": "請求延遲與吞吐量統計"}),
+    ("ReloadConfigButton", BUTTON, (10, 10, 270, 220), {"Label": "♻️", "HelpText": "重載配置選單"}),
+    ("ResetDropdownsButton", BUTTON, (10, 10, 270, 235), {"Label": "🧹", "HelpText": "還原下拉選單"}),
+    ("AdjustResponseButton", BUTTON, (50, 15, 290, 225), {"Label": "Adjust", "HelpText": "調整 AI 回應"}),
+    # Adjust Prompts display area
+    ("PromptsField", EDIT, (270, 50, 10, 255), {"MultiLine": True, "VScroll": True}),
+    ("PreviewPromptsButton", BUTTON, (50, 15, 290, 273), {"Label": "Preview", "HelpText": "預覽調整提示詞"}),
+    # Batch Button - 對整份文件或選取範圍的每個段落套用調整
+    ("BatchButton", BUTTON, (50, 15, 290, 291),
+     {"Label": "Batch", "HelpText": "以下拉選單設定逐段調整整份文件或選取範圍"}),
+    ("AskButton", BUTTON, (60, 20, 10, 330), {"Label": "Ask AI"}),
+    ("InsertButton", BUTTON, (80, 20, 80, 330), {"Label": "Insert to Doc"}),
+    ("ClearButton", BUTTON, (80, 20, 170, 330), {"Label": "Clear Response"}),
+    ("CloseButton", BUTTON, (60, 20, 260, 330), {"Label": "Close"}),
+)
+
+
+def dropdown_controls(config):
+    """由配置產生下拉選單列的控制項定義（依 position 排序，每列 DROPDOWN_POSITIONS 個）"""
+    sorted_dropdowns = sorted(config["dropdowns"], key=lambda x: x["position"])
+    per_row = len(DROPDOWN_POSITIONS)
+    return tuple(
+        (f"{dropdown['id']}List", LIST_BOX,
+         (40, 15, DROPDOWN_POSITIONS[i % per_row], DROPDOWN_ROW_Y + DROPDOWN_ROW_HEIGHT * (i // per_row)), {
+            "Dropdown": True,
+            "StringItemList": tuple(dropdown["options"]),
+            "SelectedItems": (dropdown["default_option"],)
+        })
+        for i, dropdown in enumerate(sorted_dropdowns)
+    )
+
+
+def dropdown_extra_height(row):
+    """下拉選單超過一列時，下方控制項需要往下移動的距離"""
+    rows = -(-len(row) // len(DROPDOWN_POSITIONS))
+    return DROPDOWN_ROW_HEIGHT * max(0, rows - 1)
+
+
+def shift_below_dropdowns(controls, extra):
+    """將位於下拉選單區域下方的控制項往下移動 extra"""
+    if not extra:
+        return controls
+    return tuple(
+        (name, service, (width, height, x, y + extra if y >= DROPDOWN_AREA_BOTTOM else y), properties)
+        for name, service, (width, height, x, y), properties in controls
+    )
+
+
+def _set_properties(model, geometry, properties):
+    # 序列型別的屬性（StringItemList、SelectedItems）以屬性指定，讓 pyuno 依屬性型別轉換
+    scalars = {key: value for key, value in properties.items() if not isinstance(value, tuple)}
+    model.setPropertyValues(GEOMETRY + tuple(scalars), geometry + tuple(scalars.values()))
+    for key, value in properties.items():
+        if isinstance(value, tuple):
+            setattr(model, key, value)
+
+
+def insert_controls(dialog_model, controls):
+    """依控制項定義建立模型並插入對話框模型"""
+    for name, service, geometry, properties in controls:
+        model = dialog_model.createInstance(service)
+        _set_properties(model, geometry, properties)
+        dialog_model.insertByName(name, model)
+
+
+def _shift_tail(dialog_model, models, old_row, new_row):
+    """下拉選單列數改變時，移動下方控制項並調整對話框高度"""
+    extra = dropdown_extra_height(new_row)
+    if extra == dropdown_extra_height(old_row):
+        return
+    for name, _, geometry, _ in shift_below_dropdowns(MAIN_CONTROLS_AFTER_DROPDOWNS, extra):
+        models[name].PositionY = geometry[3]
+    dialog_model.Height = MAIN_DIALOG[1] + extra
+
+
+def patch_dropdown_row(dialog_model, old_row, new_row, selections=None):
+    """
+    在開啟中的對話框換掉下拉選單列
+
+    同名的列表框直接更新選項與位置，其餘控制項（與其監聽器、文字內容）保持不動；
+    selections 為 {'dropdown_id': 'selected_value'}，選項仍存在時保留原本的選擇。
+    """
+    selections = selections or {}
+    new_names = {name for name, _, _, _ in new_row}
+    for name, _, _, _ in old_row:
+        if name not in new_names and dialog_model.hasByName(name):
+            dialog_model.removeByName(name)
+    for name, service, geometry, properties in new_row:
+        items = properties["StringItemList"]
+        selected = selections.get(name[:-len("List")])
+        if selected in items:
+            properties = dict(properties, SelectedItems=(items.index(selected),))
+        if dialog_model.hasByName(name):
+            _set_properties(dialog_model.getByName(name), geometry, properties)
+        else:
+            insert_controls(dialog_model, ((name, service, geometry, properties),))
+    models = {name: dialog_model.getByName(name) for name, _, _, _ in MAIN_CONTROLS_AFTER_DROPDOWNS}
+    _shift_tail(dialog_model, models, old_row, new_row)
+
+
+class DialogTemplateCache:
+    """
+    對話框模型範本快取
+
+    每種對話框的 UnoControlDialogModel 只建立一次（每個控制項一次 createInstance、
+    一次 setPropertyValues 與一次 insertByName，列表框另外指定選項），之後每次開啟
+    對話框都以 createClone 一次複製整個模型。主對話框的下拉選單列只有在配置的
+    下拉選單定義改變時才重建。
+    """
+
+    def __init__(self):
+        self._templates = {}
+        self._dropdown_rows = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.clones = 0
+
+    def _build(self, ctx, dialog, controls):
+        width, height, title = dialog
+        dialog_model = ctx.getServiceManager().createInstanceWithContext(
+            "com.sun.star.awt.UnoControlDialogModel", ctx
+        )
+        dialog_model.setPropertyValues(("Width", "Height", "Title"), (width, height, title))
+        insert_controls(dialog_model, controls)
+        self.builds += 1
+        return dialog_model
+
+    def _replace_dropdown_row(self, dialog_model, old_row, new_row):
+        """
+        換掉下拉選單列
+
+        其後的控制項移除後重新插入同一個模型，以維持原本的 Tab 順序；
+        下拉選單列數改變時一併調整下方控制項的位置與對話框高度。
+        """
+        tail = [(name, dialog_model.getByName(name)) for name, _, _, _ in MAIN_CONTROLS_AFTER_DROPDOWNS]
+        for name, _ in tail:
+            dialog_model.removeByName(name)
+        for name, _, _, _ in old_row:
+            dialog_model.removeByName(name)
+        insert_controls(dialog_model, new_row)
+        for name, model in tail:
+            dialog_model.insertByName(name, model)
+        _shift_tail(dialog_model, dict(tail), old_row, new_row)
+
+    def clone(self, ctx, kind, dialog, controls):
+        """取得 kind 對話框模型的複本，第一次呼叫時建立範本"""
+        with self._lock:
+            template = self._templates.get(kind)
+            if template is None:
+                template = self._templates[kind] = self._build(ctx, dialog, controls)
+            self.clones += 1
+            return template.createClone()
+
+    def clone_main(self, ctx, config):
+        """取得主對話框模型的複本；下拉選單定義與範本不同時只重建下拉選單列"""
+        row = dropdown_controls(config)
+        with self._lock:
+            template = self._templates.get("main")
+            if template is None:
+                extra = dropdown_extra_height(row)
+                controls = (MAIN_CONTROLS_BEFORE_DROPDOWNS + row
+                            + shift_below_dropdowns(MAIN_CONTROLS_AFTER_DROPDOWNS, extra))
+                width, height, title = MAIN_DIALOG
+                template = self._templates["main"] = self._build(ctx, (width, height + extra, title), controls)
+            elif self._dropdown_rows["main"] != row:
+                self._replace_dropdown_row(template, self._dropdown_rows["main"], row)
+            self._dropdown_rows["main"] = row
+            self.clones += 1
+            return template.createClone()
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+            self._dropdown_rows.clear()
+
+    def stats(self):
+        return {"builds": self.builds, "clones": self.clones}
+
+
+_shared_templates = None
+_shared_templates_lock = threading.Lock()
+
+
+def get_dialog_templates():
+    """取得行程內共用的對話框範本快取"""
+    global _shared_templates
+    with _shared_templates_lock:
+        if _shared_templates is None:
+            _shared_templates = DialogTemplateCache()
+        return _shared_templates
+
+
 class DialogBuilder:
     def __init__(self, ctx):
         self.ctx = ctx
-        
-    def create_settings_dialog(self):
-        """創建設定對話框"""
-        # Get the component context
+        self.templates = get_dialog_templates()
+
+    def _create_dialog(self, dialog_model):
+        """以對話框模型建立對話框並創建視窗"""
         smgr = self.ctx.getServiceManager()
-        
-        # Create dialog
         dialog = smgr.createInstanceWithContext("com.sun.star.awt.UnoControlDialog", self.ctx)
-        dialog_model = smgr.createInstanceWithContext("com.sun.star.awt.UnoControlDialogModel", self.ctx)
         dialog.setModel(dialog_model)
-        
-        # Set dialog properties
-        dialog_model.setPropertyValues(
-            ("Width", "Height", "Title"),
-            (300, 160, " AI Settings")
-        )
-        
-        # Model label
-        model_label = dialog.getModel().createInstance("com.sun.star.awt.UnoControlFixedTextModel")
-        model_label.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "Label"),
-            (80, 15, 20, 23, "AI Model:")
-        )
-        dialog_model.insertByName("ModelLabel", model_label)
-        
-        # Model dropdown
-        model_dropdown = dialog.getModel().createInstance("com.sun.star.awt.UnoControlListBoxModel")
-        model_dropdown.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "Dropdown"),
-            (180, 15, 100, 20, True)
-        )
-        model_dropdown.StringItemList = tuple(["Gemini", "GPT (OpenAI)", "Claude"])
-        model_dropdown.SelectedItems = [0]  # Default to Gemini
-        dialog_model.insertByName("ModelDropdown", model_dropdown)
-        
-        # API Key label
-        api_key_label = dialog.getModel().createInstance("com.sun.star.awt.UnoControlFixedTextModel")
-        api_key_label.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "Label"),
-            (80, 15, 20, 63, "API Key:")
-        )
-        dialog_model.insertByName("ApiKeyLabel", api_key_label)
-        
-        # API Key input field
-        api_key_field = dialog.getModel().createInstance("com.sun.star.awt.UnoControlEditModel")
-        api_key_field.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "EchoChar"),
-            (180, 15, 100, 60, 42)  # EchoChar 42 = "*" for password masking
-        )
-        dialog_model.insertByName("ApiKeyField", api_key_field)
-        
-        # Help text
-        help_text = dialog.getModel().createInstance("com.sun.star.awt.UnoControlFixedTextModel")
-        help_text.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "Label", "MultiLine"),
-            (280, 35, 10, 90, "設定會儲存至 ~/.libreoffice 目錄。\n按下儲存後將創建啟動 AI 服務的批次檔。", True)
-        )
-        dialog_model.insertByName("HelpText", help_text)
-        
-        # Save button
-        save_button = dialog.getModel().createInstance("com.sun.star.awt.UnoControlButtonModel")
-        save_button.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "Label"),
-            (80, 20, 110, 125, "Save")
-        )
-        dialog_model.insertByName("SaveButton", save_button)
-        
-        # Cancel button
-        cancel_button = dialog.getModel().createInstance("com.sun.star.awt.UnoControlButtonModel")
-        cancel_button.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "Label"),
-            (80, 20, 200, 125, "Cancel")
-        )
-        dialog_model.insertByName("CancelButton", cancel_button)
-        
-        # Create window peer
         toolkit = smgr.createInstanceWithContext("com.sun.star.awt.Toolkit", self.ctx)
         dialog.createPeer(toolkit, None)
-        
+        return dialog
+
+    def create_settings_dialog(self):
+        """創建設定對話框"""
+        dialog_model = self.templates.clone(self.ctx, "settings", *SETTINGS_DIALOG)
+
         # Try to load existing .env settings
         try:
-            import os
-            libreoffice_dir = os.path.join(os.path.expanduser("~"), ".libreoffice")
-            env_path = os.path.join(libreoffice_dir, ".env")
-            
-            if os.path.exists(env_path):
-                with open(env_path, 'r') as f:
-                    content = f.read()
-                    # Find key-value pairs
-                    for line in content.splitlines():
-                        if line.startswith("DEFAULT_PROVIDER="):
-                            provider = line.split("=")[1].strip('"\'')
-                            if provider == "gemini":
-                                model_dropdown.SelectedItems = [0]
-                            elif provider == "openai":
-                                model_dropdown.SelectedItems = [1]
-                            elif provider == "claude":
-                                model_dropdown.SelectedItems = [2]
-                        elif "API_KEY=" in line:
-                            api_key = line.split("=")[1].strip('"\'')
-                            if api_key:
-                                api_key_field.Text = api_key
+            from settings_service import get_settings_service
+            settings = get_settings_service().get()
+            providers = ["gemini", "openai", "claude"]
+            if settings.provider in providers:
+                dialog_model.getByName("ModelDropdown").SelectedItems = [providers.index(settings.provider)]
+            if settings.api_key:
+                dialog_model.getByName("ApiKeyField").Text = settings.api_key
         except Exception as e:
             print(f"Error loading .env: {str(e)}")
-            
-        return dialog
 
-    def create_simple_dialog(self, config):
-        """創建主要對話框"""
-        # Get the component context
-        smgr = self.ctx.getServiceManager()
-        
-        # Create dialog
-        dialog = smgr.createInstanceWithContext("com.sun.star.awt.UnoControlDialog", self.ctx)
-        dialog_model = smgr.createInstanceWithContext("com.sun.star.awt.UnoControlDialogModel", self.ctx)
-        dialog.setModel(dialog_model)
-        
-        # Set dialog properties
-        dialog_model.setPropertyValues(
-            ("Width", "Height", "Title"),
-            (350, 360, " AI Query")
-        )
-        
-        # Question label
-        question_label = dialog.getModel().createInstance("com.sun.star.awt.UnoControlFixedTextModel")
-        question_label.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "Label"),
-            (170, 15, 10, 10, "Your question:")
-        )
-        dialog_model.insertByName("QuestionLabel", question_label)
-        
-        # Question input field
-        text_field = dialog.getModel().createInstance("com.sun.star.awt.UnoControlEditModel")
-        text_field.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "MultiLine", "VScroll"),
-            (330, 50, 10, 30, True, True)
-        )
-        dialog_model.insertByName("TextField1", text_field)
-        
-        # Response label
-        response_label = dialog.getModel().createInstance("com.sun.star.awt.UnoControlFixedTextModel")
-        response_label.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "Label"),
-            (170, 15, 10, 100, "AI Response:")
-        )
-        dialog_model.insertByName("ResponseLabel", response_label)
-        
-        # Response display area
-        response_field = dialog.getModel().createInstance("com.sun.star.awt.UnoControlEditModel")
-        response_field.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "MultiLine", "ReadOnly", "VScroll"),
-            (330, 90, 10, 120, True, True, True)
-        )
-        dialog_model.insertByName("ResponseField", response_field)
-
-        # Adjust Response label
-        adjust_response_label = dialog.getModel().createInstance("com.sun.star.awt.UnoControlFixedTextModel")
-        adjust_response_label.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "Label"),
-            (55, 10, 10, 228, "Adjust Response:")
-        )
-        dialog_model.insertByName("AdjustResponseLabel", adjust_response_label)
-
-        # 根據配置排序下拉選單
-        sorted_dropdowns = sorted(config["dropdowns"], key=lambda x: x["position"])
-        
-        # 定義下拉選單的位置
-        dropdown_positions = [70, 120, 170, 220]
-        
-        # 動態創建所有的下拉選單
-        for i, dropdown in enumerate(sorted_dropdowns):
-            if i < len(dropdown_positions):  # 確保不超過預定義的位置數量
-                list_box = dialog.getModel().createInstance("com.sun.star.awt.UnoControlListBoxModel")
-                list_box.setPropertyValues(
-                    ("Width", "Height", "PositionX", "PositionY", "Dropdown"),
-                    (40, 15, dropdown_positions[i], 225, True)
-                )
-                # 設置選項
-                list_box.StringItemList = tuple(dropdown["options"])
-                # 設置默認選項
-                list_box.SelectedItems = [dropdown["default_option"]]
-                # 插入到對話框模型
-                dialog_model.insertByName(f"{dropdown['id']}List", list_box)
-
-        # Settings Button - 設定按鈕
-        settings_button = dialog.getModel().createInstance("com.sun.star.awt.UnoControlButtonModel")
-        settings_button.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "Label", "HelpText"),
-            (10, 10, 330, 335, "⚙️", "AI 模型設定")
-        )
-        dialog_model.insertByName("SettingsButton", settings_button)
+        return self._create_dialog(dialog_model)
 
-        # Reload Config Button - 重載配置按鈕
-        reload_config_button = dialog.getModel().createInstance("com.sun.star.awt.UnoControlButtonModel")
-        reload_config_button.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "Label", "HelpText"),
-            (10, 10, 270, 220, "♻️", "重載配置選單")
-        )
-        dialog_model.insertByName("ReloadConfigButton", reload_config_button)
+    def create_diagnostics_dialog(self, report):
+        """創建診斷對話框，顯示請求延遲與吞吐量統計"""
+        dialog_model = self.templates.clone(self.ctx, "diagnostics", *DIAGNOSTICS_DIALOG)
+        dialog_model.getByName("ReportField").Text = report
+        return self._create_dialog(dialog_model)
 
-        # Reset Dropdowns Button - 清除下拉選單按鈕
-        reset_dropdowns_button = dialog.getModel().createInstance("com.sun.star.awt.UnoControlButtonModel")
-        reset_dropdowns_button.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "Label", "HelpText"),
-            (10, 10, 270, 235, "🧹", "還原下拉選單")
-        )
-        dialog_model.insertByName("ResetDropdownsButton", reset_dropdowns_button)
-
-        # Adjust Response Button
-        adjust_response_button = dialog.getModel().createInstance("com.sun.star.awt.UnoControlButtonModel")
-        adjust_response_button.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "Label", "HelpText"),
-            (50, 15, 290, 225, "Adjust", "調整 AI 回應")
-        )
-        dialog_model.insertByName("AdjustResponseButton", adjust_response_button)
-
-        # Adjust Prompts display area
-        prompts_field = dialog.getModel().createInstance("com.sun.star.awt.UnoControlEditModel")
-        prompts_field.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "MultiLine", "VScroll"),
-            (270, 50, 10, 255, True, True)
-        )
-        dialog_model.insertByName("PromptsField", prompts_field)
+    def create_history_dialog(self, results):
+        """創建歷史紀錄對話框，顯示搜尋結果"""
+        dialog_model = self.templates.clone(self.ctx, "history", *HISTORY_DIALOG)
+        dialog_model.getByName("ResultsField").Text = results
+        return self._create_dialog(dialog_model)
 
-        # Preview Prompts Button
-        preview_prompts_button = dialog.getModel().createInstance("com.sun.star.awt.UnoControlButtonModel")
-        preview_prompts_button.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "Label", "HelpText"),
-            (50, 15, 290, 273, "Preview", "預覽調整提示詞")
-        )
-        dialog_model.insertByName("PreviewPromptsButton", preview_prompts_button)
+    def create_simple_dialog(self, config):
+        """創建主要對話框"""
+        return self._create_dialog(self.templates.clone_main(self.ctx, config))
 
-        # Ask button
-        ask_button = dialog.getModel().createInstance("com.sun.star.awt.UnoControlButtonModel")
-        ask_button.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "Label"),
-            (60, 20, 10, 330, "Ask AI")
-        )
-        dialog_model.insertByName("AskButton", ask_button)
-        
-        # Insert button
-        insert_button = dialog.getModel().createInstance("com.sun.star.awt.UnoControlButtonModel")
-        insert_button.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "Label"),
-            (80, 20, 80, 330, "Insert to Doc")
-        )
-        dialog_model.insertByName("InsertButton", insert_button)
-        
-        # Clear Response button
-        clear_button = dialog.getModel().createInstance("com.sun.star.awt.UnoControlButtonModel")
-        clear_button.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "Label"),
-            (80, 20, 170, 330, "Clear Response")
-        )
-        dialog_model.insertByName("ClearButton", clear_button)
-        
-        # Close button
-        close_button = dialog.getModel().createInstance("com.sun.star.awt.UnoControlButtonModel")
-        close_button.setPropertyValues(
-            ("Width", "Height", "PositionX", "PositionY", "Label"),
-            (60, 20, 260, 330, "Close")
-        )
-        dialog_model.insertByName("CloseButton", close_button)
-        
-        # Create window peer
-        toolkit = smgr.createInstanceWithContext("com.sun.star.awt.Toolkit", self.ctx)
-        dialog.createPeer(toolkit, None)
-        
-        return dialog
+    def update_dropdowns(self, dialog, old_config, config, selections=None):
+        """配置變更時只更新開啟中主對話框的下拉選單，保留問題與回應等其他內容"""
+        patch_dropdown_row(dialog.getModel(), dropdown_controls(old_config), dropdown_controls(config), selections)
@@ -2,15 +2,195 @@ import unohelper
 from com.sun.star.awt import XActionListener
 from com.sun.star.awt.MessageBoxType import MESSAGEBOX, INFOBOX
 import uno
+from cancellation import CancelToken
+from config_watcher import ConfigWatcher
+from conversation import Conversation
+from history_store import SessionHistory, format_entries, get_history_store
+from request_executor import BackgroundExecutor
+
+
+class ResponseFieldWriter:
+    """將串流回應的文字片段逐步附加到回應欄位（需在 UI 執行緒上呼叫）"""
+
+    def __init__(self, response_field, prefix=""):
+        self.response_field = response_field
+        self.response_field.setText(prefix)
+        self.length = self._field_length(prefix)
+
+    @staticmethod
+    def _field_length(text):
+        # 編輯欄位以 UTF-16 單位計算位置，且換行只算一個字元
+        return len(text.replace("\r\n", "\n").encode("utf-16-le")) // 2
+
+    def append(self, text):
+        """在欄位末端插入文字"""
+        selection = uno.createUnoStruct("com.sun.star.awt.Selection", self.length, self.length)
+        self.response_field.insertText(selection, text)
+        self.length += self._field_length(text)
 
 
 class EventHandlers:
+    # 請求執行中需要停用的按鈕
+    BUSY_DISABLED_CONTROLS = (
+        "AskButton", "AdjustResponseButton", "PreviewPromptsButton", "InsertButton",
+        "ClearButton", "ReloadConfigButton", "ResetDropdownsButton", "SettingsButton", "BatchButton"
+    )
+
     def __init__(self, ctx, ai_service, config_manager, utils):
         self.ctx = ctx
         self.ai_service = ai_service
         self.config_manager = config_manager
         self.utils = utils
+        # 在背景執行緒執行 AI 請求，避免凍結 LibreOffice
+        self.executor = BackgroundExecutor(ctx)
+        self.active_request = None
+        # 對話框開啟期間監看配置檔；由 watch_config 建立
+        self.config_watcher = None
+        self._watch_token = CancelToken()
+        self._reload_pending = False
+        # 本次對話框的問答紀錄；欄位只顯示最近幾則，全部紀錄寫入本機資料庫
+        self.history = SessionHistory(get_history_store(), window=ai_service.settings_service.get().history_window)
+        # 多輪對話（.env 的 CONVERSATION_MODE）；由 start_conversation 建立
+        self.conversation = None
+        # 開啟對話框時選取的文字，長文本分塊處理時用來分離使用者的請求
+        self.document = ""
+
+    def set_busy(self, dialog, busy, status_text=""):
+        """切換對話框忙碌狀態：停用操作按鈕、啟用取消按鈕並顯示狀態文字"""
+        for control_name in self.BUSY_DISABLED_CONTROLS:
+            dialog.getControl(control_name).setEnable(not busy)
+        dialog.getControl("CancelRequestButton").setEnable(busy)
+        dialog.getModel().getByName("StatusLabel").Label = status_text
+
+    def start_request(self, dialog, task, on_success, error_prefix="Error", error_title="Error",
+                      status_text="⏳ 等待 AI 回應中..."):
+        """
+        在背景執行 AI 請求，完成後於 UI 執行緒更新對話框
+
+        Args:
+            dialog: 對話框實例
+            task: 在背景執行的函式 task(cancel_token)
+            on_success: 成功時在 UI 執行緒呼叫 on_success(result)
+            error_prefix: 錯誤訊息前綴
+            error_title: 錯誤對話框標題
+            status_text: 執行期間顯示的狀態文字
+
+        Returns:
+            CancelToken: 本次請求的取消旗標
+        """
+        request = {}
+
+        def on_error(e):
+            self.utils.show_message(f"{error_prefix}: {str(e)}", error_title, MESSAGEBOX)
+
+        def on_finished():
+            # 已取消或已被新請求取代時，忙碌狀態早已由其他路徑處理
+            if self.active_request is request["token"]:
+                self.active_request = None
+                self.set_busy(dialog, False)
+
+        self.set_busy(dialog, True, status_text)
+        request["token"] = self.executor.submit(task, on_success, on_error, on_finished)
+        self.active_request = request["token"]
+        return request["token"]
+
+    def cancel_request(self, dialog=None):
+        """取消執行中的請求；傳入 dialog 時同時恢復對話框狀態"""
+        if self.active_request is None:
+            return
+        self.active_request.cancel()
+        self.active_request = None
+        if dialog is not None:
+            self.set_busy(dialog, False, "已取消")
+
+    def dispose(self):
+        """對話框關閉時取消請求、停止監看配置檔、關閉背景執行緒池並寫入請求統計"""
+        self.cancel_request()
+        self._watch_token.cancel()
+        if self.config_watcher is not None:
+            self.config_watcher.stop()
+        self.executor.shutdown()
+        self.ai_service.metrics.flush()
     
+    def watch_config(self, dialog, dialog_builder):
+        """
+        對話框開啟期間監看配置檔
+
+        配置檔變更時在背景讀取、驗證與編譯，再於 UI 執行緒只更新下拉選單，
+        輸入框與回應等內容保持不變。
+        """
+        def on_change(config, compiled, signature):
+            self.executor.post(self._watch_token, self.apply_config, dialog, dialog_builder, config, compiled, signature)
+
+        def on_error(error):
+            self.executor.post(self._watch_token, self._config_error, dialog, error)
+
+        self.config_watcher = ConfigWatcher(self.config_manager.config_path, on_change, on_error,
+                                            signature=self.config_manager.signature)
+        self.config_watcher.start()
+
+    def reload_config(self):
+        """立即重新讀取配置檔（♻️ 按鈕）；結果由 apply_config 或 _config_error 在 UI 執行緒處理"""
+        self._reload_pending = True
+        self.config_watcher.check_now(force=True)
+
+    def apply_config(self, dialog, dialog_builder, config, compiled, signature):
+        """在 UI 執行緒套用新配置並更新下拉選單，保留仍存在的選擇"""
+        selections = self.read_selected_options(dialog)
+        old_config = self.config_manager.config
+        self.config_manager.apply_config(config, compiled, signature)
+        dialog_builder.update_dropdowns(dialog, old_config, config, selections)
+        self._show_config_status(dialog, "✅ 配置已重新載入")
+
+    def _config_error(self, dialog, error):
+        if self._reload_pending:
+            self._reload_pending = False
+            self.utils.show_message(f"配置重載失敗: {str(error)}", "錯誤", MESSAGEBOX)
+        else:
+            self._show_config_status(dialog, "⚠️ 配置檔格式錯誤，沿用目前配置")
+
+    def _show_config_status(self, dialog, text):
+        self._reload_pending = False
+        # 請求執行中時狀態列顯示請求進度，不覆蓋
+        if self.active_request is None:
+            dialog.getModel().getByName("StatusLabel").Label = text
+
+    def start_conversation(self, document=""):
+        """
+        開始新的多輪對話，document 為開啟對話框時選取的文字
+
+        只有 .env 設定 CONVERSATION_MODE=true 時才建立對話，否則每次詢問都是獨立的請求。
+        """
+        self.document = document or ""
+        if self.ai_service.settings_service.get().conversation_mode:
+            self.conversation = Conversation(document)
+        else:
+            self.conversation = None
+
+    def record_response(self, kind, question, response):
+        """
+        將回應加入問答紀錄
+
+        Returns:
+            str: 回應欄位應顯示的文字（最近幾則回應）
+        """
+        settings = self.ai_service.settings_service.get()
+        token_info = self.ai_service.last_token_info or {}
+        self.history.add(kind, question, response, provider=settings.provider, model=settings.model,
+                         tokens=token_info.get("completion_tokens"))
+        return self.history.render()
+
+    def read_selected_options(self, dialog):
+        """讀取對話框中每個下拉選單目前選擇的選項，格式為 {'dropdown_id': 'selected_value'}"""
+        selected_options = {}
+        for dropdown_id in self.config_manager.prompt_rules.dropdown_ids:
+            try:
+                dropdown_control = dialog.getControl(f"{dropdown_id}List")
+                selected_options[dropdown_id] = dropdown_control.getItem(dropdown_control.getSelectedItemPos())
+            except Exception as e:
+                print(f"無法獲取 {dropdown_id} 的選擇: {str(e)}")
+        return selected_options
+
     def get_dialog_listeners(self, dialog, current_response):
         """
         獲取所有對話框按鈕的監聽器
@@ -25,13 +205,17 @@ class EventHandlers:
         listeners = {
             "AskButtonListener": self.create_ask_button_listener(dialog, current_response),
             "InsertButtonListener": self.create_insert_button_listener(current_response),
-            "ClearButtonListener": self.create_clear_button_listener(dialog),
+            "ClearButtonListener": self.create_clear_button_listener(dialog, current_response),
             "CloseButtonListener": self.create_close_button_listener(dialog),
             "ReloadConfigButtonListener": self.create_reload_config_button_listener(dialog),
             "ResetDropdownsButtonListener": self.create_reset_dropdowns_button_listener(dialog),
             "PreviewPromptsButtonListener": self.create_preview_prompts_button_listener(dialog),
             "AdjustResponseButtonListener": self.create_adjust_response_button_listener(dialog, current_response),
-            "SettingsButtonListener": self.create_settings_button_listener(dialog)
+            "BatchButtonListener": self.create_batch_button_listener(dialog),
+            "SettingsButtonListener": self.create_settings_button_listener(dialog),
+            "CancelRequestButtonListener": self.create_cancel_request_button_listener(dialog),
+            "DiagnosticsButtonListener": self.create_diagnostics_button_listener(),
+            "HistoryButtonListener": self.create_history_button_listener()
         }
         
         return listeners
@@ -54,14 +238,29 @@ class EventHandlers:
                     
                     question = text_field.getText()
                     if question.strip():
-                        response = self.ai_service.ask_ai(question)
-                        current_text = response_field.getText()
-                        if current_text.strip():
-                            new_text = current_text + "\n\n-------------------\n\n" + response
-                        else:
-                            new_text = response
-                        response_field.setText(new_text)
-                        self.current_response[0] = new_text  # 更新列表
+                        # 欄位只保留最近幾則回應，每次更新的成本不隨紀錄增加
+                        history = self.parent.history
+                        # 以串流方式邊接收邊顯示回應，片段透過 UI 執行緒附加到欄位
+                        writer = ResponseFieldWriter(response_field, history.prefix())
+                        executor = self.parent.executor
+
+                        conversation = self.parent.conversation
+
+                        def task(cancel_token):
+                            on_chunk = lambda text: executor.post(cancel_token, writer.append, text)
+                            if conversation is not None:
+                                # 後續問題沿用之前的問答，文件由提供商的提示詞快取讀取
+                                return self.ai_service.ask_conversation(conversation, question, on_chunk,
+                                                                        cancel_token=cancel_token)
+                            # 超過單一請求預算的長文本會先分塊整理重點再彙整
+                            return self.ai_service.ask_ai_chunked(question, on_chunk, cancel_token=cancel_token,
+                                                                  document=self.parent.document)
+
+                        def on_success(response):
+                            response_field.setText(self.parent.record_response("ask", question, response))
+                            self.current_response[0] = response  # 最近一則回應，供插入使用
+
+                        self.parent.start_request(self.dialog, task, on_success)
                     else:
                         self.utils.show_message("Please enter a question", "Warning", MESSAGEBOX)
                 except Exception as e:
@@ -92,11 +291,12 @@ class EventHandlers:
                 
         return InsertButtonListener(self, current_response, self.utils)
     
-    def create_clear_button_listener(self, dialog):
+    def create_clear_button_listener(self, dialog, current_response):
         """創建清除按鈕監聽器"""
         
         class ClearButtonListener(unohelper.Base, XActionListener):
-            def __init__(self, dialog, current_response):
+            def __init__(self, parent, dialog, current_response):
+                self.parent = parent
                 self.dialog = dialog
                 self.current_response = current_response
                 
@@ -104,26 +304,50 @@ class EventHandlers:
                 response_field = self.dialog.getControl("ResponseField")
                 response_field.setText("")
                 self.current_response[0] = ""
+                # 只清除欄位顯示的紀錄，資料庫中的紀錄保留
+                self.parent.history.clear()
+                # 之後的問題開始新的對話（文件不變）
+                if self.parent.conversation is not None:
+                    self.parent.conversation.clear()
             
             def disposing(self, event):
                 pass
         
-        return ClearButtonListener(dialog, [])
+        return ClearButtonListener(self, dialog, current_response)
     
     def create_close_button_listener(self, dialog):
         """創建關閉按鈕監聽器"""
         
         class CloseButtonListener(unohelper.Base, XActionListener):
-            def __init__(self, dialog):
+            def __init__(self, parent, dialog):
+                self.parent = parent
                 self.dialog = dialog
                 
             def actionPerformed(self, event):
+                # 關閉前取消仍在執行的請求
+                self.parent.cancel_request()
                 self.dialog.endExecute()
             
             def disposing(self, event):
                 pass
         
-        return CloseButtonListener(dialog)
+        return CloseButtonListener(self, dialog)
+
+    def create_cancel_request_button_listener(self, dialog):
+        """創建取消請求按鈕監聽器"""
+        
+        class CancelRequestButtonListener(unohelper.Base, XActionListener):
+            def __init__(self, parent, dialog):
+                self.parent = parent
+                self.dialog = dialog
+                
+            def actionPerformed(self, event):
+                self.parent.cancel_request(self.dialog)
+            
+            def disposing(self, event):
+                pass
+        
+        return CancelRequestButtonListener(self, dialog)
     
     def create_reload_config_button_listener(self, dialog):
         """創建重載配置按鈕監聽器"""
@@ -137,18 +361,8 @@ class EventHandlers:
                 
             def actionPerformed(self, event):
                 try:
-                    # 重新載入配置
-                    success = self.config_manager.reload_configuration()
-                    if success:
-                        self.utils.show_message("配置已重新載入", "成功", INFOBOX)
-                        
-                        # 關閉當前對話框
-                        self.dialog.endExecute()
-                        
-                        # 通知外部重新開啟主對話框
-                        self.parent.reload_requested = True
-                    else:
-                        self.utils.show_message("配置重載失敗", "錯誤", MESSAGEBOX)
+                    # 在背景重新讀取並編譯配置，完成後只更新下拉選單，不關閉對話框
+                    self.parent.reload_config()
                 except Exception as e:
                     self.utils.show_message(f"重載配置時發生錯誤: {str(e)}", "錯誤", MESSAGEBOX)
                     
@@ -170,15 +384,14 @@ class EventHandlers:
             def actionPerformed(self, event):
                 try:
                     # 遍歷配置中的所有下拉選單
-                    for dropdown in self.config_manager.config["dropdowns"]:
-                        dropdown_id = dropdown["id"]
-                        default_option = dropdown["default_option"]
+                    for dropdown in self.config_manager.prompt_rules.dropdowns:
+                        dropdown_id = dropdown.id
                         
                         try:
                             # 獲取下拉選單控制項
                             dropdown_control = self.dialog.getControl(f"{dropdown_id}List")
                             # 重置為默認選項
-                            dropdown_control.selectItemPos(default_option, True)
+                            dropdown_control.selectItem(dropdown.default_option, True)
                         except Exception as e:
                             print(f"無法重置 {dropdown_id} 的選擇: {str(e)}")
                     
@@ -204,25 +417,10 @@ class EventHandlers:
             def actionPerformed(self, event):
                 try:
                     # 獲取每個下拉選單的選擇
-                    selected_options = {}
-                    
-                    # 遍歷配置中的所有下拉選單
-                    for dropdown in self.config_manager.config["dropdowns"]:
-                        dropdown_id = dropdown["id"]
-                        try:
-                            # 獲取選擇的選項索引
-                            dropdown_control = self.dialog.getControl(f"{dropdown_id}List")
-                            selected_index = dropdown_control.getSelectedItemPos()
-                            # 獲取選擇的選項值
-                            selected_value = dropdown_control.getItem(selected_index)
-                            # 添加到選項字典
-                            selected_options[dropdown_id] = selected_value
-                        except Exception as e:
-                            print(f"無法獲取 {dropdown_id} 的選擇: {str(e)}")
+                    selected_options = self.parent.read_selected_options(self.dialog)
                             
-                    # 獲取當前的回應文本
-                    response_field = self.dialog.getControl("ResponseField")
-                    current_text = response_field.getText().strip()
+                    # 獲取最近一則回應（欄位中較早的回應不放入提示詞）
+                    current_text = self.parent.history.latest.strip()
                     
                     # 生成包含當前文本的提示詞
                     prompt_template = self.config_manager.generate_adjustment_prompt(
@@ -262,6 +460,8 @@ class EventHandlers:
                     
                     # 初始化長度調整參數
                     length_adjustment = None
+                    # 過長文本切出的區塊；只在自動生成提示詞時使用
+                    chunks = []
                     
                     # 判斷是否有手動編輯的提示詞
                     if prompts_text:
@@ -271,49 +471,70 @@ class EventHandlers:
                         length_adjustment = self.ai_service.extract_length_adjustment(complete_prompt)
                     else:
                         # 如果提示詞欄位為空，則自動生成提示詞
-                        selected_options = {}
+                        selected_options = self.parent.read_selected_options(self.dialog)
                         
-                        # 遍歷配置中的所有下拉選單
-                        for dropdown in self.config_manager.config["dropdowns"]:
-                            dropdown_id = dropdown["id"]
-                            try:
-                                dropdown_control = self.dialog.getControl(f"{dropdown_id}List")
-                                selected_index = dropdown_control.getSelectedItemPos()
-                                selected_value = dropdown_control.getItem(selected_index)
-                                selected_options[dropdown_id] = selected_value
-                                
-                                # 檢查是否有長度調整選項
-                                if dropdown_id == "length_adjustment" and selected_value != dropdown["options"][dropdown["default_option"]]:
-                                    length_adjustment = selected_value
-                            except Exception as e:
-                                print(f"無法獲取 {dropdown_id} 的選擇: {str(e)}")
+                        # 檢查是否有長度調整選項
+                        length_adjustment = self.config_manager.prompt_rules.length_adjustment(selected_options)
                                 
-                        # 獲取當前的回應文本
-                        current_text = response_field.getText().strip()
+                        # 獲取最近一則回應（欄位中較早的回應不放入提示詞）
+                        current_text = self.parent.history.latest.strip()
                         
                         # 生成包含當前文本的提示詞
                         complete_prompt = self.config_manager.generate_adjustment_prompt(
                             selected_options=selected_options,
                             text=current_text
                         )
+
+                        # 只有目標長度超過單次請求的輸出上限時才分塊改寫，否則以長度調整優先
+                        chunks = self.ai_service.split_for_adjustment(current_text, length_adjustment)
                         
+                    executor = self.parent.executor
+
                     # 使用新的長度調整功能發送請求
-                    if length_adjustment:
+                    if len(chunks) > 1:
+                        # 各區塊平行改寫，依原文順序串流顯示
+                        writer = ResponseFieldWriter(response_field, self.parent.history.prefix())
+
+                        def task(cancel_token):
+                            outputs = self.ai_service.map_chunks(
+                                chunks,
+                                lambda chunk, index, count: self.config_manager.generate_adjustment_prompt(
+                                    selected_options=selected_options,
+                                    text=chunk.strip()
+                                ),
+                                on_chunk=lambda text: executor.post(cancel_token, writer.append, text),
+                                cancel_token=cancel_token
+                            )
+                            return "\n".join(output.strip() for output in outputs)
+                    elif length_adjustment:
                         # 使用帶長度調整的高級方法
-                        adjusted_response = self.ai_service.ask_ai_with_length_adjustment(
-                            question=complete_prompt,
-                            length_adjustment=length_adjustment,
-                            max_attempts=3
-                        )
+                        def task(cancel_token):
+                            return self.ai_service.ask_ai_with_length_adjustment(
+                                question=complete_prompt,
+                                length_adjustment=length_adjustment,
+                                max_attempts=3,
+                                cancel_token=cancel_token
+                            )
                     else:
-                        # 使用標準方法（不帶長度調整）
-                        adjusted_response = self.ai_service.ask_ai(question=complete_prompt)
-                    
-                    # 更新回應欄位
-                    response_field.setText(adjusted_response)
-                    
-                    # 更新 current_response 列表的第一個元素
-                    self.current_response[0] = adjusted_response
+                        # 使用串流方法（不帶長度調整），邊接收邊顯示回應
+                        writer = ResponseFieldWriter(response_field, self.parent.history.prefix())
+
+                        def task(cancel_token):
+                            return self.ai_service.ask_ai_stream(
+                                complete_prompt,
+                                lambda text: executor.post(cancel_token, writer.append, text),
+                                cancel_token=cancel_token
+                            )
+
+                    def on_success(adjusted_response):
+                        # 調整後的回應接在原回應之後，成為最近一則回應
+                        response_field.setText(self.parent.record_response("adjust", complete_prompt, adjusted_response))
+                        
+                        # 更新 current_response 列表的第一個元素
+                        self.current_response[0] = adjusted_response
+
+                    self.parent.start_request(self.dialog, task, on_success,
+                                              error_prefix="調整回應錯誤", error_title="錯誤")
                     
                 except Exception as e:
                     self.utils.show_message(f"調整回應錯誤: {str(e)}", "錯誤", MESSAGEBOX)
@@ -323,6 +544,87 @@ class EventHandlers:
                 
         return AdjustResponseButtonListener(self, dialog, current_response, self.config_manager, self.ai_service, self.utils)
     
+    def create_batch_button_listener(self, dialog):
+        """創建批次處理按鈕監聽器"""
+        
+        class BatchButtonListener(unohelper.Base, XActionListener):
+            def __init__(self, parent, dialog, config_manager, ai_service, utils):
+                self.parent = parent
+                self.dialog = dialog
+                self.config_manager = config_manager
+                self.ai_service = ai_service
+                self.utils = utils
+                
+            def actionPerformed(self, event):
+                try:
+                    # 獲取每個下拉選單的選擇，至少要選擇一項調整
+                    selected_options = self.parent.read_selected_options(self.dialog)
+                    if not self.config_manager.prompt_rules.has_adjustment(selected_options):
+                        self.utils.show_message("請先在下拉選單中選擇要套用的調整", "Warning", MESSAGEBOX)
+                        return
+
+                    # 在 UI 執行緒上列舉段落，之後只在背景處理文字
+                    jobs, scope, doc = self.utils.get_document_paragraphs()
+                    if not jobs:
+                        self.utils.show_message("文件中沒有可處理的段落", "Warning", MESSAGEBOX)
+                        return
+
+                    executor = self.parent.executor
+                    status_label = self.dialog.getModel().getByName("StatusLabel")
+                    scope_name = "選取範圍" if scope == "selection" else "整份文件"
+                    conflicts = [0]
+
+                    def transform(text, cancel_token):
+                        prompt = self.config_manager.generate_adjustment_prompt(
+                            selected_options=selected_options,
+                            text=text
+                        )
+                        # 各段落平行請求，不更新 previous_token 等單次詢問使用的狀態
+                        return self.ai_service.ask_ai(prompt, cancel_token=cancel_token, raise_errors=True,
+                                                      record=False)
+
+                    def apply_results(items):
+                        # 在 UI 執行緒依文件順序寫回，每次寫回為一個復原步驟
+                        from text_inserter import replace_paragraphs
+                        conflicts[0] += replace_paragraphs(doc, items)
+
+                    def show_progress(stats):
+                        status_label.Label = f"⏳ 批次 {stats['processed']}/{stats['total']}，已寫回 {stats['written']}"
+
+                    # 批次處理不常使用，第一次按下時才匯入
+                    from batch_processor import BatchProcessor
+
+                    def task(cancel_token):
+                        workers = self.ai_service.settings_service.get().batch_workers
+                        processor = BatchProcessor(transform, max_workers=workers)
+                        return processor.run(
+                            jobs,
+                            lambda items: executor.post(cancel_token, apply_results, items),
+                            cancel_token=cancel_token,
+                            on_progress=lambda stats: executor.post(cancel_token, show_progress, stats)
+                        )
+
+                    def on_success(stats):
+                        message = (
+                            f"{scope_name}共 {stats['total']} 個段落：已寫回 {stats['written'] - conflicts[0]}，"
+                            f"空白略過 {stats['skipped_empty']}，內容未改變 {stats['unchanged']}，"
+                            f"失敗 {stats['failed']}，已被編輯而略過 {conflicts[0]}"
+                        )
+                        if stats["errors"]:
+                            message += "\n\n" + "\n".join(stats["errors"])
+                        self.utils.show_message(message, "批次處理完成", INFOBOX)
+
+                    self.parent.start_request(self.dialog, task, on_success,
+                                              error_prefix="批次處理錯誤", error_title="錯誤",
+                                              status_text=f"⏳ 批次處理{scope_name} {len(jobs)} 個段落...")
+                except Exception as e:
+                    self.utils.show_message(f"批次處理錯誤: {str(e)}", "錯誤", MESSAGEBOX)
+                    
+            def disposing(self, event):
+                pass
+                
+        return BatchButtonListener(self, dialog, self.config_manager, self.ai_service, self.utils)
+    
     def create_settings_button_listener(self, dialog):
         """創建設定按鈕監聽器"""
         
@@ -361,6 +663,98 @@ class EventHandlers:
                 
         return SettingsButtonListener(self, dialog, self.ctx, self.config_manager, self.ai_service, self.utils)
     
+    def create_diagnostics_button_listener(self):
+        """創建診斷按鈕監聽器"""
+        
+        class DiagnosticsButtonListener(unohelper.Base, XActionListener):
+            def __init__(self, ctx, ai_service, utils):
+                self.ctx = ctx
+                self.ai_service = ai_service
+                self.utils = utils
+                
+            def actionPerformed(self, event):
+                try:
+                    from dialog_builder import DialogBuilder
+                    
+                    diagnostics_dialog = DialogBuilder(self.ctx).create_diagnostics_dialog(
+                        self.ai_service.get_diagnostics_report()
+                    )
+                    report_field = diagnostics_dialog.getControl("ReportField")
+                    ai_service = self.ai_service
+                    
+                    class RefreshListener(unohelper.Base, XActionListener):
+                        def actionPerformed(self, event):
+                            report_field.setText(ai_service.get_diagnostics_report())
+                            
+                        def disposing(self, event):
+                            pass
+                            
+                    class CloseListener(unohelper.Base, XActionListener):
+                        def actionPerformed(self, event):
+                            diagnostics_dialog.endExecute()
+                            
+                        def disposing(self, event):
+                            pass
+                    
+                    diagnostics_dialog.getControl("RefreshButton").addActionListener(RefreshListener())
+                    diagnostics_dialog.getControl("CloseButton").addActionListener(CloseListener())
+                    diagnostics_dialog.execute()
+                    # 關閉面板時順便寫入統計檔案
+                    self.ai_service.metrics.flush()
+                except Exception as e:
+                    self.utils.show_message(f"打開診斷對話框時出錯: {str(e)}", "錯誤", MESSAGEBOX)
+                    
+            def disposing(self, event):
+                pass
+                
+        return DiagnosticsButtonListener(self.ctx, self.ai_service, self.utils)
+    
+    def create_history_button_listener(self):
+        """創建歷史紀錄按鈕監聽器"""
+        
+        class HistoryButtonListener(unohelper.Base, XActionListener):
+            def __init__(self, ctx, store, utils):
+                self.ctx = ctx
+                self.store = store
+                self.utils = utils
+                
+            def actionPerformed(self, event):
+                try:
+                    from dialog_builder import DialogBuilder
+                    
+                    store = self.store
+                    # 先顯示最近的紀錄
+                    history_dialog = DialogBuilder(self.ctx).create_history_dialog(format_entries(store.recent()))
+                    search_field = history_dialog.getControl("SearchField")
+                    results_field = history_dialog.getControl("ResultsField")
+                    
+                    class SearchListener(unohelper.Base, XActionListener):
+                        def actionPerformed(self, event):
+                            text = search_field.getText().strip()
+                            entries = store.search(text) if text else store.recent()
+                            results_field.setText(format_entries(entries))
+                            
+                        def disposing(self, event):
+                            pass
+                            
+                    class CloseListener(unohelper.Base, XActionListener):
+                        def actionPerformed(self, event):
+                            history_dialog.endExecute()
+                            
+                        def disposing(self, event):
+                            pass
+                    
+                    history_dialog.getControl("SearchButton").addActionListener(SearchListener())
+                    history_dialog.getControl("CloseButton").addActionListener(CloseListener())
+                    history_dialog.execute()
+                except Exception as e:
+                    self.utils.show_message(f"打開歷史紀錄對話框時出錯: {str(e)}", "錯誤", MESSAGEBOX)
+                    
+            def disposing(self, event):
+                pass
+                
+        return HistoryButtonListener(self.ctx, self.history.store or get_history_store(), self.utils)
+    
     def get_settings_dialog_listeners(self, settings_dialog):
         """獲取設定對話框的事件監聽器"""
         
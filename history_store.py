@@ -0,0 +1,235 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from log_setup import get_logger
+
+
+logger = get_logger("history_store")
+
+
+HISTORY_FILE_NAME = "ai_query_history.sqlite3"
+# 資料庫最多保留的紀錄數，超過時刪除最舊的紀錄
+MAX_ENTRIES = 5000
+# 每個行程第一次寫入時，以及之後每寫入這麼多筆，檢查一次是否需要刪除舊紀錄
+PRUNE_EVERY = 100
+# 回應欄位預設只顯示最近幾則回應
+DEFAULT_WINDOW = 3
+SEPARATOR = "\n\n-------------------\n\n"
+# 歷史紀錄對話框中問題最多顯示的字數（調整回應的問題包含完整的提示詞）
+QUESTION_PREVIEW_CHARS = 200
+KIND_LABELS = {"ask": "詢問", "adjust": "調整回應"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    created REAL NOT NULL,
+    kind TEXT NOT NULL,
+    provider TEXT,
+    model TEXT,
+    tokens INTEGER,
+    question TEXT NOT NULL,
+    response TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_created ON entries (created);
+"""
+
+
+def default_history_path():
+    return os.path.join(os.path.expanduser("~"), ".libreoffice", HISTORY_FILE_NAME)
+
+
+class HistoryEntry(namedtuple("HistoryEntry", [
+    "session_id", "created", "kind", "provider", "model", "tokens", "question", "response"
+])):
+    """
+    一則問答紀錄
+
+    kind 為 "ask"（詢問）或 "adjust"（調整回應）；tokens 為回應的 token 數，未知時為 None。
+    """
+    __slots__ = ()
+
+
+class HistoryStore:
+    """
+    以本機 SQLite 檔案保存的問答紀錄
+
+    寫入由單一背景執行緒依序執行，UI 執行緒不會等待磁碟；紀錄數超過 max_entries 時
+    刪除最舊的紀錄。查詢（recent、search）在呼叫端的執行緒同步執行。
+    """
+
+    def __init__(self, path=None, max_entries=MAX_ENTRIES):
+        self.path = path or default_history_path()
+        self.max_entries = max_entries
+        self._connection = None
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ai-history")
+        self._writes = 0
+        self.errors = 0
+
+    def _connect(self):
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def add(self, entry):
+        """在背景寫入一則紀錄"""
+        return self._writer.submit(self._insert, entry)
+
+    def _insert(self, entry):
+        try:
+            with self._lock:
+                connection = self._connect()
+                with connection:
+                    connection.execute(
+                        "INSERT INTO entries (session_id, created, kind, provider, model, tokens, question, response) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", entry
+                    )
+                    self._writes += 1
+                    # 每次開啟對話框的寫入通常遠少於 PRUNE_EVERY，因此行程的第一筆寫入一定檢查
+                    if self._writes == 1 or self._writes % PRUNE_EVERY == 0:
+                        connection.execute(
+                            "DELETE FROM entries WHERE id <= "
+                            "(SELECT id FROM entries ORDER BY id DESC LIMIT 1 OFFSET ?)", (self.max_entries,)
+                        )
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning("無法寫入歷史紀錄: %s", e)
+
+    def _query(self, sql, params):
+        try:
+            with self._lock:
+                rows = self._connect().execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            logger.warning("無法讀取歷史紀錄: %s", e)
+            return []
+        return [HistoryEntry(*row) for row in rows]
+
+    def recent(self, limit=20):
+        """最近的紀錄，新的在前"""
+        return self._query(
+            "SELECT session_id, created, kind, provider, model, tokens, question, response "
+            "FROM entries ORDER BY id DESC LIMIT ?", (limit,)
+        )
+
+    def search(self, text, limit=50):
+        """搜尋問題或回應中包含 text 的紀錄（不分大小寫），新的在前"""
+        pattern = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return self._query(
+            "SELECT session_id, created, kind, provider, model, tokens, question, response FROM entries "
+            "WHERE question LIKE ? ESCAPE '\\' OR response LIKE ? ESCAPE '\\' ORDER BY id DESC LIMIT ?",
+            (pattern, pattern, limit)
+        )
+
+    def count(self):
+        try:
+            with self._lock:
+                return self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def flush(self):
+        """等待已排入的寫入完成"""
+        self._writer.submit(lambda: None).result()
+
+    def stats(self):
+        return {"entries": self.count(), "errors": self.errors, "path": self.path}
+
+
+def format_entries(entries):
+    """歷史紀錄對話框顯示的文字：每則紀錄的時間、類型、模型、問題與回應，以分隔線隔開"""
+    parts = []
+    for entry in entries:
+        header = "[{}] {}".format(time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.created)),
+                                  KIND_LABELS.get(entry.kind, entry.kind))
+        if entry.model:
+            header += f" ({entry.model})"
+        question = entry.question.strip()
+        if len(question) > QUESTION_PREVIEW_CHARS:
+            question = question[:QUESTION_PREVIEW_CHARS] + "⋯"
+        parts.append(f"{header}\n問題: {question}\n\n{entry.response.strip()}")
+    return SEPARATOR.join(parts) if parts else "沒有符合的紀錄"
+
+
+class SessionHistory:
+    """
+    對話框開啟期間的問答紀錄
+
+    記憶體中只保留最近 window 則，回應欄位也只顯示這幾則，因此每次詢問更新欄位的成本
+    與累積的紀錄數無關；所有紀錄同時寫入 HistoryStore，可跨工作階段搜尋。
+    """
+
+    def __init__(self, store=None, window=DEFAULT_WINDOW):
+        self.store = store
+        self.session_id = uuid.uuid4().hex
+        self.entries = deque(maxlen=max(1, window))
+        self.total = 0
+
+    def add(self, kind, question, response, provider=None, model=None, tokens=None):
+        entry = HistoryEntry(self.session_id, time.time(), kind, provider, model, tokens, question, response)
+        self.entries.append(entry)
+        self.total += 1
+        if self.store is not None:
+            self.store.add(entry)
+        return entry
+
+    @property
+    def latest(self):
+        """最近一則回應的文字，沒有紀錄時為空字串"""
+        return self.entries[-1].response if self.entries else ""
+
+    @property
+    def hidden(self):
+        """已不在欄位中顯示的回應數"""
+        return self.total - len(self.entries)
+
+    def render(self):
+        """回應欄位顯示的文字：最近 window 則回應，以分隔線隔開"""
+        parts = [entry.response for entry in self.entries]
+        if self.hidden:
+            parts.insert(0, f"⋯ 較早的 {self.hidden} 則回應已收起，可按 History 按鈕搜尋")
+        return SEPARATOR.join(parts)
+
+    def prefix(self, keep=None):
+        """
+        新回應串流顯示前的欄位內容
+
+        Args:
+            keep: 新回應加入後仍會顯示的舊回應數，預設為 window - 1
+        """
+        if keep is None:
+            keep = self.entries.maxlen - 1
+        shown = list(self.entries)[-keep:] if keep > 0 else []
+        hidden = self.total - len(shown)
+        parts = [entry.response for entry in shown]
+        if hidden:
+            parts.insert(0, f"⋯ 較早的 {hidden} 則回應已收起，可按 History 按鈕搜尋")
+        return SEPARATOR.join(parts) + SEPARATOR if parts else ""
+
+    def clear(self):
+        """清除欄位中的紀錄（資料庫中的紀錄保留）"""
+        self.entries.clear()
+        self.total = 0
+
+
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """取得行程內共用的歷史紀錄資料庫"""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = HistoryStore()
+        return _shared_store
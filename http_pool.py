@@ -0,0 +1,354 @@
+import base64
+import io
+import http.client
+import socket
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+# 與 urllib 相同：最多跟隨的重新導向次數，以及需要改為 GET 的狀態碼
+MAX_REDIRECTS = 10
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+def parse_proxy(proxy_url):
+    """
+    解析 HTTP_PROXY / HTTPS_PROXY 形式的代理伺服器位址
+
+    Returns:
+        tuple: (主機, 連接埠, Proxy-Authorization 標頭值或 None)
+    """
+    if "://" not in proxy_url:
+        proxy_url = "http://" + proxy_url
+    parsed = urllib.parse.urlsplit(proxy_url)
+    authorization = None
+    if parsed.username is not None:
+        credentials = f"{urllib.parse.unquote(parsed.username)}:{urllib.parse.unquote(parsed.password or '')}"
+        authorization = "Basic " + base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+    return parsed.hostname, parsed.port or 80, authorization
+
+
+class PooledResponse:
+    """
+    包裝 http.client.HTTPResponse，介面與 urllib 回應物件相容
+
+    讀取完畢並關閉時，底層連線會歸還連線池以便重複使用 (keep-alive)。
+    """
+
+    def __init__(self, pool, key, conn, response, url, cancel_token=None, abort=None):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self._released = False
+        self._cancel_token = cancel_token
+        self._abort = abort
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        # connect: 建立連線（含 TLS 交握）秒數，重複使用連線時為 0；first_byte: 送出請求到收到回應標頭的秒數
+        self.timings = {}
+
+    def getcode(self):
+        return self.status
+
+    def read(self, amt=None):
+        return self._response.read(amt)
+
+    def readline(self, limit=-1):
+        return self._response.readline(limit)
+
+    def __iter__(self):
+        while True:
+            line = self._response.readline()
+            if not line:
+                break
+            yield line
+
+    def close(self):
+        """關閉回應；若回應已完整讀取且伺服器允許，連線將歸還連線池"""
+        if self._released:
+            return
+        self._released = True
+        if self._cancel_token is not None:
+            self._cancel_token.remove_callback(self._abort)
+            if self._cancel_token.cancelled:
+                self._response.close()
+                self._conn.close()
+                return
+        reusable = self._response.isclosed() and self._conn.sock is not None
+        if not reusable:
+            self._response.close()
+            self._conn.close()
+            return
+        self._pool._release(self._key, self._conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+
+class HTTPConnectionPool:
+    """
+    以主機為單位的 HTTP/HTTPS keep-alive 連線池
+
+    每個 (scheme, host, port) 最多保留 max_per_host 條閒置連線，
+    閒置超過 idle_timeout 秒的連線會在下次取用時被淘汰。
+
+    代理伺服器設定與 urllib 相同（urllib.request.getproxies 與 proxy_bypass，
+    即 HTTPS_PROXY、HTTP_PROXY、NO_PROXY 或系統設定）：HTTPS 請求以 CONNECT 建立通道，
+    HTTP 請求以完整網址送給代理伺服器。3xx 重新導向也與 urllib 一樣自動跟隨。
+    """
+
+    # 重複使用的連線可能已被伺服器關閉，這些錯誤代表請求尚未被處理，可安全重送一次
+    STALE_CONNECTION_ERRORS = (
+        http.client.RemoteDisconnected,
+        http.client.BadStatusLine,
+        ConnectionResetError,
+        ConnectionAbortedError,
+        BrokenPipeError,
+    )
+
+    def __init__(self, max_per_host=4, idle_timeout=30.0):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._ssl_context = None
+        # getproxies() 的結果；在 Windows 與 macOS 上需要讀取系統設定，只讀一次
+        self._proxies = None
+        self.created = 0
+        self.reused = 0
+
+    def configure(self, max_per_host=None, idle_timeout=None, proxies=None):
+        """調整連線池大小與閒置逾時設定；proxies 為 {scheme: 代理網址}，覆寫系統的代理設定"""
+        with self._lock:
+            if proxies is not None:
+                self._proxies = dict(proxies)
+            if max_per_host is not None:
+                self.max_per_host = max(0, int(max_per_host))
+            if idle_timeout is not None:
+                self.idle_timeout = float(idle_timeout)
+            for key in list(self._idle):
+                self._trim_locked(key)
+
+    def _get_ssl_context(self):
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    def _proxy_for(self, scheme, host):
+        """回傳連線到 host 時使用的代理伺服器 (主機, 連接埠, 認證)，不使用代理時回傳 None"""
+        with self._lock:
+            if self._proxies is None:
+                self._proxies = urllib.request.getproxies()
+            proxies = self._proxies
+        proxy_url = proxies.get(scheme)
+        if not proxy_url:
+            return None
+        if "no" in proxies:
+            # proxy_bypass_environment 只檢查傳入的 no 設定，不會重新讀取環境變數
+            if urllib.request.proxy_bypass_environment(host, proxies):
+                return None
+        elif urllib.request.proxy_bypass(host):
+            return None
+        return parse_proxy(proxy_url)
+
+    def _new_connection(self, key, timeout):
+        scheme, host, port, proxy = key
+        if proxy is not None:
+            proxy_host, proxy_port, authorization = proxy
+            if scheme == "https":
+                # 先與代理伺服器建立 CONNECT 通道，再於通道內進行 TLS 交握
+                conn = http.client.HTTPSConnection(proxy_host, proxy_port, timeout=timeout,
+                                                   context=self._get_ssl_context())
+                conn.set_tunnel(host, port, headers={"Proxy-Authorization": authorization} if authorization else None)
+            else:
+                conn = http.client.HTTPConnection(proxy_host, proxy_port, timeout=timeout)
+        elif scheme == "https":
+            conn = http.client.HTTPSConnection(host, port, timeout=timeout, context=self._get_ssl_context())
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def _trim_locked(self, key):
+        """淘汰逾時或超出數量上限的閒置連線（呼叫者需持有鎖）"""
+        idle = self._idle.get(key)
+        if not idle:
+            return
+        now = time.monotonic()
+        alive = []
+        for conn, last_used in idle:
+            if now - last_used < self.idle_timeout:
+                alive.append((conn, last_used))
+            else:
+                conn.close()
+        while len(alive) > self.max_per_host:
+            conn, _ = alive.pop(0)
+            conn.close()
+        self._idle[key] = alive
+
+    def _acquire(self, key, timeout):
+        with self._lock:
+            self._trim_locked(key)
+            idle = self._idle.get(key)
+            if idle:
+                conn, _ = idle.pop()
+                self.reused += 1
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+        return self._new_connection(key, timeout), False
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) >= self.max_per_host:
+                conn.close()
+                return
+            idle.append((conn, time.monotonic()))
+
+    @staticmethod
+    def _abort_connection(conn):
+        """從其他執行緒中斷連線，讓阻塞中的讀取立即返回"""
+        sock = conn.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def urlopen(self, url, data=None, headers=None, method=None, timeout=30, cancel_token=None):
+        """
+        發送 HTTP 請求並回傳 PooledResponse
+
+        錯誤處理與 urllib.request.urlopen 一致：HTTP 狀態碼 >= 400 時拋出
+        urllib.error.HTTPError，連線層錯誤拋出 urllib.error.URLError。
+        傳入 cancel_token 時，取消請求會中斷該連線。
+        """
+        if method is None:
+            method = "POST" if data is not None else "GET"
+        headers = dict(headers or {})
+        for _ in range(MAX_REDIRECTS + 1):
+            pooled = self._open(url, data, headers, method, timeout, cancel_token)
+            location = pooled.headers.get("Location")
+            if pooled.status not in REDIRECT_CODES or not location:
+                break
+            # 讀完並歸還這條連線，再依 urllib 的規則跟隨重新導向：307/308 保留方法與內容，其餘改為 GET
+            try:
+                pooled.read()
+            finally:
+                pooled.close()
+            url = urllib.parse.urljoin(url, location)
+            if pooled.status not in (307, 308) and method != "HEAD":
+                method, data = "GET", None
+                headers = {name: value for name, value in headers.items()
+                           if name.lower() not in ("content-type", "content-length")}
+        else:
+            raise urllib.error.HTTPError(url, pooled.status, "重新導向次數過多", pooled.headers, io.BytesIO(b""))
+
+        if pooled.status >= 400:
+            try:
+                body = pooled.read()
+            finally:
+                pooled.close()
+            raise urllib.error.HTTPError(url, pooled.status, pooled.reason, pooled.headers, io.BytesIO(body))
+        return pooled
+
+    def _open(self, url, data, headers, method, timeout, cancel_token):
+        """送出單一請求（不跟隨重新導向），回傳 PooledResponse"""
+        parsed = urllib.parse.urlsplit(url)
+        scheme = parsed.scheme.lower()
+        port = parsed.port or (443 if scheme == "https" else 80)
+        proxy = self._proxy_for(scheme, parsed.hostname)
+        key = (scheme, parsed.hostname, port, proxy)
+        if proxy is not None and scheme != "https":
+            # 經過 HTTP 代理伺服器時送出完整網址
+            path = urllib.parse.urlunsplit((scheme, parsed.netloc, parsed.path or "/", parsed.query, ""))
+            if proxy[2]:
+                headers = dict(headers, **{"Proxy-Authorization": proxy[2]})
+        else:
+            path = parsed.path or "/"
+            if parsed.query:
+                path += "?" + parsed.query
+
+        while True:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            conn, reused = self._acquire(key, timeout)
+            abort = None
+            if cancel_token is not None:
+                abort = lambda conn=conn: self._abort_connection(conn)
+                cancel_token.add_callback(abort)
+            try:
+                connect_started = time.perf_counter()
+                if conn.sock is None:
+                    # 明確建立連線，以便分開計算連線與等待回應的時間
+                    conn.connect()
+                request_started = time.perf_counter()
+                conn.request(method, path, body=data, headers=headers)
+                response = conn.getresponse()
+                timings = {
+                    "connect": request_started - connect_started,
+                    "first_byte": time.perf_counter() - request_started
+                }
+                break
+            except self.STALE_CONNECTION_ERRORS as e:
+                conn.close()
+                if cancel_token is not None:
+                    cancel_token.remove_callback(abort)
+                if reused:
+                    # 閒置連線已失效，改用新連線重試
+                    continue
+                raise urllib.error.URLError(e)
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                if cancel_token is not None:
+                    cancel_token.remove_callback(abort)
+                raise urllib.error.URLError(e)
+
+        pooled = PooledResponse(self, key, conn, response, url, cancel_token, abort)
+        pooled.timings = timings
+        return pooled
+
+    def stats(self):
+        """回傳連線池統計資訊"""
+        with self._lock:
+            return {
+                "created": self.created,
+                "reused": self.reused,
+                "idle": sum(len(idle) for idle in self._idle.values()),
+                "max_per_host": self.max_per_host,
+            }
+
+    def close(self):
+        """關閉所有閒置連線"""
+        with self._lock:
+            for idle in self._idle.values():
+                for conn, _ in idle:
+                    conn.close()
+            self._idle.clear()
+
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def get_http_pool():
+    """取得行程內共用的連線池"""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = HTTPConnectionPool()
+        return _shared_pool
@@ -0,0 +1,254 @@
+import math
+import threading
+
+from model_limits import output_token_limit
+
+
+# 模型回應長度與要求長度的關係以冪次模型近似：
+#   achieved / current = (requested / current) ** k
+# k < 1 表示模型調整不足（要求縮減一半卻只縮減三成），k > 1 表示調整過度。
+DEFAULT_RESPONSE_EXPONENT = 1.0
+MIN_RESPONSE_EXPONENT = 0.25
+MAX_RESPONSE_EXPONENT = 2.0
+# k 以通過原點的加權最小平方法估計：x = log(requested / current)、y = log(achieved / current)，
+# k = (PRIOR_WEIGHT * k0 + Σxy) / (PRIOR_WEIGHT + Σx²)。要求變化越大的觀察權重越高，
+# 先驗 k0 相當於一筆 |x| 約 0.22（要求變化約 25%）的觀察。
+PRIOR_WEIGHT = 0.05
+# 每次新的長度調整結束後，舊觀察的權重衰減比例，讓模型行為改變時能跟上
+HISTORY_DECAY = 0.8
+# 單一回合內要求的長度比例上下限，避免極端的修正
+MIN_REQUEST_RATIO = 0.1
+MAX_REQUEST_RATIO = 10.0
+# 輸出上限相對於容許範圍上限的餘裕，避免回應在句子中途被截斷
+MAX_TOKENS_HEADROOM = 1.25
+# 平行候選之間要求長度的間距（對數尺度，約 ±15%），讓候選結果涵蓋目標範圍兩側
+CANDIDATE_SPREAD = 0.15
+
+
+class LengthResponseModel:
+    """
+    記錄各提供商與模型對長度要求的反應程度 (k)
+
+    每次長度調整的觀察結果都會更新對應模型的 k，下一次請求從學到的值開始，
+    第一回合就能送出經過修正的目標長度。
+    """
+
+    def __init__(self, default_exponent=DEFAULT_RESPONSE_EXPONENT):
+        self.default_exponent = default_exponent
+        self._statistics = {}
+        self._lock = threading.Lock()
+
+    def exponent(self, provider, model):
+        with self._lock:
+            sum_xy, sum_xx = self._statistics.get((provider, model), (0.0, 0.0))
+        return estimate_exponent(self.default_exponent, sum_xy, sum_xx)
+
+    def update(self, provider, model, observations):
+        """
+        加入一次長度調整的觀察結果
+
+        Args:
+            observations: (current, requested, achieved) 的列表
+        """
+        sum_xy, sum_xx = observation_statistics(observations)
+        if not sum_xx:
+            return
+        with self._lock:
+            previous_xy, previous_xx = self._statistics.get((provider, model), (0.0, 0.0))
+            self._statistics[(provider, model)] = (
+                previous_xy * HISTORY_DECAY + sum_xy,
+                previous_xx * HISTORY_DECAY + sum_xx
+            )
+
+
+def observation_statistics(observations):
+    """
+    由 (current, requested, achieved) 觀察計算最小平方法所需的 Σxy 與 Σx²
+
+    數值無效的觀察會被略過。
+    """
+    sum_xy = sum_xx = 0.0
+    for current, requested, achieved in observations:
+        if not current or not requested or not achieved or current <= 0 or requested <= 0 or achieved <= 0:
+            continue
+        x = math.log(requested / current)
+        y = math.log(achieved / current)
+        sum_xy += x * y
+        sum_xx += x * x
+    return sum_xy, sum_xx
+
+
+def estimate_exponent(prior, sum_xy, sum_xx):
+    """結合先驗與觀察統計量估計 k，並限制在合理範圍內"""
+    exponent = (PRIOR_WEIGHT * prior + sum_xy) / (PRIOR_WEIGHT + sum_xx)
+    return min(MAX_RESPONSE_EXPONENT, max(MIN_RESPONSE_EXPONENT, exponent))
+
+
+class LengthRequest:
+    """單一回合的長度要求：提示詞中的目標 token 數與提供商的輸出上限"""
+
+    def __init__(self, round_number, current_tokens, requested_tokens, max_tokens):
+        self.round_number = round_number
+        self.current_tokens = current_tokens
+        self.requested_tokens = requested_tokens
+        self.max_tokens = max_tokens
+
+    def __repr__(self):
+        return (f"LengthRequest(round={self.round_number}, current={self.current_tokens}, "
+                f"requested={self.requested_tokens}, max_tokens={self.max_tokens})")
+
+
+class LengthController:
+    """
+    閉迴路長度控制器
+
+    每回合依目前已知的 k 計算要向模型要求的長度（預先補償模型的偏差），
+    收到回應後以實際長度修正 k，再決定下一回合的要求。回應落在目標的
+    ±tolerance 範圍內或回合數用盡時停止，並保留最接近目標的回應。
+
+    用法:
+        controller = LengthController(target, current, max_rounds=3, exponent=k)
+        while True:
+            request = controller.next_request()
+            if request is None:
+                break
+            text = ...  # 以 request.requested_tokens 與 request.max_tokens 發送請求
+            controller.observe(text, token_count)
+        best_text, best_tokens = controller.best
+    """
+
+    def __init__(self, target_tokens, current_tokens, max_rounds=3, tolerance=0.1,
+                 exponent=DEFAULT_RESPONSE_EXPONENT, output_limit=None, model=None):
+        self.target_tokens = target_tokens
+        # 提供商輸出上限的上限（.env 的 MAX_TOKENS），指定 model 時也不超過該模型的單次輸出上限；None 表示不限制
+        if model is not None:
+            output_limit = min(output_limit or output_token_limit(model), output_token_limit(model))
+        self.output_limit = output_limit
+        self.current_tokens = current_tokens
+        self.max_rounds = max_rounds
+        self.tolerance = tolerance
+        self.prior_exponent = exponent
+        self.exponent = exponent
+        self.rounds = 0
+        self.observations = []
+        self.best = (None, None)
+        # best 是否為被截斷的回應
+        self.best_truncated = False
+        self._pending = None
+
+    @property
+    def lower_bound(self):
+        return int(self.target_tokens * (1 - self.tolerance))
+
+    @property
+    def upper_bound(self):
+        return int(self.target_tokens * (1 + self.tolerance))
+
+    def in_band(self, token_count):
+        return token_count is not None and self.lower_bound <= token_count <= self.upper_bound
+
+    @property
+    def converged(self):
+        return not self.best_truncated and self.in_band(self.best[1])
+
+    def requested_tokens(self, current_tokens):
+        """依目前的 k 計算要求長度，使預期的實際長度落在目標上"""
+        if not current_tokens or current_tokens <= 0:
+            return self.target_tokens
+        ratio = (self.target_tokens / current_tokens) ** (1 / self.exponent)
+        ratio = min(MAX_REQUEST_RATIO, max(MIN_REQUEST_RATIO, ratio))
+        return max(1, int(current_tokens * ratio + 0.5))
+
+    def max_output_tokens(self, requested_tokens):
+        """提供商的輸出上限：涵蓋容許範圍上限與要求長度，並保留截斷餘裕，但不超過 output_limit"""
+        ceiling = max(self.upper_bound, requested_tokens)
+        max_tokens = int(ceiling * MAX_TOKENS_HEADROOM) + 16
+        if self.output_limit:
+            max_tokens = min(max_tokens, self.output_limit)
+        return max_tokens
+
+    def next_request(self):
+        """
+        下一回合的要求；已收斂或回合數用盡時回傳 None
+
+        第一回合以原文長度為基準，之後以目前最接近目標的回應為基準。
+        """
+        requests = self.next_requests(1)
+        if not requests:
+            return None
+        self._pending = requests[0]
+        return self._pending
+
+    def next_requests(self, count, spread=CANDIDATE_SPREAD):
+        """
+        下一回合的 count 個平行候選要求；已收斂或回合數用盡時回傳空列表
+
+        候選的要求長度以控制器的估計值為中心，在對數尺度上以 spread 為間距向兩側展開，
+        即使 k 的估計有誤差，也有較高機率至少一個候選落在容許範圍內。
+        """
+        if self.converged or self.rounds >= self.max_rounds:
+            return []
+        current = self.best[1] if self.best[1] is not None else self.current_tokens
+        center = self.requested_tokens(current)
+        requests = []
+        for index in range(count):
+            offset = (index - (count - 1) / 2) * spread
+            requested = max(1, int(center * math.exp(offset) + 0.5))
+            requests.append(LengthRequest(self.rounds + 1, current, requested, self.max_output_tokens(requested)))
+        # 先送出最接近估計值的候選
+        requests.sort(key=lambda request: abs(request.requested_tokens - center))
+        return requests
+
+    def observe(self, text, token_count, request=None, truncated=None):
+        """
+        記錄一個回應與其 token 數，並修正 k
+
+        Args:
+            request: 回應所對應的 LengthRequest；未指定時使用 next_request 回傳的要求。
+                同一回合的多個平行候選只計為一回合。
+            truncated: 回應是否因達到輸出上限而被截斷（提供商回傳的結束原因）；
+                None 表示未知，以 token 數達到 request.max_tokens 的 98% 判斷
+
+        Returns:
+            bool: 此回應是否成為目前最接近目標的結果
+        """
+        if request is None:
+            request = self._pending
+            self._pending = None
+        if request is not None:
+            self.rounds = max(self.rounds, request.round_number)
+        else:
+            self.rounds += 1
+        if truncated is None:
+            truncated = request is not None and token_count is not None and token_count >= request.max_tokens * 0.98
+        # 被截斷的回應實際長度未知，不用來修正 k
+        if request is not None and not truncated:
+            self.observations.append((request.current_tokens, request.requested_tokens, token_count))
+            self.exponent = estimate_exponent(self.prior_exponent, *observation_statistics(self.observations))
+
+        if token_count is None:
+            return False
+        # 被截斷的回應停在句子中途，只有在沒有完整的回應時才保留
+        if truncated and self.best[1] is not None and not self.best_truncated:
+            return False
+        best_tokens = self.best[1]
+        if (best_tokens is None or (self.best_truncated and not truncated)
+                or abs(token_count - self.target_tokens) < abs(best_tokens - self.target_tokens)):
+            self.best = (text, token_count)
+            self.best_truncated = truncated
+            return True
+        return False
+
+
+
+_shared_model = None
+_shared_model_lock = threading.Lock()
+
+
+def get_length_response_model():
+    """取得行程內共用的長度反應模型"""
+    global _shared_model
+    with _shared_model_lock:
+        if _shared_model is None:
+            _shared_model = LengthResponseModel()
+        return _shared_model
@@ -0,0 +1,174 @@
+import atexit
+import glob
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+
+LOG_FILE_NAME = "ai_query.log"
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(threadName)s - %(message)s"
+DEFAULT_LEVEL = "INFO"
+# 單一日誌檔上限與保留的舊檔數量：最多佔用約 MAX_BYTES * (BACKUP_COUNT + 1)
+MAX_BYTES = 2 * 1024 * 1024
+BACKUP_COUNT = 5
+# 日誌檔寫入超過這段時間後換新檔；舊版依日期命名的日誌檔超過保留天數時刪除
+MAX_AGE = 24 * 3600
+RETENTION_DAYS = 14
+# 佇列長度上限；寫入跟不上時丟棄新的紀錄，而不是讓請求執行緒等待磁碟
+QUEUE_SIZE = 10000
+
+
+def default_log_dir():
+    return os.path.join(os.path.expanduser("~"), ".libreoffice", "logs")
+
+
+class SizeAndAgeRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """檔案超過 max_bytes 或開始寫入超過 max_age 秒時換新檔，保留 backup_count 個舊檔"""
+
+    def __init__(self, filename, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT, max_age=MAX_AGE):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.max_age = max_age
+        try:
+            started = os.stat(filename).st_mtime
+        except OSError:
+            started = time.time()
+        self._rollover_at = started + max_age
+
+    def shouldRollover(self, record):
+        if self.max_age and time.time() >= self._rollover_at and os.path.exists(self.baseFilename):
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self._rollover_at = time.time() + self.max_age
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    將紀錄放入佇列，由背景執行緒格式化與寫入
+
+    呼叫端只合併 % 參數（參數之後可能被修改），時間戳記與完整格式化在寫入執行緒進行；
+    佇列已滿時丟棄紀錄並計數，請求執行緒不會因磁碟寫入而阻塞。
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BlockingSentinelListener(logging.handlers.QueueListener):
+    """停止時以阻塞方式放入結束標記，佇列已滿時等待背景執行緒寫出剩餘紀錄"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+_listener = None
+_handler = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(level=DEFAULT_LEVEL, log_dir=None):
+    """
+    設定行程內共用的非同步日誌管線（只在第一次呼叫時建立），並套用日誌等級
+
+    Returns:
+        logging.Logger: ai_query 根記錄器
+    """
+    global _listener, _handler
+    root = logging.getLogger("ai_query")
+    with _setup_lock:
+        if _listener is None:
+            log_dir = log_dir or default_log_dir()
+            try:
+                os.makedirs(log_dir, exist_ok=True)
+                file_handler = SizeAndAgeRotatingFileHandler(os.path.join(log_dir, LOG_FILE_NAME))
+                file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+                _purge_legacy_logs(log_dir)
+            except OSError as e:
+                print(f"無法設置日誌系統: {str(e)}")
+                file_handler = logging.NullHandler()
+
+            log_queue = queue.Queue(QUEUE_SIZE)
+            _handler = DeferredQueueHandler(log_queue)
+            _listener = BlockingSentinelListener(log_queue, file_handler, respect_handler_level=False)
+            _listener.start()
+            atexit.register(shutdown_logging)
+
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+            root.addHandler(_handler)
+            root.propagate = False
+            root.info("====== AI 服務日誌系統已初始化 ======")
+        set_level(level)
+    return root
+
+
+def set_level(level):
+    """調整日誌等級，例如 "DEBUG"、"INFO"、"WARNING"；無法辨識時使用 INFO"""
+    if isinstance(level, str):
+        level = logging.getLevelName(level.strip().upper())
+    if not isinstance(level, int):
+        level = logging.INFO
+    logging.getLogger("ai_query").setLevel(level)
+
+
+def get_logger(name):
+    """取得 ai_query 之下的子記錄器，例如 get_logger("ai_service")"""
+    return logging.getLogger(f"ai_query.{name}")
+
+
+def dropped_records():
+    return _handler.dropped if _handler is not None else 0
+
+
+def shutdown_logging():
+    """停止背景寫入執行緒並寫出佇列中剩餘的紀錄"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def _purge_legacy_logs(log_dir):
+    """刪除舊版依日期命名（ai_query_YYYY-MM-DD.log）且超過保留天數的日誌檔"""
+    cutoff = time.time() - RETENTION_DAYS * 24 * 3600
+    for path in glob.glob(os.path.join(log_dir, "ai_query_????-??-??.log")):
+        try:
+            if os.stat(path).st_mtime < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+class Truncated:
+    """延遲截斷的長文本：只有在紀錄真的被輸出時才會產生截斷後的字串"""
+
+    __slots__ = ("text", "limit")
+
+    def __init__(self, text, limit=200):
+        self.text = text
+        self.limit = limit
+
+    def __str__(self):
+        text = self.text or ""
+        return text[:self.limit] + "..." if len(text) > self.limit else text
@@ -1,10 +1,9 @@
 import uno
 import unohelper
-import urllib.request
-import json
 import officehelper
 import sys
 import os
+import time
 from com.sun.star.task import XJobExecutor
 from com.sun.star.awt import XActionListener
 from com.sun.star.awt.MessageBoxType import MESSAGEBOX, INFOBOX
@@ -40,71 +39,91 @@ class AIQueryJob(unohelper.Base, XJobExecutor):
             
     def main(self, *args):
         try:
-            # 導入模組
-            from config_manager import ConfigManager
-            from ai_service import AIService
-            from utils import Utils
-            from dialog_builder import DialogBuilder
-            from event_handlers import EventHandlers
+            started = time.perf_counter()
 
-            # 初始化各個服務
-            utils = Utils(self.ctx)
-            config_manager = ConfigManager(self.ctx)
-            ai_service = AIService(self.ctx)
-            dialog_builder = DialogBuilder(self.ctx)
+            # 服務物件在整個 office 行程內共用，只有第一次點擊時匯入模組並建立
+            from services import get_services
+            services = get_services(self.ctx)
+
+            self.run_dialog(services, started)
             
-            # 確保配置已加載
-            config = config_manager.load_config()
+        except Exception as e:
+            from utils import Utils
+            utils = Utils(self.ctx)
+            utils.show_message(f"Error: {str(e)}", "Error", MESSAGEBOX)
 
-            # 在創建對話框前先獲取選取的文字
-            selected_text = utils.get_selected_text()
+    def open_dialog(self, services):
+        """
+        建立主對話框並綁定事件（尚未顯示）
 
-            # Create dialog
-            dialog = dialog_builder.create_simple_dialog(config)
-            text_field = dialog.getControl("TextField1")
-            response_field = dialog.getControl("ResponseField")
-            prompts_field = dialog.getControl("PromptsField")
+        Returns:
+            tuple: (對話框, EventHandlers)
+        """
+        from event_handlers import EventHandlers
 
-            current_response = [""]
+        utils = services.utils
+        config_manager = services.config_manager
+        ai_service = services.ai_service
+        ai_service.reset_session()
 
-            # 如果有選取的文字，設置到輸入框
-            if selected_text:
-                # 使用 Model 來設置文字
-                text_field.getModel().Text = selected_text
+        # 配置檔未變更時直接使用記憶體中的配置
+        config = config_manager.load_config()
 
-                # 將游標移到文字末尾
-                text_field.setSelection(uno.createUnoStruct("com.sun.star.awt.Selection", len(selected_text), len(selected_text)))
+        # 在創建對話框前先獲取選取的文字
+        selected_text = utils.get_selected_text()
 
-            # 創建事件處理器
-            event_handler = EventHandlers(self.ctx, ai_service, config_manager, utils)
-            event_handler.reload_requested = False
-            
-            # 獲取所有對話框監聽器
-            listeners = event_handler.get_dialog_listeners(dialog, current_response)
-            
-            # 綁定按鈕事件
-            dialog.getControl("AskButton").addActionListener(listeners["AskButtonListener"])
-            dialog.getControl("InsertButton").addActionListener(listeners["InsertButtonListener"])
-            dialog.getControl("ClearButton").addActionListener(listeners["ClearButtonListener"])
-            dialog.getControl("CloseButton").addActionListener(listeners["CloseButtonListener"])
-            dialog.getControl("ReloadConfigButton").addActionListener(listeners["ReloadConfigButtonListener"])
-            dialog.getControl("ResetDropdownsButton").addActionListener(listeners["ResetDropdownsButtonListener"])
-            dialog.getControl("PreviewPromptsButton").addActionListener(listeners["PreviewPromptsButtonListener"])
-            dialog.getControl("AdjustResponseButton").addActionListener(listeners["AdjustResponseButtonListener"])
-            dialog.getControl("SettingsButton").addActionListener(listeners["SettingsButtonListener"])
-            
+        # Create dialog
+        dialog = services.dialog_builder.create_simple_dialog(config)
+        text_field = dialog.getControl("TextField1")
+
+        current_response = [""]
+
+        # 如果有選取的文字，設置到輸入框
+        if selected_text:
+            # 使用 Model 來設置文字
+            text_field.getModel().Text = selected_text
+
+            # 將游標移到文字末尾
+            text_field.setSelection(uno.createUnoStruct("com.sun.star.awt.Selection", len(selected_text), len(selected_text)))
+
+        # 創建事件處理器
+        event_handler = EventHandlers(self.ctx, ai_service, config_manager, utils)
+        event_handler.start_conversation(selected_text)
+        
+        # 獲取所有對話框監聽器
+        listeners = event_handler.get_dialog_listeners(dialog, current_response)
+        
+        # 綁定按鈕事件
+        for control_name in ("AskButton", "InsertButton", "ClearButton", "CloseButton", "ReloadConfigButton",
+                             "ResetDropdownsButton", "PreviewPromptsButton", "AdjustResponseButton",
+                             "BatchButton", "SettingsButton", "CancelRequestButton", "DiagnosticsButton",
+                             "HistoryButton"):
+            dialog.getControl(control_name).addActionListener(listeners[f"{control_name}Listener"])
+
+        # 配置檔變更時直接更新下拉選單，不需要關閉對話框
+        event_handler.watch_config(dialog, services.dialog_builder)
+        return dialog, event_handler
+
+    def run_dialog(self, services, started=None):
+        """
+        顯示主對話框直到關閉
+
+        Args:
+            started: 點擊工具列的時間 (time.perf_counter)，用於記錄開啟對話框的耗時
+        """
+        from log_setup import get_logger
+
+        if started is None:
+            started = time.perf_counter()
+        dialog, event_handler = self.open_dialog(services)
+        get_logger("startup").info("對話框開啟耗時 %.1f ms", (time.perf_counter() - started) * 1000)
+        try:
             # Execute dialog
             dialog.execute()
-            
-            # 檢查是否需要重新載入
-            if hasattr(event_handler, 'reload_requested') and event_handler.reload_requested:
-                # 重新執行主函數來重新創建對話框
-                self.main()
-            
-        except Exception as e:
-            from utils import Utils
-            utils = Utils(self.ctx)
-            utils.show_message(f"Error: {str(e)}", "Error", MESSAGEBOX)
+        finally:
+            # 對話框關閉後，取消仍在背景執行的請求並釋放工作執行緒
+            event_handler.dispose()
+            dialog.dispose()
 
 # Starting from Python IDE
 def main():
@@ -0,0 +1,234 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from log_setup import get_logger
+
+
+logger = get_logger("metrics")
+
+# 每個 (提供商, 模型) 的每項指標保留最近的樣本數
+HISTOGRAM_WINDOW = 500
+# 統計檔案的寫入間隔（秒）
+FLUSH_INTERVAL = 60.0
+STATS_FILE_NAME = "ai_query_stats.json"
+
+# 顯示與寫入檔案時的指標順序與單位
+METRIC_UNITS = (
+    ("settings", "ms"), ("queue", "ms"), ("connect", "ms"), ("first_byte", "ms"), ("first_token", "ms"),
+    ("body", "ms"), ("decode", "ms"), ("total", "ms"),
+    ("prompt_tokens", "tok"), ("cached_tokens", "tok"), ("completion_tokens", "tok"), ("tokens_per_sec", "tok/s")
+)
+
+
+def default_stats_path():
+    return os.path.join(os.path.expanduser("~"), ".libreoffice", "logs", STATS_FILE_NAME)
+
+
+class RequestTimer:
+    """
+    單次 API 請求的分段計時
+
+    lap(phase) 記錄從上一個時間點到現在的時間；同一階段多次記錄（例如重試）時累加。
+    """
+
+    def __init__(self, provider, model, stream=False, started=None):
+        self.provider = provider
+        self.model = model
+        self.stream = stream
+        self.started = started if started is not None else time.perf_counter()
+        self.phases = {}
+        self._last = self.started
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.add(phase, now - self._last)
+        self._last = now
+
+    def add_response(self, timings):
+        """加入連線池回報的排隊、連線與等待回應標頭時間，並從現在開始計算讀取時間"""
+        for phase in ("queue", "connect", "first_byte"):
+            if phase in timings:
+                self.add(phase, timings[phase])
+        self._last = time.perf_counter()
+
+    def first_token(self):
+        """串流收到第一段文字時呼叫，記錄從請求開始到第一段文字的時間"""
+        if "first_token" not in self.phases:
+            self.phases["first_token"] = time.perf_counter() - self.started
+
+    def finish(self):
+        self.phases["total"] = time.perf_counter() - self.started
+        return self.phases
+
+
+class RollingHistogram:
+    """保留最近 window 個樣本，依需求計算百分位數"""
+
+    def __init__(self, window=HISTOGRAM_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+
+    def summary(self):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        last = len(ordered) - 1
+
+        def percentile(fraction):
+            return ordered[min(last, int(fraction * len(ordered)))]
+
+        return {
+            "n": len(ordered),
+            "mean": sum(ordered) / len(ordered),
+            "p50": percentile(0.50),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99)
+        }
+
+
+class MetricsRegistry:
+    """
+    以 (提供商, 模型) 分組的請求計時與吞吐量統計
+
+    每次完成的請求都會記錄各階段時間、token 數與每秒 token 數；統計保存在記憶體中，
+    並每 FLUSH_INTERVAL 秒寫入一次 ~/.libreoffice/logs 下的統計檔案。
+    """
+
+    def __init__(self, path=None, window=HISTOGRAM_WINDOW, flush_interval=FLUSH_INTERVAL):
+        self.path = path or default_stats_path()
+        self.window = window
+        self.flush_interval = flush_interval
+        self._groups = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._dirty = False
+
+    def _histogram(self, key, metric):
+        group = self._groups.setdefault(key, {})
+        histogram = group.get(metric)
+        if histogram is None:
+            histogram = group[metric] = RollingHistogram(self.window)
+        return histogram
+
+    def _count(self, key, name):
+        counters = self._counters.setdefault(key, {"requests": 0, "errors": 0, "streamed": 0})
+        counters[name] += 1
+
+    def record(self, timer, token_info=None):
+        """記錄一次成功的請求"""
+        phases = timer.finish()
+        key = (timer.provider, timer.model)
+        with self._lock:
+            self._count(key, "requests")
+            if timer.stream:
+                self._count(key, "streamed")
+            for phase, seconds in phases.items():
+                self._histogram(key, phase).add(seconds * 1000)
+            if token_info:
+                prompt_tokens = token_info.get("prompt_tokens") or 0
+                completion_tokens = token_info.get("completion_tokens") or 0
+                self._histogram(key, "prompt_tokens").add(prompt_tokens)
+                self._histogram(key, "completion_tokens").add(completion_tokens)
+                if "cached_tokens" in token_info:
+                    # 由提供商提示詞快取讀取的輸入 token 數（已包含在 prompt_tokens 中）
+                    self._histogram(key, "cached_tokens").add(token_info["cached_tokens"] or 0)
+                # 生成速度以開始收到回應後的時間計算，不包含排隊與等待第一個位元組
+                generation = phases.get("body", 0.0) + phases.get("decode", 0.0)
+                if not timer.stream:
+                    generation += phases.get("first_byte", 0.0)
+                if completion_tokens and generation > 0:
+                    self._histogram(key, "tokens_per_sec").add(completion_tokens / generation)
+            self._dirty = True
+        self.maybe_flush()
+
+    def record_failure(self, timer):
+        with self._lock:
+            self._count((timer.provider, timer.model), "errors")
+            self._dirty = True
+        self.maybe_flush()
+
+    def summary(self):
+        """
+        Returns:
+            dict: {"provider/model": {"requests": n, "errors": n, "streamed": n,
+                   "metrics": {metric: {"n", "mean", "p50", "p95", "p99"}}}}
+        """
+        with self._lock:
+            result = {}
+            for key in set(self._groups) | set(self._counters):
+                entry = dict(self._counters.get(key, {}))
+                metrics = {}
+                for metric, histogram in self._groups.get(key, {}).items():
+                    values = histogram.summary()
+                    if values:
+                        metrics[metric] = {name: round(value, 1) for name, value in values.items()}
+                entry["metrics"] = metrics
+                result[f"{key[0]}/{key[1]}"] = entry
+            return result
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """將統計摘要寫入檔案（先寫暫存檔再取代，避免留下不完整的內容）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            self._last_flush = time.monotonic()
+        data = {
+            "updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "providers": self.summary()
+        }
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.warning("無法寫入統計檔案: %s", e)
+
+    def format_report(self):
+        """產生診斷面板顯示的文字報表"""
+        summary = self.summary()
+        if not summary:
+            return "尚無請求紀錄"
+        lines = []
+        for name in sorted(summary):
+            entry = summary[name]
+            lines.append(f"■ {name}  請求 {entry.get('requests', 0)}  "
+                         f"串流 {entry.get('streamed', 0)}  錯誤 {entry.get('errors', 0)}")
+            for metric, unit in METRIC_UNITS:
+                values = entry["metrics"].get(metric)
+                if not values:
+                    continue
+                lines.append(f"  {metric:<18} p50 {values['p50']:>9.1f}  p95 {values['p95']:>9.1f}  "
+                             f"p99 {values['p99']:>9.1f} {unit}  (n={values['n']})")
+            lines.append("")
+        return "\n".join(lines)
+
+
+_shared_registry = None
+_shared_registry_lock = threading.Lock()
+
+
+def get_metrics():
+    """取得行程內共用的請求統計"""
+    global _shared_registry
+    with _shared_registry_lock:
+        if _shared_registry is None:
+            _shared_registry = MetricsRegistry()
+        return _shared_registry
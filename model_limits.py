@@ -0,0 +1,71 @@
+# 各模型的上下文視窗（輸入 + 輸出 token 數），以模型名稱前綴比對，越長的前綴越優先
+CONTEXT_WINDOWS = {
+    "gemini-1.5": 1000000,
+    "gemini-2": 1000000,
+    "gemini": 32768,
+    "gpt-4o": 128000,
+    "gpt-4.1": 1000000,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "o1": 128000,
+    "o3": 200000,
+    "o4": 200000,
+    "claude": 200000,
+    "mistral-large": 128000,
+    "mistral": 32000
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+# 各模型單次回應的輸出 token 上限，比對方式與 CONTEXT_WINDOWS 相同
+OUTPUT_TOKEN_LIMITS = {
+    "gemini-2.5": 65536,
+    "gemini-1.5": 8192,
+    "gemini-2": 8192,
+    "gemini": 2048,
+    "gpt-4o": 16384,
+    "gpt-4.1": 32768,
+    "gpt-4-turbo": 4096,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 4096,
+    "o1": 32768,
+    "o3": 100000,
+    "o4": 100000,
+    "claude-sonnet-4": 64000,
+    "claude-opus-4": 32000,
+    "claude-3-7": 64000,
+    "claude-3-5": 8192,
+    "claude": 4096,
+    "mistral": 8192
+}
+DEFAULT_OUTPUT_TOKEN_LIMIT = 4096
+# Gemini 建立 cachedContents 所需的最低輸入 token 數，低於此數的請求會被拒絕；比對方式與 CONTEXT_WINDOWS 相同
+GEMINI_MIN_CACHE_TOKENS = {
+    "gemini-2.5-flash": 1024,
+    "gemini-2.5-pro": 4096,
+    "gemini-2.0": 32768,
+    "gemini-1.5": 32768
+}
+DEFAULT_GEMINI_MIN_CACHE_TOKENS = 32768
+
+
+def _lookup_model(table, model, default):
+    model = (model or "").lower()
+    for prefix in sorted(table, key=len, reverse=True):
+        if model.startswith(prefix):
+            return table[prefix]
+    return default
+
+
+def context_window(model):
+    """依模型名稱取得上下文視窗大小"""
+    return _lookup_model(CONTEXT_WINDOWS, model, DEFAULT_CONTEXT_WINDOW)
+
+
+def output_token_limit(model):
+    """依模型名稱取得單次回應的輸出 token 上限"""
+    return _lookup_model(OUTPUT_TOKEN_LIMITS, model, DEFAULT_OUTPUT_TOKEN_LIMIT)
+
+
+def gemini_min_cache_tokens(model):
+    """依模型名稱取得 Gemini cachedContents 的最低 token 數"""
+    return _lookup_model(GEMINI_MIN_CACHE_TOKENS, model, DEFAULT_GEMINI_MIN_CACHE_TOKENS)
@@ -0,0 +1,202 @@
+from collections import namedtuple
+from types import MappingProxyType
+
+
+DEFAULT_HEADER = "請按照以下要求修改文本："
+DEFAULT_ORIGINAL_LABEL = "\n原始文本："
+DEFAULT_MODIFIED_LABEL = "\n修改後的文本："
+
+# 規則類型：由下拉選單配置中出現的欄位決定，不依賴下拉選單 id
+RULE_PERCENTAGE = "percentage"  # prompt_templates 的 decrease / increase，選項為 "-25%"、"+50%" 等
+RULE_TARGET = "target"          # 選擇 target_option 時套用 prompt_template
+RULE_VALUES = "values"          # prompt_template 搭配 prompt_values 中各選項的說明
+RULE_TEMPLATE = "template"      # 只以選項名稱套用 prompt_template
+RULE_NONE = "none"              # 沒有任何模板，不產生提示詞
+
+
+class DropdownRule(namedtuple("DropdownRule", [
+    "id", "display_name", "position", "options", "default_option", "rule"
+])):
+    """單一下拉選單編譯後的定義；default_option 為預設選項的文字"""
+    __slots__ = ()
+
+
+def rule_type(dropdown):
+    """依下拉選單配置的欄位判斷規則類型"""
+    if "prompt_templates" in dropdown:
+        return RULE_PERCENTAGE
+    if "target_option" in dropdown:
+        return RULE_TARGET
+    if "prompt_values" in dropdown:
+        return RULE_VALUES
+    if "prompt_template" in dropdown:
+        return RULE_TEMPLATE
+    return RULE_NONE
+
+
+def _render_template(template, **fields):
+    """套用模板；模板需要的欄位不存在時不產生提示詞"""
+    try:
+        return template.format(**fields)
+    except (KeyError, IndexError):
+        return None
+
+
+def _render_option(dropdown, rule, option):
+    """
+    產生選擇 option 時的提示詞片段；不需要提示詞時回傳 None
+
+    除了長度調整類以外，依序嘗試 target_option、prompt_values、prompt_template，
+    第一個符合的規則決定片段內容。
+    """
+    if rule == RULE_PERCENTAGE:
+        templates = dropdown["prompt_templates"]
+        if "-" in option:
+            return _render_template(templates["decrease"], percentage=option.replace("-", ""))
+        return _render_template(templates["increase"], percentage=option.replace("+", ""))
+    if "target_option" in dropdown and option == dropdown["target_option"]:
+        return _render_template(dropdown.get("prompt_template", "將文本轉換為{option}。"), option=option)
+    if "prompt_values" in dropdown and option in dropdown["prompt_values"]:
+        template = dropdown.get("prompt_template", "")
+        if not template:
+            return None
+        return _render_template(template, option=option, prompt_value=dropdown["prompt_values"][option])
+    if "prompt_template" in dropdown:
+        return _render_template(dropdown["prompt_template"], option=option)
+    return None
+
+
+class CompiledPromptConfig:
+    """
+    libreoffice_ai_config.json 編譯後的不可變規則表
+
+    每個 (下拉選單 id, 選項) 的提示詞片段在編譯時就套用好模板，產生提示詞時只需查表，
+    成本與下拉選單與選項的數量無關。
+    """
+
+    __slots__ = ("dropdowns", "header", "original_label", "modified_label", "_order", "_defaults",
+                 "_fragments", "_lookup", "_length_ids")
+
+    def __init__(self, dropdowns, header, original_label, modified_label, fragments):
+        # dropdowns 依 position 排序，供對話框排列；產生提示詞時依配置檔中的順序
+        self.dropdowns = tuple(sorted(dropdowns, key=lambda rule: rule.position))
+        self.header = header
+        self.original_label = original_label
+        self.modified_label = modified_label
+        self._order = tuple(rule.id for rule in dropdowns)
+        self._defaults = MappingProxyType({rule.id: rule.default_option for rule in dropdowns})
+        self._fragments = MappingProxyType(fragments)
+        # 直接使用底層 dict 的 get，省去 MappingProxyType 的轉呼叫
+        self._lookup = fragments.get
+        self._length_ids = tuple(rule.id for rule in dropdowns if rule.rule == RULE_PERCENTAGE)
+
+    @property
+    def dropdown_ids(self):
+        return self._order
+
+    def fragment(self, dropdown_id, option):
+        """回傳選擇 option 時的提示詞片段；預設選項或不需要提示詞時回傳 None"""
+        return self._fragments.get((dropdown_id, option))
+
+    def is_default(self, dropdown_id, option):
+        return self._defaults.get(dropdown_id) == option
+
+    def has_adjustment(self, selected_options):
+        """是否有任何下拉選單選擇了非預設選項"""
+        return any(option and not self.is_default(dropdown_id, option)
+                   for dropdown_id, option in selected_options.items() if dropdown_id in self._defaults)
+
+    def length_adjustment(self, selected_options):
+        """回傳長度調整類下拉選單選擇的非預設選項（例如 "+25%"），沒有時回傳 None"""
+        for dropdown_id in self._length_ids:
+            option = selected_options.get(dropdown_id)
+            if option and not self.is_default(dropdown_id, option):
+                return option
+        return None
+
+    def render(self, selected_options, text=""):
+        """依選擇的選項產生完整提示詞"""
+        lookup = self._lookup
+        get = selected_options.get
+        parts = [self.header]
+        parts.extend(filter(None, [lookup((dropdown_id, get(dropdown_id))) for dropdown_id in self._order]))
+        parts.append(self.original_label)
+        parts.append(text)
+        parts.append(self.modified_label)
+        return "\n".join(parts)
+
+
+def validate_prompt_config(config):
+    """
+    檢查配置的結構，格式錯誤時拋出 ValueError（訊息指出錯誤的下拉選單與欄位）
+
+    只檢查編譯與建立對話框需要的欄位；模板內容不需要的欄位在編譯時略過。
+    """
+    if not isinstance(config, dict):
+        raise ValueError("配置必須是 JSON 物件")
+    dropdowns = config.get("dropdowns")
+    if not isinstance(dropdowns, list):
+        raise ValueError("配置缺少 dropdowns 清單")
+    seen = set()
+    for index, dropdown in enumerate(dropdowns):
+        if not isinstance(dropdown, dict):
+            raise ValueError(f"第 {index + 1} 個下拉選單必須是 JSON 物件")
+        dropdown_id = dropdown.get("id")
+        if not isinstance(dropdown_id, str) or not dropdown_id:
+            raise ValueError(f"第 {index + 1} 個下拉選單缺少 id")
+        if dropdown_id in seen:
+            raise ValueError(f"下拉選單 id 重複: {dropdown_id}")
+        seen.add(dropdown_id)
+        options = dropdown.get("options")
+        if not isinstance(options, list) or not options or not all(isinstance(option, str) for option in options):
+            raise ValueError(f"下拉選單 {dropdown_id} 的 options 必須是非空的字串清單")
+        default_option = dropdown.get("default_option", 0)
+        if not isinstance(default_option, int) or not 0 <= default_option < len(options):
+            raise ValueError(f"下拉選單 {dropdown_id} 的 default_option 超出選項範圍")
+        if not isinstance(dropdown.get("position"), (int, float)):
+            raise ValueError(f"下拉選單 {dropdown_id} 缺少數字的 position")
+        templates = dropdown.get("prompt_templates")
+        if templates is not None and not (isinstance(templates, dict)
+                                          and "decrease" in templates and "increase" in templates):
+            raise ValueError(f"下拉選單 {dropdown_id} 的 prompt_templates 需要 decrease 與 increase")
+
+
+def compile_prompt_config(config):
+    """
+    將配置編譯為 CompiledPromptConfig
+
+    Args:
+        config: libreoffice_ai_config.json 的內容
+
+    Returns:
+        CompiledPromptConfig: 不可變的規則表
+    """
+    rules = []
+    fragments = {}
+    for index, dropdown in enumerate(config.get("dropdowns", ())):
+        options = tuple(dropdown.get("options", ()))
+        default_index = dropdown.get("default_option", 0)
+        default_option = options[default_index] if 0 <= default_index < len(options) else None
+        rule = DropdownRule(
+            id=dropdown["id"],
+            display_name=dropdown.get("display_name", dropdown["id"]),
+            position=dropdown.get("position", index + 1),
+            options=options,
+            default_option=default_option,
+            rule=rule_type(dropdown)
+        )
+        rules.append(rule)
+        for option in options:
+            if option == default_option:
+                continue
+            fragment = _render_option(dropdown, rule.rule, option)
+            if fragment:
+                fragments[(rule.id, option)] = fragment
+
+    return CompiledPromptConfig(
+        rules,
+        config.get("prompt_header", DEFAULT_HEADER),
+        config.get("original_text_label", DEFAULT_ORIGINAL_LABEL),
+        config.get("modified_text_label", DEFAULT_MODIFIED_LABEL),
+        fragments
+    )
@@ -0,0 +1,192 @@
+import threading
+import time
+
+from cancellation import CancelToken, RequestCancelled
+
+
+# 失敗的提供商在這段時間內排到候選清單最後，避免每次請求都先等它失敗
+FAILURE_COOLDOWN = 60.0
+# 競速模式同時送出請求的提供商數
+RACE_WIDTH = 2
+
+
+class ProviderRouter:
+    """
+    在多個提供商之間分派請求
+
+    failover 模式依 PROVIDER_ORDER 的順序嘗試，失敗（錯誤或逾時）時改用下一個提供商；
+    race 模式同時送給前兩個提供商，採用先成功者並取消另一個，兩者都失敗時再依序嘗試其餘提供商。
+    沒有設定 API 金鑰的提供商會被略過，最近失敗過的提供商排到最後。
+    """
+
+    def __init__(self, cooldown=FAILURE_COOLDOWN):
+        self.cooldown = cooldown
+        self._failed_at = {}
+        self._lock = threading.Lock()
+        self.failovers = 0
+        self.race_wins = {}
+
+    def candidates(self, settings):
+        """依設定的順序列出有 API 金鑰的提供商，冷卻中的提供商排在最後"""
+        names = []
+        for name in (settings.provider,) + tuple(settings.provider_order):
+            if name and name not in names and settings.api_keys.get(name):
+                names.append(name)
+        now = time.monotonic()
+        with self._lock:
+            cooling = {name for name, failed_at in self._failed_at.items() if now - failed_at < self.cooldown}
+        return [name for name in names if name not in cooling] + [name for name in names if name in cooling]
+
+    def mark_failed(self, name):
+        with self._lock:
+            self._failed_at[name] = time.monotonic()
+
+    def mark_succeeded(self, name):
+        with self._lock:
+            self._failed_at.pop(name, None)
+
+    def route(self, settings, call, cancel_token=None, logger=None, should_failover=None):
+        """
+        依 settings.routing_mode 呼叫 call(provider, cancel_token)
+
+        call 失敗時應拋出例外；所有提供商都失敗時拋出最後一個錯誤。
+        should_failover(error) 回傳 False 時不再嘗試其他提供商（例如串流已輸出部分內容）。
+        """
+        names = self.candidates(settings)
+        if not names:
+            return call(settings.provider, cancel_token)
+        if settings.routing_mode == "race" and len(names) > 1:
+            racers = names[:RACE_WIDTH]
+            try:
+                return self.race(racers, call, cancel_token, logger)
+            except RequestCancelled:
+                raise
+            except Exception as e:
+                if len(names) == len(racers) or (should_failover is not None and not should_failover(e)):
+                    raise
+                if logger:
+                    logger.warning("競速的提供商 %s 都失敗: %s，改用其餘提供商", ", ".join(racers), e)
+                names = names[len(racers):]
+        return self.failover(names, call, cancel_token, logger, should_failover)
+
+    def failover(self, names, call, cancel_token=None, logger=None, should_failover=None):
+        """依序嘗試各提供商，直到其中一個成功"""
+        error = None
+        for position, name in enumerate(names):
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            try:
+                result = call(name, cancel_token)
+            except RequestCancelled:
+                raise
+            except Exception as e:
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                self.mark_failed(name)
+                error = e
+                if should_failover is not None and not should_failover(e):
+                    raise
+                if position + 1 < len(names):
+                    with self._lock:
+                        self.failovers += 1
+                    if logger:
+                        logger.warning("提供商 %s 失敗: %s，改用 %s", name, e, names[position + 1])
+                continue
+            self.mark_succeeded(name)
+            return result
+        raise error
+
+    def race(self, names, call, cancel_token=None, logger=None):
+        """同時呼叫多個提供商，回傳第一個成功的結果並取消其餘請求"""
+        parent = cancel_token if cancel_token is not None else CancelToken()
+        condition = threading.Condition()
+        outcomes = []
+        tokens = {name: parent.child() for name in names}
+
+        def run(name):
+            try:
+                outcome = (name, True, call(name, tokens[name]))
+            except BaseException as e:
+                outcome = (name, False, e)
+            with condition:
+                outcomes.append(outcome)
+                condition.notify()
+
+        for name in names:
+            threading.Thread(target=run, args=(name,), name=f"ai-race-{name}", daemon=True).start()
+
+        try:
+            seen = 0
+            error = None
+            while seen < len(names):
+                with condition:
+                    while len(outcomes) <= seen:
+                        condition.wait(0.1)
+                        parent.raise_if_cancelled()
+                    name, ok, value = outcomes[seen]
+                seen += 1
+                if ok:
+                    self.mark_succeeded(name)
+                    with self._lock:
+                        self.race_wins[name] = self.race_wins.get(name, 0) + 1
+                    if logger:
+                        logger.info("競速模式: %s 先完成", name)
+                    return value
+                if not isinstance(value, RequestCancelled):
+                    self.mark_failed(name)
+                error = value
+            raise error
+        finally:
+            # 取消仍在進行的請求；勝出的請求已經結束，取消它的 token 沒有影響
+            for token in tokens.values():
+                token.cancel()
+                parent.release_child(token)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "failovers": self.failovers,
+                "race_wins": dict(self.race_wins),
+                "cooling_down": sorted(name for name, failed_at in self._failed_at.items()
+                                       if now - failed_at < self.cooldown)
+            }
+
+
+class StreamClaim:
+    """
+    競速串流時決定由哪個提供商輸出到對話框
+
+    第一個送出文字片段的提供商取得輸出權，其他提供商的片段被丟棄並取消其請求。
+    """
+
+    def __init__(self, on_chunk):
+        self.on_chunk = on_chunk
+        self.owner = None
+        self._lock = threading.Lock()
+
+    def writer(self, name, cancel_token):
+        def write(text):
+            with self._lock:
+                if self.owner is None:
+                    self.owner = name
+                owner = self.owner
+            if owner == name:
+                self.on_chunk(text)
+            else:
+                cancel_token.cancel()
+                cancel_token.raise_if_cancelled()
+        return write
+
+
+_shared_router = None
+_shared_router_lock = threading.Lock()
+
+
+def get_provider_router():
+    """取得行程內共用的提供商路由器"""
+    global _shared_router
+    with _shared_router_lock:
+        if _shared_router is None:
+            _shared_router = ProviderRouter()
+        return _shared_router
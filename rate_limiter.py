@@ -0,0 +1,371 @@
+import datetime
+import hashlib
+import re
+import threading
+import time
+
+
+# 收到 429 但沒有 Retry-After 時的等待秒數，連續 429 時加倍
+DEFAULT_RETRY_AFTER = 2.0
+MAX_RETRY_AFTER = 60.0
+# 單一請求排隊等待額度的上限，超過時直接視為失敗
+MAX_QUEUE_WAIT = 120.0
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+_RETRY_DELAY = re.compile(r'"retryDelay"\s*:\s*"(\d+(?:\.\d+)?)s"')
+
+
+class RateLimitExceeded(Exception):
+    """等待額度的時間超過上限"""
+
+    def __init__(self, wait):
+        super().__init__(f"API速率限制：需要等待 {wait:.0f} 秒")
+        self.wait = wait
+
+
+def parse_duration(value, now=None):
+    """
+    解析標頭中的重設時間，回傳距離現在的秒數
+
+    支援純秒數 ("20")、OpenAI 的持續時間 ("1m30s"、"250ms")、
+    RFC 3339 時間戳記 (Anthropic) 與 HTTP 日期 (Retry-After)；無法解析時回傳 None。
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if parts and "".join(number + unit for number, unit in parts) == value:
+        return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+    try:
+        moment = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            from email.utils import parsedate_to_datetime
+            moment = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (moment - now).total_seconds())
+
+
+def _header_int(headers, name):
+    try:
+        return int(float(headers.get(name)))
+    except (TypeError, ValueError):
+        return None
+
+
+def read_rate_limit_headers(headers):
+    """
+    由回應標頭讀取目前的額度
+
+    Returns:
+        dict: 可能包含 requests / tokens 兩個鍵，值為 (limit, remaining, reset_seconds)；
+              以及 retry_after（秒）
+    """
+    info = {}
+    if headers is None:
+        return info
+    # OpenAI 與 Mistral 使用 x-ratelimit-*，Anthropic 使用 anthropic-ratelimit-*
+    names = {
+        "requests": [
+            ("x-ratelimit-limit-requests", "x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"),
+            ("anthropic-ratelimit-requests-limit", "anthropic-ratelimit-requests-remaining",
+             "anthropic-ratelimit-requests-reset"),
+            ("x-ratelimit-limit-req-minute", "x-ratelimit-remaining-req-minute", None)
+        ],
+        "tokens": [
+            ("x-ratelimit-limit-tokens", "x-ratelimit-remaining-tokens", "x-ratelimit-reset-tokens"),
+            ("anthropic-ratelimit-tokens-limit", "anthropic-ratelimit-tokens-remaining",
+             "anthropic-ratelimit-tokens-reset"),
+            ("x-ratelimit-limit-tokens-minute", "x-ratelimit-remaining-tokens-minute", None)
+        ]
+    }
+    for kind, candidates in names.items():
+        for limit_name, remaining_name, reset_name in candidates:
+            limit = _header_int(headers, limit_name)
+            remaining = _header_int(headers, remaining_name)
+            if limit is None and remaining is None:
+                continue
+            reset = parse_duration(headers.get(reset_name)) if reset_name else None
+            info[kind] = (limit, remaining, reset)
+            break
+
+    retry_after = parse_duration(headers.get("retry-after"))
+    if retry_after is None:
+        # retry-after-ms 為 OpenAI 的毫秒版本
+        retry_after_ms = _header_int(headers, "retry-after-ms")
+        if retry_after_ms is not None:
+            retry_after = retry_after_ms / 1000
+    if retry_after is not None:
+        info["retry_after"] = retry_after
+    return info
+
+
+class TokenBucket:
+    """
+    以每分鐘額度持續補充的權杖桶
+
+    wait_time 計算額度足夠前需要等待的秒數，take 扣除額度；額度在持鎖時一併檢查與扣除，
+    多個執行緒同時排隊時只有一個能取得剛補充的額度，其餘繼續等待。
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self._updated = time.monotonic()
+
+    @property
+    def rate(self):
+        return self.capacity / 60.0
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount, now):
+        """額度足以扣除 amount 之前需要等待的秒數"""
+        self._refill(now)
+        # 單一請求超過整個桶的容量時，只要求桶滿即可，否則永遠無法送出
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate if self.rate else MAX_QUEUE_WAIT
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount, now):
+        self._refill(now)
+        self.level = min(self.capacity, self.level + amount)
+
+    def sync(self, limit, remaining, now):
+        """以伺服器回報的額度校正本地狀態"""
+        self._refill(now)
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            # 伺服器回報的剩餘量不包含其他進行中請求的預扣，只在伺服器較保守時往下修正
+            self.level = min(self.level, float(remaining))
+        self.level = min(self.level, self.capacity)
+
+
+class _KeyLimits:
+    """單一 (提供商, API 金鑰) 的請求與 token 額度；限制未知時對應的桶為 None，不限制"""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.blocked_until = 0.0
+        self.consecutive_limited = 0
+
+    def buckets(self):
+        return [bucket for bucket in (self.requests, self.tokens) if bucket is not None]
+
+    def set_capacity(self, kind, per_minute):
+        bucket = getattr(self, kind)
+        if bucket is None:
+            setattr(self, kind, TokenBucket(per_minute))
+        else:
+            bucket.capacity = float(per_minute)
+            bucket.level = min(bucket.level, bucket.capacity)
+
+    def learn(self, info, now):
+        """以伺服器回報的額度建立或校正對應的桶；只回報剩餘量而沒有上限時無法建立新的桶"""
+        for kind in ("requests", "tokens"):
+            if kind not in info:
+                continue
+            limit, remaining = info[kind][:2]
+            bucket = getattr(self, kind)
+            if bucket is None and limit:
+                bucket = TokenBucket(limit)
+                setattr(self, kind, bucket)
+            if bucket is not None:
+                bucket.sync(limit, remaining, now)
+
+
+class RateLimiter:
+    """
+    依提供商與 API 金鑰分別限制每分鐘請求數 (RPM) 與 token 數 (TPM)
+
+    發送請求前呼叫 acquire 預扣額度，額度不足時在用戶端排隊等待，
+    不會讓請求被伺服器以 429 拒絕；回應標頭中的 x-ratelimit-* /
+    anthropic-ratelimit-* 會用來校正額度，收到 429 時依 Retry-After 暫停該金鑰的所有請求。
+
+    用戶端沒有內建的預設限制（各帳號等級的限制差異很大）：只依 .env 設定的限制，
+    或由回應標頭學到的限制排隊；兩者都沒有時不在用戶端限制，只在收到 429 時暫停。
+    """
+
+    def __init__(self, limits=None):
+        # 提供商 -> (每分鐘請求數, 每分鐘 token 數)，未知的項目為 None
+        self.limits = dict(limits or {})
+        self._keys = {}
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.rate_limited = 0
+
+    @staticmethod
+    def _key(provider, api_key):
+        # 只保存金鑰的雜湊，避免金鑰留在記憶體中的其他結構
+        digest = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+        return (provider or "", digest)
+
+    def _state(self, provider, api_key):
+        key = self._key(provider, api_key)
+        state = self._keys.get(key)
+        if state is None:
+            rpm, tpm = self.limits.get(provider, (None, None))
+            state = self._keys[key] = _KeyLimits(rpm, tpm)
+        return state
+
+    def configure(self, provider, requests_per_minute=None, tokens_per_minute=None):
+        """以 .env 的設定指定提供商的限制；未指定的項目維持原狀"""
+        with self._lock:
+            rpm, tpm = self.limits.get(provider, (None, None))
+            limits = (requests_per_minute or rpm, tokens_per_minute or tpm)
+            if limits == (rpm, tpm):
+                return
+            self.limits[provider] = limits
+            for (key_provider, _), state in self._keys.items():
+                if key_provider != provider:
+                    continue
+                for kind, per_minute in zip(("requests", "tokens"), limits):
+                    if per_minute:
+                        state.set_capacity(kind, per_minute)
+
+    def acquire(self, provider, api_key, tokens, cancel_token=None, max_wait=MAX_QUEUE_WAIT):
+        """
+        預扣一次請求與 tokens 個 token 的額度，額度不足時等待
+
+        Args:
+            tokens: 預估的輸入加輸出 token 數
+            cancel_token: 等待期間取消時拋出 RequestCancelled
+
+        Returns:
+            float: 實際等待的秒數
+
+        Raises:
+            RateLimitExceeded: 需要等待的時間超過 max_wait
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                state = self._state(provider, api_key)
+                now = time.monotonic()
+                wait = max(
+                    state.blocked_until - now,
+                    state.requests.wait_time(1, now) if state.requests else 0.0,
+                    state.tokens.wait_time(tokens, now) if state.tokens else 0.0
+                )
+                if wait <= 0:
+                    if state.requests:
+                        state.requests.take(1, now)
+                    if state.tokens:
+                        state.tokens.take(tokens, now)
+                    if waited:
+                        self.waits += 1
+                        self.wait_seconds += waited
+                    return waited
+            if waited + wait > max_wait:
+                raise RateLimitExceeded(waited + wait)
+            # 分段等待，讓其他執行緒釋放的額度或取消能及時生效
+            step = min(wait, 1.0)
+            if cancel_token is not None:
+                cancel_token.wait(step)
+                cancel_token.raise_if_cancelled()
+            else:
+                time.sleep(step)
+            waited += step
+
+    def settle(self, provider, api_key, reserved, actual):
+        """請求完成後以實際使用量修正預扣的 token 數"""
+        if actual is None:
+            return
+        with self._lock:
+            state = self._state(provider, api_key)
+            if state.tokens is None:
+                return
+            now = time.monotonic()
+            if actual < reserved:
+                state.tokens.give_back(reserved - actual, now)
+            elif actual > reserved:
+                state.tokens.take(actual - reserved, now)
+
+    def update_from_headers(self, provider, api_key, headers):
+        """以成功回應的標頭校正額度"""
+        info = read_rate_limit_headers(headers)
+        with self._lock:
+            state = self._state(provider, api_key)
+            state.consecutive_limited = 0
+            state.learn(info, time.monotonic())
+
+    def on_rate_limited(self, provider, api_key, headers=None, body=None):
+        """
+        收到 429 時暫停該金鑰的請求
+
+        等待時間依序取自 Retry-After 標頭、額度重設時間、回應內容中的 retryDelay (Gemini)，
+        都沒有時以 DEFAULT_RETRY_AFTER 起算並隨連續 429 次數加倍。
+
+        Returns:
+            float: 暫停的秒數
+        """
+        info = read_rate_limit_headers(headers)
+        delay = info.get("retry_after")
+        if delay is None:
+            resets = [info[kind][2] for kind in ("requests", "tokens")
+                      if kind in info and info[kind][1] == 0 and info[kind][2] is not None]
+            if resets:
+                delay = max(resets)
+        if delay is None and body:
+            match = _RETRY_DELAY.search(body)
+            if match:
+                delay = float(match.group(1))
+        with self._lock:
+            state = self._state(provider, api_key)
+            state.consecutive_limited += 1
+            if delay is None:
+                delay = DEFAULT_RETRY_AFTER * 2 ** (state.consecutive_limited - 1)
+            delay = min(MAX_RETRY_AFTER, delay)
+            now = time.monotonic()
+            state.blocked_until = max(state.blocked_until, now + delay)
+            state.learn(info, now)
+            # 伺服器已拒絕，表示本地額度高估了，清空後重新累積
+            if state.tokens is not None:
+                state.tokens.level = min(state.tokens.level, 0.0)
+            self.rate_limited += 1
+        return delay
+
+    def stats(self):
+        with self._lock:
+            return {
+                "keys": len(self._keys),
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 2),
+                "rate_limited": self.rate_limited
+            }
+
+
+_shared_limiter = None
+_shared_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """取得行程內共用的速率限制器"""
+    global _shared_limiter
+    with _shared_limiter_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter()
+        return _shared_limiter
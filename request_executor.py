@@ -0,0 +1,90 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import unohelper
+from com.sun.star.awt import XCallback
+
+from cancellation import CancelToken, RequestCancelled
+from log_setup import get_logger
+
+
+logger = get_logger("request_executor")
+
+
+class _UICallback(unohelper.Base, XCallback):
+    """AsyncCallback 在 UI 執行緒上呼叫的包裝物件"""
+
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+
+    def notify(self, data):
+        try:
+            self.function(*self.args)
+        except Exception as e:
+            logger.exception("UI 回呼執行失敗: %s", e)
+
+
+class BackgroundExecutor:
+    """
+    在背景工作執行緒上執行 AI 請求，並透過 UNO AsyncCallback 服務
+    將結果安全地送回 LibreOffice 的 UI 執行緒
+    """
+
+    def __init__(self, ctx, max_workers=2):
+        self.ctx = ctx
+        self._async_callback = ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.awt.AsyncCallback", ctx
+        )
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-request")
+
+    def post(self, cancel_token, function, *args):
+        """
+        將函式排入 UI 執行緒執行；若請求已取消則略過
+
+        AsyncCallback 會依排入順序執行，因此串流片段不會亂序。
+        """
+        def guarded(*call_args):
+            if cancel_token is None or not cancel_token.cancelled:
+                function(*call_args)
+
+        self._async_callback.addCallback(_UICallback(guarded, args), None)
+
+    def run_on_ui_thread(self, function, *args):
+        """無條件將函式排入 UI 執行緒執行"""
+        self._async_callback.addCallback(_UICallback(function, args), None)
+
+    def submit(self, task, on_success=None, on_error=None, on_finished=None):
+        """
+        在背景執行 task(cancel_token)
+
+        Args:
+            task: 接收 CancelToken 的可呼叫物件，回傳值會傳給 on_success
+            on_success: 成功時在 UI 執行緒呼叫 on_success(result)
+            on_error: 失敗時在 UI 執行緒呼叫 on_error(exception)
+            on_finished: 不論結果如何，最後在 UI 執行緒呼叫 on_finished()
+
+        Returns:
+            CancelToken: 用於取消請求
+        """
+        cancel_token = CancelToken()
+
+        def worker():
+            try:
+                result = task(cancel_token)
+            except RequestCancelled:
+                pass
+            except Exception as e:
+                if on_error:
+                    self.post(cancel_token, on_error, e)
+            else:
+                if on_success:
+                    self.post(cancel_token, on_success, result)
+            finally:
+                if on_finished:
+                    self.run_on_ui_thread(on_finished)
+
+        self._pool.submit(worker)
+        return cancel_token
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
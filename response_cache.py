@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from log_setup import get_logger
+
+
+logger = get_logger("response_cache")
+
+
+class ResponseCache:
+    """
+    AI 回應快取：記憶體 LRU 層 + 磁碟持久層
+
+    快取鍵由提供商、模型、生成參數與提示詞雜湊組成。磁碟層每筆回應存為
+    一個 JSON 檔，依存放時間 (max_age) 與總容量 (disk_max_bytes) 淘汰。
+    """
+
+    def __init__(self, cache_dir=None, memory_entries=128, disk_max_bytes=20 * 1024 * 1024,
+                 max_age=7 * 24 * 3600):
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.expanduser("~"), ".libreoffice", "cache", "responses")
+        self.cache_dir = cache_dir
+        self.memory_entries = memory_entries
+        self.disk_max_bytes = disk_max_bytes
+        self.max_age = max_age
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(provider, model, params, prompt):
+        """
+        產生快取鍵
+
+        Args:
+            provider: AI 提供商
+            model: 模型名稱
+            params: 生成參數字典（temperature、max_tokens 等）
+            prompt: 完整提示詞
+        """
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        header = json.dumps([provider, model, params, prompt_hash], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(header.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _expired(self, created):
+        return self.max_age is not None and time.time() - created > self.max_age
+
+    def get(self, key):
+        """
+        查詢快取
+
+        Returns:
+            dict: {"response": str, "token_info": dict 或 None}，未命中時為 None
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._expired(entry["created"]):
+                    del self._memory[key]
+                else:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember_locked(key, entry)
+            return entry
+
+    def put(self, key, response, token_info=None):
+        """存入快取；空白回應不會被存入"""
+        if not response:
+            return
+        entry = {"created": time.time(), "response": response, "token_info": token_info}
+        with self._lock:
+            self._remember_locked(key, entry)
+            self.stores += 1
+        self._write_disk(key, entry)
+
+    def _remember_locked(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(entry.get("created", 0)):
+            self._remove_file(path)
+            return None
+        return entry
+
+    def _write_disk(self, key, entry):
+        try:
+            if not os.path.exists(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            path = self._path(key)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            logger.warning("無法寫入回應快取: %s", e)
+            return
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk_locked()
+            else:
+                self._disk_bytes += size
+            if self._disk_bytes > self.disk_max_bytes:
+                self._evict_disk_locked()
+
+    def _remove_file(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _list_disk_locked(self):
+        entries = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _scan_disk_locked(self):
+        return sum(size for _, size, _ in self._list_disk_locked())
+
+    def _evict_disk_locked(self):
+        """移除過期的檔案，再從最舊的開始刪除直到容量降到上限的九成"""
+        entries = sorted(self._list_disk_locked())
+        total = sum(size for _, size, _ in entries)
+        limit = self.disk_max_bytes * 0.9
+        now = time.time()
+        for mtime, size, path in entries:
+            if total <= limit and (self.max_age is None or now - mtime <= self.max_age):
+                continue
+            self._remove_file(path)
+            total -= size
+            self.evictions += 1
+        self._disk_bytes = total
+
+    def stats(self):
+        """回傳快取命中統計，供診斷使用"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def clear(self):
+        """清除記憶體與磁碟上的所有快取"""
+        with self._lock:
+            self._memory.clear()
+            for _, _, path in self._list_disk_locked():
+                self._remove_file(path)
+            self._disk_bytes = 0
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """取得行程內共用的回應快取"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache()
+        return _shared_cache
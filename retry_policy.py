@@ -0,0 +1,293 @@
+import http.client
+import queue
+import random
+import socket
+import ssl
+import threading
+import time
+import urllib.error
+from collections import deque
+
+from cancellation import CancelToken, RequestCancelled
+
+
+# 暫時性的伺服器錯誤：過載、閘道逾時等，稍後重送通常會成功（429 由速率限制器處理）
+RETRIABLE_STATUS = {408, 500, 502, 503, 504, 529}
+# 連線層的暫時性錯誤
+RETRIABLE_REASONS = (
+    socket.timeout,
+    TimeoutError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    ConnectionRefusedError,
+    BrokenPipeError,
+    http.client.RemoteDisconnected,
+    http.client.IncompleteRead,
+)
+
+DEFAULT_MAX_RETRIES = 2
+BASE_DELAY = 0.5
+MAX_DELAY = 8.0
+# 重試預算：每次首次請求存入 BUDGET_RATIO 次重試額度，最多累積 BUDGET_MAX 次；
+# 服務整體故障時重試次數不會超過正常流量的一定比例，避免重試風暴
+BUDGET_RATIO = 0.2
+BUDGET_MAX = 10.0
+
+# 對沖請求：第一個請求超過此百分位延遲仍未回應時，送出第二個相同的請求
+HEDGE_PERCENTILE = 0.95
+# 延遲樣本不足時不對沖
+MIN_LATENCY_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+
+def is_retriable(error):
+    """判斷錯誤是否為暫時性、可以安全重送的錯誤"""
+    if isinstance(error, RequestCancelled):
+        return False
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code in RETRIABLE_STATUS
+    if isinstance(error, urllib.error.URLError):
+        reason = error.reason
+        # 憑證錯誤等 SSL 問題重送也不會成功
+        if isinstance(reason, ssl.SSLCertVerificationError):
+            return False
+        return isinstance(reason, RETRIABLE_REASONS)
+    return isinstance(error, RETRIABLE_REASONS)
+
+
+class RetryBudget:
+    """限制重試次數佔總請求數比例的預算"""
+
+    def __init__(self, ratio=BUDGET_RATIO, maximum=BUDGET_MAX):
+        self.ratio = ratio
+        self.maximum = maximum
+        self.balance = maximum
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.balance = min(self.maximum, self.balance + self.ratio)
+
+    def withdraw(self):
+        """取出一次重試的額度；預算不足時回傳 False"""
+        with self._lock:
+            if self.balance < 1:
+                return False
+            self.balance -= 1
+            return True
+
+
+class RetryPolicy:
+    """
+    暫時性錯誤的重試策略
+
+    可重試的錯誤以指數退避加上完全隨機抖動 (full jitter) 等待後重送，
+    等待期間可以被取消；重試次數同時受 max_retries 與共用的 RetryBudget 限制。
+    """
+
+    def __init__(self, max_retries=DEFAULT_MAX_RETRIES, base_delay=BASE_DELAY, max_delay=MAX_DELAY,
+                 budget=None, rng=None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget or RetryBudget()
+        self.rng = rng or random.Random()
+        self.attempts = 0
+        self.retries = 0
+        self.budget_exhausted = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def backoff(self, retry_number):
+        """第 retry_number 次重試前的等待秒數（從 0 起算）"""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** retry_number)
+        return self.rng.uniform(0, ceiling)
+
+    def call(self, function, cancel_token=None, max_retries=None, should_retry=None, on_retry=None):
+        """
+        呼叫 function(cancel_token)，暫時性錯誤時重試
+
+        Args:
+            max_retries: 覆寫本次呼叫的重試次數上限
+            should_retry: should_retry(error) 回傳 False 時不重試（例如串流已輸出部分內容）
+            on_retry: on_retry(error, retry_number, delay) 在每次等待前呼叫
+
+        Returns:
+            function 的回傳值；重試用盡時拋出最後一次的錯誤
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+        self.budget.deposit()
+        retry_number = 0
+        while True:
+            self.attempts += 1
+            try:
+                return function(cancel_token)
+            except Exception as error:
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                if retry_number >= max_retries or not is_retriable(error):
+                    raise
+                if should_retry is not None and not should_retry(error):
+                    raise
+                if not self.budget.withdraw():
+                    self.budget_exhausted += 1
+                    raise
+                delay = self.backoff(retry_number)
+                retry_number += 1
+                self.retries += 1
+                if on_retry:
+                    on_retry(error, retry_number, delay)
+                if cancel_token is not None:
+                    cancel_token.wait(delay)
+                    cancel_token.raise_if_cancelled()
+                else:
+                    time.sleep(delay)
+
+    def record_hedge(self, won):
+        """記錄一次對沖請求，won 表示對沖請求比原請求先完成"""
+        self.hedged += 1
+        if won:
+            self.hedge_wins += 1
+
+    def stats(self):
+        return {
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "budget_exhausted": self.budget_exhausted,
+            "budget": round(self.budget.balance, 2),
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins
+        }
+
+
+class LatencyTracker:
+    """以 (提供商, 模型) 為鍵，保留最近 LATENCY_WINDOW 次請求的延遲"""
+
+    def __init__(self, window=LATENCY_WINDOW, min_samples=MIN_LATENCY_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, key, fraction):
+        """回傳延遲的百分位數；樣本不足時回傳 None"""
+        with self._lock:
+            samples = self._samples.get(key)
+            if not samples or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def stats(self):
+        with self._lock:
+            keys = list(self._samples)
+        return {f"{provider}/{model}": self.percentile((provider, model), HEDGE_PERCENTILE)
+                for provider, model in keys}
+
+
+def hedged_call(function, hedge_after, cancel_token=None, discard=None, stats=None):
+    """
+    呼叫 function(token)；超過 hedge_after 秒仍未完成時，再送出一個相同的請求，採用先完成者
+
+    兩個請求各自使用 cancel_token 的子 token，先完成者勝出後取消另一個；
+    另一個若已取得結果，交給 discard 釋放（例如關閉回應）。只有兩個請求都失敗時才拋出錯誤。
+
+    Args:
+        hedge_after: 對沖等待秒數，None 時不對沖
+        stats: 具有 record_hedge(won) 的物件（RetryPolicy），記錄對沖次數與對沖請求勝出次數
+    """
+    if hedge_after is None:
+        return function(cancel_token)
+
+    parent = cancel_token if cancel_token is not None else CancelToken()
+    results = queue.Queue()
+    tokens = []
+
+    def launch():
+        token = parent.child()
+        tokens.append(token)
+
+        def run():
+            try:
+                results.put((token, True, function(token)))
+            except BaseException as e:
+                results.put((token, False, e))
+
+        threading.Thread(target=run, name="ai-hedge", daemon=True).start()
+
+    launch()
+    pending = 1
+    error = None
+    while pending:
+        try:
+            token, ok, value = results.get(timeout=hedge_after if len(tokens) == 1 else None)
+        except queue.Empty:
+            if parent.cancelled:
+                continue
+            launch()
+            pending += 1
+            continue
+        pending -= 1
+        if ok:
+            hedged = len(tokens) > 1
+            for other in tokens:
+                if other is not token:
+                    other.cancel()
+                    parent.release_child(other)
+            if hedged and stats is not None:
+                stats.record_hedge(token is tokens[-1])
+            if pending and discard is not None:
+                _discard_late(results, pending, discard)
+            # 勝出的子 token 保留在父 token 上，後續讀取回應時仍可被取消
+            return value
+        error = value
+        if len(tokens) == 1:
+            break
+    for token in tokens:
+        parent.release_child(token)
+    raise error
+
+
+def _discard_late(results, pending, discard):
+    """在背景等待落敗的請求結束，並釋放它已取得的結果"""
+    def drain():
+        for _ in range(pending):
+            _, ok, value = results.get()
+            if ok:
+                try:
+                    discard(value)
+                except Exception:
+                    pass
+
+    threading.Thread(target=drain, name="ai-hedge-drain", daemon=True).start()
+
+
+_shared_policy = None
+_shared_tracker = None
+_shared_lock = threading.Lock()
+
+
+def get_retry_policy():
+    """取得行程內共用的重試策略（重試預算由所有請求共用）"""
+    global _shared_policy
+    with _shared_lock:
+        if _shared_policy is None:
+            _shared_policy = RetryPolicy()
+        return _shared_policy
+
+
+def get_latency_tracker():
+    """取得行程內共用的延遲統計"""
+    global _shared_tracker
+    with _shared_lock:
+        if _shared_tracker is None:
+            _shared_tracker = LatencyTracker()
+        return _shared_tracker
@@ -0,0 +1,286 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from difflib import SequenceMatcher
+
+
+# 預設的相似度門檻：估計的 Jaccard 相似度達到這個值才成為比對的對象
+DEFAULT_THRESHOLD = 0.8
+# 字元 n-gram 的長度；以字元切分，中文沒有空白也能比較
+SHINGLE_SIZE = 3
+# MinHash 簽章長度 = BANDS × ROWS；LSH 以 BANDS 個區段分桶，每段 ROWS 個值
+BANDS = 16
+ROWS = 4
+# 索引的提示詞數上限，超過時淘汰最久未使用的項目
+MAX_ENTRIES = 1024
+# 超過這個長度（正規化後）的提示詞不做相似比對；計算簽章與逐字比對的成本與長度成正比，
+# 索引保存正規化後的提示詞，記憶體上限約為 MAX_ENTRIES × MAX_PROMPT_CHARS 個字元
+MAX_PROMPT_CHARS = 4000
+# 相似的提示詞之間最多只能插入或刪除這麼多個字元（正規化後），不能有替換
+MAX_EDIT_CHARS = 8
+# 插入或刪除的文字只能由這些客套字組成（正規化後）；其他文字都可能改變指令，例如「用英文」「並簡短」
+FILLER_WORDS = ("請", "麻煩", "幫我", "幫忙", "一下", "謝謝", "感謝", "please", "pls", "kindly", "thanks", "thankyou")
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_HASH_MASK = (1 << 61) - 1
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_FILLER = re.compile("(?:" + "|".join(sorted(map(re.escape, FILLER_WORDS), key=len, reverse=True)) + ")+")
+
+
+def normalize_prompt(text):
+    """
+    正規化提示詞：全形半形統一 (NFKC)、轉小寫，並移除空白、標點與符號
+
+    只差在標點或空白的提示詞正規化後完全相同。
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    return "".join(ch for ch in text if unicodedata.category(ch)[0] not in "PZSC")
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """正規化文字的字元 n-gram 集合（以雜湊值表示）"""
+    if len(text) <= size:
+        return {hash(text) & _HASH_MASK}
+    return {hash(text[i:i + size]) & _HASH_MASK for i in range(len(text) - size + 1)}
+
+
+class MinHasher:
+    """
+    以 (a·x + b) mod p 的通用雜湊族模擬 num_perm 個隨機排列
+
+    兩個集合的簽章中相同位置數值相等的比例，是兩者 Jaccard 相似度的不偏估計。
+    shingle 使用 Python 內建的 hash()，每個行程的雜湊種子不同，簽章只在行程內有效。
+    """
+
+    def __init__(self, num_perm=BANDS * ROWS, seed=1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._perms = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+                       for _ in range(num_perm)]
+
+    def signature(self, hashes):
+        hashes = list(hashes)
+        return tuple(min([(a * h + b) % _MERSENNE_PRIME for h in hashes]) for a, b in self._perms)
+
+
+def estimate_similarity(signature, other):
+    """由兩個 MinHash 簽章估計 Jaccard 相似度"""
+    return sum(1 for x, y in zip(signature, other) if x == y) / len(signature)
+
+
+def is_small_edit(text, other, max_chars=MAX_EDIT_CHARS):
+    """
+    兩段正規化文字是否只差在少量插入或刪除的客套字
+
+    Jaccard 相似度無法區分「加上『請』」與「英文改成日文」「加上『用英文』」：長提示詞中
+    替換或插入幾個字，相似度仍然很高。因此候選還要逐字比對，只接受合計不超過 max_chars 個字元、
+    且完全由 FILLER_WORDS 組成的插入或刪除；任何替換或其他文字都視為不同的指令。
+    """
+    if abs(len(text) - len(other)) > max_chars:
+        return False
+    changed = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, text, other, autojunk=False).get_opcodes():
+        if tag == "equal":
+            continue
+        if tag == "replace":
+            return False
+        part = text[i1:i2] or other[j1:j2]
+        if not _FILLER.fullmatch(part):
+            return False
+        changed.append(part)
+        if sum(len(part) for part in changed) > max_chars:
+            return False
+    return True
+
+
+class _Entry:
+    __slots__ = ("target", "normalized", "signature", "numbers", "bands")
+
+    def __init__(self, target, normalized, signature, numbers, bands):
+        self.target = target
+        self.normalized = normalized
+        self.signature = signature
+        self.numbers = numbers
+        self.bands = bands
+
+
+class SemanticCache:
+    """
+    近似重複提示詞的索引：MinHash 簽章 + LSH 分區段分桶
+
+    提示詞先正規化（去除標點、空白，統一大小寫與全半形），正規化後相同即命中。
+    預設不啟用（.env 的 SEMANTIC_CACHE）。其餘提示詞以字元 n-gram 的 MinHash 簽章索引，簽章切成 bands 段，任一段完全相同的
+    提示詞才成為候選，查詢時間與索引大小無關。候選以完整簽章估計 Jaccard 相似度，
+    達到 threshold、提示詞中的數字完全相同（避免「擴展 20%」與「擴展 30%」被視為相同），
+    且逐字比對只差在少量客套字的插入或刪除（見 is_small_edit）時才命中，指令的文字不做模糊比對。
+
+    索引保存簽章、正規化後的提示詞與精確快取的鍵（target），回應內容仍由 ResponseCache 保存；
+    scope 區分提供商、模型與生成參數，不同 scope 之間不會互相命中。
+    超過 max_entries 時淘汰最久未使用的項目。
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, bands=BANDS, rows=ROWS, max_entries=MAX_ENTRIES,
+                 shingle_size=SHINGLE_SIZE, max_prompt_chars=MAX_PROMPT_CHARS, max_edit_chars=MAX_EDIT_CHARS):
+        self.threshold = threshold
+        self.max_edit_chars = max_edit_chars
+        self.bands = bands
+        self.rows = rows
+        self.max_entries = max_entries
+        self.shingle_size = shingle_size
+        self.max_prompt_chars = max_prompt_chars
+        self.hasher = MinHasher(bands * rows)
+        # 正規化後的提示詞雜湊 -> _Entry，依最近使用排序
+        self._entries = OrderedDict()
+        # (scope, 區段序號, 區段數值) -> set(正規化後的提示詞雜湊)
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.normalized_hits = 0
+        self.misses = 0
+        self.candidates = 0
+        self.rejected = 0
+        self.evictions = 0
+
+    def configure(self, threshold=None):
+        if threshold is not None:
+            self.threshold = threshold
+
+    @staticmethod
+    def make_scope(provider, model, params):
+        return hashlib.sha256(json.dumps([provider, model, params], sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _features(self, scope, prompt):
+        """
+        Returns:
+            tuple: (正規化提示詞的鍵, 正規化提示詞, 簽章, 數字)；提示詞過長或沒有內容時回傳 None
+        """
+        normalized = normalize_prompt(prompt)
+        if not normalized or len(normalized) > self.max_prompt_chars:
+            return None
+        key = (scope, hashlib.sha256(normalized.encode("utf-8")).digest())
+        signature = self.hasher.signature(shingles(normalized, self.shingle_size))
+        numbers = tuple(_NUMBER.findall(unicodedata.normalize("NFKC", prompt)))
+        return key, normalized, signature, numbers
+
+    def _band_keys(self, scope, signature):
+        rows = self.rows
+        return [(scope, band, signature[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+    def lookup(self, scope, prompt):
+        """
+        尋找相似的已快取提示詞
+
+        Returns:
+            tuple: (target, similarity)；沒有相似的提示詞時回傳 (None, 0.0)
+        """
+        features = self._features(scope, prompt)
+        if features is None:
+            return None, 0.0
+        key, normalized, signature, numbers = features
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.numbers == numbers:
+                self._entries.move_to_end(key)
+                self.normalized_hits += 1
+                return entry.target, 1.0
+
+            scored = []
+            seen = set()
+            for band_key in self._band_keys(scope, signature):
+                for candidate_key in self._buckets.get(band_key, ()):
+                    if candidate_key in seen:
+                        continue
+                    seen.add(candidate_key)
+                    candidate = self._entries[candidate_key]
+                    if candidate.numbers != numbers:
+                        continue
+                    similarity = estimate_similarity(signature, candidate.signature)
+                    if similarity >= self.threshold:
+                        scored.append((similarity, candidate_key, candidate.normalized))
+            self.candidates += len(seen)
+
+        # 逐字比對在鎖外進行，從最相似的候選開始
+        scored.sort(key=lambda item: item[0], reverse=True)
+        for similarity, candidate_key, candidate_text in scored:
+            if is_small_edit(normalized, candidate_text, self.max_edit_chars):
+                with self._lock:
+                    entry = self._entries.get(candidate_key)
+                    if entry is None:
+                        continue
+                    self._entries.move_to_end(candidate_key)
+                    self.hits += 1
+                    return entry.target, similarity
+        with self._lock:
+            if scored:
+                self.rejected += 1
+            self.misses += 1
+        return None, scored[0][0] if scored else 0.0
+
+    def add(self, scope, prompt, target):
+        """將提示詞加入索引，target 為命中時回傳的值（ResponseCache 的鍵）"""
+        features = self._features(scope, prompt)
+        if features is None:
+            return
+        key, normalized, signature, numbers = features
+        bands = self._band_keys(scope, signature)
+        with self._lock:
+            if key in self._entries:
+                self._remove_locked(key)
+            self._entries[key] = _Entry(target, normalized, signature, numbers, bands)
+            for band_key in bands:
+                self._buckets.setdefault(band_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove_locked(next(iter(self._entries)))
+                self.evictions += 1
+
+    def discard(self, target):
+        """移除指向 target 的項目（例如精確快取中的回應已過期）"""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry.target == target]:
+                self._remove_locked(key)
+
+    def _remove_locked(self, key):
+        entry = self._entries.pop(key)
+        for band_key in entry.bands:
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.normalized_hits + self.misses
+            return {
+                "hits": self.hits,
+                "normalized_hits": self.normalized_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.normalized_hits) / lookups if lookups else 0.0,
+                "candidates_per_lookup": self.candidates / lookups if lookups else 0.0,
+                "rejected_by_edit_check": self.rejected,
+                "entries": len(self._entries),
+                "evictions": self.evictions,
+                "threshold": self.threshold,
+            }
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_semantic_cache():
+    """取得行程內共用的相似提示詞索引"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = SemanticCache()
+        return _shared_cache
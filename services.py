@@ -0,0 +1,43 @@
+import threading
+
+
+class OfficeServices:
+    """
+    在同一個 office 行程內重複使用的服務物件
+
+    工具列每次點擊只需要建立新的對話框與事件處理器；Utils、ConfigManager、AIService
+    與 DialogBuilder 在第一次使用時建立後就一直保留，避免重複匯入模組、重新設定日誌
+    以及重新讀取配置檔。
+    """
+
+    def __init__(self, ctx):
+        from ai_service import AIService
+        from config_manager import ConfigManager
+        from dialog_builder import DialogBuilder
+        from utils import Utils
+
+        self.ctx = ctx
+        self.utils = Utils(ctx)
+        self.config_manager = ConfigManager(ctx)
+        self.ai_service = AIService(ctx)
+        self.dialog_builder = DialogBuilder(ctx)
+
+
+_shared_services = None
+_shared_services_lock = threading.Lock()
+
+
+def get_services(ctx):
+    """取得行程內共用的服務物件（一個 office 行程只有一個元件上下文）"""
+    global _shared_services
+    with _shared_services_lock:
+        if _shared_services is None:
+            _shared_services = OfficeServices(ctx)
+        return _shared_services
+
+
+def reset_services():
+    """捨棄共用的服務物件，下次 get_services 時重新建立"""
+    global _shared_services
+    with _shared_services_lock:
+        _shared_services = None
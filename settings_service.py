@@ -0,0 +1,233 @@
+import os
+import threading
+from collections import namedtuple
+
+
+# 各提供商在 .env 中對應的 API 金鑰名稱
+PROVIDER_KEY_NAMES = {
+    "gemini": "GOOGLE_API_KEY",
+    "openai": "OPENAI_API_KEY",
+    "claude": "ANTHROPIC_API_KEY",
+    "mistral": "MISTRAL_API_KEY"
+}
+
+# 各提供商的預設模型（.env 未指定 *_MODEL 時使用）
+DEFAULT_MODELS = {
+    "gemini": "gemini-1.5-flash",
+    "openai": "gpt-3.5-turbo",
+    "claude": "claude-3-opus-20240229",
+    "mistral": "mistral-large-latest"
+}
+
+_FALSE_VALUES = ("0", "false", "no", "off")
+
+
+class EnvSettings(namedtuple("EnvSettings", [
+    "provider", "api_keys", "models", "max_tokens", "temperature", "request_timeout",
+    "http_pool_size", "stream_responses", "response_cache", "length_candidates", "batch_workers",
+    "rate_limit_rpm", "rate_limit_tpm", "max_retries", "hedge_requests",
+    "provider_order", "routing_mode", "log_level", "history_window", "conversation_mode",
+    "semantic_cache", "semantic_cache_threshold", "values"
+])):
+    """
+    .env 設定的不可變快照
+
+    api_keys 與 models 以提供商名稱為鍵；values 保留檔案中所有原始鍵值，
+    供尚未有專屬欄位的設定使用。
+    """
+    __slots__ = ()
+
+    @property
+    def api_key(self):
+        """目前提供商的 API 金鑰"""
+        return self.api_keys.get(self.provider, "")
+
+    @property
+    def model(self):
+        """目前提供商的模型名稱"""
+        return self.models.get(self.provider) or DEFAULT_MODELS.get(self.provider, "")
+
+    def get(self, name, default=None):
+        return self.values.get(name, default)
+
+    def get_bool(self, name, default=False):
+        value = self.values.get(name)
+        if value is None or value == "":
+            return default
+        return value.lower() not in _FALSE_VALUES
+
+    def get_int(self, name, default=None):
+        try:
+            return int(self.values[name])
+        except (KeyError, ValueError):
+            return default
+
+    def get_float(self, name, default=None):
+        try:
+            return float(self.values[name])
+        except (KeyError, ValueError):
+            return default
+
+
+def parse_env(content):
+    """
+    解析 .env 內容為有序字典
+
+    只接受完整的 KEY=VALUE 行；忽略空白行、# 註解與 export 前綴，並去除值兩側的引號。
+    """
+    values = {}
+    for line in content.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("export "):
+            line = line[len("export "):].lstrip()
+        key, sep, value = line.partition("=")
+        if not sep:
+            continue
+        values[key.strip()] = value.strip().strip('"\'')
+    return values
+
+
+def _routing_mode(value):
+    value = value.strip().lower()
+    return value if value in ("single", "failover", "race") else "single"
+
+
+def build_settings(values):
+    """由原始鍵值建立 EnvSettings 快照"""
+    api_keys = {}
+    models = {}
+    for provider, key_name in PROVIDER_KEY_NAMES.items():
+        api_key = values.get(key_name)
+        if not api_key and provider == "gemini":
+            api_key = values.get("GEMINI_API_KEY")
+        if api_key:
+            api_keys[provider] = api_key
+        model = values.get(f"{provider.upper()}_MODEL")
+        if model:
+            models[provider] = model
+
+    raw = EnvSettings("", {}, {}, *([None] * (len(EnvSettings._fields) - 4)), dict(values))
+    return raw._replace(
+        provider=values.get("DEFAULT_PROVIDER") or "gemini",
+        api_keys=api_keys,
+        models=models,
+        max_tokens=raw.get_int("MAX_TOKENS", 2048),
+        temperature=raw.get_float("TEMPERATURE", 0.7),
+        request_timeout=raw.get_float("REQUEST_TIMEOUT", 30),
+        http_pool_size=raw.get_int("HTTP_POOL_SIZE"),
+        stream_responses=raw.get_bool("STREAM_RESPONSES", True),
+        response_cache=raw.get_bool("RESPONSE_CACHE", True),
+        # 長度調整每回合平行送出的候選數，預設 1 為循序調整
+        length_candidates=max(1, raw.get_int("LENGTH_CANDIDATES", 1)),
+        # 批次處理段落時同時執行的請求數
+        batch_workers=max(1, raw.get_int("BATCH_WORKERS", 4)),
+        # 目前提供商的每分鐘請求數與 token 數上限，未設定時只依回應標頭學到的限制與 429 回應限速
+        rate_limit_rpm=raw.get_int("RATE_LIMIT_RPM"),
+        rate_limit_tpm=raw.get_int("RATE_LIMIT_TPM"),
+        # 暫時性錯誤（5xx、連線中斷、逾時）的重試次數
+        max_retries=max(0, raw.get_int("MAX_RETRIES", 2)),
+        # 請求超過近期 p95 延遲仍未回應時，再送出一個相同的請求
+        hedge_requests=raw.get_bool("HEDGE_REQUESTS", False),
+        # 多提供商路由：PROVIDER_ORDER 為以逗號分隔的備援順序，ROUTING_MODE 為 single / failover / race
+        provider_order=tuple(name.strip().lower() for name in values.get("PROVIDER_ORDER", "").split(",")
+                             if name.strip().lower() in PROVIDER_KEY_NAMES),
+        routing_mode=_routing_mode(values.get("ROUTING_MODE", "")),
+        # 日誌等級（DEBUG 時才記錄提示詞與回應內容）
+        log_level=values.get("LOG_LEVEL", "INFO").strip().upper() or "INFO",
+        # 回應欄位顯示的最近回應數，較早的回應只保存在歷史紀錄資料庫
+        history_window=max(1, raw.get_int("HISTORY_WINDOW", 3)),
+        # 詢問時保留之前的問答並使用提供商的提示詞快取，後續問題不必重新處理選取的文件（預設關閉）
+        conversation_mode=raw.get_bool("CONVERSATION_MODE", False),
+        # 只差在標點、空白、大小寫或客套字的提示詞沿用已快取的回應（預設關閉）；門檻為估計的 Jaccard 相似度
+        semantic_cache=raw.get_bool("SEMANTIC_CACHE", False),
+        semantic_cache_threshold=min(1.0, max(0.0, raw.get_float("SEMANTIC_CACHE_THRESHOLD", 0.8)))
+    )
+
+
+class SettingsService:
+    """
+    快取 ~/.libreoffice/.env 的解析結果
+
+    每次 get() 只做一次 os.stat，檔案的修改時間或大小改變時才重新解析。
+    """
+
+    def __init__(self, env_path=None):
+        if env_path is None:
+            env_path = os.path.join(os.path.expanduser("~"), ".libreoffice", ".env")
+        self.env_path = env_path
+        self._lock = threading.Lock()
+        self._signature = None
+        self._snapshot = build_settings({})
+        self.loads = 0
+
+    def _stat_signature(self):
+        try:
+            stat = os.stat(self.env_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self):
+        """取得最新的設定快照"""
+        signature = self._stat_signature()
+        with self._lock:
+            if signature == self._signature:
+                return self._snapshot
+            values = {}
+            if signature is not None:
+                try:
+                    with open(self.env_path, "r", encoding="utf-8") as f:
+                        values = parse_env(f.read())
+                except OSError:
+                    return self._snapshot
+            self._snapshot = build_settings(values)
+            self._signature = signature
+            self.loads += 1
+            return self._snapshot
+
+    def save(self, provider, api_key):
+        """
+        更新預設提供商與其 API 金鑰
+
+        保留檔案中的其他設定（例如其他提供商的金鑰），先寫入暫存檔再以
+        os.replace 原子性地取代 .env，並同步更新記憶體中的快照。
+        """
+        env_dir = os.path.dirname(self.env_path)
+        if not os.path.exists(env_dir):
+            os.makedirs(env_dir)
+
+        with self._lock:
+            values = {}
+            if os.path.exists(self.env_path):
+                with open(self.env_path, "r", encoding="utf-8") as f:
+                    values = parse_env(f.read())
+            values["DEFAULT_PROVIDER"] = provider
+            key_name = PROVIDER_KEY_NAMES.get(provider)
+            if key_name:
+                values[key_name] = api_key
+
+            temp_path = f"{self.env_path}.tmp"
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for key, value in values.items():
+                    f.write(f"{key}={value}\n")
+            os.replace(temp_path, self.env_path)
+
+            self._snapshot = build_settings(values)
+            self._signature = self._stat_signature()
+            return self._snapshot
+
+
+_shared_service = None
+_shared_service_lock = threading.Lock()
+
+
+def get_settings_service():
+    """取得行程內共用的設定服務"""
+    global _shared_service
+    with _shared_service_lock:
+        if _shared_service is None:
+            _shared_service = SettingsService()
+        return _shared_service
@@ -0,0 +1,93 @@
+class SSEParser:
+    """
+    增量式 Server-Sent Events 解析器
+
+    依照 SSE 規格逐行處理：`event:` 設定事件名稱、`data:` 累積資料、
+    空白行送出事件、以 `:` 開頭的行為註解。可處理跨讀取區塊被切斷的行。
+    """
+
+    def __init__(self):
+        self._buffer = b""
+        self._event = None
+        self._data_lines = []
+
+    def feed(self, chunk):
+        """
+        餵入原始位元組，回傳此次完整解析出的事件列表
+
+        Returns:
+            list: [(event_name, data_str), ...]；未指定事件名稱時 event_name 為 "message"
+        """
+        self._buffer += chunk
+        events = []
+        while True:
+            newline = self._buffer.find(b"\n")
+            if newline < 0:
+                break
+            line = self._buffer[:newline]
+            self._buffer = self._buffer[newline + 1:]
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            event = self._process_line(line.decode("utf-8"))
+            if event is not None:
+                events.append(event)
+        return events
+
+    def flush(self):
+        """串流結束時送出尚未以空白行結尾的最後一個事件"""
+        events = []
+        if self._buffer:
+            event = self._process_line(self._buffer.decode("utf-8"))
+            self._buffer = b""
+            if event is not None:
+                events.append(event)
+        event = self._dispatch()
+        if event is not None:
+            events.append(event)
+        return events
+
+    def _process_line(self, line):
+        if not line:
+            return self._dispatch()
+        if line.startswith(":"):
+            return None
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "event":
+            self._event = value
+        elif field == "data":
+            self._data_lines.append(value)
+        return None
+
+    def _dispatch(self):
+        if not self._data_lines:
+            self._event = None
+            return None
+        event = (self._event or "message", "\n".join(self._data_lines))
+        self._event = None
+        self._data_lines = []
+        return event
+
+
+def iter_sse_events(response, chunk_size=1024):
+    """
+    從 HTTP 回應物件逐步讀取並產生 SSE 事件
+
+    Args:
+        response: 具有 read(amt) 方法的回應物件
+        chunk_size: 每次讀取的位元組數
+
+    Yields:
+        (event_name, data_str)
+    """
+    parser = SSEParser()
+    while True:
+        # 使用 readline 讓每個事件一到達就能處理，而不必等待讀滿整個區塊
+        chunk = response.readline(chunk_size) if hasattr(response, "readline") else response.read(chunk_size)
+        if not chunk:
+            break
+        for event in parser.feed(chunk):
+            yield event
+    for event in parser.flush():
+        yield event
@@ -0,0 +1,118 @@
+import pytest
+
+from ai_service import AIService, AIServiceError
+from conversation import Conversation
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    return AIService(None)
+
+
+@pytest.mark.parametrize("provider, result, truncated", [
+    ("gemini", {"candidates": [{"content": {"parts": [{"text": "a"}]}, "finishReason": "MAX_TOKENS"}]}, True),
+    ("gemini", {"candidates": [{"content": {"parts": [{"text": "a"}]}, "finishReason": "STOP"}]}, False),
+    ("openai", {"choices": [{"message": {"content": "a"}, "finish_reason": "length"}]}, True),
+    ("mistral", {"choices": [{"message": {"content": "a"}, "finish_reason": "stop"}]}, False),
+    ("claude", {"content": [{"text": "a"}], "stop_reason": "max_tokens"}, True),
+    ("claude", {"content": [{"text": "a"}], "stop_reason": "end_turn"}, False),
+    ("openai", {"choices": [{"message": {"content": "a"}}]}, None),
+])
+def test_truncation_from_finish_reason(service, provider, result, truncated):
+    text, token_info = service._parse_response(provider, result)
+    assert text == "a"
+    assert service.is_truncated(token_info) is truncated
+
+
+def test_stream_events_record_finish_reason(service):
+    usage = {}
+    service._parse_stream_event("claude", "message_delta",
+                                {"delta": {"stop_reason": "max_tokens"}, "usage": {"output_tokens": 5}}, usage)
+    assert service.is_truncated(usage)
+    usage = {}
+    service._parse_stream_event("openai", "message", {"choices": [{"delta": {}, "finish_reason": "length"}]}, usage)
+    assert service.is_truncated(usage)
+
+
+def english_text(words, seed=0):
+    vocabulary = ["the", "quarterly", "report", "shows", "steady", "growth", "in", "regional", "sales", "while",
+                  "operating", "costs", "remained", "flat", "and", "customer", "retention", "improved", "across",
+                  "most", "markets"]
+    sentences = []
+    for start in range(0, words, 12):
+        sentence = [vocabulary[(seed + index * 5) % len(vocabulary)] for index in range(start, min(start + 12, words))]
+        sentences.append(" ".join(sentence).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def record_ask(service, text, completion_tokens):
+    service._record_response(text, {"completion_tokens": completion_tokens}, service._load_api_settings())
+
+
+def test_usage_calibrates_offline_token_count(service):
+    service.token_counts.clear()
+    record_ask(service, english_text(360), 470)
+    # 另一段英文文本沒有 usage，以近期回應的比例校正字元類別估算
+    other = english_text(300, seed=3)
+    assert abs(service.count_tokens_offline(other) - 300 * 470 / 360) < 300 * 0.25
+
+
+@pytest.mark.parametrize("length_adjustment", ["+75%", "-50%", None])
+def test_normal_length_english_adjust_is_not_chunked(service, length_adjustment):
+    # 一般長度（約 360 字）的英文回應調整長度時不應分塊，否則分塊改寫會跳過長度調整
+    service.token_counts.clear()
+    reply = english_text(360)
+    record_ask(service, reply, 470)
+    assert service.split_for_adjustment(reply, length_adjustment) == [reply]
+    # 剛回答、尚無 usage 的其他英文文本也以校正後的估算分塊
+    other = english_text(360, seed=5)
+    assert service.split_for_adjustment(other, length_adjustment) == [other]
+
+
+def test_adjust_chunks_text_beyond_output_limit(service):
+    service.token_counts.clear()
+    settings = service._load_api_settings()
+    reply = english_text(3000)
+    record_ask(service, reply, 3900)
+    chunks = service.split_for_adjustment(reply, "+75%")
+    assert len(chunks) > 1
+    assert "".join(chunks) == reply
+    assert all(service.count_tokens_offline(chunk) * 4.0 <= settings.max_tokens * 1.1 for chunk in chunks)
+
+
+def test_chunked_ask_streams_only_reduce(service, monkeypatch):
+    prompts = []
+
+    def fake_stream(prompt, on_chunk, **kwargs):
+        prompts.append(prompt)
+        output = "reduced" if "依序整理出的重點" in prompt else f"note {len(prompts)}"
+        on_chunk(output)
+        return output
+
+    monkeypatch.setattr(service, "ask_ai_stream", fake_stream)
+    monkeypatch.setattr(service, "request_token_budget", lambda output_ratio=None, reserved_tokens=0: 200)
+    document = english_text(600)
+    streamed = []
+    result = service.ask_ai_chunked("Summarize: " + document, streamed.append, document=document)
+    # map 階段的重點只交給 reduce，回應欄位只收到最終回應
+    assert result == "reduced"
+    assert streamed == ["reduced"]
+    assert len(prompts) > 2
+
+
+def test_conversation_overflow_raises_instead_of_recording_error(service, monkeypatch):
+    def failing_stream(prompt, on_chunk, **kwargs):
+        error = AIServiceError("API錯誤", "quota exceeded")
+        if kwargs.get("raise_errors"):
+            raise error
+        return error.message
+
+    monkeypatch.setattr(service, "ask_ai_stream", failing_stream)
+    monkeypatch.setattr(service, "request_token_budget", lambda output_ratio=None, reserved_tokens=0: 200)
+    document = english_text(600)
+    conversation = Conversation(document)
+    # 文件超過單一請求時改以分塊整理，失敗時拋出例外，錯誤訊息不會成為對話的一輪
+    with pytest.raises(AIServiceError):
+        service.ask_conversation(conversation, "Summarize: " + document, lambda text: None)
+    assert conversation.turns == []
@@ -0,0 +1,91 @@
+import random
+import threading
+import time
+
+import pytest
+
+from batch_processor import BatchProcessor, ParagraphJob
+from cancellation import CancelToken, RequestCancelled
+
+
+def make_jobs(texts):
+    return [ParagraphJob(index, text, f"target{index}") for index, text in enumerate(texts)]
+
+
+def test_writes_results_in_document_order():
+    rng = random.Random(1)
+
+    def transform(text, cancel_token):
+        time.sleep(rng.random() * 0.01)
+        return text.upper()
+
+    written = []
+    jobs = make_jobs([f"paragraph {index}" for index in range(50)])
+    stats = BatchProcessor(transform, max_workers=8, max_pending=10).run(jobs, written.extend)
+    assert [job.index for job, _ in written] == list(range(50))
+    assert written[3] == (jobs[3], "PARAGRAPH 3")
+    assert stats["written"] == 50
+    assert stats["processed"] == 50
+
+
+def test_skips_empty_unchanged_and_failed_paragraphs():
+    calls = []
+
+    def transform(text, cancel_token):
+        calls.append(text)
+        if text == "bad":
+            raise ValueError("boom")
+        if text == "same":
+            return " same "
+        return "new " + text
+
+    written = []
+    stats = BatchProcessor(transform, max_workers=2).run(make_jobs(["a", "  ", "same", "bad", "b"]), written.extend)
+    assert "  " not in calls
+    assert [text for _, text in written] == ["new a", "new b"]
+    assert (stats["skipped_empty"], stats["unchanged"], stats["failed"]) == (1, 1, 1)
+    assert stats["errors"] == ["段落 4: boom"]
+
+
+def test_pending_work_is_bounded():
+    running = [0]
+    peak = [0]
+    lock = threading.Lock()
+
+    def transform(text, cancel_token):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.002)
+        with lock:
+            running[0] -= 1
+        return text + "!"
+
+    written = []
+    processor = BatchProcessor(transform, max_workers=3, max_pending=5)
+    processor.run(make_jobs([str(index) for index in range(40)]), written.extend)
+    assert peak[0] <= 3
+    assert len(written) == 40
+
+
+def test_cancel_stops_processing():
+    token = CancelToken()
+
+    def transform(text, cancel_token):
+        if text == "3":
+            token.cancel()
+        cancel_token.raise_if_cancelled()
+        return text + "!"
+
+    written = []
+    with pytest.raises(RequestCancelled):
+        BatchProcessor(transform, max_workers=1).run(make_jobs([str(index) for index in range(100)]),
+                                                      written.extend, cancel_token=token)
+    assert len(written) <= 3
+
+
+def test_reports_progress():
+    reports = []
+    BatchProcessor(lambda text, token: text + "!").run(make_jobs(["a", "b"]), lambda items: None,
+                                                         on_progress=reports.append, progress_interval=0)
+    assert reports[-1]["processed"] == 2
@@ -0,0 +1,117 @@
+import base64
+import os
+
+import pytest
+
+import bpe_tokenizer
+from bpe_tokenizer import (CL100K_PATTERN, GPT2_PATTERN, O200K_PATTERN, BPETokenizer, TokenizerRegistry,
+                           encoding_for_model, load_binary_ranks, load_merges_ranks, load_tiktoken_ranks,
+                           pattern_for_encoding, save_binary_ranks)
+
+MERGES = [b"he", b"ll", b"hell", b"hello", b" w", b"or", b" wor", b"ld", b" world"]
+
+
+def make_ranks():
+    ranks = {bytes([byte]): byte for byte in range(256)}
+    for token in MERGES:
+        ranks[token] = len(ranks)
+    return ranks
+
+
+def reference_merge(piece, ranks):
+    """逐步找出 rank 最小的相鄰對並合併的直接實作，用來比對堆積版本的結果"""
+    parts = [bytes([byte]) for byte in piece]
+    while len(parts) > 1:
+        pairs = [(ranks.get(parts[i] + parts[i + 1]), i) for i in range(len(parts) - 1)]
+        pairs = [pair for pair in pairs if pair[0] is not None]
+        if not pairs:
+            break
+        _, index = min(pairs)
+        parts[index:index + 2] = [parts[index] + parts[index + 1]]
+    return [ranks[part] for part in parts]
+
+
+def write_tiktoken(path, ranks):
+    with open(path, "wb") as f:
+        for token, rank in ranks.items():
+            f.write(base64.b64encode(token) + b" " + str(rank).encode("ascii") + b"\n")
+
+
+@pytest.mark.parametrize("text", ["hello world", "hellohello", "hell", "world hello", "中文 hello", ""])
+def test_encode_matches_reference_bpe(text):
+    ranks = make_ranks()
+    tokenizer = BPETokenizer(ranks)
+    expected = []
+    for match in CL100K_PATTERN.finditer(text):
+        expected.extend(reference_merge(match.group().encode("utf-8"), ranks))
+    assert tokenizer.encode(text) == expected
+    assert tokenizer.count(text) == len(expected)
+
+
+def test_pre_tokenizer_patterns():
+    assert [m.group() for m in CL100K_PATTERN.finditer("helloWorld it's 12345")] == \
+        ["helloWorld", " it", "'s", " ", "123", "45"]
+    assert [m.group() for m in O200K_PATTERN.finditer("helloWorld it's")] == ["hello", "World", " it's"]
+    assert [m.group() for m in GPT2_PATTERN.finditer("hello 12345!")] == ["hello", " 12345", "!"]
+    assert pattern_for_encoding("o200k_base") is O200K_PATTERN
+    assert pattern_for_encoding("unknown") is CL100K_PATTERN
+
+
+def test_encoding_for_model():
+    assert encoding_for_model("gpt-4o-mini") == "o200k_base"
+    assert encoding_for_model("gpt-3.5-turbo") == "cl100k_base"
+    assert encoding_for_model(None) == "cl100k_base"
+
+
+def test_rank_file_formats_round_trip(tmp_path):
+    ranks = make_ranks()
+    tiktoken_path = str(tmp_path / "test.tiktoken")
+    write_tiktoken(tiktoken_path, ranks)
+    assert load_tiktoken_ranks(tiktoken_path) == ranks
+
+    binary_path = str(tmp_path / "test.bin")
+    save_binary_ranks(ranks, binary_path)
+    assert load_binary_ranks(binary_path) == ranks
+
+    merges_path = tmp_path / "test.merges.txt"
+    merges_path.write_text("#version: 0.2\nh e\nl l\nhe ll\n", encoding="utf-8")
+    merges = load_merges_ranks(str(merges_path))
+    assert merges[b"hell"] == 258
+    assert len(merges) == 259
+
+
+def test_registry_loads_and_caches_binary(tmp_path):
+    write_tiktoken(str(tmp_path / "cl100k_base.tiktoken"), make_ranks())
+    registry = TokenizerRegistry(str(tmp_path))
+    assert registry.available_encodings() == ["cl100k_base"]
+    tokenizer = registry.get("cl100k_base")
+    assert tokenizer.count("hello world") == 2
+    assert os.path.exists(tmp_path / "cl100k_base.bin")
+    assert registry.get("cl100k_base") is tokenizer
+    assert registry.count_tokens("hello world", "openai", "gpt-3.5-turbo") == 2
+    # 其他提供商套用校正係數
+    assert registry.count_tokens("hello world", "claude") == round(2 * bpe_tokenizer.CALIBRATION["claude"][0])
+
+
+def test_registry_without_vocabulary(tmp_path):
+    registry = TokenizerRegistry(str(tmp_path / "missing"))
+    assert registry.get("cl100k_base") is None
+    assert registry.count_tokens("text", "openai") is None
+    assert registry.count_tokens("", "openai") == 0
+
+
+def test_registry_retries_failed_loads(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(bpe_tokenizer.time, "monotonic", lambda: clock[0])
+    registry = TokenizerRegistry(str(tmp_path))
+    assert registry.get("cl100k_base") is None
+    write_tiktoken(str(tmp_path / "cl100k_base.tiktoken"), make_ranks())
+    # 失敗後 RETRY_INTERVAL 內不重新嘗試，目錄清單也沿用快取
+    assert registry.get("cl100k_base") is None
+    assert registry.available_encodings() == ["cl100k_base"]
+    clock[0] += bpe_tokenizer.LISTING_TTL / 2
+    (tmp_path / "o200k_base.tiktoken").write_bytes(b"")
+    assert registry.available_encodings() == ["cl100k_base"]
+    clock[0] += bpe_tokenizer.RETRY_INTERVAL
+    assert registry.get("cl100k_base") is not None
+    assert registry.available_encodings() == ["cl100k_base", "o200k_base"]
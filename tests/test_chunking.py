@@ -0,0 +1,58 @@
+from chunking import MIN_CHUNK_TOKENS, OrderedStreamMerger, PROMPT_OVERHEAD_TOKENS, chunk_token_budget, split_text
+from model_limits import context_window
+
+
+def count_characters(text):
+    return len(text)
+
+
+def test_chunk_token_budget_limits():
+    window = context_window("unknown-model")
+    # 輸出與輸入無關時只受上下文視窗限制
+    assert chunk_token_budget("unknown-model", 1000, output_ratio=None) == window - PROMPT_OVERHEAD_TOKENS - 1000
+    # 改寫時輸入不能超過輸出上限
+    assert chunk_token_budget("unknown-model", 1000, output_ratio=1.0) == 1000
+    assert chunk_token_budget("unknown-model", 1000, output_ratio=0.5) == 2000
+    assert chunk_token_budget("unknown-model", window * 2, output_ratio=None) == MIN_CHUNK_TOKENS
+
+
+def test_split_text_short_text_is_single_chunk():
+    assert split_text("", 10) == []
+    assert split_text("短文", 10, count_characters) == ["短文"]
+
+
+def test_split_text_prefers_paragraphs_and_round_trips():
+    text = "第一段。\n第二段。\n第三段比較長一些。"
+    chunks = split_text(text, 10, count_characters)
+    assert "".join(chunks) == text
+    assert chunks[0] == "第一段。\n第二段。\n"
+    assert all(len(chunk) <= 10 for chunk in chunks)
+
+
+def test_split_text_splits_chinese_sentences_without_spaces():
+    text = "這是第一句。這是第二句！這是第三句？"
+    chunks = split_text(text, 7, count_characters)
+    assert chunks == ["這是第一句。", "這是第二句！", "這是第三句？"]
+
+
+def test_split_text_hard_splits_text_without_punctuation():
+    text = "a" * 25
+    chunks = split_text(text, 10, count_characters)
+    assert "".join(chunks) == text
+    assert all(len(chunk) <= 10 for chunk in chunks)
+
+
+def test_ordered_stream_merger_emits_in_order():
+    output = []
+    merger = OrderedStreamMerger(3, output.append, separator="|")
+    merger.feed(1, "b")
+    merger.feed(0, "a")
+    merger.feed(2, "c")
+    assert output == ["a"]
+    merger.finish(1)
+    assert output == ["a"]
+    merger.finish(0)
+    assert "".join(output) == "a|b|c"
+    merger.feed(2, "d")
+    merger.finish(2)
+    assert "".join(output) == "a|b|cd"
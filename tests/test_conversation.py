@@ -0,0 +1,70 @@
+from conversation import CACHE_CONTROL, DEFAULT_DOCUMENT_QUESTION, DOCUMENT_INSTRUCTION, Conversation
+
+
+def test_take_question_removes_document():
+    conversation = Conversation("文件內容")
+    assert conversation.take_question("請摘要：文件內容") == "請摘要："
+    assert conversation.take_question("文件內容") == DEFAULT_DOCUMENT_QUESTION
+    assert conversation.document == "文件內容"
+
+
+def test_first_question_without_document_drops_it():
+    conversation = Conversation("文件內容")
+    assert conversation.take_question("別的問題") == "別的問題"
+    assert conversation.document == ""
+
+
+def test_prefix_is_stable_across_turns():
+    conversation = Conversation("文件")
+    first = conversation.chat_messages("問題1")
+    conversation.add_turn("問題1", "回答1", {"prompt_tokens": 100, "cached_tokens": 0})
+    second = conversation.chat_messages("問題2")
+    assert second[:len(first)] == first
+    assert second[0] == {"role": "system", "content": DOCUMENT_INSTRUCTION + "文件"}
+    assert second[-2:] == [{"role": "assistant", "content": "回答1"}, {"role": "user", "content": "問題2"}]
+    assert conversation.stats()["prompt_tokens"] == 100
+
+
+def test_claude_fields_mark_cache_breakpoints():
+    conversation = Conversation("文件")
+    conversation.add_turn("問題1", "回答1")
+    fields = conversation.claude_fields("問題2")
+    assert fields["system"][0]["cache_control"] == CACHE_CONTROL
+    assert fields["messages"][1]["content"][0]["cache_control"] == CACHE_CONTROL
+    assert fields["messages"][-1] == {"role": "user", "content": "問題2"}
+
+
+def test_keeps_max_turns():
+    conversation = Conversation("", max_turns=2)
+    for index in range(3):
+        conversation.add_turn(f"q{index}", f"a{index}")
+    assert [asked for asked, _ in conversation.turns] == ["q1", "q2"]
+    conversation.clear()
+    assert conversation.turns == []
+
+
+def test_trim_to_budget_drops_oldest_turns():
+    conversation = Conversation("文件" * 10)
+    for index in range(3):
+        conversation.add_turn("問" * 50, "答" * 50)
+    fits, dropped = conversation.trim_to_budget("問題", 150)
+    assert fits and dropped == 2
+    assert len(conversation.turns) == 1
+    # 文件與問題本身就超過時不捨棄任何問答
+    assert conversation.trim_to_budget("問" * 500, 150) == (False, 0)
+    assert len(conversation.turns) == 1
+
+
+def test_gemini_cache_uses_model_minimum():
+    conversation = Conversation("word " * 2000)
+    assert not conversation.needs_gemini_cache("gemini-1.5-flash", count_tokens=lambda text: 2000)
+    assert conversation.needs_gemini_cache("gemini-2.5-flash", count_tokens=lambda text: 2000)
+    conversation.set_gemini_cache("gemini-2.5-flash", "cachedContents/abc")
+    assert not conversation.needs_gemini_cache("gemini-2.5-flash", count_tokens=lambda text: 2000)
+    fields = conversation.gemini_fields("gemini-2.5-flash", "問題")
+    assert fields["cachedContent"] == "cachedContents/abc"
+    assert "systemInstruction" not in fields
+    # 其他模型沒有快取時把文件放在 systemInstruction
+    assert "systemInstruction" in conversation.gemini_fields("gemini-2.5-pro", "問題")
+    conversation.gemini_cache_failed.add("gemini-2.5-pro")
+    assert not conversation.needs_gemini_cache("gemini-2.5-pro", count_tokens=lambda text: 10000)
@@ -0,0 +1,95 @@
+from history_store import SEPARATOR, HistoryEntry, HistoryStore, SessionHistory, format_entries
+
+
+def make_entry(index, question="問題", response="回應"):
+    return HistoryEntry("session", float(index), "ask", "openai", "gpt-4o", index, f"{question}{index}",
+                        f"{response}{index}")
+
+
+def test_add_recent_and_count(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+    for index in range(3):
+        store.add(make_entry(index))
+    store.flush()
+    assert store.count() == 3
+    assert [entry.question for entry in store.recent(2)] == ["問題2", "問題1"]
+
+
+def test_search_escapes_wildcards(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+    store.add(make_entry(0, question="折扣 50%"))
+    store.add(make_entry(1, question="折扣 500"))
+    store.add(make_entry(2, response="Hello World"))
+    store.flush()
+    assert [entry.question for entry in store.search("50%")] == ["折扣 50%0"]
+    assert len(store.search("hello world")) == 1
+    assert store.search("不存在") == []
+
+
+def test_prunes_old_entries(tmp_path, monkeypatch):
+    import history_store
+    monkeypatch.setattr(history_store, "PRUNE_EVERY", 5)
+    store = HistoryStore(str(tmp_path / "history.sqlite3"), max_entries=3)
+    for index in range(10):
+        store.add(make_entry(index))
+    store.flush()
+    assert store.count() == 3
+    assert store.recent(1)[0].question == "問題9"
+
+
+def test_prunes_on_first_write_of_each_process(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    store = HistoryStore(path, max_entries=100)
+    for index in range(10):
+        store.add(make_entry(index))
+    store.flush()
+    # 下一個行程以較小的上限開啟同一個資料庫，第一筆寫入就刪除最舊的紀錄
+    store = HistoryStore(path, max_entries=3)
+    store.add(make_entry(10))
+    store.flush()
+    assert store.count() == 3
+    assert [entry.question for entry in store.recent()] == ["問題10", "問題9", "問題8"]
+
+
+def test_write_errors_are_counted(tmp_path):
+    path = tmp_path / "history.sqlite3"
+    path.write_bytes(b"not a database" * 100)
+    store = HistoryStore(str(path))
+    store.add(make_entry(0))
+    store.flush()
+    assert store.errors == 1
+    assert store.recent() == []
+
+
+def test_session_history_window(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+    session = SessionHistory(store, window=2)
+    assert session.latest == ""
+    assert session.prefix() == ""
+    for index in range(3):
+        session.add("ask", f"q{index}", f"r{index}")
+    assert session.latest == "r2"
+    assert session.hidden == 1
+    rendered = session.render()
+    assert rendered.endswith(SEPARATOR.join(["r1", "r2"]))
+    assert "1 則回應已收起，可按 History 按鈕搜尋" in rendered
+    assert session.prefix().endswith("r2" + SEPARATOR)
+    store.flush()
+    assert store.count() == 3
+    session.clear()
+    assert session.render() == ""
+    assert store.count() == 3
+
+
+def test_format_entries_for_history_dialog():
+    long_question = "請調整以下文字：" + "字" * 300
+    text = format_entries([
+        HistoryEntry("s", 0.0, "adjust", "openai", "gpt-4o", 5, long_question, " 回應 "),
+        HistoryEntry("s", 0.0, "ask", "gemini", None, None, "問題", "答案"),
+    ])
+    first, second = text.split(SEPARATOR)
+    assert "調整回應 (gpt-4o)" in first
+    assert first.endswith("⋯\n\n回應")
+    assert len(first) < len(long_question)
+    assert "詢問" in second and "問題: 問題" in second
+    assert format_entries([]) == "沒有符合的紀錄"
@@ -0,0 +1,114 @@
+import pytest
+
+from length_controller import (MAX_RESPONSE_EXPONENT, MIN_RESPONSE_EXPONENT, LengthController, LengthResponseModel,
+                               estimate_exponent)
+
+
+def test_requested_tokens_without_bias_equals_target():
+    controller = LengthController(target_tokens=150, current_tokens=100)
+    assert controller.requested_tokens(100) == 150
+    assert controller.requested_tokens(0) == 150
+
+
+def test_requested_tokens_compensates_exponent():
+    # k = 0.5：模型只做到要求變化量的一半（對數尺度），需要要求 (1.5)^2 倍
+    controller = LengthController(target_tokens=150, current_tokens=100, exponent=0.5)
+    assert controller.requested_tokens(100) == 225
+
+
+def test_max_output_tokens_is_capped_by_output_limit():
+    controller = LengthController(target_tokens=1000, current_tokens=500)
+    assert controller.max_output_tokens(1000) > 1000
+    capped = LengthController(target_tokens=1000, current_tokens=500, output_limit=800)
+    assert capped.max_output_tokens(1000) == 800
+    # 模型的單次輸出上限低於 .env 的 MAX_TOKENS 時以模型為準
+    model_capped = LengthController(target_tokens=1000, current_tokens=500, output_limit=8000, model="gemini-pro")
+    assert model_capped.max_output_tokens(3000) == 2048
+    assert LengthController(1000, 500, output_limit=800, model="gpt-4o").output_limit == 800
+    assert LengthController(1000, 500, model="gemini-pro").output_limit == 2048
+
+
+def test_converges_and_stops_when_in_band():
+    controller = LengthController(target_tokens=100, current_tokens=200, max_rounds=3)
+    request = controller.next_request()
+    assert request.round_number == 1
+    assert controller.observe("response", 105)
+    assert controller.converged
+    assert controller.next_request() is None
+    assert controller.best == ("response", 105)
+
+
+def test_keeps_closest_response_and_respects_max_rounds():
+    controller = LengthController(target_tokens=100, current_tokens=200, max_rounds=2)
+    controller.next_request()
+    controller.observe("far", 160)
+    controller.next_request()
+    controller.observe("farther", 170)
+    assert controller.best == ("far", 160)
+    assert controller.next_request() is None
+
+
+def test_next_requests_spread_around_estimate():
+    controller = LengthController(target_tokens=200, current_tokens=100)
+    requests = controller.next_requests(3)
+    assert len(requests) == 3
+    assert requests[0].requested_tokens == 200
+    assert min(r.requested_tokens for r in requests) < 200 < max(r.requested_tokens for r in requests)
+    # 同一回合的平行候選只計為一回合
+    for request in requests:
+        controller.observe("x", 150, request)
+    assert controller.rounds == 1
+
+
+def test_truncated_response_does_not_update_exponent():
+    controller = LengthController(target_tokens=200, current_tokens=100)
+    request = controller.next_request()
+    controller.observe("cut", request.max_tokens)
+    assert controller.observations == []
+
+
+def test_estimate_exponent_is_clamped():
+    assert estimate_exponent(1.0, 0.0, 0.0) == pytest.approx(1.0)
+    assert estimate_exponent(1.0, 100.0, 1.0) == MAX_RESPONSE_EXPONENT
+    assert estimate_exponent(1.0, -100.0, 1.0) == MIN_RESPONSE_EXPONENT
+
+
+def test_response_model_learns_per_model():
+    model = LengthResponseModel()
+    assert model.exponent("openai", "gpt-4o") == 1.0
+    # 要求 2 倍，只得到約 1.41 倍：k ≈ 0.5
+    model.update("openai", "gpt-4o", [(100, 200, 141), (100, 50, 71)])
+    assert model.exponent("openai", "gpt-4o") == pytest.approx(0.5, abs=0.05)
+    assert model.exponent("openai", "gpt-4o-mini") == 1.0
+
+
+def test_truncated_response_never_replaces_complete_best():
+    controller = LengthController(target_tokens=100, current_tokens=200, max_rounds=3)
+    controller.next_request()
+    assert controller.observe("complete but long", 150, truncated=False)
+    request = controller.next_request()
+    # 被截斷的回應雖然更接近目標，也不會取代完整的回應
+    assert not controller.observe("cut off mid-sen", 100, truncated=True)
+    assert controller.best == ("complete but long", 150)
+    assert not controller.converged
+    assert request.round_number == 2
+
+
+def test_truncated_best_is_replaced_by_complete_response():
+    controller = LengthController(target_tokens=100, current_tokens=200, max_rounds=3)
+    controller.next_request()
+    assert controller.observe("cut off", 100, truncated=True)
+    assert controller.best_truncated
+    assert not controller.converged
+    controller.next_request()
+    assert controller.observe("complete", 130, truncated=False)
+    assert controller.best == ("complete", 130)
+    assert not controller.best_truncated
+
+
+def test_finish_reason_overrides_token_guess():
+    controller = LengthController(target_tokens=200, current_tokens=100)
+    request = controller.next_request()
+    # 提供商回報正常結束時，接近上限的回應仍用來修正 k
+    controller.observe("complete", request.max_tokens, truncated=False)
+    assert len(controller.observations) == 1
@@ -0,0 +1,22 @@
+from model_limits import (DEFAULT_CONTEXT_WINDOW, DEFAULT_GEMINI_MIN_CACHE_TOKENS, DEFAULT_OUTPUT_TOKEN_LIMIT,
+                          context_window, gemini_min_cache_tokens, output_token_limit)
+
+
+def test_context_window_uses_longest_prefix():
+    assert context_window("gpt-4-turbo-preview") == 128000
+    assert context_window("GPT-4-0613") == 8192
+    assert context_window("unknown-model") == DEFAULT_CONTEXT_WINDOW
+    assert context_window(None) == DEFAULT_CONTEXT_WINDOW
+
+
+def test_output_token_limit_uses_longest_prefix():
+    assert output_token_limit("claude-3-5-sonnet-latest") == 8192
+    assert output_token_limit("claude-2.1") == 4096
+    assert output_token_limit("unknown-model") == DEFAULT_OUTPUT_TOKEN_LIMIT
+
+
+def test_gemini_min_cache_tokens_per_model():
+    assert gemini_min_cache_tokens("gemini-1.5-flash-002") == 32768
+    assert gemini_min_cache_tokens("gemini-2.5-flash-lite") == 1024
+    assert gemini_min_cache_tokens("gemini-2.5-pro") == 4096
+    assert gemini_min_cache_tokens("unknown-model") == DEFAULT_GEMINI_MIN_CACHE_TOKENS
@@ -0,0 +1,76 @@
+import pytest
+
+from prompt_compiler import (DEFAULT_HEADER, RULE_NONE, RULE_PERCENTAGE, RULE_TARGET, RULE_TEMPLATE, RULE_VALUES,
+                             compile_prompt_config, validate_prompt_config)
+
+CONFIG = {
+    "dropdowns": [
+        {"id": "length", "position": 2, "options": ["0%", "-25%", "+50%"], "default_option": 0,
+         "prompt_templates": {"decrease": "將文本縮短 {percentage}。", "increase": "將文本擴展 {percentage}。"}},
+        {"id": "language", "position": 1, "options": ["不變", "英文", "日文"],
+         "prompt_template": "翻譯成{option}。"},
+        {"id": "tone", "position": 3, "options": ["不變", "正式", "輕鬆"],
+         "prompt_template": "語氣：{prompt_value}", "prompt_values": {"正式": "正式而禮貌"}},
+        {"id": "format", "position": 4, "options": ["不變", "條列"], "target_option": "條列"},
+        {"id": "plain", "position": 5, "options": ["a", "b"]},
+    ]
+}
+
+
+def test_rule_types():
+    compiled = compile_prompt_config(CONFIG)
+    rules = {rule.id: rule.rule for rule in compiled.dropdowns}
+    assert rules == {"length": RULE_PERCENTAGE, "language": RULE_TEMPLATE, "tone": RULE_VALUES,
+                     "format": RULE_TARGET, "plain": RULE_NONE}
+    # 對話框依 position 排列
+    assert [rule.id for rule in compiled.dropdowns][:2] == ["language", "length"]
+    assert compiled.dropdown_ids[0] == "length"
+
+
+def test_fragments():
+    compiled = compile_prompt_config(CONFIG)
+    assert compiled.fragment("length", "-25%") == "將文本縮短 25%。"
+    assert compiled.fragment("length", "+50%") == "將文本擴展 50%。"
+    assert compiled.fragment("length", "0%") is None
+    assert compiled.fragment("language", "英文") == "翻譯成英文。"
+    assert compiled.fragment("tone", "正式") == "語氣：正式而禮貌"
+    assert compiled.fragment("tone", "輕鬆") is None
+    assert compiled.fragment("format", "條列") == "將文本轉換為條列。"
+    assert compiled.fragment("plain", "b") is None
+
+
+def test_adjustments():
+    compiled = compile_prompt_config(CONFIG)
+    assert not compiled.has_adjustment({"length": "0%", "language": "不變"})
+    assert compiled.has_adjustment({"language": "英文"})
+    assert compiled.length_adjustment({"length": "+50%"}) == "+50%"
+    assert compiled.length_adjustment({"length": "0%"}) is None
+
+
+def test_render_follows_config_order():
+    compiled = compile_prompt_config(CONFIG)
+    prompt = compiled.render({"length": "-25%", "language": "英文"}, "原文")
+    assert prompt.startswith(DEFAULT_HEADER)
+    assert prompt.index("縮短") < prompt.index("翻譯")
+    assert "原文" in prompt
+
+
+@pytest.mark.parametrize("config, message", [
+    ([], "JSON 物件"),
+    ({}, "dropdowns"),
+    ({"dropdowns": [{"position": 1, "options": ["a"]}]}, "缺少 id"),
+    ({"dropdowns": [{"id": "a", "position": 1, "options": ["a"]},
+                    {"id": "a", "position": 2, "options": ["a"]}]}, "重複"),
+    ({"dropdowns": [{"id": "a", "position": 1, "options": []}]}, "options"),
+    ({"dropdowns": [{"id": "a", "position": 1, "options": ["a"], "default_option": 1}]}, "default_option"),
+    ({"dropdowns": [{"id": "a", "options": ["a"]}]}, "position"),
+    ({"dropdowns": [{"id": "a", "position": 1, "options": ["a"], "prompt_templates": {"decrease": ""}}]},
+     "prompt_templates"),
+])
+def test_validate_prompt_config_errors(config, message):
+    with pytest.raises(ValueError, match=message):
+        validate_prompt_config(config)
+
+
+def test_validate_prompt_config_accepts_valid_config():
+    validate_prompt_config(CONFIG)
@@ -0,0 +1,120 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from cancellation import CancelToken, RequestCancelled
+from provider_router import ProviderRouter, StreamClaim
+
+
+def make_settings(routing_mode="failover", provider="gemini", order=("openai", "claude"), keys=None):
+    if keys is None:
+        keys = {"gemini": "g", "openai": "o", "claude": "c"}
+    return SimpleNamespace(provider=provider, provider_order=order, api_keys=keys, routing_mode=routing_mode)
+
+
+def test_candidates_skip_missing_keys_and_put_cooling_last():
+    router = ProviderRouter()
+    settings = make_settings(keys={"gemini": "g", "claude": "c"})
+    assert router.candidates(settings) == ["gemini", "claude"]
+    router.mark_failed("gemini")
+    assert router.candidates(settings) == ["claude", "gemini"]
+    router.mark_succeeded("gemini")
+    assert router.candidates(settings) == ["gemini", "claude"]
+
+
+def test_failover_uses_next_provider():
+    router = ProviderRouter()
+    calls = []
+
+    def call(name, cancel_token):
+        calls.append(name)
+        if name == "gemini":
+            raise OSError("timeout")
+        return name
+
+    assert router.route(make_settings(), call) == "openai"
+    assert calls == ["gemini", "openai"]
+    assert router.stats()["failovers"] == 1
+    assert router.stats()["cooling_down"] == ["gemini"]
+
+
+def test_failover_raises_last_error_and_respects_should_failover():
+    router = ProviderRouter()
+
+    def call(name, cancel_token):
+        raise ValueError(name)
+
+    with pytest.raises(ValueError, match="claude"):
+        router.route(make_settings(), call)
+
+    calls = []
+
+    def partial(name, cancel_token):
+        calls.append(name)
+        raise ValueError(name)
+
+    # 串流已輸出部分內容時不再改用其他提供商
+    with pytest.raises(ValueError, match="gemini"):
+        ProviderRouter().route(make_settings(), partial, should_failover=lambda error: False)
+    assert calls == ["gemini"]
+
+
+def test_without_keys_calls_configured_provider():
+    router = ProviderRouter()
+    assert router.route(make_settings(keys={}), lambda name, cancel_token: name) == "gemini"
+
+
+def test_race_returns_first_success_and_cancels_loser():
+    router = ProviderRouter()
+    slow_cancelled = threading.Event()
+
+    def call(name, cancel_token):
+        if name == "gemini":
+            cancel_token.add_callback(slow_cancelled.set)
+            cancel_token.wait(5)
+            cancel_token.raise_if_cancelled()
+            return "slow"
+        return "fast"
+
+    assert router.route(make_settings(routing_mode="race"), call) == "fast"
+    assert slow_cancelled.wait(1)
+    assert router.stats()["race_wins"] == {"openai": 1}
+
+
+def test_race_falls_back_to_remaining_providers():
+    router = ProviderRouter()
+
+    def call(name, cancel_token):
+        if name in ("gemini", "openai"):
+            raise OSError(name)
+        return name
+
+    assert router.route(make_settings(routing_mode="race"), call) == "claude"
+
+
+def test_race_propagates_cancellation():
+    router = ProviderRouter()
+    token = CancelToken()
+
+    def call(name, cancel_token):
+        token.cancel()
+        cancel_token.wait(5)
+        cancel_token.raise_if_cancelled()
+
+    with pytest.raises(RequestCancelled):
+        router.route(make_settings(routing_mode="race"), call, cancel_token=token)
+
+
+def test_stream_claim_first_writer_owns_output():
+    output = []
+    claim = StreamClaim(output.append)
+    winner_token, loser_token = CancelToken(), CancelToken()
+    winner = claim.writer("openai", winner_token)
+    loser = claim.writer("gemini", loser_token)
+    winner("a")
+    with pytest.raises(RequestCancelled):
+        loser("b")
+    winner("c")
+    assert output == ["a", "c"]
+    assert loser_token.cancelled and not winner_token.cancelled
@@ -0,0 +1,87 @@
+import datetime
+
+import pytest
+
+from rate_limiter import (DEFAULT_RETRY_AFTER, RateLimiter, RateLimitExceeded, TokenBucket, parse_duration,
+                          read_rate_limit_headers)
+
+
+def test_parse_duration_formats():
+    assert parse_duration("20") == 20.0
+    assert parse_duration("1m30s") == 90.0
+    assert parse_duration("250ms") == pytest.approx(0.25)
+    now = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    assert parse_duration("2024-01-01T00:00:30Z", now=now) == 30.0
+    assert parse_duration("Mon, 01 Jan 2024 00:01:00 GMT", now=now) == 60.0
+    assert parse_duration("soon") is None
+    assert parse_duration(None) is None
+
+
+def test_read_rate_limit_headers():
+    headers = {
+        "x-ratelimit-limit-requests": "500",
+        "x-ratelimit-remaining-requests": "499",
+        "x-ratelimit-reset-requests": "120ms",
+        "anthropic-ratelimit-tokens-limit": "40000",
+        "anthropic-ratelimit-tokens-remaining": "39000",
+        "retry-after-ms": "1500",
+    }
+    info = read_rate_limit_headers(headers)
+    assert info["requests"][:2] == (500, 499)
+    assert info["requests"][2] == pytest.approx(0.12)
+    assert info["tokens"] == (40000, 39000, None)
+    assert info["retry_after"] == 1.5
+    assert read_rate_limit_headers(None) == {}
+
+
+def test_token_bucket_wait_and_refill():
+    bucket = TokenBucket(60)
+    bucket.take(60, now=bucket._updated)
+    assert bucket.wait_time(1, now=bucket._updated) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now=bucket._updated + 1.0) == 0.0
+    # 超過容量的請求只需要等到桶滿
+    assert bucket.wait_time(1000, now=bucket._updated) == pytest.approx(59.0)
+
+
+def test_unknown_limits_do_not_queue():
+    limiter = RateLimiter()
+    for _ in range(100):
+        assert limiter.acquire("openai", "key", 10000) == 0.0
+
+
+def test_configured_limits_queue_and_raise_beyond_max_wait():
+    limiter = RateLimiter()
+    limiter.configure("openai", requests_per_minute=2)
+    limiter.acquire("openai", "key", 1)
+    limiter.acquire("openai", "key", 1)
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire("openai", "key", 1, max_wait=0.5)
+    # 金鑰分別計算額度
+    assert limiter.acquire("openai", "other-key", 1) == 0.0
+
+
+def test_learns_limits_from_headers():
+    limiter = RateLimiter()
+    limiter.update_from_headers("openai", "key", {
+        "x-ratelimit-limit-requests": "100",
+        "x-ratelimit-remaining-requests": "0",
+    })
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire("openai", "key", 1, max_wait=0.1)
+
+
+def test_settle_returns_unused_tokens():
+    limiter = RateLimiter({"openai": (None, 1000)})
+    limiter.acquire("openai", "key", 800)
+    limiter.settle("openai", "key", 800, 100)
+    assert limiter.acquire("openai", "key", 800, max_wait=0.1) == 0.0
+
+
+def test_rate_limited_blocks_key_with_backoff():
+    limiter = RateLimiter()
+    assert limiter.on_rate_limited("gemini", "key", body='{"retryDelay": "7s"}') == 7.0
+    assert limiter.on_rate_limited("gemini", "key2") == DEFAULT_RETRY_AFTER
+    assert limiter.on_rate_limited("gemini", "key2") == DEFAULT_RETRY_AFTER * 2
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire("gemini", "key", 1, max_wait=0.1)
+    assert limiter.stats()["rate_limited"] == 3
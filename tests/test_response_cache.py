@@ -0,0 +1,82 @@
+import json
+import os
+import time
+
+from response_cache import ResponseCache
+
+
+def test_make_key_depends_on_every_part():
+    key = ResponseCache.make_key("openai", "gpt-4o", {"temperature": 0.7}, "prompt")
+    assert key == ResponseCache.make_key("openai", "gpt-4o", {"temperature": 0.7}, "prompt")
+    assert key != ResponseCache.make_key("claude", "gpt-4o", {"temperature": 0.7}, "prompt")
+    assert key != ResponseCache.make_key("openai", "gpt-4o-mini", {"temperature": 0.7}, "prompt")
+    assert key != ResponseCache.make_key("openai", "gpt-4o", {"temperature": 0.2}, "prompt")
+    assert key != ResponseCache.make_key("openai", "gpt-4o", {"temperature": 0.7}, "prompt ")
+
+
+def test_memory_and_disk_hits(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.put("key", "response", {"completion_tokens": 3})
+    assert cache.get("key")["response"] == "response"
+    assert cache.stats()["memory_hits"] == 1
+
+    # 新的行程只能從磁碟讀取
+    reopened = ResponseCache(str(tmp_path))
+    entry = reopened.get("key")
+    assert entry["token_info"] == {"completion_tokens": 3}
+    assert reopened.stats()["disk_hits"] == 1
+    assert reopened.get("missing") is None
+    assert reopened.stats()["misses"] == 1
+
+
+def test_empty_responses_are_not_stored(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.put("key", "")
+    assert cache.get("key") is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_expired_entries_are_removed(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_age=60)
+    cache.put("key", "response")
+    cache._memory["key"]["created"] = time.time() - 120
+    path = os.path.join(str(tmp_path), "key.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"created": time.time() - 120, "response": "response", "token_info": None}, f)
+    assert cache.get("key") is None
+    assert not os.path.exists(path)
+
+
+def test_memory_lru_eviction(tmp_path):
+    cache = ResponseCache(str(tmp_path), memory_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, key)
+    assert list(cache._memory) == ["b", "c"]
+    assert cache.stats()["evictions"] == 1
+    # 記憶體中淘汰的項目仍可從磁碟讀取
+    assert cache.get("a")["response"] == "a"
+
+
+def test_disk_eviction_keeps_size_under_limit(tmp_path):
+    cache = ResponseCache(str(tmp_path), disk_max_bytes=2000)
+    for index in range(20):
+        cache.put(f"key{index}", "x" * 200)
+    total = sum(os.path.getsize(os.path.join(str(tmp_path), name)) for name in os.listdir(tmp_path))
+    assert total <= 2000
+    assert cache.get("key19")["response"] == "x" * 200
+
+
+def test_write_failure_is_not_raised(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("not a directory")
+    cache = ResponseCache(str(blocker / "cache"))
+    cache.put("key", "response")
+    assert cache.get("key")["response"] == "response"
+
+
+def test_clear(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.put("key", "response")
+    cache.clear()
+    assert cache.get("key") is None
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,116 @@
+import random
+import socket
+import threading
+import urllib.error
+
+import pytest
+
+from cancellation import RequestCancelled
+from retry_policy import LatencyTracker, RetryBudget, RetryPolicy, hedged_call, is_retriable
+
+
+def http_error(code):
+    return urllib.error.HTTPError("https://example.com", code, "error", {}, None)
+
+
+def test_is_retriable():
+    assert is_retriable(http_error(503))
+    assert not is_retriable(http_error(400))
+    assert not is_retriable(http_error(429))
+    assert is_retriable(urllib.error.URLError(ConnectionResetError()))
+    assert not is_retriable(urllib.error.URLError("unknown host"))
+    assert is_retriable(socket.timeout())
+    assert not is_retriable(RequestCancelled())
+    assert not is_retriable(ValueError())
+
+
+def test_retry_budget_limits_retries():
+    budget = RetryBudget(ratio=0.5, maximum=1)
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+def make_policy(**kwargs):
+    return RetryPolicy(base_delay=0.0, rng=random.Random(1), **kwargs)
+
+
+def test_call_retries_transient_errors():
+    failures = [http_error(502), ConnectionResetError()]
+    retries = []
+
+    def function(cancel_token):
+        if failures:
+            raise failures.pop(0)
+        return "ok"
+
+    policy = make_policy(max_retries=2)
+    assert policy.call(function, on_retry=lambda error, number, delay: retries.append(number)) == "ok"
+    assert retries == [1, 2]
+    assert policy.stats()["attempts"] == 3
+
+
+def test_call_does_not_retry_permanent_errors_or_beyond_limit():
+    calls = []
+
+    def function(cancel_token):
+        calls.append(1)
+        raise http_error(400)
+
+    with pytest.raises(urllib.error.HTTPError):
+        make_policy().call(function)
+    assert len(calls) == 1
+
+    def failing(cancel_token):
+        calls.append(1)
+        raise http_error(503)
+
+    calls.clear()
+    with pytest.raises(urllib.error.HTTPError):
+        make_policy(max_retries=1).call(failing)
+    assert len(calls) == 2
+
+    calls.clear()
+    with pytest.raises(urllib.error.HTTPError):
+        make_policy().call(failing, should_retry=lambda error: False)
+    assert len(calls) == 1
+
+
+def test_backoff_is_bounded():
+    policy = RetryPolicy(base_delay=0.5, max_delay=2.0, rng=random.Random(1))
+    assert all(0 <= policy.backoff(number) <= min(2.0, 0.5 * 2 ** number) for number in range(10))
+
+
+def test_latency_tracker_needs_samples():
+    tracker = LatencyTracker(window=100, min_samples=10)
+    for index in range(5):
+        tracker.record(("openai", "gpt-4o"), index)
+    assert tracker.percentile(("openai", "gpt-4o"), 0.95) is None
+    for index in range(5, 100):
+        tracker.record(("openai", "gpt-4o"), index)
+    assert 90 <= tracker.percentile(("openai", "gpt-4o"), 0.95) <= 99
+
+
+def test_hedged_call_without_hedge_calls_once():
+    assert hedged_call(lambda token: 42, None) == 42
+
+
+def test_hedged_call_uses_faster_request():
+    release = threading.Event()
+    calls = []
+
+    def function(token):
+        calls.append(token)
+        if len(calls) == 1:
+            # 第一個請求卡住，直到被取消
+            token.wait(5)
+            release.set()
+            raise RequestCancelled()
+        return "hedge"
+
+    policy = make_policy()
+    assert hedged_call(function, 0.05, stats=policy) == "hedge"
+    assert release.wait(5)
+    assert policy.stats()["hedge_wins"] == 1
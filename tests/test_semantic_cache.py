@@ -0,0 +1,67 @@
+from semantic_cache import SemanticCache, is_small_edit, normalize_prompt
+
+PROMPT = "請將以下段落改寫得更正式，並保留原本的意思：本季營收成長，主要來自海外市場的新客戶與既有客戶的續約。"
+
+
+def make_cache():
+    cache = SemanticCache()
+    scope = SemanticCache.make_scope("openai", "gpt-4o", {"temperature": 0.7})
+    cache.add(scope, PROMPT, "target")
+    return cache, scope
+
+
+def test_normalize_prompt_ignores_punctuation_width_and_case():
+    assert normalize_prompt("Hello， World！") == normalize_prompt("hello,world!")
+    assert normalize_prompt("ＡＢＣ　１２３") == "abc123"
+
+
+def test_is_small_edit_accepts_only_filler_words():
+    text = normalize_prompt(PROMPT)
+    assert is_small_edit(text, "麻煩" + text)
+    assert is_small_edit(text + "謝謝", text)
+    assert not is_small_edit(text, text + "用英文")
+    assert not is_small_edit(text, text.replace("正式", "口語"))
+
+
+def test_normalized_prompt_hits():
+    cache, scope = make_cache()
+    assert cache.lookup(scope, PROMPT.replace("，", ",") + "  ") == ("target", 1.0)
+
+
+def test_filler_edit_hits():
+    cache, scope = make_cache()
+    target, similarity = cache.lookup(scope, "麻煩" + PROMPT + "謝謝")
+    assert target == "target"
+    assert similarity >= cache.threshold
+
+
+def test_changed_instruction_misses():
+    cache, scope = make_cache()
+    assert cache.lookup(scope, PROMPT + "用英文")[0] is None
+    assert cache.lookup(scope, PROMPT.replace("正式", "口語"))[0] is None
+
+
+def test_different_numbers_miss():
+    cache = SemanticCache()
+    scope = SemanticCache.make_scope("openai", "gpt-4o", {})
+    cache.add(scope, "將下列文本擴展 20%：" + PROMPT, "target")
+    assert cache.lookup(scope, "將下列文本擴展 30%：" + PROMPT)[0] is None
+
+
+def test_scopes_are_separate():
+    cache, _ = make_cache()
+    other = SemanticCache.make_scope("openai", "gpt-4o", {"temperature": 0.2})
+    assert cache.lookup(other, PROMPT)[0] is None
+
+
+def test_discard_and_eviction():
+    cache, scope = make_cache()
+    cache.discard("target")
+    assert cache.lookup(scope, PROMPT)[0] is None
+
+    cache = SemanticCache(max_entries=2)
+    for index in range(3):
+        cache.add(scope, f"第 {index} 個完全不同的提示詞內容", index)
+    assert cache.stats()["entries"] == 2
+    assert cache.lookup(scope, "第 0 個完全不同的提示詞內容")[0] is None
+    assert cache.lookup(scope, "第 2 個完全不同的提示詞內容")[0] == 2
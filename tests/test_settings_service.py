@@ -0,0 +1,87 @@
+import os
+import stat
+
+from settings_service import DEFAULT_MODELS, SettingsService, build_settings, parse_env
+
+
+def test_parse_env():
+    content = """
+# comment
+export OPENAI_API_KEY="sk-test"
+DEFAULT_PROVIDER = openai
+EMPTY=
+not a setting
+QUOTED='a=b'
+"""
+    assert parse_env(content) == {"OPENAI_API_KEY": "sk-test", "DEFAULT_PROVIDER": "openai", "EMPTY": "",
+                                  "QUOTED": "a=b"}
+
+
+def test_build_settings_defaults():
+    settings = build_settings({})
+    assert settings.provider == "gemini"
+    assert settings.api_key == ""
+    assert settings.model == DEFAULT_MODELS["gemini"]
+    assert settings.max_tokens == 2048
+    assert settings.stream_responses is True
+    assert settings.semantic_cache is False
+    assert settings.conversation_mode is False
+    assert settings.routing_mode == "single"
+
+
+def test_build_settings_values():
+    settings = build_settings({
+        "DEFAULT_PROVIDER": "claude",
+        "ANTHROPIC_API_KEY": "key",
+        "GEMINI_API_KEY": "gemini-key",
+        "CLAUDE_MODEL": "claude-3-5-sonnet-latest",
+        "MAX_TOKENS": "oops",
+        "STREAM_RESPONSES": "off",
+        "BATCH_WORKERS": "0",
+        "PROVIDER_ORDER": "claude, OpenAI, unknown",
+        "ROUTING_MODE": "Race",
+        "SEMANTIC_CACHE_THRESHOLD": "1.5",
+        "CUSTOM": "value",
+    })
+    assert settings.api_key == "key"
+    assert settings.api_keys["gemini"] == "gemini-key"
+    assert settings.model == "claude-3-5-sonnet-latest"
+    assert settings.max_tokens == 2048
+    assert settings.stream_responses is False
+    assert settings.batch_workers == 1
+    assert settings.provider_order == ("claude", "openai")
+    assert settings.routing_mode == "race"
+    assert settings.semantic_cache_threshold == 1.0
+    assert settings.get("CUSTOM") == "value"
+
+
+def test_reloads_only_when_file_changes(tmp_path):
+    path = tmp_path / ".env"
+    path.write_text("DEFAULT_PROVIDER=openai\n")
+    service = SettingsService(str(path))
+    first = service.get()
+    assert first.provider == "openai"
+    assert service.get() is first
+    assert service.loads == 1
+
+    path.write_text("DEFAULT_PROVIDER=mistral\n")
+    os.utime(path, ns=(0, 0))
+    assert service.get().provider == "mistral"
+    assert service.loads == 2
+
+
+def test_missing_file_uses_defaults(tmp_path):
+    service = SettingsService(str(tmp_path / "missing" / ".env"))
+    assert service.get().provider == "gemini"
+
+
+def test_save_keeps_other_settings(tmp_path):
+    path = tmp_path / "config" / ".env"
+    service = SettingsService(str(path))
+    service.save("openai", "sk-1")
+    path.write_text(path.read_text() + "GOOGLE_API_KEY=g\n")
+    saved = service.save("claude", "sk-2")
+    assert saved.provider == "claude"
+    assert saved.api_keys == {"openai": "sk-1", "gemini": "g", "claude": "sk-2"}
+    assert service.get() is saved
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
@@ -0,0 +1,38 @@
+import io
+
+from sse_stream import SSEParser, iter_sse_events
+
+
+def test_events_split_across_chunks():
+    parser = SSEParser()
+    assert parser.feed(b"event: delta\nda") == []
+    assert parser.feed(b"ta: {\"a\": 1}\r\n\r\n") == [("delta", '{"a": 1}')]
+
+
+def test_multiline_data_comments_and_default_event():
+    parser = SSEParser()
+    events = parser.feed(b": keep-alive\ndata: first\ndata:second\n\n")
+    assert events == [("message", "first\nsecond")]
+
+
+def test_blank_line_without_data_resets_event_name():
+    parser = SSEParser()
+    assert parser.feed(b"event: ping\n\ndata: x\n\n") == [("message", "x")]
+
+
+def test_flush_emits_unterminated_event():
+    parser = SSEParser()
+    assert parser.feed(b"data: [DONE]") == []
+    assert parser.flush() == [("message", "[DONE]")]
+
+
+def test_multibyte_character_split_across_chunks():
+    parser = SSEParser()
+    data = "data: 中文\n\n".encode("utf-8")
+    assert parser.feed(data[:8]) == []
+    assert parser.feed(data[8:]) == [("message", "中文")]
+
+
+def test_iter_sse_events_reads_response():
+    response = io.BytesIO(b"data: a\n\nevent: done\ndata: b")
+    assert list(iter_sse_events(response, chunk_size=4)) == [("message", "a"), ("done", "b")]
@@ -0,0 +1,102 @@
+import pytest
+
+from text_inserter import WriterTextInserter, insert_text
+
+
+class FakeRange:
+    def __init__(self, text, position):
+        self.text = text
+        self.position = position
+
+    def getEnd(self):
+        return FakeRange(self.text, self.position)
+
+    def getText(self):
+        return self.text
+
+    def gotoRange(self, other, expand):
+        self.position = other.position
+
+
+class FakeText:
+    def __init__(self, fail_on_break=False):
+        self.content = ""
+        self.fail_on_break = fail_on_break
+        self.inserts = 0
+
+    def createTextCursorByRange(self, text_range):
+        return FakeRange(self, text_range.position)
+
+    def insertControlCharacter(self, cursor, character, absorb):
+        if self.fail_on_break:
+            raise RuntimeError("insertControlCharacter failed")
+        self.insertString(cursor, "\n", absorb)
+
+    def insertString(self, cursor, string, absorb):
+        self.content = self.content[:cursor.position] + string + self.content[cursor.position:]
+        cursor.position += len(string)
+        self.inserts += 1
+
+
+class FakeUndoManager:
+    def __init__(self):
+        self.depth = 0
+        self.titles = []
+
+    def enterUndoContext(self, title):
+        self.depth += 1
+        self.titles.append(title)
+
+    def leaveUndoContext(self):
+        self.depth -= 1
+
+
+class FakeDocument:
+    def __init__(self, text):
+        self.text = text
+        self.view_cursor = FakeRange(text, 0)
+        self.undo_manager = FakeUndoManager()
+        self.lock_depth = 0
+
+    def getCurrentController(self):
+        return self
+
+    def getViewCursor(self):
+        return self.view_cursor
+
+    def getUndoManager(self):
+        return self.undo_manager
+
+    def lockControllers(self):
+        self.lock_depth += 1
+
+    def unlockControllers(self):
+        self.lock_depth -= 1
+
+
+def test_insert_text_is_one_undo_step():
+    doc = FakeDocument(FakeText())
+    inserter = insert_text(doc, "hello", flush_chars=2)
+    assert doc.text.content == "\nhello"
+    assert doc.undo_manager.titles == [inserter.undo_title]
+    assert doc.undo_manager.depth == 0
+    assert doc.lock_depth == 0
+    assert doc.view_cursor.position == len("\nhello")
+
+
+def test_writes_are_buffered_until_flush_chars():
+    doc = FakeDocument(FakeText())
+    with WriterTextInserter(doc, flush_chars=10) as inserter:
+        for piece in ["abc", "def", "ghij", "k"]:
+            inserter.write(piece)
+        assert inserter.flushes == 1
+    assert doc.text.content == "\nabcdefghijk"
+    assert inserter.flushes == 2
+
+
+def test_begin_failure_leaves_undo_context_and_unlocks():
+    doc = FakeDocument(FakeText(fail_on_break=True))
+    with pytest.raises(RuntimeError):
+        WriterTextInserter(doc).begin()
+    assert doc.undo_manager.depth == 0
+    assert doc.lock_depth == 0
@@ -0,0 +1,63 @@
+import pytest
+
+from token_count_cache import TokenCountCache
+from token_estimator import heuristic_token_count
+
+
+def test_get_and_put():
+    cache = TokenCountCache()
+    assert cache.get("openai", "gpt-4o", "text") is None
+    cache.put("openai", "gpt-4o", "text", 5, "local")
+    assert cache.get("openai", "gpt-4o", "text") == (5, "local")
+    # 提供商、模型與文本都是鍵的一部分
+    assert cache.get("openai", "gpt-4o-mini", "text") is None
+    assert cache.get("claude", "gpt-4o", "text") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_less_accurate_source_does_not_overwrite():
+    cache = TokenCountCache()
+    cache.put("openai", "gpt-4o", "text", 5, "api")
+    cache.put("openai", "gpt-4o", "text", 9, "heuristic")
+    assert cache.get("openai", "gpt-4o", "text") == (5, "api")
+    cache.put("openai", "gpt-4o", "text", 6, "usage")
+    assert cache.get("openai", "gpt-4o", "text") == (6, "usage")
+
+
+def test_ignores_empty_text_and_unknown_counts():
+    cache = TokenCountCache()
+    cache.put("openai", "gpt-4o", "", 0, "local")
+    cache.put("openai", "gpt-4o", "text", None, "local")
+    assert cache.stats()["entries"] == 0
+
+
+def test_seed_from_usage():
+    cache = TokenCountCache()
+    cache.seed_from_usage("openai", "gpt-4o", "response", {"prompt_tokens": 10, "completion_tokens": 3})
+    cache.seed_from_usage("openai", "gpt-4o", "other", {"prompt_tokens": 10})
+    cache.seed_from_usage("openai", "gpt-4o", "none", None)
+    assert cache.get("openai", "gpt-4o", "response") == (3, "usage")
+    assert cache.get("openai", "gpt-4o", "other") is None
+    assert cache.stats()["seeded"] == 1
+
+
+def test_lru_eviction():
+    cache = TokenCountCache(max_entries=2)
+    cache.put("p", "m", "a", 1, "local")
+    cache.put("p", "m", "b", 2, "local")
+    cache.get("p", "m", "a")
+    cache.put("p", "m", "c", 3, "local")
+    assert cache.get("p", "m", "b") is None
+    assert cache.get("p", "m", "a") == (1, "local")
+
+
+def test_heuristic_scale_from_usage():
+    cache = TokenCountCache()
+    assert cache.heuristic_scale("openai", "gpt-4o") is None
+    text = "The quarterly report shows steady growth in regional sales."
+    estimate = heuristic_token_count(text)[0]
+    cache.seed_from_usage("openai", "gpt-4o", text, {"completion_tokens": estimate // 2})
+    assert cache.heuristic_scale("openai", "gpt-4o") == pytest.approx((estimate // 2) / estimate)
+    assert cache.heuristic_scale("openai", "gpt-4o-mini") is None
+    cache.clear()
+    assert cache.heuristic_scale("openai", "gpt-4o") is None
@@ -0,0 +1,50 @@
+import random
+import re
+
+import pytest
+
+from token_estimator import count_char_classes, heuristic_token_count
+
+
+def reference_counts(text):
+    """原本以五次 re.findall 分類的結果"""
+    chinese = len(re.findall(r"[一-鿿]", text))
+    numbers = len(re.findall(r"\d", text))
+    punct = len(re.findall(r"[^\w\s一-鿿]", text))
+    whitespace = len(re.findall(r"\s", text))
+    return {
+        "chinese": chinese,
+        "numbers": numbers,
+        "english_words": len(re.findall(r"\b[a-zA-Z]+\b", text)),
+        "punct": punct,
+        "whitespace": whitespace,
+        "other": len(text) - chinese - numbers - punct - whitespace,
+    }
+
+
+def reference_estimate(text):
+    counts = reference_counts(text)
+    estimated = (counts["chinese"] * 0.7 + counts["english_words"] * 1.3 + counts["numbers"] * 0.5 +
+                 counts["punct"] * 0.5 + counts["whitespace"] * 0.3 + counts["other"] * 1.0)
+    return int(estimated + 0.5)
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "The quick brown fox jumps over the lazy dog.",
+    "這是一段中文，包含標點符號！還有English words與數字123。",
+    "abc中文def 123abc abc123 _abc abc_ café naïve",
+    "全形１２３ＡＢＣ\t\n\r 表情😀符號🎉 𠀀",
+    "a b c​d",
+])
+def test_matches_previous_regex_counts(text):
+    assert count_char_classes(text) == reference_counts(text)
+    assert heuristic_token_count(text)[0] == reference_estimate(text)
+
+
+def test_matches_previous_regex_counts_on_random_text():
+    rng = random.Random(7)
+    alphabet = "abcXYZ019 _\t\n.,!？。中文字éü😀ＡＢ１-'"
+    for _ in range(200):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 80)))
+        assert count_char_classes(text) == reference_counts(text), text
@@ -0,0 +1,149 @@
+UNDO_TITLE = "插入 AI 回應"
+BATCH_UNDO_TITLE = "批次套用 AI 調整"
+# 累積到這個字數才寫入文件一次，減少 UNO 呼叫與版面重排的次數
+FLUSH_CHARS = 4000
+# com.sun.star.text.ControlCharacter.PARAGRAPH_BREAK
+PARAGRAPH_BREAK = 0
+
+
+class WriterTextInserter:
+    """
+    將文字分段寫入 Writer 文件的游標位置
+
+    整個插入過程包在一個復原內容 (undo context) 中，不論寫入多少段，復原一次就能移除；
+    寫入時以 lockControllers 暫停畫面更新，解除鎖定時只重排一次版面。文字以文件模型的
+    文字游標寫入，不會每段都移動畫面上的游標，結束時才把游標移到插入內容之後。
+    """
+
+    def __init__(self, doc, undo_title=UNDO_TITLE, flush_chars=FLUSH_CHARS):
+        self.doc = doc
+        self.undo_title = undo_title
+        self.flush_chars = flush_chars
+        self.view_cursor = None
+        self.cursor = None
+        self.text = None
+        self.written = 0
+        self.flushes = 0
+        self._buffer = []
+        self._buffered = 0
+        self._undo_manager = None
+        self._locked = False
+
+    @classmethod
+    def for_current_document(cls, ctx, **kwargs):
+        desktop = ctx.ServiceManager.createInstance("com.sun.star.frame.Desktop")
+        return cls(desktop.getCurrentComponent(), **kwargs)
+
+    def _lock(self):
+        if not self._locked:
+            self.doc.lockControllers()
+            self._locked = True
+
+    def _unlock(self):
+        if self._locked:
+            self._locked = False
+            self.doc.unlockControllers()
+
+    def begin(self):
+        """開始插入：進入復原內容，並在選取範圍（或游標）之後新增一個段落"""
+        self.view_cursor = self.doc.getCurrentController().getViewCursor()
+        self.text = self.view_cursor.getText()
+        # 首先移動到選取區域的結束位置
+        self.cursor = self.text.createTextCursorByRange(self.view_cursor.getEnd())
+        try:
+            self._undo_manager = self.doc.getUndoManager()
+            self._undo_manager.enterUndoContext(self.undo_title)
+        except Exception:
+            self._undo_manager = None
+        try:
+            self._lock()
+            self.text.insertControlCharacter(self.cursor, PARAGRAPH_BREAK, False)
+        except Exception:
+            # 無法開始插入時不留下未結束的復原內容與鎖定的畫面
+            if self._undo_manager is not None:
+                self._undo_manager.leaveUndoContext()
+                self._undo_manager = None
+            self._unlock()
+            raise
+        return self
+
+    def write(self, text):
+        """加入一段文字；累積超過 flush_chars 時寫入文件"""
+        if not text:
+            return
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self.flush_chars:
+            self.flush()
+
+    def flush(self):
+        """將累積的文字以一次 insertString 寫入文件"""
+        if not self._buffer:
+            return
+        text = "".join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        self.text.insertString(self.cursor, text, False)
+        self.written += len(text)
+        self.flushes += 1
+
+    def finish(self):
+        """寫入剩餘文字、離開復原內容並解除畫面鎖定，最後把畫面游標移到插入內容之後"""
+        try:
+            self.flush()
+        finally:
+            if self._undo_manager is not None:
+                self._undo_manager.leaveUndoContext()
+                self._undo_manager = None
+            self._unlock()
+        self.view_cursor.gotoRange(self.cursor.getEnd(), False)
+
+    def __enter__(self):
+        return self.begin()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # 發生錯誤時仍結束復原內容，已寫入的部分可以一次復原
+        self.finish()
+        return False
+
+
+def insert_text(doc, text, **kwargs):
+    """將完整文字插入文件游標位置，整個操作為一個復原步驟"""
+    with WriterTextInserter(doc, **kwargs) as inserter:
+        inserter.write(text)
+    return inserter
+
+
+def replace_paragraphs(doc, items, undo_title=BATCH_UNDO_TITLE):
+    """
+    將批次處理的結果寫回各段落，整批寫回為一個復原步驟，期間以 lockControllers 暫停畫面更新
+
+    段落內容以涵蓋整個段落的文字游標取代，段落本身的格式（樣式、縮排等）保留，
+    新文字沿用段落開頭的字元格式。處理期間已被使用者修改的段落不覆蓋。
+
+    Args:
+        items: (ParagraphJob, 新文字) 的列表
+
+    Returns:
+        int: 因內容已改變而略過的段落數
+    """
+    conflicts = 0
+    try:
+        undo_manager = doc.getUndoManager()
+        undo_manager.enterUndoContext(undo_title)
+    except Exception:
+        undo_manager = None
+    doc.lockControllers()
+    try:
+        for job, new_text in items:
+            paragraph = job.target
+            if paragraph.getString() != job.text:
+                conflicts += 1
+                continue
+            text = paragraph.getText()
+            text.insertString(text.createTextCursorByRange(paragraph), new_text, True)
+    finally:
+        if undo_manager is not None:
+            undo_manager.leaveUndoContext()
+        doc.unlockControllers()
+    return conflicts
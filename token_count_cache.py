@@ -0,0 +1,132 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from token_estimator import heuristic_token_count
+
+
+# token 數來源的可信程度，數字越大越準確；較不準確的結果不會覆蓋較準確的結果
+SOURCE_PRIORITY = {
+    "heuristic": 0,
+    "local": 1,
+    "api": 2,
+    "usage": 3
+}
+# 字元類別估算的校正比例中，舊回應的權重衰減比例
+CALIBRATION_DECAY = 0.9
+
+
+class TokenCountCache:
+    """
+    以內容定址的 token 數快取
+
+    快取鍵為 (提供商, 模型, 文本 SHA-256)，只保存雜湊而不保存原文，
+    記憶體用量與文本長度無關；超過 max_entries 時淘汰最久未使用的項目。
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.seeded = 0
+        # (提供商, 模型) -> (usage 的 token 數總和, 字元類別估算總和)，依 CALIBRATION_DECAY 衰減
+        self._calibration = {}
+
+    @staticmethod
+    def make_key(provider, model, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return (provider or "", model or "", digest)
+
+    def get(self, provider, model, text):
+        """
+        查詢文本的 token 數
+
+        Returns:
+            tuple: (token_count, source)，未命中時為 None
+        """
+        key = self.make_key(provider, model, text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, provider, model, text, token_count, source):
+        """保存 token 數；已有來源更準確的項目時保留原值"""
+        if not text or token_count is None:
+            return
+        key = self.make_key(provider, model, text)
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None and SOURCE_PRIORITY.get(existing[1], 0) > SOURCE_PRIORITY.get(source, 0):
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = (token_count, source)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def seed_from_usage(self, provider, model, text, token_info):
+        """
+        以提供商回傳的 usage 資訊（completion_tokens）預先填入回應文本的 token 數
+
+        之後對同一段文本估算 token 數時直接命中，不會再發送 countTokens 請求。
+        """
+        if not token_info:
+            return
+        completion_tokens = token_info.get("completion_tokens")
+        if not completion_tokens:
+            return
+        self.put(provider, model, text, completion_tokens, "usage")
+        estimate = heuristic_token_count(text)[0]
+        with self._lock:
+            self.seeded += 1
+            if estimate:
+                key = (provider or "", model or "")
+                usage_sum, estimate_sum = self._calibration.get(key, (0.0, 0.0))
+                self._calibration[key] = (usage_sum * CALIBRATION_DECAY + completion_tokens,
+                                          estimate_sum * CALIBRATION_DECAY + estimate)
+
+    def heuristic_scale(self, provider, model):
+        """
+        提供商回報的 token 數與字元類別估算 (heuristic_token_count) 的比例
+
+        字元類別估算對英文明顯高估，乘上這個比例即為以 usage 校正的估算；還沒有 usage 時回傳 None。
+        """
+        with self._lock:
+            calibration = self._calibration.get((provider or "", model or ""))
+        if not calibration or not calibration[1]:
+            return None
+        return calibration[0] / calibration[1]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "seeded": self.seeded
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._calibration.clear()
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_token_count_cache():
+    """取得行程內共用的 token 數快取"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = TokenCountCache()
+        return _shared_cache
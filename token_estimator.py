@@ -0,0 +1,122 @@
+import re
+
+
+# 各字元類別的 token 權重
+# 中文字符权重 - 根据Gemini/GPT等模型，中文每个字符约为0.5-0.7个token
+CHINESE_WEIGHT = 0.7
+# 英文单词权重 - 平均每个英文单词约1.3个token
+ENGLISH_WORD_WEIGHT = 1.3
+# 数字权重 - 数字通常比字母更高效编码
+NUMBER_WEIGHT = 0.5
+# 标点符号权重
+PUNCT_WEIGHT = 0.5
+# 空白字符权重
+WHITESPACE_WEIGHT = 0.3
+# 其他字符权重
+OTHER_WEIGHT = 1.0
+
+# 字元類別：h=中文（H 為不屬於 \w 的中文區段字元）、d=數字、a=ASCII 字母、w=其他文字字元、s=空白、p=標點。
+# 分組順序即判斷優先順序，與原本五個正規表示式的計數方式一致。
+_CLASS_PATTERN = re.compile(
+    r"(?P<h>(?=\w)[\u4e00-\u9fff])|(?P<H>[\u4e00-\u9fff])|(?P<d>\d)|(?P<a>[a-zA-Z])|(?P<w>\w)|(?P<s>\s)|(?P<p>.)",
+    re.S
+)
+_CLASS_CODES = "hHdawsp"
+
+# 類別代碼轉為英文單字判斷用的代碼：a=ASCII 字母、w=其他文字字元（\w）、空白=單字邊界
+_WORD_BOUNDARY_TABLE = bytes.maketrans(_CLASS_CODES.encode("ascii"), b"w waw  ")
+
+_bmp_table = None
+
+
+def _classify(char):
+    return _CLASS_PATTERN.match(char).lastgroup
+
+
+def _get_bmp_table():
+    """
+    基本多文種平面 (U+0000-U+FFFF) 的分類表
+
+    以長度 65536 的字串作為 str.translate 的對照表，依字碼直接索引，不需雜湊查詢。
+    第一次使用時以單一正規表示式建立，約需數十毫秒。
+    """
+    global _bmp_table
+    if _bmp_table is None:
+        bmp = "".join(map(chr, range(0x10000)))
+        _bmp_table = _CLASS_PATTERN.sub(lambda match: match.lastgroup, bmp)
+    return _bmp_table
+
+
+# 第一次 translate 後仍保留原樣的字元，即超出 BMP 對照表範圍的補充平面字元（例如表情符號）
+_UNCLASSIFIED = re.compile(r"[^hHdawsp]")
+
+_astral_codes = {}
+
+
+def _classify_astral(match):
+    char = match.group()
+    code = _astral_codes.get(char)
+    if code is None:
+        code = _astral_codes[char] = _CLASS_PATTERN.match(char).lastgroup
+    return code
+
+
+def _count_codes(codes, classes):
+    """代碼位元組中屬於 classes 的數量（刪除這些代碼後減少的長度）"""
+    return len(codes) - len(codes.translate(None, classes))
+
+
+def count_char_classes(text):
+    """
+    一次走訪文本完成字元分類並統計各類別數量
+
+    以 str.translate 將文本轉為單位元組的類別代碼，之後的計數都在代碼位元組上以
+    bytes 操作完成，不需要對原文做多次正規表示式掃描，也不會建立比對結果列表。
+
+    Returns:
+        dict: chinese、numbers、english_words、punct、whitespace、other 的數量
+    """
+    codes = text.translate(_get_bmp_table())
+    if not codes.isascii():
+        codes = _UNCLASSIFIED.sub(_classify_astral, codes)
+    codes = codes.encode("ascii")
+    chinese = _count_codes(codes, b"hH")
+    numbers = _count_codes(codes, b"d")
+    punct = _count_codes(codes, b"p")
+    whitespace = _count_codes(codes, b"s")
+
+    # 英文單字即前後都不是 \w 的連續 ASCII 字母（\b[a-zA-Z]+\b）。
+    # 以空白分隔出的每一段連續文字字元中，只由 a 組成的段落才是英文單字：
+    # 段落總數減去刪除 a 後仍留下 w 的段落數。
+    words = b" " + codes.translate(_WORD_BOUNDARY_TABLE)
+    segments = words.count(b" a") + words.count(b" w")
+    english_words = segments - words.translate(None, b"a").count(b" w")
+
+    return {
+        "chinese": chinese,
+        "numbers": numbers,
+        "english_words": english_words,
+        "punct": punct,
+        "whitespace": whitespace,
+        "other": len(text) - chinese - numbers - punct - whitespace
+    }
+
+
+def heuristic_token_count(text):
+    """
+    以字元類別權重估算 token 數
+
+    Returns:
+        tuple: (token_count, counts)，counts 為 count_char_classes 的結果
+    """
+    counts = count_char_classes(text)
+    estimated_tokens = (
+        counts["chinese"] * CHINESE_WEIGHT +
+        counts["english_words"] * ENGLISH_WORD_WEIGHT +
+        counts["numbers"] * NUMBER_WEIGHT +
+        counts["punct"] * PUNCT_WEIGHT +
+        counts["whitespace"] * WHITESPACE_WEIGHT +
+        counts["other"] * OTHER_WEIGHT
+    )
+    # 向上取整
+    return int(estimated_tokens + 0.5), counts
@@ -46,16 +46,47 @@ class Utils:
             print(f"Error getting selected text: {str(e)}")  # 用於除錯
             return ""
             
-    def insert_text_at_cursor(self, text):
-        """在游標位置插入文字"""
+    def get_document_paragraphs(self):
+        """
+        列舉 Writer 文件中的段落（不含表格）
+
+        有選取文字時只列舉選取範圍內的段落，否則列舉整份文件。
+
+        Returns:
+            tuple: (ParagraphJob 列表, "selection" 或 "document", 文件)
+        """
+        from batch_processor import ParagraphJob
+
         desktop = self.ctx.ServiceManager.createInstance("com.sun.star.frame.Desktop")
         doc = desktop.getCurrentComponent()
-        cursor = doc.getCurrentController().getViewCursor()
-    
-        # 首先移動到選取區域的結束位置
-        if cursor.isCollapsed() == False:  # 如果有選取文字
-            cursor.gotoRange(cursor.getEnd(), False)  # 移動到選取區域的結尾
-    
-        # 插入換行符號，然後在新行插入文字
-        cursor.Text.insertControlCharacter(cursor, 0, False)  # 插入換行符號 (0 = 換行)
-        cursor.Text.insertString(cursor, text, False)
+        if doc is None or not doc.supportsService("com.sun.star.text.TextDocument"):
+            raise Exception("批次處理只支援 Writer 文件")
+
+        ranges = []
+        selection = doc.getCurrentController().getSelection()
+        if selection and selection.supportsService("com.sun.star.text.TextRanges"):
+            for i in range(selection.getCount()):
+                selected_range = selection.getByIndex(i)
+                if selected_range.getString():
+                    ranges.append(selected_range)
+        scope = "selection" if ranges else "document"
+        if not ranges:
+            ranges = [doc.getText()]
+
+        jobs = []
+        for text_range in ranges:
+            enumeration = text_range.createEnumeration()
+            while enumeration.hasMoreElements():
+                paragraph = enumeration.nextElement()
+                # 表格等非段落元素不處理
+                if not paragraph.supportsService("com.sun.star.text.Paragraph"):
+                    continue
+                jobs.append(ParagraphJob(len(jobs), paragraph.getString(), paragraph))
+        return jobs, scope, doc
+
+    def insert_text_at_cursor(self, text):
+        """在游標位置（選取範圍之後）的新段落插入文字，整個插入為一個復原步驟"""
+        from text_inserter import insert_text
+
+        desktop = self.ctx.ServiceManager.createInstance("com.sun.star.frame.Desktop")
+        insert_text(desktop.getCurrentComponent(), text)